@@ -0,0 +1,87 @@
+"""
+Benchmark CovarianceService: tinh lai ca cua so so voi doc file / cap nhat EWMA tang dan
+
+Chay:
+    python benchmarks/bench_covariance.py                  # 500, 1600 ma x 2 nam
+    python benchmarks/bench_covariance.py --sizes 1600 --days 750
+
+Bang gia sinh ngau nhien duoc ghi vao thu muc tam. Buoc 'ewma_update' gia
+lap ngay hom sau: them 1 phien vao bang gia roi cap nhat EWMA da luu.
+"""
+import argparse
+import json
+import logging
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+import pandas as pd
+
+sys.path.append(str(Path(__file__).parent.parent))
+
+from src.data_pipeline.close_panel import ClosePanel
+from src.portfolio.covariance import CovarianceService, ESTIMATORS
+from bench_optimizer import NoFetchCrawler, make_panel
+
+
+def run_size(n, days, workdir):
+    panel_file = Path(workdir) / f'panel_{n}.parquet'
+    cache_dir = Path(workdir) / f'covariance_{n}'
+    symbols = make_panel(n, days + 1, panel_file)
+
+    # Bang gia thieu phien cuoi (de do cap nhat EWMA 1 phien)
+    full_panel = pd.read_parquet(panel_file)
+    full_panel.iloc[:-1].to_parquet(panel_file)
+
+    def service():
+        panel = ClosePanel(NoFetchCrawler(), panel_file=panel_file)
+        return CovarianceService(panel, cache_dir=cache_dir, lookback_days=days * 2)
+
+    row = {'symbols': n}
+    for estimator in ESTIMATORS:
+        started = time.perf_counter()
+        service().matrix(symbols, estimator)
+        row[f'{estimator}_s'] = time.perf_counter() - started
+
+    started = time.perf_counter()
+    service().matrix(symbols[: n // 2], 'ledoit_wolf')
+    row['cached_s'] = time.perf_counter() - started
+
+    # Hom sau: them phien cuoi, EWMA cap nhat tu ma tran da luu
+    full_panel.to_parquet(panel_file)
+    meta_file = cache_dir / 'ewma.json'
+    meta = json.loads(meta_file.read_text())
+    meta['checked'] = '2000-01-03T00:00:00'
+    meta_file.write_text(json.dumps(meta))
+
+    started = time.perf_counter()
+    updated = service()
+    updated.matrix(symbols, 'ewma')
+    row['ewma_update_s'] = time.perf_counter() - started
+    assert updated.info('ewma')['observations'] == meta['observations'] + 1
+    return row
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[1])
+    parser.add_argument('--sizes', type=int, nargs='+', default=[500, 1600])
+    parser.add_argument('--days', type=int, default=500, help='So phien lich su')
+    args = parser.parse_args()
+
+    logging.disable(logging.INFO)
+
+    rows = []
+    with tempfile.TemporaryDirectory() as workdir:
+        for n in args.sizes:
+            rows.append(run_size(n, args.days, workdir))
+            print(f"{n} symbols done")
+
+    table = pd.DataFrame(rows).set_index('symbols')
+    print(f"\ndays={args.days}")
+    print("\nSeconds:")
+    print(table.round(3).to_string())
+
+
+if __name__ == "__main__":
+    main()
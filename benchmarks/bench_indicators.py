@@ -0,0 +1,109 @@
+"""
+Benchmark add_all_indicators: kernel (numba/numpy) so voi ban dung thu vien ta
+
+Chay:
+    python benchmarks/bench_indicators.py                  # 2,000 ma x 10 nam
+    python benchmarks/bench_indicators.py --symbols 200 --years 2
+
+Du lieu gia duoc sinh ngau nhien (252 phien/nam) nen khong can mang.
+"""
+import argparse
+import sys
+import time
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+from ta.trend import MACD, SMAIndicator, EMAIndicator
+from ta.momentum import RSIIndicator, StochasticOscillator
+from ta.volatility import BollingerBands, AverageTrueRange
+from ta.volume import OnBalanceVolumeIndicator
+
+sys.path.append(str(Path(__file__).parent.parent))
+
+from src.analysis import kernels
+from src.analysis.technical import TechnicalAnalyzer
+from config.settings import TECHNICAL_PARAMS
+
+
+def make_universe(n_symbols, n_bars, seed=0):
+    """Sinh n_symbols chuoi OHLCV gia lap"""
+    rng = np.random.default_rng(seed)
+    dates = pd.bdate_range(end='2025-10-17', periods=n_bars)
+    universe = []
+    for _ in range(n_symbols):
+        close = 30000 * np.cumprod(1 + rng.normal(0.0003, 0.02, n_bars))
+        spread = np.abs(rng.normal(0, 0.01, n_bars)) * close
+        universe.append(pd.DataFrame({
+            'open': close,
+            'high': close + spread,
+            'low': close - spread,
+            'close': close,
+            'volume': rng.integers(10_000, 5_000_000, n_bars)
+        }, index=dates))
+    return universe
+
+
+def add_all_indicators_ta(df, params=TECHNICAL_PARAMS):
+    """Ban tham chieu dung truc tiep thu vien ta (cach lam truoc day)"""
+    df = df.copy()
+    for period in params['ma_periods']:
+        df[f'SMA_{period}'] = SMAIndicator(close=df['close'], window=period).sma_indicator()
+        df[f'EMA_{period}'] = EMAIndicator(close=df['close'], window=period).ema_indicator()
+    df['RSI'] = RSIIndicator(close=df['close'], window=params['rsi_period']).rsi()
+    macd = MACD(close=df['close'], window_fast=params['macd_fast'],
+                window_slow=params['macd_slow'], window_sign=params['macd_signal'])
+    df['MACD'] = macd.macd()
+    df['MACD_signal'] = macd.macd_signal()
+    df['MACD_diff'] = macd.macd_diff()
+    bb = BollingerBands(close=df['close'], window=params['bb_period'], window_dev=params['bb_std'])
+    df['BB_upper'] = bb.bollinger_hband()
+    df['BB_middle'] = bb.bollinger_mavg()
+    df['BB_lower'] = bb.bollinger_lband()
+    df['BB_width'] = bb.bollinger_wband()
+    stoch = StochasticOscillator(high=df['high'], low=df['low'], close=df['close'],
+                                 window=14, smooth_window=3)
+    df['Stoch_K'] = stoch.stoch()
+    df['Stoch_D'] = stoch.stoch_signal()
+    df['ATR'] = AverageTrueRange(high=df['high'], low=df['low'], close=df['close'],
+                                 window=14).average_true_range()
+    df['OBV'] = OnBalanceVolumeIndicator(close=df['close'], volume=df['volume']).on_balance_volume()
+    df['Daily_Return'] = df['close'].pct_change()
+    df['Volume_Change'] = df['volume'].pct_change()
+    return df
+
+
+def time_it(func, universe):
+    start = time.perf_counter()
+    for df in universe:
+        func(df)
+    return time.perf_counter() - start
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark indicator kernels')
+    parser.add_argument('--symbols', type=int, default=2000)
+    parser.add_argument('--years', type=int, default=10)
+    parser.add_argument('--skip-ta', action='store_true', help='Bo qua ban tham chieu ta (cham)')
+    args = parser.parse_args()
+
+    n_bars = args.years * 252
+    universe = make_universe(args.symbols, n_bars)
+    analyzer = TechnicalAnalyzer()
+
+    # Warm-up: bien dich JIT (neu co numba) truoc khi do
+    analyzer.add_all_indicators(universe[0])
+
+    print(f"Universe: {args.symbols} symbols x {n_bars} bars | kernel backend: {kernels.BACKEND}")
+
+    kernel_time = time_it(analyzer.add_all_indicators, universe)
+    print(f"kernels : {kernel_time:8.2f}s  ({kernel_time / args.symbols * 1000:.2f} ms/symbol)")
+
+    if not args.skip_ta:
+        ta_time = time_it(add_all_indicators_ta, universe)
+        print(f"ta      : {ta_time:8.2f}s  ({ta_time / args.symbols * 1000:.2f} ms/symbol)")
+        print(f"speedup : {ta_time / kernel_time:8.1f}x")
+
+
+if __name__ == '__main__':
+    main()
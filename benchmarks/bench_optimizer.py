@@ -0,0 +1,100 @@
+"""
+Benchmark toi uu danh muc: uoc luong hiep phuong sai + 4 phuong phap o 100 / 250 / 500 ma
+
+Chay:
+    python benchmarks/bench_optimizer.py                   # 100, 250, 500 ma x 250 phien
+    python benchmarks/bench_optimizer.py --sizes 500 --days 500
+
+Khong goi mang: gia dong cua sinh ngau nhien (mo hinh 5 nhan to) duoc ghi
+san vao bang gia (ClosePanel) trong thu muc tam, nen buoc estimate do dung
+duong di thuc te: doc bang gia -> CovarianceService (Ledoit-Wolf, lan dau
+tinh va luu file) -> loi nhuan ky vong.
+"""
+import argparse
+import logging
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+
+sys.path.append(str(Path(__file__).parent.parent))
+
+from src.data_pipeline.close_panel import ClosePanel, last_trading_day
+from src.portfolio.covariance import CovarianceService
+from src.portfolio.optimizer import PortfolioOptimizer, METHODS
+from src.portfolio.returns import ReturnsEngine
+
+
+class NoFetchCrawler:
+    """Bang gia da du phien: khong co gi de lay them"""
+    cache_dir = ''
+
+    def get_historical_data(self, symbol, start_date=None, end_date=None, use_cache=True):
+        return pd.DataFrame()
+
+
+def make_panel(n_symbols, n_days, panel_file, seed=0):
+    """Ghi bang gia n_days phien x n_symbols ma (5 nhan to + nhieu rieng)"""
+    rng = np.random.default_rng(seed)
+    dates = pd.bdate_range(end=last_trading_day(), periods=n_days)
+    factors = rng.normal(0, 0.01, (n_days, 5))
+    loadings = rng.normal(0.8, 0.4, (n_symbols, 5))
+    returns = factors @ loadings.T * 0.5 + rng.normal(0.0004, 0.018, (n_days, n_symbols))
+    closes = 20000 * np.cumprod(1 + returns, axis=0)
+    symbols = [f'S{i:04d}' for i in range(n_symbols)]
+    panel = pd.DataFrame(closes, index=pd.DatetimeIndex(dates, name='date'), columns=symbols)
+    panel.to_parquet(panel_file)
+    return symbols
+
+
+def run_size(n, days, workdir):
+    panel_file = Path(workdir) / f'panel_{n}.parquet'
+    symbols = make_panel(n, days, panel_file)
+    panel = ClosePanel(NoFetchCrawler(), panel_file=panel_file)
+    covariance = CovarianceService(panel, cache_dir=Path(workdir) / f'covariance_{n}',
+                                   lookback_days=days * 2)
+    optimizer = PortfolioOptimizer(ReturnsEngine(panel), lookback_days=days * 2, covariance=covariance)
+
+    row = {'symbols': n}
+    started = time.perf_counter()
+    mu, cov = optimizer.estimate(symbols)
+    row['estimate_s'] = time.perf_counter() - started
+
+    for method in METHODS:
+        started = time.perf_counter()
+        result = optimizer.optimize(method=method, cov=cov, expected_returns=mu)
+        row[f'{method}_s'] = time.perf_counter() - started
+
+        weights = result['weights']
+        limits = optimizer.constraints
+        assert len(weights) <= limits['max_positions']
+        assert weights.max() <= limits['max_position_size'] + 1e-9
+        assert abs(weights.sum() - (1 - limits['min_cash_reserve'])) < 1e-6
+    return row
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[1])
+    parser.add_argument('--sizes', type=int, nargs='+', default=[100, 250, 500])
+    parser.add_argument('--days', type=int, default=250, help='So phien lich su')
+    args = parser.parse_args()
+
+    logging.disable(logging.INFO)
+
+    rows = []
+    with tempfile.TemporaryDirectory() as workdir:
+        for n in args.sizes:
+            rows.append(run_size(n, args.days, workdir))
+            print(f"{n} symbols done")
+
+    table = pd.DataFrame(rows).set_index('symbols')
+    print(f"\ndays={args.days}, constraints checked for every method")
+    print("\nSeconds:")
+    print(table.round(3).to_string())
+
+
+if __name__ == "__main__":
+    main()
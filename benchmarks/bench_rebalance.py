@@ -0,0 +1,62 @@
+"""
+Benchmark RebalanceEngine: mot ke hoach va quet nguong lech (K phuong an x N ma)
+
+Chay:
+    python benchmarks/bench_rebalance.py                   # 20, 100, 500 ma x 5,000 nguong
+    python benchmarks/bench_rebalance.py --sizes 50 --candidates 20000
+
+So vi the, gia va ty trong muc tieu sinh ngau nhien; khong can mang.
+"""
+import argparse
+import logging
+import sys
+import time
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+
+sys.path.append(str(Path(__file__).parent.parent))
+
+from src.portfolio.position_book import PositionBook
+from src.portfolio.rebalance import RebalanceEngine
+
+
+def run_size(n, candidates, seed=0):
+    rng = np.random.default_rng(seed)
+    symbols = [f'S{i:04d}' for i in range(n)]
+    book = PositionBook.from_records([
+        {'symbol': s, 'shares': int(rng.integers(1, 100)) * 100, 'avg_price': 20000.0} for s in symbols
+    ])
+    prices = {s: float(rng.uniform(5000, 150000)) for s in symbols}
+    target = pd.Series(rng.dirichlet(np.ones(n)) * 0.9, index=symbols)
+    engine = RebalanceEngine()
+
+    row = {'symbols': n}
+    started = time.perf_counter()
+    plan = engine.plan(book, 100_000_000, prices, target)
+    row['plan_s'] = time.perf_counter() - started
+    row['orders'] = plan['summary']['orders']
+
+    started = time.perf_counter()
+    engine.sweep(book, 100_000_000, prices, np.linspace(0, 0.05, candidates), target)
+    row['sweep_s'] = time.perf_counter() - started
+    row['candidates/s'] = candidates / row['sweep_s']
+    return row
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[1])
+    parser.add_argument('--sizes', type=int, nargs='+', default=[20, 100, 500])
+    parser.add_argument('--candidates', type=int, default=5000, help='So nguong trong mot lan quet')
+    args = parser.parse_args()
+
+    logging.disable(logging.INFO)
+
+    table = pd.DataFrame([run_size(n, args.candidates) for n in args.sizes]).set_index('symbols')
+    print(f"\ncandidates={args.candidates}")
+    print(table.round(4).to_string())
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,246 @@
+"""
+Benchmark toan thi truong: update, scan, screen o 100 / 500 / 1,600 ma
+
+Chay:
+    python benchmarks/bench_universe.py                        # 100, 500, 1600 ma
+    python benchmarks/bench_universe.py --sizes 100 --latency 0.05
+    python benchmarks/bench_universe.py --workers 16
+
+Khong goi mang: vnstock duoc thay bang FakeVnstock (cung giao dien
+stock().quote.history / finance.ratio / listing) tra du lieu sinh ngau
+nhien sau mot do tre gia lap moi lan goi. Cache gia, bang nganh va bang
+chi so duoc ghi vao thu muc tam, khong dong den data/.
+"""
+import argparse
+import logging
+import sys
+import tempfile
+import time
+import zlib
+from concurrent.futures import ThreadPoolExecutor
+from itertools import product
+from pathlib import Path
+from string import ascii_uppercase
+
+import numpy as np
+import pandas as pd
+
+sys.path.append(str(Path(__file__).parent.parent))
+
+from src.data_pipeline import price_data, fundamental_data
+from src.data_pipeline.price_data import PriceDataCrawler
+from src.data_pipeline.fundamental_data import FundamentalDataCrawler
+from src.data_pipeline.universe import UniverseRegistry
+from src.screener.fundamental_screener import StockScreener
+from src.screener.technical_scanner import TechnicalScanner
+
+# Ty le so ma theo san (xap xi thuc te: ~400 HOSE, ~330 HNX, ~870 UPCoM)
+EXCHANGE_SHARE = {'HOSE': 0.25, 'HNX': 0.20, 'UPCOM': 0.55}
+INDUSTRIES = ['Ngân hàng', 'Bất động sản', 'Thép', 'Bán lẻ', 'Phần mềm',
+              'Điện', 'Thực phẩm', 'Chứng khoán', 'Xây dựng', 'Hóa chất']
+
+
+# ==================== FAKE VNSTOCK ====================
+
+def _rng(symbol, salt=0):
+    return np.random.default_rng(zlib.crc32(symbol.encode()) + salt)
+
+
+class FakeQuote:
+    def __init__(self, symbol, latency):
+        self.symbol = symbol
+        self.latency = latency
+
+    def history(self, start, end, **kwargs):
+        time.sleep(self.latency)
+        dates = pd.bdate_range(start, end)
+        rng = _rng(self.symbol)
+        close = 20000 * np.cumprod(1 + rng.normal(0.0004, 0.02, len(dates)))
+        spread = np.abs(rng.normal(0, 0.01, len(dates))) * close
+        return pd.DataFrame({
+            'time': dates,
+            'open': close,
+            'high': close + spread,
+            'low': close - spread,
+            'close': close,
+            'volume': rng.integers(10_000, 5_000_000, len(dates))
+        })
+
+
+class FakeFinance:
+    def __init__(self, symbol, latency):
+        self.symbol = symbol
+        self.latency = latency
+
+    def ratio(self, **kwargs):
+        """8 quy gan nhat, cot MultiIndex nhu finance.ratio(lang='vi')"""
+        time.sleep(self.latency)
+        rng = _rng(self.symbol, salt=1)
+        n = 8
+        year = pd.Timestamp.now().year
+        columns = {
+            ('Meta', 'Năm'): [year - i // 4 for i in range(n)],
+            ('Meta', 'Kỳ'): [4 - i % 4 for i in range(n)],
+            ('Chỉ tiêu định giá', 'P/E'): rng.uniform(4, 35, n),
+            ('Chỉ tiêu định giá', 'P/B'): rng.uniform(0.5, 5, n),
+            ('Chỉ tiêu định giá', 'P/S'): rng.uniform(0.3, 6, n),
+            ('Chỉ tiêu định giá', 'EPS (VND)'): rng.uniform(500, 8000, n),
+            ('Chỉ tiêu định giá', 'BVPS (VND)'): rng.uniform(8000, 40000, n),
+            ('Chỉ tiêu định giá', 'EV/EBITDA'): rng.uniform(3, 20, n),
+            ('Chỉ tiêu khả năng sinh lợi', 'ROE (%)'): rng.uniform(2, 35, n),
+            ('Chỉ tiêu khả năng sinh lợi', 'ROA (%)'): rng.uniform(1, 15, n),
+            ('Chỉ tiêu khả năng sinh lợi', 'ROIC (%)'): rng.uniform(2, 30, n),
+            ('Chỉ tiêu khả năng sinh lợi', 'Biên lợi nhuận gộp (%)'): rng.uniform(5, 50, n),
+            ('Chỉ tiêu khả năng sinh lợi', 'Biên lợi nhuận ròng (%)'): rng.uniform(1, 30, n),
+            ('Chỉ tiêu khả năng sinh lợi', 'Biên EBIT (%)'): rng.uniform(2, 35, n),
+            ('Chỉ tiêu cơ cấu nguồn vốn', 'Nợ/VCSH'): rng.uniform(0.1, 4, n),
+            ('Chỉ tiêu thanh khoản', 'Chỉ số thanh toán hiện thời'): rng.uniform(0.5, 3, n),
+            ('Chỉ tiêu thanh khoản', 'Chỉ số thanh toán nhanh'): rng.uniform(0.3, 2, n),
+        }
+        return pd.DataFrame(columns, columns=pd.MultiIndex.from_tuples(columns))
+
+
+class FakeListing:
+    def __init__(self, symbols, latency):
+        self.symbols = symbols
+        self.latency = latency
+
+    def symbols_by_industries(self):
+        time.sleep(self.latency)
+        return pd.DataFrame({
+            'symbol': self.symbols,
+            'organ_name': [f'Công ty {s}' for s in self.symbols],
+            'icb_name3': [INDUSTRIES[zlib.crc32(s.encode()) % len(INDUSTRIES)]
+                          for s in self.symbols]
+        })
+
+    def symbols_by_exchange(self):
+        time.sleep(self.latency)
+        cuts = np.cumsum(list(EXCHANGE_SHARE.values())) * len(self.symbols)
+        exchanges = [list(EXCHANGE_SHARE)[np.searchsorted(cuts, i, side='right')]
+                     for i in range(len(self.symbols))]
+        # vnstock tra HSX cho HOSE; them mot ma trung de kiem tra dedup
+        exchanges = ['HSX' if e == 'HOSE' else e for e in exchanges]
+        return pd.DataFrame({'symbol': self.symbols + self.symbols[:1],
+                             'exchange': exchanges + exchanges[:1]})
+
+
+class FakeStock:
+    def __init__(self, symbol, universe, latency):
+        self.quote = FakeQuote(symbol, latency)
+        self.finance = FakeFinance(symbol, latency)
+        self.listing = FakeListing(universe, latency)
+
+
+def make_fake_vnstock(universe, latency):
+    """Lop thay the Vnstock (moi lan goi stock() la mot doi tuong moi nhu ban that)"""
+    class FakeVnstock:
+        def stock(self, symbol, source='VCI'):
+            return FakeStock(symbol, universe, latency)
+    return FakeVnstock
+
+
+def make_symbols(n):
+    """n ma 3 chu cai (AAA, AAB, ...)"""
+    return [''.join(letters) for letters in product(ascii_uppercase, repeat=3)][:n]
+
+
+# ==================== BENCHMARK ====================
+
+def timed(fn):
+    started = time.perf_counter()
+    result = fn()
+    return result, time.perf_counter() - started
+
+
+def run_size(n, latency, workers, workdir):
+    """Mot vong update -> scan -> screen tren n ma, tra dict thoi gian (giay)"""
+    symbols = make_symbols(n)
+    fake = make_fake_vnstock(symbols, latency)
+    price_data.Vnstock = fake
+    fundamental_data.Vnstock = fake
+
+    cache = Path(workdir) / f'n{n}'
+    cache.mkdir()
+
+    def price_crawler():
+        crawler = PriceDataCrawler()
+        crawler.cache_dir = cache
+        return crawler
+
+    def fundamental_crawler():
+        crawler = FundamentalDataCrawler()
+        crawler.industry_cache_file = cache / 'industries.parquet'
+        crawler.ratios_table_file = cache / 'ratios_table.parquet'
+        return crawler
+
+    row = {'symbols': n}
+
+    # Danh muc: listing -> registry (chuan hoa, loai trung)
+    registry = UniverseRegistry(universe_file=cache / 'universe.parquet')
+    universe, row['registry_s'] = timed(lambda: registry.refresh(fundamental_crawler()))
+    assert len(universe) == n
+
+    # Update gia (2 nam, bo qua cache) song song nhu mot dot cap nhat
+    crawler = price_crawler()
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        _, row['update_prices_s'] = timed(lambda: list(pool.map(
+            lambda s: crawler.get_historical_data(s, use_cache=False), symbols)))
+
+    # Update chi so co ban (refresh_ratios_table, tuan tu)
+    fundamentals = fundamental_crawler()
+    _, row['update_ratios_s'] = timed(lambda: fundamentals.refresh_ratios_table(symbols))
+
+    # Scan ky thuat tren cache gia vua tai
+    scanner = TechnicalScanner(watchlist=symbols)
+    scanner.price_crawler = crawler
+    _, row['scan_s'] = timed(lambda: scanner.scan_all(max_workers=workers))
+
+    # Screen day du (co ban + gia 1 nam + ky thuat cho moi ma)
+    screener = StockScreener(watchlist=symbols)
+    screener.price_crawler = price_crawler()
+    screener.fundamental_crawler = fundamentals
+    _, row['screen_s'] = timed(lambda: screener.screen_multiple_stocks(max_workers=workers))
+
+    # Screen 2 giai doan tren bang chi so da luu (cache gia 1 nam da co)
+    staged = StockScreener(watchlist=symbols)
+    staged.price_crawler = screener.price_crawler
+    staged.fundamental_crawler = fundamentals
+    _, row['screen_staged_s'] = timed(lambda: staged.screen_staged(max_workers=workers))
+    row['staged_survivors'] = staged.stage_report[0]['passed']
+
+    return row
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[1])
+    parser.add_argument('--sizes', type=int, nargs='+', default=[100, 500, 1600])
+    parser.add_argument('--latency', type=float, default=0.02,
+                        help='Do tre gia lap moi lan goi vnstock (giay)')
+    parser.add_argument('--workers', type=int, default=8)
+    args = parser.parse_args()
+
+    # Log INFO tung ma cua cac module lam nhieu ket qua
+    logging.disable(logging.INFO)
+
+    rows = []
+    with tempfile.TemporaryDirectory() as workdir:
+        for n in args.sizes:
+            row = run_size(n, args.latency, args.workers, workdir)
+            rows.append(row)
+            print(f"{n} symbols done")
+
+    table = pd.DataFrame(rows).set_index('symbols')
+    timing = [c for c in table.columns if c.endswith('_s')]
+    throughput = (1 / table[timing]).mul(table.index, axis=0)
+    throughput.columns = [c[:-2] + '/s' for c in timing]
+
+    print(f"\nlatency={args.latency * 1000:.0f}ms/call, workers={args.workers}")
+    print("\nSeconds:")
+    print(table.round(2).to_string())
+    print("\nSymbols per second:")
+    print(throughput.round(1).to_string())
+
+
+if __name__ == "__main__":
+    main()
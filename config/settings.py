@@ -18,8 +18,9 @@ CACHE_DIR = DATA_DIR / 'cache'
 for dir_path in [RAW_DATA_DIR, PROCESSED_DATA_DIR, CACHE_DIR]:
     dir_path.mkdir(parents=True, exist_ok=True)
 
-# Danh sách cổ phiếu theo dõi (VN30 + một số mã khác)
-WATCHLIST = [
+# Danh sách cổ phiếu theo dõi (VN30 + một số mã khác), đã loại mã trùng
+# Toàn thị trường (HOSE, HNX, UPCoM): src/data_pipeline/universe.py
+WATCHLIST = list(dict.fromkeys([
     'VNM', 'VCB', 'VHM', 'VIC', 'GAS', 'HPG', 'TCB',
     'BID', 'VPB', 'CTG', 'MWG', 'PLX', 'VRE', 'HDB',
     'SSI', 'MBB', 'FPT', 'STB', 'POW', 'ACB', 'VJC',
@@ -30,7 +31,7 @@ WATCHLIST = [
     'BVS','DBC','DRC','DGW','GEG','NKG','NLG','PAN',
     'TNG','PVT','CTR','CTD','CMC','MSN','PDR','HPG',
     'SHB','HHV','VIB','HVN','NVL'
-]
+]))
 
 # Tiêu chí sàng lọc cơ bản
 FUNDAMENTAL_CRITERIA = {
@@ -54,6 +55,27 @@ TECHNICAL_PARAMS = {
     'bb_std': 2
 }
 
+# Trọng số kết hợp điểm cơ bản / kỹ thuật trong StockScreener
+SCREENER_WEIGHTS = {
+    'fundamental': 0.6,
+    'technical': 0.4
+}
+
+# Định giá Monte Carlo (StockValuation.monte_carlo_valuation)
+# dist: normal(mean, std) | lognormal(median, sigma) | uniform(low, high)
+#       | triangular(low, mode, high) | fixed(value)
+MONTE_CARLO_PARAMS = {
+    'n_draws': 100_000,
+    'max_cells': 20_000_000,    # Tổng phần tử float64 sống cùng lúc mỗi batch (3 mảng draws × mã) ~160MB đỉnh
+    'percentiles': [5, 25, 50, 75, 95],
+    'distributions': {
+        'growth': {'dist': 'normal', 'mean': 0.10, 'std': 0.04},
+        'required_return': {'dist': 'normal', 'mean': None, 'std': 0.02},  # None = market_return
+        'peg': {'dist': 'lognormal', 'median': 1.0, 'sigma': 0.25},        # Fair P/E = PEG × g × 100
+        'pb_multiple': {'dist': 'lognormal', 'median': 1.0, 'sigma': 0.15}
+    }
+}
+
 # Cấu hình portfolio
 PORTFOLIO_CONFIG = {
     'max_positions': 8,
@@ -62,6 +84,16 @@ PORTFOLIO_CONFIG = {
     'rebalance_threshold': 0.05  # 5% chênh lệch
 }
 
+# Phí giao dịch và thanh toán
+# Biểu phí theo bậc: [(giá trị lệnh tối thiểu VND, tỷ lệ)], lấy bậc cao nhất <= giá trị lệnh
+TRADING_FEES = {
+    'buy_fee': [(0, 0.0015)],        # Phí môi giới khi mua 0.15%
+    'sell_fee': [(0, 0.0)],          # Phí môi giới khi bán (vd. [(0, 0.0015), (1e9, 0.001)])
+    'sell_tax': 0.001,               # Thuế TNCN 0.1% trên giá trị bán
+    'min_fee': 0,                    # Phí tối thiểu mỗi lệnh (VND)
+    'settlement_days': 2             # T+2: cổ phiếu mua / tiền bán về sau 2 ngày làm việc
+}
+
 # Cấu hình cập nhật dữ liệu
 UPDATE_SCHEDULE = {
     'price_data': '15:30',      # Sau giờ đóng cửa
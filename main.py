@@ -5,9 +5,13 @@ import argparse
 import logging
 from datetime import datetime
 
+import pandas as pd
+
 from src.data_pipeline.price_data import PriceDataCrawler
 from src.data_pipeline.fundamental_data import FundamentalDataCrawler
 from src.screener.fundamental_screener import StockScreener
+from src.screener.history import ScreenHistory
+from src.data_pipeline.universe import UniverseRegistry, EXCHANGES
 from src.portfolio.portfolio_manager import PortfolioManager
 from config.settings import WATCHLIST, LOG_FILE
 
@@ -23,14 +27,28 @@ logging.basicConfig(
 logger = logging.getLogger(__name__)
 
 
-def run_screener(symbols=None, save_results=True):
+def run_screener(symbols=None, save_results=True, staged=False, mode='thread',
+                 stream=False, stop_after=None, deadline=None, export_csv=False):
     """Chạy screener"""
     print("\n" + "="*80)
     print("RUNNING STOCK SCREENER")
     print("="*80)
     
     screener = StockScreener(watchlist=symbols or WATCHLIST)
-    results = screener.screen_multiple_stocks(max_workers=5)
+    if stream:
+        results = stream_screener(screener, stop_after=stop_after)
+    elif deadline:
+        results = screener.screen_with_deadline(deadline=deadline, max_workers=5)
+        report = screener.deadline_report
+        print(f"  {report['completed']} fresh, {len(report['late'])} late "
+              f"({len(report['filled_from_cache'])} filled from cache) in {report['elapsed']:.1f}s")
+    elif staged:
+        results = screener.screen_staged(max_workers=5)
+        for stage in screener.stage_report:
+            print(f"  {stage['stage']}: {stage['passed']}/{stage['input']} passed "
+                  f"({stage['seconds']:.2f}s)")
+    else:
+        results = screener.screen_multiple_stocks(max_workers=5, mode=mode)
     
     if not results.empty:
         print("\n📊 SCREENING RESULTS:\n")
@@ -50,15 +68,69 @@ def run_screener(symbols=None, save_results=True):
         else:
             print("Không có mã nào đạt tiêu chí BUY")
         
-        # Save to file
+        # Luu vao lich su sang loc
         if save_results:
+            run_ts = ScreenHistory().append_run(results)
+            print(f"\n💾 Results saved to screen history (run {run_ts})")
+        
+        if export_csv:
             filename = f"screening_results_{datetime.now().strftime('%Y%m%d_%H%M%S')}.csv"
             results.to_csv(filename, index=False)
-            print(f"\n💾 Results saved to: {filename}")
+            print(f"💾 Results exported to: {filename}")
     else:
         print("❌ No results found")
 
 
+def stream_screener(screener, stop_after=None):
+    """In từng mã ngay khi xong, trả về DataFrame các mã đã chạy"""
+    rows = []
+    
+    for event in screener.iter_screen(max_workers=5, stop_after=stop_after):
+        progress = f"[{event['completed']}/{event['total']}]"
+        row = event['row']
+        
+        if row:
+            rows.append(row)
+            print(f"{progress} {row['Symbol']:<6} {row['Rating']:<11} "
+                  f"Score {row['Score']:.2f}  RSI {row['RSI']:.1f}  "
+                  f"({event['elapsed']:.1f}s)")
+        else:
+            print(f"{progress} {event['symbol']:<6} ✗ không có dữ liệu")
+    
+    if not rows:
+        return pd.DataFrame()
+    return pd.DataFrame(rows).sort_values('Score', ascending=False)
+
+
+def show_history(action='diff', since=None, rating=None, import_dir=None):
+    """Truy vấn lịch sử sàng lọc"""
+    history = ScreenHistory()
+    
+    if import_dir:
+        count = history.import_csv(import_dir)
+        print(f"✓ Imported {count} screening runs")
+    
+    runs = history.runs()
+    if not runs:
+        print("❌ Chưa có lịch sử sàng lọc")
+        return
+    
+    print(f"\n📚 {len(runs)} runs ({runs[0]} → {runs[-1]})\n")
+    
+    if action == 'diff':
+        result = history.diff()
+        title = "Thay đổi so với lần chạy trước"
+    elif action == 'changes':
+        result = history.rating_changes(since=since)
+        title = f"Đổi rating từ {since or 'hôm nay'}"
+    else:
+        result = history.streaks(value=rating)
+        title = "Chuỗi rating hiện tại"
+    
+    print(title + ":")
+    print(result.to_string() if not result.empty else "  (không có)")
+
+
 def update_data(symbols=None):
     """Cập nhật dữ liệu mới nhất"""
     print("\n" + "="*80)
@@ -145,16 +217,61 @@ def main():
     """Main function"""
     parser = argparse.ArgumentParser(description='Vietnam Stock Analysis System')
     
-    parser.add_argument('command', choices=['screen', 'update', 'portfolio', 'analyze', 'dashboard'],
+    parser.add_argument('command', choices=['screen', 'update', 'portfolio', 'analyze', 'dashboard',
+                                            'history'],
                        help='Command to execute')
     parser.add_argument('-s', '--symbols', nargs='+', help='Stock symbols')
     parser.add_argument('--symbol', help='Single stock symbol for analysis')
+    # Cách chạy screen: chỉ chọn một (kết hợp sẽ bị argparse báo lỗi)
+    screen_mode = parser.add_mutually_exclusive_group()
+    screen_mode.add_argument('--staged', action='store_true',
+                       help='Screen: lọc cơ bản trước, chỉ mã đạt mới tải giá; '
+                            'thêm cột Fair_Value, Upside')
+    screen_mode.add_argument('--stream', action='store_true',
+                       help='Screen: in kết quả từng mã ngay khi xong')
+    screen_mode.add_argument('--deadline', type=float,
+                       help='Screen: tổng thời gian tối đa (giây), mã trễ dùng kết quả cũ; '
+                            'lệnh gọi treo không giữ chương trình khi thoát')
+    screen_mode.add_argument('--mode', choices=['thread', 'hybrid'],
+                       help='Screen: thread (mặc định) hoặc hybrid = tải dữ liệu bằng luồng, '
+                            'phân tích bằng tiến trình')
+    parser.add_argument('--stop-after', type=int,
+                       help='Screen --stream: dừng khi đủ số mã BUY/STRONG BUY')
+    parser.add_argument('--csv', action='store_true',
+                       help='Screen: xuất thêm file screening_results_*.csv')
+    parser.add_argument('--history', choices=['diff', 'changes', 'streaks'], default='diff',
+                       help='History: loại truy vấn')
+    parser.add_argument('--since', help='History changes: từ ngày (YYYY-MM-DD)')
+    parser.add_argument('--rating', help='History streaks: chỉ rating này (vd. BUY)')
+    parser.add_argument('--import-csv', metavar='DIR',
+                       help='History: nhập các file screening_results_*.csv trong thư mục')
+    parser.add_argument('--universe', nargs='*', choices=EXCHANGES, metavar='EXCHANGE',
+                       help='Screen/update: toàn thị trường thay cho WATCHLIST '
+                            '(có thể chỉ định sàn: HOSE HNX UPCOM)')
     
     args = parser.parse_args()
     
+    if args.universe is not None and not args.symbols:
+        # Không lùi về WATCHLIST: WATCHLIST không có sàn, kết quả sẽ sai âm thầm
+        registry = UniverseRegistry()
+        if not registry.universe_file.exists():
+            print(f"❌ {registry.universe_file} not found. Run first: python -m src.data_pipeline.universe")
+            return
+        args.symbols = registry.symbols(exchanges=args.universe)
+        if not args.symbols:
+            print(f"❌ No symbols on {', '.join(args.universe)} in {registry.universe_file}")
+            return
+        print(f"🌐 Universe: {len(args.symbols)} symbols ({', '.join(args.universe or EXCHANGES)})")
+    
     try:
         if args.command == 'screen':
-            run_screener(symbols=args.symbols)
+            run_screener(symbols=args.symbols, staged=args.staged, mode=args.mode or 'thread',
+                         stream=args.stream, stop_after=args.stop_after,
+                         deadline=args.deadline, export_csv=args.csv)
+        
+        elif args.command == 'history':
+            show_history(action=args.history, since=args.since, rating=args.rating,
+                         import_dir=args.import_csv)
         
         elif args.command == 'update':
             update_data(symbols=args.symbols)
@@ -4,17 +4,102 @@ Module phân tích cơ bản
 import pandas as pd
 import numpy as np
 import logging
+from src.analysis.sector_ranks import SectorRanker
 from config.settings import FUNDAMENTAL_CRITERIA
 
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
+# Bảng quy tắc chấm điểm dùng cho score_universe - giữ đúng thứ tự if/elif
+# và ngưỡng của score_stock. Mỗi nhánh: (điều kiện, điểm, mẫu lý do);
+# 'default' là nhánh else (None = không cộng điểm / không ghi lý do).
+# 'zero_is_missing': score_stock dùng `if ratios.get(...)` nên 0 bị bỏ qua
+# (riêng D/E dùng `is not None`); NaN luôn bị coi là thiếu (_known_ratios).
+SCORE_RULES = [
+    {
+        'field': 'roe', 'max_score': 10, 'zero_is_missing': True,
+        'branches': [
+            (lambda x: x >= 20, 10, 'ROE xuất sắc: {:.1f}%'),
+            (lambda x: x >= 15, 7, 'ROE tốt: {:.1f}%'),
+            (lambda x: x >= 10, 4, 'ROE trung bình: {:.1f}%'),
+        ],
+        'default': (0, 'ROE thấp: {:.1f}%'),
+    },
+    {
+        'field': 'pe', 'max_score': 10, 'zero_is_missing': True,
+        'branches': [
+            (lambda x: (x >= 8) & (x <= 15), 10, 'P/E hấp dẫn: {:.1f}x'),
+            (lambda x: (x > 15) & (x <= 20), 6, 'P/E hợp lý: {:.1f}x'),
+            (lambda x: (x >= 5) & (x < 8), 5, 'P/E thấp (value trap?): {:.1f}x'),
+            (lambda x: x > 25, 0, 'P/E cao: {:.1f}x'),
+        ],
+        'default': (3, None),
+    },
+    {
+        'field': 'pb', 'max_score': 8, 'zero_is_missing': True,
+        'branches': [
+            (lambda x: x < 1.5, 8, 'P/B rất tốt: {:.2f}x'),
+            (lambda x: x < 2.5, 5, 'P/B hợp lý: {:.2f}x'),
+            (lambda x: x < 4, 2, 'P/B cao: {:.2f}x'),
+        ],
+        'default': (0, 'P/B rất cao: {:.2f}x'),
+    },
+    {
+        'field': 'debt_to_equity', 'max_score': 10, 'zero_is_missing': False,
+        'branches': [
+            (lambda x: x < 0.5, 10, 'Nợ rất thấp: {:.2f}x'),
+            (lambda x: x < 1, 7, 'Nợ thấp: {:.2f}x'),
+            (lambda x: x < 2, 4, 'Nợ trung bình: {:.2f}x'),
+        ],
+        'default': (1, 'Nợ cao: {:.2f}x'),
+    },
+    {
+        'field': 'roa', 'max_score': 7, 'zero_is_missing': True,
+        'branches': [
+            (lambda x: x >= 10, 7, 'ROA tốt: {:.1f}%'),
+            (lambda x: x >= 5, 4, 'ROA trung bình: {:.1f}%'),
+        ],
+        'default': (1, 'ROA thấp: {:.1f}%'),
+    },
+    {
+        'field': 'net_margin', 'max_score': 8, 'zero_is_missing': True,
+        'branches': [
+            (lambda x: x >= 15, 8, 'Biên lợi nhuận cao: {:.1f}%'),
+            (lambda x: x >= 10, 5, 'Biên lợi nhuận tốt: {:.1f}%'),
+            (lambda x: x >= 5, 2, 'Biên lợi nhuận thấp: {:.1f}%'),
+        ],
+        'default': (0, None),
+    },
+    {
+        'field': 'current_ratio', 'max_score': 7, 'zero_is_missing': True,
+        'branches': [
+            (lambda x: (x >= 1.5) & (x <= 3), 7, 'Thanh khoản tốt: {:.2f}'),
+            (lambda x: (x >= 1) & (x < 1.5), 4, 'Thanh khoản ổn: {:.2f}'),
+            (lambda x: x < 1, 0, 'Thanh khoản yếu: {:.2f}'),
+        ],
+        'default': (3, 'Thanh khoản dư thừa: {:.2f}'),
+    },
+]
+
+RATING_THRESHOLDS = [
+    (80, 'EXCELLENT'),
+    (65, 'GOOD'),
+    (50, 'AVERAGE'),
+    (35, 'BELOW AVERAGE'),
+]
+
 
 class FundamentalAnalyzer:
     """Phân tích cơ bản cổ phiếu"""
     
-    def __init__(self, criteria=None):
+    def __init__(self, criteria=None, sector_ranker=None):
         self.criteria = criteria or FUNDAMENTAL_CRITERIA
+        self.sector_ranker = sector_ranker or SectorRanker()
+    
+    @staticmethod
+    def _known_ratios(ratios: dict):
+        """Bỏ các chỉ số NaN (vnstock hay trả NaN) để chúng được coi như thiếu key"""
+        return {k: v for k, v in ratios.items() if not (np.isscalar(v) and pd.isna(v))}
     
     def score_stock(self, ratios: dict):
         """
@@ -26,6 +111,7 @@ class FundamentalAnalyzer:
         Returns:
             dict với score và lý do
         """
+        ratios = self._known_ratios(ratios)
         score = 0
         max_score = 0
         reasons = []
@@ -164,8 +250,93 @@ class FundamentalAnalyzer:
             'reasons': reasons
         }
     
+    def score_universe(self, ratios_df: pd.DataFrame, with_reasons: bool = False):
+        """
+        Chấm điểm toàn bộ universe một lần (vector hóa)
+        
+        Cùng ngưỡng và kết quả với score_stock, nhưng áp dụng bằng np.select
+        trên từng cột thay vì if/elif cho từng mã.
+        
+        Args:
+            ratios_df: DataFrame mỗi dòng một mã, các cột roe, pe, pb,
+                       debt_to_equity, roa, net_margin, current_ratio
+                       (thiếu cột hoặc NaN = không có dữ liệu, như key None trong dict)
+            with_reasons: True = sinh thêm cột 'reasons' (list lý do như score_stock)
+            
+        Returns:
+            DataFrame cùng index với các cột score, max_score, percentage, rating
+            (và reasons nếu yêu cầu)
+        """
+        n = len(ratios_df)
+        score = np.zeros(n, dtype=np.int64)
+        max_score = 0
+        chosen = []
+        
+        for rule in SCORE_RULES:
+            max_score += rule['max_score']
+            
+            if rule['field'] in ratios_df.columns:
+                values = pd.to_numeric(ratios_df[rule['field']], errors='coerce').to_numpy(dtype=float)
+            else:
+                values = np.full(n, np.nan)
+            
+            present = ~np.isnan(values)
+            if rule['zero_is_missing']:
+                present &= values != 0
+            
+            with np.errstate(invalid='ignore'):
+                conditions = [cond(values) for cond, _, _ in rule['branches']]
+            branch = np.select(conditions, np.arange(len(conditions)), default=len(conditions))
+            
+            points = np.array([pts for _, pts, _ in rule['branches']] + [rule['default'][0]])
+            score += np.where(present, points[branch], 0)
+            chosen.append((rule, values, present, branch))
+        
+        percentage = score / max_score * 100 if max_score > 0 else np.zeros(n)
+        
+        rating = np.select(
+            [percentage >= threshold for threshold, _ in RATING_THRESHOLDS],
+            [label for _, label in RATING_THRESHOLDS],
+            default='POOR'
+        )
+        
+        result = pd.DataFrame({
+            'score': score,
+            'max_score': max_score,
+            'percentage': percentage,
+            'rating': rating
+        }, index=ratios_df.index)
+        
+        if with_reasons:
+            result['reasons'] = self._universe_reasons(chosen, n)
+        
+        return result
+    
+    @staticmethod
+    def _universe_reasons(chosen, n):
+        """Sinh list lý do cho từng dòng - chỉ chạy khi được yêu cầu"""
+        reasons = [[] for _ in range(n)]
+        
+        for rule, values, present, branch in chosen:
+            templates = [tmpl for _, _, tmpl in rule['branches']] + [rule['default'][1]]
+            for i in np.flatnonzero(present):
+                template = templates[branch[i]]
+                if template is not None:
+                    reasons[i].append(template.format(values[i]))
+        
+        return reasons
+    
+    @staticmethod
+    def ratios_frame(ratios_list):
+        """Chuyển list dict chỉ số (như get_financial_ratios) thành DataFrame theo symbol"""
+        df = pd.DataFrame([r for r in ratios_list if r])
+        if 'symbol' in df.columns:
+            df = df.set_index('symbol')
+        return df
+    
     def check_criteria(self, ratios: dict):
-        """Kiểm tra xem cổ phiếu có đáp ứng tiêu chí sàng lọc không"""
+        """Kiểm tra xem cổ phiếu có đáp ứng tiêu chí sàng lọc không (NaN = không có dữ liệu)"""
+        ratios = self._known_ratios(ratios)
         passed = []
         failed = []
         
@@ -198,6 +369,44 @@ class FundamentalAnalyzer:
             'failed': failed
         }
     
+    def check_universe(self, ratios_df: pd.DataFrame):
+        """
+        Kiểm tra tiêu chí sàng lọc cho toàn bộ universe (vector hóa)
+        
+        Cùng quy tắc với check_criteria: ROE/P/E bằng 0 hoặc NaN bị bỏ qua,
+        D/E chỉ bỏ qua khi NaN; đạt khi không trượt tiêu chí nào và có ít nhất
+        2 tiêu chí được kiểm tra đạt.
+        
+        Returns:
+            DataFrame cùng index với các cột passed_count, failed_count, meets_criteria
+        """
+        def column(name):
+            if name in ratios_df.columns:
+                return pd.to_numeric(ratios_df[name], errors='coerce').to_numpy(dtype=float)
+            return np.full(len(ratios_df), np.nan)
+        
+        roe = column('roe')
+        pe = column('pe')
+        de = column('debt_to_equity')
+        
+        checks = [
+            (~np.isnan(roe) & (roe != 0), roe >= self.criteria['min_roe']),
+            (~np.isnan(pe) & (pe != 0), (pe <= self.criteria['max_pe']) & (pe > 0)),
+            (~np.isnan(de), de <= self.criteria['max_debt_to_equity']),
+        ]
+        
+        passed_count = np.zeros(len(ratios_df), dtype=np.int64)
+        failed_count = np.zeros(len(ratios_df), dtype=np.int64)
+        for present, ok in checks:
+            passed_count += present & ok
+            failed_count += present & ~ok
+        
+        return pd.DataFrame({
+            'passed_count': passed_count,
+            'failed_count': failed_count,
+            'meets_criteria': (failed_count == 0) & (passed_count >= 2)
+        }, index=ratios_df.index)
+    
     def calculate_intrinsic_value_simple(self, ratios: dict, growth_rate: float = 0.1):
         """
         Tính giá trị nội tại đơn giản (PE-based)
@@ -253,6 +462,7 @@ class FundamentalAnalyzer:
             'scoring': scoring,
             'criteria': criteria_check,
             'valuation': valuation,
+            'sector_relative': self.sector_ranker.get(symbol),
             'recommendation': self._generate_recommendation(scoring, criteria_check, ratios)
         }
         
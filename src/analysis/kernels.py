@@ -0,0 +1,241 @@
+"""
+Kernel tinh toan chi bao ky thuat tren numpy array
+
+Cac chi bao de quy (EMA, RSI Wilder, ATR) va cuc tri cua so truot
+(Stochastic) la tuan tu nen cham khi viet bang pandas/python. Neu co
+Numba, cac vong lap duoc JIT; neu khong, dung NumPy/pandas tuong duong.
+Ket qua khop voi thu vien `ta` (xem tests/test_kernels.py).
+
+Tat ca ham nhan va tra ve numpy array float64, khong co index.
+"""
+import logging
+
+import numpy as np
+import pandas as pd
+
+try:
+    from numba import njit
+    HAS_NUMBA = True
+except ImportError:
+    HAS_NUMBA = False
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+BACKEND = 'numba' if HAS_NUMBA else 'numpy'
+
+
+# ==================== VONG LAP (JIT DUOC) ====================
+
+def _ewm_mean_loop(x, alpha, min_periods):
+    """
+    EWM mean voi adjust=False, ignore_na=False - cung thuat toan voi pandas
+    (pandas/_libs/window/aggregations.pyx: ewm)
+    """
+    n = x.shape[0]
+    out = np.empty(n)
+    if n == 0:
+        return out
+
+    weighted = x[0]
+    nobs = 1 if weighted == weighted else 0
+    out[0] = weighted if nobs >= min_periods else np.nan
+    old_wt_factor = 1.0 - alpha
+    old_wt = 1.0
+
+    for i in range(1, n):
+        cur = x[i]
+        is_obs = cur == cur
+        if is_obs:
+            nobs += 1
+        if weighted == weighted:
+            old_wt *= old_wt_factor
+            if is_obs:
+                if weighted != cur:
+                    weighted = (old_wt * weighted + alpha * cur) / (old_wt + alpha)
+                old_wt = 1.0
+        elif is_obs:
+            weighted = cur
+        out[i] = weighted if nobs >= min_periods else np.nan
+
+    return out
+
+
+def _wilder_atr_loop(true_range, window):
+    """ATR kieu `ta`: 0 truoc phien window-1, khoi tao bang trung binh TR"""
+    n = true_range.shape[0]
+    out = np.zeros(n)
+    if n < window:
+        return out
+
+    total = 0.0
+    for i in range(window):
+        total += true_range[i]
+    out[window - 1] = total / window
+
+    for i in range(window, n):
+        out[i] = (out[i - 1] * (window - 1) + true_range[i]) / window
+
+    return out
+
+
+def _rolling_extreme_loop(x, window, find_max):
+    """
+    Min/max cua so truot O(n) bang hang doi don dieu (monotonic deque)
+
+    Cua so co NaN cho NaN, giong ban NumPy va rolling(window).min/max.
+    """
+    n = x.shape[0]
+    out = np.full(n, np.nan)
+    queue = np.empty(n, dtype=np.int64)
+    head = 0
+    tail = 0
+    last_nan = -window
+
+    for i in range(n):
+        if x[i] != x[i]:
+            last_nan = i
+            head = tail
+            continue
+        if find_max:
+            while tail > head and x[queue[tail - 1]] <= x[i]:
+                tail -= 1
+        else:
+            while tail > head and x[queue[tail - 1]] >= x[i]:
+                tail -= 1
+        queue[tail] = i
+        tail += 1
+
+        if queue[head] <= i - window:
+            head += 1
+        if i - last_nan >= window and i >= window - 1:
+            out[i] = x[queue[head]]
+
+    return out
+
+
+if HAS_NUMBA:
+    _ewm_mean_jit = njit(cache=True)(_ewm_mean_loop)
+    _wilder_atr_jit = njit(cache=True)(_wilder_atr_loop)
+    _rolling_extreme_jit = njit(cache=True)(_rolling_extreme_loop)
+
+
+# ==================== KERNEL CONG KHAI ====================
+
+def _as_float(x):
+    return np.ascontiguousarray(x, dtype=np.float64)
+
+
+def ewm_mean(x, alpha, min_periods=0):
+    """EWM mean (adjust=False), tuong duong Series.ewm(alpha=...).mean()"""
+    x = _as_float(x)
+    if HAS_NUMBA:
+        return _ewm_mean_jit(x, float(alpha), int(min_periods))
+    return pd.Series(x).ewm(alpha=alpha, min_periods=min_periods, adjust=False).mean().to_numpy()
+
+
+def ema(x, span):
+    """EMA giong ta.trend.EMAIndicator (min_periods = span)"""
+    return ewm_mean(x, 2.0 / (span + 1.0), span)
+
+
+def sma(x, window):
+    """SMA giong ta.trend.SMAIndicator"""
+    return pd.Series(_as_float(x)).rolling(window, min_periods=window).mean().to_numpy()
+
+
+def rolling_std(x, window):
+    """Do lech chuan truot ddof=0 (Bollinger Bands)"""
+    return pd.Series(_as_float(x)).rolling(window, min_periods=window).std(ddof=0).to_numpy()
+
+
+def rsi(close, window=14):
+    """RSI Wilder giong ta.momentum.RSIIndicator"""
+    close = _as_float(close)
+    diff = np.empty_like(close)
+    if close.shape[0]:
+        diff[0] = np.nan
+        diff[1:] = close[1:] - close[:-1]
+
+    # Phien dau (diff NaN) duoc tinh la 0, giong diff.where(...) trong ta
+    up = np.where(diff > 0, diff, 0.0)
+    down = np.where(diff < 0, -diff, 0.0)
+
+    ema_up = ewm_mean(up, 1.0 / window, window)
+    ema_down = ewm_mean(down, 1.0 / window, window)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        out = np.where(ema_down == 0, 100.0, 100.0 - 100.0 / (1.0 + ema_up / ema_down))
+    return out
+
+
+def macd(close, fast=12, slow=26, signal=9):
+    """MACD, signal, histogram giong ta.trend.MACD"""
+    line = ema(close, fast) - ema(close, slow)
+    signal_line = ema(line, signal)
+    return line, signal_line, line - signal_line
+
+
+def true_range(high, low, close):
+    """True range; phien dau chi dung high - low"""
+    high, low, close = _as_float(high), _as_float(low), _as_float(close)
+    prev_close = np.empty_like(close)
+    if close.shape[0]:
+        prev_close[0] = np.nan
+        prev_close[1:] = close[:-1]
+    return np.fmax(high - low, np.fmax(np.abs(high - prev_close), np.abs(low - prev_close)))
+
+
+def atr(high, low, close, window=14):
+    """ATR giong ta.volatility.AverageTrueRange"""
+    tr = true_range(high, low, close)
+    if HAS_NUMBA:
+        return _wilder_atr_jit(tr, int(window))
+
+    out = np.zeros(tr.shape[0])
+    if tr.shape[0] < window:
+        return out
+    seeded = tr[window - 1:].copy()
+    seeded[0] = tr[:window].mean()
+    out[window - 1:] = ewm_mean(seeded, 1.0 / window)
+    return out
+
+
+def rolling_min(x, window):
+    """Min cua so truot (min_periods = window)"""
+    x = _as_float(x)
+    if HAS_NUMBA:
+        return _rolling_extreme_jit(x, int(window), False)
+    out = np.full(x.shape[0], np.nan)
+    if x.shape[0] >= window:
+        out[window - 1:] = np.lib.stride_tricks.sliding_window_view(x, window).min(axis=1)
+    return out
+
+
+def rolling_max(x, window):
+    """Max cua so truot (min_periods = window)"""
+    x = _as_float(x)
+    if HAS_NUMBA:
+        return _rolling_extreme_jit(x, int(window), True)
+    out = np.full(x.shape[0], np.nan)
+    if x.shape[0] >= window:
+        out[window - 1:] = np.lib.stride_tricks.sliding_window_view(x, window).max(axis=1)
+    return out
+
+
+def stochastic(high, low, close, window=14, smooth_window=3):
+    """%K va %D giong ta.momentum.StochasticOscillator"""
+    low_min = rolling_min(low, window)
+    high_max = rolling_max(high, window)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        k = 100.0 * (_as_float(close) - low_min) / (high_max - low_min)
+    d = sma(k, smooth_window)
+    return k, d
+
+
+def obv(close, volume):
+    """On Balance Volume giong ta.volume.OnBalanceVolumeIndicator"""
+    close, volume = _as_float(close), _as_float(volume)
+    signed = volume.copy()
+    if close.shape[0] > 1:
+        signed[1:] = np.where(close[1:] < close[:-1], -volume[1:], volume[1:])
+    return np.cumsum(signed)
@@ -0,0 +1,323 @@
+"""
+Module quet tham so (parameter sweep) cho TECHNICAL_PARAMS
+
+Danh gia mot luoi (grid) cac bo tham so ky thuat tren nhieu ma cung luc.
+Cac dai luong trung gian (prefix sum cua gia, EMA theo tung span, RSI theo
+tung chu ky, true range) duoc tinh mot lan cho moi ma va dung chung cho
+toan bo luoi, thay vi goi lai add_all_indicators cho tung to hop.
+"""
+import itertools
+import logging
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+import pandas as pd
+
+from src.analysis import kernels
+from config.settings import TECHNICAL_PARAMS
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+# Cac cot thong ke tra ve cho moi to hop tham so
+STAT_COLUMNS = [
+    'n_symbols', 'n_bars', 'n_buy', 'n_sell', 'buy_rate', 'sell_rate',
+    'buy_fwd_return', 'buy_hit_rate', 'buy_fwd_atr',
+    'sell_fwd_return', 'sell_hit_rate'
+]
+
+
+class _SharedSeries:
+    """
+    Cac dai luong trung gian cua mot ma, dung chung cho moi to hop tham so
+
+    SMA va do lech chuan Bollinger lay tu prefix sum; EMA va RSI duoc cache
+    theo span/chu ky nen moi gia tri chi tinh mot lan cho ca luoi.
+    """
+
+    def __init__(self, close, high, low, horizon, atr_window=14):
+        self.close = np.asarray(close, dtype=float)
+        self.high = np.asarray(high, dtype=float)
+        self.low = np.asarray(low, dtype=float)
+        self.n = len(self.close)
+
+        # Prefix sum tren gia da tru trung binh de giam sai so lam tron
+        self._offset = self.close.mean() if self.n else 0.0
+        centered = self.close - self._offset
+        self._csum = np.concatenate(([0.0], np.cumsum(centered)))
+        self._csum2 = np.concatenate(([0.0], np.cumsum(centered ** 2)))
+
+        self._ema_cache = {}
+        self._rsi_cache = {}
+        self._sma_cache = {}
+
+        # True range va ATR (Wilder) - khong phu thuoc vao luoi tham so
+        self.true_range = kernels.true_range(self.high, self.low, self.close)
+        self.atr = kernels.atr(self.high, self.low, self.close, window=atr_window)
+        self.atr[self.atr == 0] = np.nan
+
+        # Loi nhuan tuong lai sau `horizon` phien
+        self.fwd_return = np.full(self.n, np.nan)
+        if self.n > horizon:
+            self.fwd_return[:-horizon] = self.close[horizon:] / self.close[:-horizon] - 1
+
+    def sma(self, window):
+        if window not in self._sma_cache:
+            out = np.full(self.n, np.nan)
+            if self.n >= window:
+                out[window - 1:] = (self._csum[window:] - self._csum[:-window]) / window
+                out[window - 1:] += self._offset
+            self._sma_cache[window] = out
+        return self._sma_cache[window]
+
+    def rolling_std(self, window):
+        """Do lech chuan truot (ddof=0) tu prefix sum, giong BollingerBands cua ta"""
+        out = np.full(self.n, np.nan)
+        if self.n >= window:
+            s1 = self._csum[window:] - self._csum[:-window]
+            s2 = self._csum2[window:] - self._csum2[:-window]
+            var = s2 / window - (s1 / window) ** 2
+            out[window - 1:] = np.sqrt(np.maximum(var, 0.0))
+        return out
+
+    def ema(self, span):
+        if span not in self._ema_cache:
+            self._ema_cache[span] = kernels.ema(self.close, span)
+        return self._ema_cache[span]
+
+    def rsi(self, period):
+        if period not in self._rsi_cache:
+            self._rsi_cache[period] = kernels.rsi(self.close, period)
+        return self._rsi_cache[period]
+
+
+def signal_scores(shared: _SharedSeries, params: dict):
+    """
+    Diem tin hieu cho toan bo chuoi gia, cung quy tac voi
+    TechnicalAnalyzer.generate_signals nhung tinh vector hoa tren moi phien.
+
+    MA trung han / dai han lay tu hai phan tu cuoi cua ma_periods
+    (mac dinh SMA_50 va SMA_200). Nguong RSI lay tu params
+    (oversold, oversold + 10, overbought, overbought - 10).
+
+    Returns:
+        (score, valid): mang diem va mat na cac phien du du lieu
+    """
+    close = shared.close
+    ma_mid, ma_long = sorted(params['ma_periods'])[-2:]
+    sma_mid = shared.sma(ma_mid)
+    sma_long = shared.sma(ma_long)
+
+    rsi = shared.rsi(params['rsi_period'])
+    oversold = params['rsi_oversold']
+    overbought = params['rsi_overbought']
+
+    macd = shared.ema(params['macd_fast']) - shared.ema(params['macd_slow'])
+    macd_signal = kernels.ema(macd, params['macd_signal'])
+    macd_diff = macd - macd_signal
+
+    bb_mid = shared.sma(params['bb_period'])
+    bb_dev = params['bb_std'] * shared.rolling_std(params['bb_period'])
+    bb_upper = bb_mid + bb_dev
+    bb_lower = bb_mid - bb_dev
+
+    score = np.select(
+        [rsi < oversold, rsi < oversold + 10, rsi > overbought, rsi > overbought - 10],
+        [2, 1, -2, -1], 0
+    )
+    score += np.select(
+        [(macd > macd_signal) & (macd_diff > 0), macd < macd_signal],
+        [1, -1], 0
+    )
+    score += np.select(
+        [(close > sma_mid) & (sma_mid > sma_long), (close < sma_mid) & (sma_mid < sma_long)],
+        [2, -2], 0
+    )
+    score += np.select([close < bb_lower, close > bb_upper], [1, -1], 0)
+
+    valid = ~(np.isnan(rsi) | np.isnan(macd_signal) | np.isnan(sma_long) | np.isnan(bb_mid))
+    return score, valid
+
+
+def _symbol_stats(shared: _SharedSeries, params: dict):
+    """Tong hop (sum/count) cho mot ma - cong duoc giua cac ma"""
+    score, valid = signal_scores(shared, params)
+    fwd = shared.fwd_return
+    has_fwd = valid & ~np.isnan(fwd)
+
+    buy = valid & (score >= 1)
+    sell = valid & (score <= -1)
+    buy_fwd = buy & has_fwd
+    sell_fwd = sell & has_fwd
+
+    with np.errstate(divide='ignore', invalid='ignore'):
+        fwd_atr = fwd * shared.close / shared.atr
+    buy_atr = buy_fwd & np.isfinite(fwd_atr)
+
+    return {
+        'n_bars': int(valid.sum()),
+        'n_buy': int(buy.sum()),
+        'n_sell': int(sell.sum()),
+        'n_buy_fwd': int(buy_fwd.sum()),
+        'sum_buy_fwd': float(fwd[buy_fwd].sum()),
+        'n_buy_win': int((fwd[buy_fwd] > 0).sum()),
+        'n_buy_atr': int(buy_atr.sum()),
+        'sum_buy_atr': float(fwd_atr[buy_atr].sum()),
+        'n_sell_fwd': int(sell_fwd.sum()),
+        'sum_sell_fwd': float(fwd[sell_fwd].sum()),
+        'n_sell_win': int((fwd[sell_fwd] < 0).sum()),
+    }
+
+
+def _run_chunk(chunk, combos, horizon):
+    """
+    Worker cho process pool: xu ly mot nhom ma tren toan bo luoi
+
+    Args:
+        chunk: list (symbol, close, high, low) dang numpy array
+        combos: list cac dict tham so
+    """
+    rows = []
+    for symbol, close, high, low in chunk:
+        shared = _SharedSeries(close, high, low, horizon)
+        for combo_id, params in enumerate(combos):
+            stats = _symbol_stats(shared, params)
+            stats['combo_id'] = combo_id
+            stats['symbol'] = symbol
+            rows.append(stats)
+    return rows
+
+
+class ParameterSweep:
+    """Quet luoi tham so ky thuat tren nhieu ma"""
+
+    def __init__(self, base_params=None, horizon=20, max_workers=None, chunk_size=16):
+        """
+        Args:
+            base_params: Tham so goc, cac key khong co trong grid lay tu day
+            horizon: So phien de do loi nhuan sau tin hieu
+            max_workers: So process; 1 = chay tuan tu trong process hien tai
+            chunk_size: So ma moi lan gui sang process pool
+        """
+        self.base_params = base_params or TECHNICAL_PARAMS
+        self.horizon = horizon
+        self.max_workers = max_workers
+        self.chunk_size = chunk_size
+
+    def expand_grid(self, grid: dict):
+        """
+        Sinh danh sach bo tham so tu grid
+
+        Args:
+            grid: dict ten tham so -> list gia tri,
+                  VD: {'rsi_period': [9, 14], 'ma_periods': [[20, 50, 200], [10, 30, 100]]}
+
+        Returns:
+            list cac dict tham so day du (bo qua to hop macd_fast >= macd_slow)
+        """
+        keys = list(grid.keys())
+        combos = []
+        for values in itertools.product(*(grid[k] for k in keys)):
+            params = dict(self.base_params)
+            params.update(zip(keys, values))
+            if params['macd_fast'] >= params['macd_slow']:
+                continue
+            combos.append(params)
+        return combos
+
+    def run(self, price_data: dict, grid: dict, by_symbol=False):
+        """
+        Chay sweep
+
+        Args:
+            price_data: dict symbol -> DataFrame (close, high, low)
+            grid: xem expand_grid
+            by_symbol: True = tra ve mot dong cho moi (to hop, ma)
+
+        Returns:
+            DataFrame tidy: cot tham so + thong ke tin hieu cho moi to hop
+        """
+        combos = self.expand_grid(grid)
+        if not combos or not price_data:
+            return pd.DataFrame()
+
+        items = [
+            (symbol, df['close'].to_numpy(float), df['high'].to_numpy(float), df['low'].to_numpy(float))
+            for symbol, df in price_data.items()
+            if df is not None and not df.empty
+        ]
+        if not items:
+            return pd.DataFrame()
+        chunks = [items[i:i + self.chunk_size] for i in range(0, len(items), self.chunk_size)]
+
+        logger.info(f"Sweeping {len(combos)} combinations over {len(items)} symbols "
+                    f"({len(chunks)} chunks)")
+
+        rows = []
+        if self.max_workers == 1 or len(chunks) == 1:
+            for chunk in chunks:
+                rows.extend(_run_chunk(chunk, combos, self.horizon))
+        else:
+            with ProcessPoolExecutor(max_workers=self.max_workers) as executor:
+                futures = [
+                    executor.submit(_run_chunk, chunk, combos, self.horizon)
+                    for chunk in chunks
+                ]
+                for future in futures:
+                    rows.extend(future.result())
+
+        raw = pd.DataFrame(rows)
+        params_df = self._params_frame(combos, grid)
+
+        if by_symbol:
+            table = self._finalize(raw.assign(n_symbols=1))
+            return params_df.merge(table, on='combo_id').sort_values(['combo_id', 'symbol'])
+
+        sums = raw.drop(columns='symbol').groupby('combo_id').sum()
+        sums['n_symbols'] = raw.groupby('combo_id')['symbol'].nunique()
+        table = self._finalize(sums.reset_index())
+        return params_df.merge(table, on='combo_id')
+
+    @staticmethod
+    def _params_frame(combos, grid):
+        """Cot tham so cua cac key trong grid (list duoc doi thanh chuoi)"""
+        records = []
+        for combo_id, params in enumerate(combos):
+            row = {'combo_id': combo_id}
+            for key in grid:
+                value = params[key]
+                row[key] = '/'.join(map(str, value)) if isinstance(value, (list, tuple)) else value
+            records.append(row)
+        return pd.DataFrame(records)
+
+    @staticmethod
+    def _finalize(sums: pd.DataFrame):
+        """Doi cac tong sum/count thanh ty le va trung binh"""
+        out = sums.copy()
+        with np.errstate(divide='ignore', invalid='ignore'):
+            out['buy_rate'] = out['n_buy'] / out['n_bars']
+            out['sell_rate'] = out['n_sell'] / out['n_bars']
+            out['buy_fwd_return'] = out['sum_buy_fwd'] / out['n_buy_fwd']
+            out['buy_hit_rate'] = out['n_buy_win'] / out['n_buy_fwd']
+            out['buy_fwd_atr'] = out['sum_buy_atr'] / out['n_buy_atr']
+            out['sell_fwd_return'] = out['sum_sell_fwd'] / out['n_sell_fwd']
+            out['sell_hit_rate'] = out['n_sell_win'] / out['n_sell_fwd']
+        keys = ['combo_id', 'symbol'] if 'symbol' in out.columns else ['combo_id']
+        return out[keys + STAT_COLUMNS]
+
+
+# Example usage
+if __name__ == "__main__":
+    from src.data_pipeline.price_data import PriceDataCrawler
+
+    crawler = PriceDataCrawler()
+    data = crawler.get_multiple_stocks(['VNM', 'VCB', 'FPT'], start_date='2023-10-22')
+
+    sweep = ParameterSweep(horizon=20)
+    results = sweep.run(data, grid={
+        'rsi_period': [9, 14, 21],
+        'rsi_oversold': [25, 30],
+        'bb_std': [2, 2.5],
+    })
+
+    print(results.sort_values('buy_fwd_return', ascending=False).to_string(index=False))
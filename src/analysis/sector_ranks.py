@@ -0,0 +1,141 @@
+"""
+Module xep hang phan vi theo nganh (sector-relative percentile)
+
+Nguong tuyet doi trong FUNDAMENTAL_CRITERIA (ROE >= 15, P/E <= 20...) ap
+dung giong nhau cho ngan hang, bat dong san va ban le. Module nay tinh
+phan vi cua tung chi so trong nganh (cross-sectional rank) mot lan moi
+lan cap nhat du lieu co ban, luu ra file, va cho phep tra cuu theo ma.
+"""
+import logging
+from datetime import datetime
+
+import numpy as np
+import pandas as pd
+
+from config.settings import PROCESSED_DATA_DIR
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+# Chi so duoc xep hang: True = cao hon la tot hon
+SECTOR_METRICS = {
+    'roe': True,
+    'roa': True,
+    'net_margin': True,
+    'pe': False,
+    'pb': False,
+    'debt_to_equity': False,
+}
+
+# Cac chi so dinh gia chi co nghia khi duong (P/E am = dang lo)
+POSITIVE_ONLY = ['pe', 'pb']
+
+
+class SectorRanker:
+    """Tinh va tra cuu phan vi chi so theo nganh"""
+
+    def __init__(self, ranks_file=None, metrics=None, min_sector_size=5):
+        """
+        Args:
+            ranks_file: File luu ket qua (mac dinh data/processed/sector_ranks.parquet)
+            metrics: dict chi so -> True neu cao hon la tot hon
+            min_sector_size: Nganh it ma hon nguong nay xep hang tren toan thi truong
+        """
+        self.ranks_file = ranks_file or PROCESSED_DATA_DIR / 'sector_ranks.parquet'
+        self.metrics = metrics or SECTOR_METRICS
+        self.min_sector_size = min_sector_size
+        self._ranks = None
+
+    def compute(self, ratios_table: pd.DataFrame, save: bool = True):
+        """
+        Tinh phan vi cho ca universe
+
+        Args:
+            ratios_table: DataFrame index symbol, co cot 'industry' va cac chi so
+            save: Ghi ket qua ra ranks_file
+
+        Returns:
+            DataFrame index symbol: industry, sector_size, <metric>_pct (0-100),
+            sector_score (trung binh cac phan vi), as_of
+        """
+        if ratios_table.empty:
+            return pd.DataFrame()
+
+        industry = ratios_table.get('industry', pd.Series('Unknown', index=ratios_table.index))
+        industry = industry.fillna('Unknown')
+        sector_size = industry.map(industry.value_counts())
+
+        # Nganh qua nho hoac khong ro nganh -> so voi toan thi truong
+        use_market = (sector_size < self.min_sector_size) | (industry == 'Unknown')
+
+        result = pd.DataFrame({'industry': industry, 'sector_size': sector_size},
+                              index=ratios_table.index)
+
+        pct_columns = []
+        for metric, higher_is_better in self.metrics.items():
+            if metric not in ratios_table.columns:
+                continue
+
+            values = pd.to_numeric(ratios_table[metric], errors='coerce')
+            if metric in POSITIVE_ONLY:
+                values = values.where(values > 0)
+
+            ranks = values.groupby(industry).rank(pct=True, ascending=higher_is_better)
+            market_ranks = values.rank(pct=True, ascending=higher_is_better)
+            ranks = ranks.where(~use_market, market_ranks)
+            result[f'{metric}_pct'] = ranks * 100
+            pct_columns.append(f'{metric}_pct')
+
+        result['sector_score'] = result[pct_columns].mean(axis=1) if pct_columns else np.nan
+        result['as_of'] = datetime.now()
+
+        if save:
+            result.to_parquet(self.ranks_file)
+            logger.info(f"Saved sector ranks for {len(result)} symbols to {self.ranks_file}")
+
+        self._ranks = result
+        return result
+
+    def load(self, reload: bool = False):
+        """Doc bang phan vi da luu (cache trong bo nho)"""
+        if self._ranks is None or reload:
+            if self.ranks_file.exists():
+                self._ranks = pd.read_parquet(self.ranks_file)
+            else:
+                self._ranks = pd.DataFrame()
+        return self._ranks
+
+    def get(self, symbol: str):
+        """
+        Tra cuu phan vi cua mot ma
+
+        Returns:
+            dict (industry, sector_score, <metric>_pct...) hoac None neu chua co
+        """
+        ranks = self.load()
+        if ranks.empty or symbol not in ranks.index:
+            return None
+
+        row = ranks.loc[symbol]
+        return {key: (None if pd.isna(value) else value) for key, value in row.items()}
+
+    def lookup(self, symbols, column='sector_score'):
+        """Tra cuu mot cot cho nhieu ma (NaN neu chua co)"""
+        ranks = self.load()
+        if ranks.empty or column not in ranks.columns:
+            return pd.Series(np.nan, index=list(symbols))
+        return ranks[column].reindex(list(symbols))
+
+
+# Example usage
+if __name__ == "__main__":
+    test_table = pd.DataFrame({
+        'industry': ['Ngân hàng'] * 5 + ['Bất động sản'] * 5,
+        'roe': [22, 18, 15, 12, 9, 14, 10, 8, 6, 3],
+        'pe': [8, 9, 10, 12, 15, 12, 20, -5, 30, 45],
+        'debt_to_equity': [8, 9, 10, 11, 12, 0.8, 1.2, 1.5, 2.0, 2.5],
+    }, index=['VCB', 'TCB', 'MBB', 'ACB', 'STB', 'VHM', 'KDH', 'NVL', 'DXG', 'PDR'])
+
+    ranker = SectorRanker()
+    ranks = ranker.compute(test_table, save=False)
+    print(ranks.round(1).to_string())
@@ -3,12 +3,9 @@ Module phân tích kỹ thuật
 """
 import pandas as pd
 import numpy as np
-from ta.trend import MACD, SMAIndicator, EMAIndicator
-from ta.momentum import RSIIndicator, StochasticOscillator
-from ta.volatility import BollingerBands, AverageTrueRange
-from ta.volume import OnBalanceVolumeIndicator, VolumeWeightedAveragePrice
 import logging
 
+from src.analysis import kernels
 from config.settings import TECHNICAL_PARAMS
 
 logging.basicConfig(level=logging.INFO)
@@ -33,70 +30,47 @@ class TechnicalAnalyzer:
         """
         df = df.copy()
         
+        close = df['close'].to_numpy(dtype=float)
+        high = df['high'].to_numpy(dtype=float)
+        low = df['low'].to_numpy(dtype=float)
+        
         # Moving Averages
         for period in self.params['ma_periods']:
-            df[f'SMA_{period}'] = SMAIndicator(
-                close=df['close'], window=period
-            ).sma_indicator()
-            
-            df[f'EMA_{period}'] = EMAIndicator(
-                close=df['close'], window=period
-            ).ema_indicator()
+            df[f'SMA_{period}'] = kernels.sma(close, period)
+            df[f'EMA_{period}'] = kernels.ema(close, period)
         
         # RSI
-        rsi = RSIIndicator(
-            close=df['close'], 
-            window=self.params['rsi_period']
-        )
-        df['RSI'] = rsi.rsi()
+        df['RSI'] = kernels.rsi(close, self.params['rsi_period'])
         
         # MACD
-        macd = MACD(
-            close=df['close'],
-            window_fast=self.params['macd_fast'],
-            window_slow=self.params['macd_slow'],
-            window_sign=self.params['macd_signal']
+        macd_line, macd_signal, macd_diff = kernels.macd(
+            close,
+            fast=self.params['macd_fast'],
+            slow=self.params['macd_slow'],
+            signal=self.params['macd_signal']
         )
-        df['MACD'] = macd.macd()
-        df['MACD_signal'] = macd.macd_signal()
-        df['MACD_diff'] = macd.macd_diff()
+        df['MACD'] = macd_line
+        df['MACD_signal'] = macd_signal
+        df['MACD_diff'] = macd_diff
         
         # Bollinger Bands
-        bb = BollingerBands(
-            close=df['close'],
-            window=self.params['bb_period'],
-            window_dev=self.params['bb_std']
-        )
-        df['BB_upper'] = bb.bollinger_hband()
-        df['BB_middle'] = bb.bollinger_mavg()
-        df['BB_lower'] = bb.bollinger_lband()
-        df['BB_width'] = bb.bollinger_wband()
+        bb_middle = kernels.sma(close, self.params['bb_period'])
+        bb_dev = self.params['bb_std'] * kernels.rolling_std(close, self.params['bb_period'])
+        df['BB_upper'] = bb_middle + bb_dev
+        df['BB_middle'] = bb_middle
+        df['BB_lower'] = bb_middle - bb_dev
+        df['BB_width'] = (df['BB_upper'] - df['BB_lower']) / df['BB_middle'] * 100
         
         # Stochastic
-        stoch = StochasticOscillator(
-            high=df['high'],
-            low=df['low'],
-            close=df['close'],
-            window=14,
-            smooth_window=3
-        )
-        df['Stoch_K'] = stoch.stoch()
-        df['Stoch_D'] = stoch.stoch_signal()
+        stoch_k, stoch_d = kernels.stochastic(high, low, close, window=14, smooth_window=3)
+        df['Stoch_K'] = stoch_k
+        df['Stoch_D'] = stoch_d
         
         # ATR (Average True Range)
-        atr = AverageTrueRange(
-            high=df['high'],
-            low=df['low'],
-            close=df['close'],
-            window=14
-        )
-        df['ATR'] = atr.average_true_range()
+        df['ATR'] = kernels.atr(high, low, close, window=14)
         
         # Volume indicators
-        df['OBV'] = OnBalanceVolumeIndicator(
-            close=df['close'],
-            volume=df['volume']
-        ).on_balance_volume()
+        df['OBV'] = kernels.obv(close, df['volume'].to_numpy(dtype=float))
         
         # Price changes
         df['Daily_Return'] = df['close'].pct_change()
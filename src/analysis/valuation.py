@@ -2,12 +2,20 @@
 Module dinh gia co phieu (DCF, DDM, comparable)
 Copy vao: src/analysis/valuation.py
 """
+from itertools import zip_longest
+
 import numpy as np
+import pandas as pd
 import logging
 
+from config.settings import MONTE_CARLO_PARAMS
+
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
+# So mang (draws x ma) song cung luc trong mot batch Monte Carlo (xem monte_carlo_valuation)
+MC_LIVE_ARRAYS = 3
+
 
 class StockValuation:
     """Dinh gia co phieu bang nhieu phuong phap"""
@@ -34,22 +42,22 @@ class StockValuation:
         Returns:
             Enterprise Value
         """
-        if not free_cash_flows:
+        if free_cash_flows is None or len(free_cash_flows) == 0:
             return None
         
+        fcf = np.asarray(free_cash_flows, dtype=float)
+        n = len(fcf)
+        
         # PV cua FCF trong giai doan du bao
-        pv_fcf = 0
-        for i, fcf in enumerate(free_cash_flows, start=1):
-            pv = fcf / ((1 + discount_rate) ** i)
-            pv_fcf += pv
+        discount_factors = (1 + discount_rate) ** -np.arange(1, n + 1)
+        pv_fcf = float(fcf @ discount_factors)
         
         # Terminal Value
-        last_fcf = free_cash_flows[-1]
+        last_fcf = float(fcf[-1])
         terminal_value = (last_fcf * (1 + terminal_growth_rate)) / \
                         (discount_rate - terminal_growth_rate)
         
         # PV cua Terminal Value
-        n = len(free_cash_flows)
         pv_terminal = terminal_value / ((1 + discount_rate) ** n)
         
         # Enterprise Value
@@ -62,6 +70,92 @@ class StockValuation:
             'pv_terminal': pv_terminal
         }
     
+    def dcf_grid(self, free_cash_flows, discount_rates, terminal_growth_rates):
+        """
+        DCF tren ca luoi WACC x tang truong vinh vien cho nhieu ma mot lan
+        
+        Tinh bang broadcasting: (ma x WACC x g), khong goi dcf_valuation lap lai.
+        
+        Args:
+            free_cash_flows: dict symbol -> list FCF du bao, hoac DataFrame
+                             (moi dong mot ma, moi cot mot nam; NaN = het du bao)
+            discount_rates: List/array ty le chiet khau (WACC)
+            terminal_growth_rates: List/array toc do tang truong vinh vien
+            
+        Returns:
+            DataFrame MultiIndex (symbol, discount_rate, terminal_growth) voi cac cot
+            enterprise_value, pv_fcf, terminal_value, pv_terminal
+            (NaN khi discount_rate <= terminal_growth)
+        """
+        if isinstance(free_cash_flows, pd.DataFrame):
+            symbols = list(free_cash_flows.index)
+            values = free_cash_flows.to_numpy(dtype=float, na_value=np.nan)
+        else:
+            symbols = list(free_cash_flows.keys())
+            padded = list(zip_longest(*free_cash_flows.values(), fillvalue=np.nan))
+            values = np.array(padded, dtype=float).T if padded else np.empty((len(symbols), 0))
+        
+        rates = np.asarray(discount_rates, dtype=float)
+        growth = np.asarray(terminal_growth_rates, dtype=float)
+        
+        if not symbols or rates.size == 0 or growth.size == 0:
+            return pd.DataFrame()
+        
+        # Ma tran FCF (ma x nam): don cac nam co so lieu sang trai (giu thu tu),
+        # phan thieu = 0 de khong anh huong tong PV
+        valid = ~np.isnan(values)
+        order = np.argsort(~valid, axis=1, kind='stable')
+        values = np.take_along_axis(values, order, axis=1)
+        horizon = valid.sum(axis=1)
+        n_years = max(values.shape[1], 1)
+        fcf = np.zeros((len(symbols), n_years))
+        fcf[:, :values.shape[1]] = np.where(np.take_along_axis(valid, order, axis=1), values, 0.0)
+        last_fcf = np.full(len(symbols), np.nan)
+        has_fcf = horizon > 0
+        last_fcf[has_fcf] = values[has_fcf, horizon[has_fcf] - 1]
+        
+        # He so chiet khau (WACC x nam) va PV cua FCF (ma x WACC)
+        years = np.arange(1, n_years + 1)
+        discount_factors = (1 + rates[:, None]) ** -years[None, :]
+        pv_fcf = fcf @ discount_factors.T
+        
+        # Terminal value (ma x WACC x g)
+        spread = rates[:, None] - growth[None, :]
+        with np.errstate(divide='ignore', invalid='ignore'):
+            terminal_value = (last_fcf[:, None, None] * (1 + growth[None, None, :])
+                              / spread[None, :, :])
+        terminal_value = np.where(spread[None, :, :] > 0, terminal_value, np.nan)
+        
+        # PV cua terminal value chiet khau theo so nam du bao cua tung ma
+        terminal_discount = (1 + rates[None, :]) ** -horizon[:, None]
+        pv_terminal = terminal_value * terminal_discount[:, :, None]
+        
+        enterprise_value = pv_fcf[:, :, None] + pv_terminal
+        
+        shape = enterprise_value.shape
+        index = pd.MultiIndex.from_product(
+            [symbols, rates, growth],
+            names=['symbol', 'discount_rate', 'terminal_growth']
+        )
+        return pd.DataFrame({
+            'enterprise_value': enterprise_value.ravel(),
+            'pv_fcf': np.broadcast_to(pv_fcf[:, :, None], shape).ravel(),
+            'terminal_value': terminal_value.ravel(),
+            'pv_terminal': pv_terminal.ravel()
+        }, index=index)
+    
+    def dcf_sensitivity_table(self, free_cash_flows, discount_rates, terminal_growth_rates):
+        """
+        Bang do nhay DCF cho mot ma: dong = WACC, cot = tang truong vinh vien
+        
+        Args:
+            free_cash_flows: List FCF du bao cua mot ma
+        """
+        grid = self.dcf_grid({'_': free_cash_flows}, discount_rates, terminal_growth_rates)
+        if grid.empty:
+            return grid
+        return grid.loc['_', 'enterprise_value'].unstack('terminal_growth')
+    
     def pe_valuation(self, eps, industry_pe=None, growth_rate=None):
         """
         P/E Valuation
@@ -115,18 +209,48 @@ class StockValuation:
         
         return intrinsic_value
     
-    def comprehensive_valuation(self, ratios, growth_rate=0.10):
+    @staticmethod
+    def eligible_methods(eps, bvps, roe):
+        """
+        Dieu kien ap dung P/E va P/B (dung chung cho diem va Monte Carlo)
+        
+        P/E: eps co gia tri va khac 0; P/B: bvps va roe co gia tri va khac 0
+        
+        Returns:
+            (has_pe, has_pb) - mang bool (hoac bool numpy voi dau vao vo huong)
+        """
+        eps, bvps, roe = (np.asarray(np.nan if x is None else x, dtype=float) for x in (eps, bvps, roe))
+        has_pe = np.isfinite(eps) & (eps != 0)
+        has_pb = np.isfinite(bvps) & (bvps != 0) & np.isfinite(roe) & (roe != 0)
+        return has_pe, has_pb
+    
+    def comprehensive_valuation(self, ratios, growth_rate=0.10, mode='point', seed=None):
         """
         Dinh gia tong hop bang nhieu phuong phap
         
         Args:
             ratios: Dict chua cac chi so tai chinh
             growth_rate: Toc do tang truong ky vong
+            mode: 'point' = mot gia tri; 'monte_carlo' = them phan phoi gia tri
+                  hop ly (key 'monte_carlo', xem monte_carlo_valuation)
+            seed: Seed cho che do monte_carlo
         """
+        if mode == 'monte_carlo':
+            result = self.comprehensive_valuation(ratios, growth_rate)
+            if result is not None:
+                table = pd.DataFrame([ratios]).set_index(
+                    pd.Index([ratios.get('symbol', 'N/A')], name='symbol')
+                )
+                table['growth_rate'] = growth_rate
+                mc = self.monte_carlo_valuation(table, seed=seed)
+                result['monte_carlo'] = mc.iloc[0].to_dict() if not mc.empty else None
+            return result
+        
         valuations = {}
+        has_pe, has_pb = self.eligible_methods(ratios.get('eps'), ratios.get('bvps'), ratios.get('roe'))
         
         # P/E Valuation
-        if ratios.get('eps'):
+        if has_pe:
             pe_val = self.pe_valuation(
                 ratios['eps'],
                 growth_rate=growth_rate
@@ -134,7 +258,7 @@ class StockValuation:
             valuations['pe_method'] = pe_val
         
         # P/B Valuation
-        if ratios.get('bvps') and ratios.get('roe'):
+        if has_pb:
             pb_val = self.pb_valuation(
                 ratios['bvps'],
                 ratios['roe'] / 100,
@@ -159,6 +283,278 @@ class StockValuation:
             }
         
         return None
+    
+    def batch_valuation(self, ratios_df, growth_rate=0.10, required_return=None,
+                        terminal_growth=0.03, forecast_years=5, eps_as_fcf=True):
+        """
+        Dinh gia ca universe mot lan bang P/E, P/B, DDM va DCF (theo co phieu)
+        
+        Moi phuong phap tinh bang phep toan tren cot; dong nao khong du dieu kien
+        cho phuong phap do thi de NaN va khong tinh vao trung binh:
+            P/E: eps khac 0 (eligible_methods) -> eps × g × 100 (PEG = 1; g = 0 thi P/E 15)
+            P/B: bvps, roe khac 0 (eligible_methods) -> bvps × roe / r
+            DDM: dps > 0, r > terminal_growth -> Gordon voi tang truong vinh vien
+            DCF: FCF/co phieu > 0, r > terminal_growth -> du bao forecast_years nam
+                 tang truong g, gia tri cuoi ky tang truong terminal_growth
+        
+        Args:
+            ratios_df: DataFrame index symbol, cot eps, bvps, roe (%), pe,
+                       current_price, tuy chon growth_rate (theo ma),
+                       dps hoac dividend_yield (%), fcf_per_share
+            growth_rate: Tang truong mac dinh khi khong co cot growth_rate
+            required_return: Loi nhuan yeu cau (mac dinh market_return)
+            terminal_growth: Tang truong vinh vien (DDM, DCF)
+            forecast_years: So nam du bao DCF
+            eps_as_fcf: Dung EPS thay FCF/co phieu khi thieu fcf_per_share
+            
+        Returns:
+            DataFrame index symbol: current_price, pe_value, pb_value, ddm_value,
+            dcf_value, n_methods, average_fair_value, median_fair_value, upside_downside (%)
+        """
+        if ratios_df is None or ratios_df.empty:
+            return pd.DataFrame()
+        
+        r = self.market_return if required_return is None else required_return
+        
+        def column(name):
+            if name in ratios_df.columns:
+                return pd.to_numeric(ratios_df[name], errors='coerce').to_numpy(dtype=float)
+            return np.full(len(ratios_df), np.nan)
+        
+        eps = column('eps')
+        bvps = column('bvps')
+        roe = column('roe')
+        has_pe, has_pb = self.eligible_methods(eps, bvps, roe)
+        roe = roe / 100
+        price = column('current_price')
+        price = np.where(np.isnan(price), column('pe') * eps, price)
+        growth = column('growth_rate')
+        growth = np.where(np.isnan(growth), growth_rate, growth)
+        
+        with np.errstate(invalid='ignore'):
+            # P/E
+            fair_pe = np.where(growth != 0, growth * 100, 15.0)
+            pe_value = np.where(has_pe, eps * fair_pe, np.nan)
+            
+            # P/B
+            pb_value = np.where(has_pb, bvps * roe / r, np.nan)
+            
+            # DDM
+            dps = column('dps')
+            dps = np.where(np.isnan(dps), column('dividend_yield') / 100 * price, dps)
+            if r > terminal_growth:
+                ddm_value = np.where(dps > 0, dps * (1 + terminal_growth) / (r - terminal_growth),
+                                     np.nan)
+            else:
+                ddm_value = np.full(len(ratios_df), np.nan)
+            
+            # DCF tren FCF/co phieu du bao (ma x nam)
+            fcf = column('fcf_per_share')
+            if eps_as_fcf:
+                fcf = np.where(np.isnan(fcf), eps, fcf)
+            dcf_value = np.full(len(ratios_df), np.nan)
+            has_dcf = fcf > 0
+            if has_dcf.any() and forecast_years > 0:
+                years = np.arange(1, forecast_years + 1)
+                projected = pd.DataFrame(
+                    fcf[has_dcf, None] * (1 + growth[has_dcf, None]) ** years[None, :],
+                    index=ratios_df.index[has_dcf]
+                )
+                grid = self.dcf_grid(projected, [r], [terminal_growth])
+                dcf_value[has_dcf] = grid['enterprise_value'].to_numpy()
+        
+        methods = np.column_stack([pe_value, pb_value, ddm_value, dcf_value])
+        n_methods = (~np.isnan(methods)).sum(axis=1)
+        
+        with np.errstate(invalid='ignore', divide='ignore'):
+            average = np.where(n_methods > 0, np.nansum(methods, axis=1) / n_methods, np.nan)
+            median = np.full(len(ratios_df), np.nan)
+            rows = n_methods > 0
+            median[rows] = np.nanmedian(methods[rows], axis=1)
+            upside = np.where(price > 0, (average - price) / price * 100, np.nan)
+        
+        return pd.DataFrame({
+            'current_price': price,
+            'pe_value': pe_value,
+            'pb_value': pb_value,
+            'ddm_value': ddm_value,
+            'dcf_value': dcf_value,
+            'n_methods': n_methods,
+            'average_fair_value': average,
+            'median_fair_value': median,
+            'upside_downside': upside
+        }, index=ratios_df.index)
+    
+    def monte_carlo_valuation(self, ratios_df, n_draws=None, seed=None,
+                              distributions=None, max_cells=None, percentiles=None):
+        """
+        Phan phoi gia tri hop ly Monte Carlo cho ca universe mot lan
+        
+        Moi lan rut: lay mau g (tang truong), r (loi nhuan yeu cau), PEG va
+        he so P/B, roi dinh gia nhu comprehensive_valuation:
+            P/E: eps × max(PEG × g × 100, 0)
+            P/B: bvps × (roe / r) × pb_multiple
+        Gia tri hop ly = trung binh cac phuong phap ap dung duoc.
+        
+        Tinh theo batch (so rut × nhom ma): moi batch giu toi da MC_LIVE_ARRAYS
+        mang (so rut × ma) float64 cung luc (mau duoc sinh va bien doi tai cho,
+        phan vi tinh de len mang gia tri), nen tong so phan tu song <= max_cells
+        va bo nho dinh ~ 8 × max_cells byte. Moi ma co generator rieng sinh tu seed nen ket qua cua mot ma
+        khong phu thuoc kich thuoc batch hay cac ma khac trong universe.
+        
+        Args:
+            ratios_df: DataFrame index symbol, cot eps, bvps, roe (%), current_price
+                       (thieu gia thi dung pe × eps), growth_rate (tuy chon,
+                       ghi de trung binh cua phan phoi growth theo tung ma)
+            n_draws: So lan rut moi ma (mac dinh MONTE_CARLO_PARAMS)
+            seed: Seed cho np.random.SeedSequence
+            distributions: Ghi de MONTE_CARLO_PARAMS['distributions']
+            max_cells: Tong so phan tu float64 song cung luc (mac dinh MONTE_CARLO_PARAMS)
+            percentiles: List phan vi can tra ve
+            
+        Returns:
+            DataFrame index symbol: current_price, mean, std, p<k>..., prob_upside,
+            median_upside (%), n_methods
+        """
+        n_draws = int(n_draws or MONTE_CARLO_PARAMS['n_draws'])
+        max_cells = int(max_cells or MONTE_CARLO_PARAMS['max_cells'])
+        percentiles = percentiles or MONTE_CARLO_PARAMS['percentiles']
+        dists = {**MONTE_CARLO_PARAMS['distributions'], **(distributions or {})}
+        
+        if ratios_df is None or ratios_df.empty:
+            return pd.DataFrame()
+        
+        def column(name):
+            if name in ratios_df.columns:
+                return pd.to_numeric(ratios_df[name], errors='coerce').to_numpy(dtype=float)
+            return np.full(len(ratios_df), np.nan)
+        
+        eps = column('eps')
+        bvps = column('bvps')
+        roe = column('roe')
+        has_pe, has_pb = self.eligible_methods(eps, bvps, roe)
+        roe = roe / 100
+        price = column('current_price')
+        price = np.where(np.isnan(price), column('pe') * eps, price)
+        growth_mean = column('growth_rate')
+        
+        has_pe, has_pb = self.eligible_methods(eps, bvps, roe)
+        n_methods = has_pe.astype(int) + has_pb.astype(int)
+        
+        symbols = list(ratios_df.index)
+        children = np.random.SeedSequence(seed).spawn(len(symbols))
+        block = max(1, max_cells // (n_draws * MC_LIVE_ARRAYS))
+        
+        stats = {key: np.full(len(symbols), np.nan) for key in
+                 ['mean', 'std', 'prob_upside'] + [f'p{q}' for q in percentiles]}
+        
+        for start in range(0, len(symbols), block):
+            idx = np.arange(start, min(start + block, len(symbols)))
+            idx = idx[n_methods[idx] > 0]
+            if idx.size == 0:
+                continue
+            
+            rngs = [np.random.default_rng(children[i]) for i in idx]
+            
+            # Mang (draws x ma) bien doi tai cho: toi da MC_LIVE_ARRAYS mang song cung luc.
+            # Phuong phap khong ap dung = 0 va khong tinh vao mau so
+            growth = self._sample(dists['growth'], rngs, n_draws, mean_override=growth_mean[idx])
+            pe_value = self._sample(dists['peg'], rngs, n_draws)
+            pe_value *= growth
+            del growth
+            pe_value *= 100
+            np.maximum(pe_value, 0, out=pe_value)
+            with np.errstate(invalid='ignore'):
+                pe_value *= eps[idx]
+            pe_value[:, ~has_pe[idx]] = 0.0
+            
+            required = self._sample(dists['required_return'], rngs, n_draws,
+                                    default_mean=self.market_return)
+            np.maximum(required, 0.01, out=required)
+            pb_mult = self._sample(dists['pb_multiple'], rngs, n_draws)
+            with np.errstate(invalid='ignore'):
+                pb_value = np.divide(bvps[idx] * roe[idx], required, out=required)
+                pb_value *= pb_mult
+            del pb_mult
+            pb_value[:, ~has_pb[idx]] = 0.0
+            
+            fair_value = pe_value
+            fair_value += pb_value
+            del pb_value, required
+            fair_value /= n_methods[idx]
+            
+            stats['mean'][idx] = fair_value.mean(axis=0)
+            stats['std'][idx] = fair_value.std(axis=0)
+            
+            valid_price = price[idx] > 0
+            upside = (fair_value > price[idx]).mean(axis=0)
+            stats['prob_upside'][idx] = np.where(valid_price, upside, np.nan)
+            
+            # Cuoi cung: phan vi sap xep de len fair_value (khong sao chep)
+            for q, values in zip(percentiles, np.percentile(fair_value, percentiles, axis=0,
+                                                            overwrite_input=True)):
+                stats[f'p{q}'][idx] = values
+            del fair_value
+        
+        result = pd.DataFrame(stats, index=ratios_df.index)
+        result.insert(0, 'current_price', price)
+        median = result['p50'] if 'p50' in result.columns else result['mean']
+        result['median_upside'] = np.where(price > 0, (median - price) / price * 100, np.nan)
+        result['n_methods'] = n_methods
+        return result
+    
+    @staticmethod
+    def _sample(spec, rngs, n_draws, mean_override=None, default_mean=None):
+        """
+        Lay mau (n_draws x len(rngs)) theo spec phan phoi, moi cot mot generator
+        
+        mean_override: array trung binh theo tung ma (NaN = dung spec)
+        """
+        kind = spec.get('dist', 'normal')
+        n = len(rngs)
+        
+        if kind == 'fixed':
+            return np.full((n_draws, n), float(spec['value']))
+        
+        # Moi generator ghi thang vao cot cua mang Fortran (cot lien tuc), bien doi tai cho
+        out = np.empty((n_draws, n), order='F')
+        for j, rng in enumerate(rngs):
+            if kind in ('normal', 'lognormal'):
+                rng.standard_normal(out=out[:, j])
+            else:
+                rng.random(out=out[:, j])
+        
+        if kind == 'normal':
+            mean = spec.get('mean')
+            mean = default_mean if mean is None else mean
+            mean = np.full(n, float(mean))
+            if mean_override is not None:
+                mean = np.where(np.isnan(mean_override), mean, mean_override)
+            out *= spec['std']
+            out += mean
+            return out
+        
+        if kind == 'lognormal':
+            out *= spec['sigma']
+            np.exp(out, out=out)
+            out *= spec['median']
+            return out
+        
+        if kind == 'uniform':
+            out *= spec['high'] - spec['low']
+            out += spec['low']
+            return out
+        
+        if kind == 'triangular':
+            low, mode, high = spec['low'], spec['mode'], spec['high']
+            cut = (mode - low) / (high - low)
+            return np.where(
+                out < cut,
+                low + np.sqrt(out * (high - low) * (mode - low)),
+                high - np.sqrt((1 - out) * (high - low) * (high - mode))
+            )
+        
+        raise ValueError(f"Unknown distribution: {kind}")
 
 
 # Example usage
@@ -171,8 +567,33 @@ if __name__ == "__main__":
     dcf_result = valuator.dcf_valuation(fcf_projections, discount_rate=0.10)
     print(f"Enterprise Value: {dcf_result['enterprise_value']:,.0f} VND")
     
+    # DCF sensitivity (WACC x terminal growth)
+    print("\n=== DCF Sensitivity ===")
+    table = valuator.dcf_sensitivity_table(
+        fcf_projections,
+        discount_rates=np.arange(0.08, 0.141, 0.01),
+        terminal_growth_rates=[0.01, 0.02, 0.03, 0.04]
+    )
+    print(table.round(0).to_string())
+    
     # P/E Example
     print("\n=== P/E Valuation ===")
     pe_result = valuator.pe_valuation(eps=5000, growth_rate=0.15)
     print(f"Fair Value: {pe_result['fair_value']:,.0f} VND")
-    print(f"Fair P/E: {pe_result['fair_pe']:.1f}x")
\ No newline at end of file
+    print(f"Fair P/E: {pe_result['fair_pe']:.1f}x")
+    
+    # Monte Carlo Example
+    print("\n=== Monte Carlo Valuation ===")
+    universe = pd.DataFrame({
+        'eps': [5200, 6100, 3800],
+        'bvps': [18000, 24000, 27000],
+        'roe': [25.5, 23.1, 15.2],
+        'current_price': [62000, 95000, 26000]
+    }, index=pd.Index(['VNM', 'FPT', 'HPG'], name='symbol'))
+    mc = valuator.monte_carlo_valuation(universe, seed=42)
+    print(mc.round(2).to_string())
+    
+    # Batch Example
+    print("\n=== Batch Valuation ===")
+    universe['dividend_yield'] = [5.5, 2.0, 0.0]
+    print(valuator.batch_valuation(universe).round(0).to_string())
\ No newline at end of file
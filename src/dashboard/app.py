@@ -18,6 +18,7 @@ from src.data_pipeline.fundamental_data import FundamentalDataCrawler
 from src.analysis.technical import TechnicalAnalyzer
 from src.analysis.fundamental import FundamentalAnalyzer
 from src.screener.fundamental_screener import StockScreener
+from src.screener.technical_scanner import TechnicalScanner
 from src.portfolio.portfolio_manager import PortfolioManager
 from config.settings import WATCHLIST
 
@@ -38,6 +39,7 @@ def init_components():
         'technical_analyzer': TechnicalAnalyzer(),
         'fundamental_analyzer': FundamentalAnalyzer(),
         'screener': StockScreener(),
+        'scanner': TechnicalScanner(watchlist=WATCHLIST[:5]),
         'portfolio': PortfolioManager()
     }
 
@@ -66,7 +68,7 @@ if page == "🏠 Dashboard":
         # 2. Lay thong tin Portfolio
         portfolio_mgr = components['portfolio']
         portfolio_value = portfolio_mgr.get_current_value()
-        portfolio_perf = portfolio_mgr.get_performance()
+        portfolio_perf = portfolio_mgr.get_performance(portfolio_value)
         
         # Hien thi metrics
         with col1:
@@ -160,10 +162,9 @@ if page == "🏠 Dashboard":
     # Recent alerts
     st.subheader("🔔 Recent Alerts")
     
-    # Kiem tra tin hieu tu Technical Scanner
+    # Kiem tra tin hieu tu Technical Scanner (snapshot dung chung giua cac lan render)
     try:
-        from src.screener.technical_scanner import TechnicalScanner
-        scanner = TechnicalScanner(watchlist=WATCHLIST[:5])
+        scanner = components['scanner']
         
         # Tim oversold
         oversold = scanner.find_oversold(rsi_threshold=30)
@@ -179,6 +180,9 @@ if page == "🏠 Dashboard":
         
         if oversold.empty and overbought.empty:
             st.write("Chưa có alert nào")
+        
+        if scanner.snapshot_time:
+            st.caption(f"Scan lúc {scanner.snapshot_time:%H:%M:%S}")
     
     except Exception as e:
         st.write("Không thể tải alerts")
@@ -215,7 +219,28 @@ elif page == "🔍 Stock Screener":
         with st.spinner("Screening stocks... This may take a few minutes..."):
             try:
                 screener = StockScreener(watchlist=selected_stocks)
-                results = screener.screen_multiple_stocks(max_workers=3)
+                
+                # Hien thi tien do va bang top ngay khi tung ma xong
+                progress_bar = st.progress(0.0)
+                status = st.empty()
+                live_table = st.empty()
+                rows = []
+                
+                for event in screener.iter_screen(max_workers=3):
+                    if event['row']:
+                        rows.append(event['row'])
+                    progress_bar.progress(event['completed'] / event['total'])
+                    status.caption(f"{event['completed']}/{event['total']} mã · "
+                                   f"{event['candidates']} ứng viên · {event['elapsed']:.0f}s")
+                    if event['top']:
+                        live_table.dataframe(
+                            pd.DataFrame(event['top'])[['Symbol', 'Rating', 'Score', 'RSI', 'ROE', 'PE']],
+                            use_container_width=True
+                        )
+                
+                live_table.empty()
+                results = (pd.DataFrame(rows).sort_values('Score', ascending=False)
+                           if rows else pd.DataFrame())
                 
                 if not results.empty:
                     st.success(f"✅ Screened {len(results)} stocks successfully!")
@@ -497,14 +522,17 @@ elif page == "💼 Portfolio":
     
     if st.session_state.get('show_sell'):
         with st.form("sell_form"):
-            positions = [p['symbol'] for p in pm.portfolio['positions']]
+            book = pm.portfolio['positions']
+            positions = book.symbols
             if positions:
                 col1, col2, col3 = st.columns(3)
                 with col1:
                     symbol = st.selectbox("Symbol", positions)
                 with col2:
-                    max_shares = next(p['shares'] for p in pm.portfolio['positions'] if p['symbol'] == symbol)
-                    shares = st.number_input("Shares", min_value=1, max_value=max_shares, step=100)
+                    # Chỉ bán được cổ phiếu đã về (T+2)
+                    lots = pm.get_lots().position(symbol)
+                    shares = st.number_input("Shares", min_value=1, max_value=max(lots['settled'], 1), step=100)
+                    st.caption(f"Settled: {lots['settled']:,} | Pending (T+2): {lots['pending']:,}")
                 with col3:
                     price = st.number_input("Price", min_value=0.0, step=1000.0)
                 
@@ -515,6 +543,8 @@ elif page == "💼 Portfolio":
                         st.success(f"Sold {shares} shares. P&L: {result['pnl']:,.0f} ({result['pnl_percent']:.2f}%)")
                         st.session_state.show_sell = False
                         st.rerun()
+                    else:
+                        st.error(f"Cannot sell {shares} shares of {symbol}: only {lots['settled']:,} settled")
             else:
                 st.warning("No positions to sell")
     
@@ -522,7 +552,7 @@ elif page == "💼 Portfolio":
     
     # Portfolio summary
     current = pm.get_current_value()
-    perf = pm.get_performance()
+    perf = pm.get_performance(current)
     
     # Metrics
     col1, col2, col3, col4 = st.columns(4)
@@ -566,7 +596,7 @@ elif page == "💼 Portfolio":
         st.info("No positions yet. Start by adding cash and buying stocks!")
     
     # Rebalancing suggestions
-    suggestions = pm.suggest_rebalance()
+    suggestions = pm.suggest_rebalance(current)
     if suggestions:
         st.subheader("💡 Rebalancing Suggestions")
         for sug in suggestions:
@@ -576,12 +606,45 @@ elif page == "💼 Portfolio":
                 st.error(f"⚠️ {sug['message']} → {sug['action']}")
             else:
                 st.info(f"ℹ️ {sug['message']} → {sug['action']}")
+        
+        # Lệnh cụ thể theo lô 100 cổ phiếu (quy tắc lệch rebalance_threshold)
+        plan = pm.plan_rebalance()
+        if not plan['orders'].empty:
+            summary = plan['summary']
+            st.dataframe(plan['orders'][['symbol', 'action', 'shares', 'price', 'value', 'fee', 'tax', 'cash']],
+                         use_container_width=True)
+            st.caption(f"Cash after: {summary['cash_after']:,.0f} VND · "
+                       f"Fees + tax: {summary['fees'] + summary['taxes']:,.0f} VND · "
+                       f"Max drift after: {summary['max_drift_after'] * 100:.1f}%")
     
     # Performance chart
     st.subheader("📈 Performance History")
     
-    if pm.portfolio['history']:
-        df_history = pd.DataFrame(pm.portfolio['history'])
+    # Equity curve (NAV dựng lại từ lịch sử giao dịch)
+    nav, contributions = pm.get_nav()
+    if not nav.empty:
+        fig = go.Figure()
+        fig.add_trace(go.Scatter(x=nav.index, y=nav['nav'], name='NAV', fill='tozeroy'))
+        fig.add_trace(go.Scatter(x=nav.index, y=nav['cash'], name='Cash'))
+        fig.update_layout(title='Equity Curve', height=400, hovermode='x unified')
+        st.plotly_chart(fig, use_container_width=True)
+        
+        col1, col2 = st.columns(2)
+        with col1:
+            st.metric("Exposure", f"{nav['exposure'].iloc[-1] * 100:.1f}%")
+        with col2:
+            twr = (1 + nav['returns'].fillna(0)).prod() - 1
+            st.metric("Time-weighted Return", f"{twr * 100:+.2f}%")
+        
+        if not contributions.empty:
+            total_contrib = contributions.sum().sort_values()
+            fig = px.bar(x=total_contrib.values, y=total_contrib.index, orientation='h',
+                         title='P&L Contribution by Position', labels={'x': 'VND', 'y': ''})
+            st.plotly_chart(fig, use_container_width=True)
+    
+    history = pm.get_history()
+    if history:
+        df_history = pd.DataFrame(history)
         df_history['date'] = pd.to_datetime(df_history['date'])
         
         # Calculate cumulative P&L
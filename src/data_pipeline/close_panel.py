@@ -0,0 +1,173 @@
+"""
+Bang gia dong cua (ngay x ma) luu cuc bo, cap nhat tang dan
+
+Cac phep tinh danh muc (chuoi loi nhuan, NAV, hiep phuong sai) can gia
+dong cua cua nhieu ma tren cung truc ngay. Module nay giu mot file parquet
+rong (index ngay, moi cot mot ma). Ma moi duoc khoi tao tu cac file cache
+gia da co trong CACHE_DIR truoc khi goi API; ma da co chi lay them cac
+phien sau ngay cuoi cung (va cac phien truoc ngay dau tien neu can lich su
+som hon), moi ma toi da mot lan moi ngay giao dich cho moi ngay bat dau.
+"""
+import logging
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+from pathlib import Path
+
+import pandas as pd
+
+from config.settings import PROCESSED_DATA_DIR
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+
+def last_trading_day(now=None):
+    """Ngay giao dich gan nhat (bo thu 7, chu nhat)"""
+    day = pd.Timestamp(now or datetime.now()).normalize()
+    while day.weekday() >= 5:
+        day -= pd.Timedelta(days=1)
+    return day
+
+
+class ClosePanel:
+    """Gia dong cua nhieu ma tren cung truc ngay"""
+
+    def __init__(self, price_crawler=None, panel_file=None, max_workers=8):
+        """
+        Args:
+            price_crawler: PriceDataCrawler (mac dinh tao moi)
+            panel_file: File parquet (mac dinh data/processed/close_panel.parquet)
+            max_workers: So luong lay du lieu song song
+        """
+        if price_crawler is None:
+            from src.data_pipeline.price_data import PriceDataCrawler
+            price_crawler = PriceDataCrawler()
+        self.price_crawler = price_crawler
+        self.panel_file = Path(panel_file or PROCESSED_DATA_DIR / 'close_panel.parquet')
+        self.max_workers = max_workers
+        self._panel = None
+        self._checked = {}
+
+    def load(self):
+        """Doc bang gia da luu (cache trong bo nho)"""
+        if self._panel is None:
+            if self.panel_file.exists():
+                self._panel = pd.read_parquet(self.panel_file)
+            else:
+                self._panel = pd.DataFrame(index=pd.DatetimeIndex([], name='date'))
+        return self._panel
+
+    def closes(self, symbols, start=None, update=True):
+        """
+        Ma tran gia dong cua (ngay x ma), forward-fill ngay nghi cua tung ma
+
+        Args:
+            symbols: Danh sach ma (thu tu cot)
+            start: Ngay bat dau (mac dinh lay het)
+            update: Lay them phien moi cho cac ma con thieu
+
+        Returns:
+            DataFrame index ngay, cot theo symbols (ma khong co du lieu bi bo)
+        """
+        start = pd.Timestamp(start) if start is not None else None
+        panel = self.update(symbols, start) if update else self.load()
+
+        columns = [s for s in symbols if s in panel.columns]
+        closes = panel[columns]
+        if start is not None:
+            closes = closes[closes.index >= start]
+        return closes.ffill().dropna(how='all')
+
+    def update(self, symbols, start=None):
+        """Them phien moi (va ma moi) vao bang, ghi file neu co thay doi"""
+        panel = self.load()
+        target = last_trading_day()
+        start = pd.Timestamp(start) if start is not None else target - pd.Timedelta(days=365)
+
+        todo = [s for s in dict.fromkeys(symbols) if not self._is_checked(s, start, target)]
+        if not todo:
+            return panel
+
+        current = {s: panel[s].dropna() if s in panel.columns else None for s in todo}
+        with ThreadPoolExecutor(max_workers=min(self.max_workers, len(todo))) as executor:
+            extended = dict(zip(todo, executor.map(
+                lambda s: self._extend(s, current[s], start, target), todo)))
+
+        changed = {s: series for s, series in extended.items()
+                   if series is not None and not series.empty
+                   and (current[s] is None or len(series) != len(current[s]))}
+        for symbol in todo:
+            self._checked[symbol] = (target, start)
+
+        if changed:
+            panel = pd.DataFrame(changed).combine_first(panel)
+            panel.index.name = 'date'
+            panel.to_parquet(self.panel_file)
+            self._panel = panel
+            logger.info(f"Close panel: updated {len(changed)} symbols, {len(panel)} dates")
+        return panel
+
+    def _is_checked(self, symbol, start, target):
+        """Da lay du lieu cho ma trong ngay giao dich nay, tu ngay bat dau nay hoac som hon"""
+        checked = self._checked.get(symbol)
+        return checked is not None and checked[0] == target and checked[1] <= start
+
+    def _extend(self, symbol, have, start, target):
+        """Chuoi gia cu + cac phien con thieu o hai dau (tu cache cuc bo, roi API)"""
+        if have is None or have.empty:
+            have = self._from_local_cache(symbol)
+        elif start < have.index[0]:
+            have = have.combine_first(self._from_local_cache(symbol))
+
+        if have.empty:
+            ranges = [(start, datetime.now())]
+        else:
+            ranges = []
+            if start < have.index[0]:
+                ranges.append((start, have.index[0] - pd.Timedelta(days=1)))
+            if have.index[-1] + pd.Timedelta(days=1) <= target:
+                ranges.append((have.index[-1] + pd.Timedelta(days=1), datetime.now()))
+
+        pieces = [have]
+        for fetch_from, fetch_to in ranges:
+            fresh = self._fetch(symbol, fetch_from, fetch_to)
+            if fresh is not None:
+                pieces.append(fresh)
+        if len(pieces) == 1:
+            return have
+        return pd.concat(pieces).groupby(level=0).last()
+
+    def _fetch(self, symbol, start, end):
+        """Gia dong cua [start, end] tu API (None neu loi / rong)"""
+        try:
+            df = self.price_crawler.get_historical_data(
+                symbol,
+                start_date=start.strftime('%Y-%m-%d'),
+                end_date=end.strftime('%Y-%m-%d')
+            )
+        except Exception as e:
+            logger.error(f"Error extending {symbol}: {str(e)}")
+            return None
+
+        if df is None or df.empty:
+            return None
+        fresh = df['close'].astype(float)
+        fresh.index = pd.DatetimeIndex(fresh.index).normalize()
+        return fresh
+
+    def _from_local_cache(self, symbol):
+        """Gop gia dong cua tu cac file {symbol}_*.parquet trong cache gia"""
+        cache_dir = Path(getattr(self.price_crawler, 'cache_dir', ''))
+        frames = []
+        for path in cache_dir.glob(f'{symbol}_*.parquet'):
+            try:
+                df = pd.read_parquet(path, columns=['close'])
+            except Exception:
+                continue
+            frames.append(df['close'].astype(float))
+
+        if not frames:
+            return pd.Series(dtype=float, index=pd.DatetimeIndex([]))
+        series = pd.concat(frames)
+        series.index = pd.DatetimeIndex(series.index).normalize()
+        return series.groupby(level=0).last().sort_index()
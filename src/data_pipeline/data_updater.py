@@ -9,6 +9,7 @@ from apscheduler.triggers.cron import CronTrigger
 
 from src.data_pipeline.price_data import PriceDataCrawler
 from src.data_pipeline.fundamental_data import FundamentalDataCrawler
+from src.analysis.sector_ranks import SectorRanker
 from config.settings import WATCHLIST
 
 logging.basicConfig(level=logging.INFO)
@@ -22,6 +23,7 @@ class DataUpdater:
         self.watchlist = watchlist or WATCHLIST
         self.price_crawler = PriceDataCrawler()
         self.fundamental_crawler = FundamentalDataCrawler()
+        self.sector_ranker = SectorRanker()
         self.scheduler = BackgroundScheduler()
     
     def update_price_data(self):
@@ -52,11 +54,16 @@ class DataUpdater:
         
         success_count = 0
         fail_count = 0
+        ratios_list = []
+        
+        # Lam moi bang nganh mot lan cho ca dot cap nhat
+        self.fundamental_crawler.get_industry_map(refresh=True)
         
         for symbol in self.watchlist:
             try:
                 data = self.fundamental_crawler.get_complete_fundamentals(symbol)
                 if data['ratios']:
+                    ratios_list.append(data['ratios'])
                     logger.info(f"[OK] Updated {symbol}")
                     success_count += 1
                 else:
@@ -66,6 +73,11 @@ class DataUpdater:
                 logger.error(f"[ERROR] {symbol}: {str(e)}")
                 fail_count += 1
         
+        # Luu bang chi so va tinh lai phan vi theo nganh (mot lan moi dot)
+        if ratios_list:
+            table = self.fundamental_crawler.save_ratios_table(ratios_list)
+            self.sector_ranker.compute(table)
+        
         logger.info(f"=== Complete: {success_count} OK, {fail_count} failed ===")
     
     def setup_schedule(self):
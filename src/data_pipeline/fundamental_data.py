@@ -4,24 +4,39 @@ THAY THE fundamental_data.py
 """
 import pandas as pd
 import logging
-from datetime import datetime
+from datetime import datetime, timedelta
 
 try:
     from vnstock import Vnstock
 except ImportError:
     print("Chua cai vnstock")
 
-from config.settings import RAW_DATA_DIR, CACHE_DIR
+from config.settings import RAW_DATA_DIR, CACHE_DIR, PROCESSED_DATA_DIR
 
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
 
+# Cot nganh ICB trong listing cua vnstock (uu tien cap 3, roi cap 2)
+INDUSTRY_COLUMNS = ['icb_name3', 'icb_name2', 'industry']
+EXCHANGE_COLUMNS = ['exchange', 'comGroupCode', 'board']
+
+# Cac cot so cua bang chi so toan universe
+RATIO_COLUMNS = [
+    'pe', 'pb', 'ps', 'eps', 'bvps', 'evebitda',
+    'roe', 'roa', 'roic', 'gross_margin', 'net_margin', 'ebit_margin',
+    'debt_to_equity', 'current_ratio', 'quick_ratio', 'year', 'quarter'
+]
+
+
 class FundamentalDataCrawler:
     """Lay du lieu tai chinh co ban"""
     
-    def __init__(self):
-        pass
+    def __init__(self, industry_ttl_days=7):
+        self.industry_cache_file = CACHE_DIR / 'industries.parquet'
+        self.ratios_table_file = PROCESSED_DATA_DIR / 'ratios_table.parquet'
+        self.industry_ttl = timedelta(days=industry_ttl_days)
+        self._industry_map = None
         
     def get_financial_ratios(self, symbol: str):
         """Lay cac chi so tai chinh quan trong"""
@@ -101,8 +116,87 @@ class FundamentalDataCrawler:
             traceback.print_exc()
             return None
     
+    def get_industry_map(self, refresh: bool = False):
+        """
+        Lay bang nganh (ICB) va san cua toan thi truong
+        
+        Goi listing cua vnstock mot lan, cache ra file (TTL mac dinh 7 ngay)
+        
+        Returns:
+            DataFrame index symbol, cot company_name, industry, exchange
+        """
+        if self._industry_map is not None and not refresh:
+            return self._industry_map
+        
+        cache = self.industry_cache_file
+        if not refresh and cache.exists():
+            age = datetime.now() - datetime.fromtimestamp(cache.stat().st_mtime)
+            if age < self.industry_ttl:
+                self._industry_map = pd.read_parquet(cache)
+                return self._industry_map
+        
+        try:
+            listing = Vnstock().stock(symbol='VNM', source='VCI').listing
+            industries = listing.symbols_by_industries()
+            
+            industry_col = next((c for c in INDUSTRY_COLUMNS if c in industries.columns), None)
+            name_col = next((c for c in ['organ_name', 'organ_short_name'] if c in industries.columns), None)
+            
+            result = pd.DataFrame({
+                'symbol': industries['symbol'],
+                'company_name': industries[name_col] if name_col else industries['symbol'],
+                'industry': industries[industry_col] if industry_col else 'Unknown'
+            })
+            
+            # San giao dich (neu lay duoc)
+            try:
+                exchanges = listing.symbols_by_exchange()
+                exchange_col = next((c for c in EXCHANGE_COLUMNS if c in exchanges.columns), None)
+                if exchange_col:
+                    exchange_map = exchanges.drop_duplicates('symbol').set_index('symbol')[exchange_col]
+                    result['exchange'] = result['symbol'].map(exchange_map)
+            except Exception as e:
+                logger.warning(f"Could not get exchange listing: {str(e)}")
+            
+            if 'exchange' not in result.columns:
+                result['exchange'] = None
+            
+            result['industry'] = result['industry'].fillna('Unknown')
+            result = result.drop_duplicates('symbol').set_index('symbol')
+            result.to_parquet(cache)
+            logger.info(f"Got industry map for {len(result)} symbols")
+            
+        except Exception as e:
+            logger.error(f"Error getting industry map: {str(e)}")
+            # Dung cache cu neu co, du da het han
+            if cache.exists():
+                result = pd.read_parquet(cache)
+            else:
+                result = pd.DataFrame(columns=['company_name', 'industry', 'exchange'])
+                result.index.name = 'symbol'
+        
+        self._industry_map = result
+        return result
+    
     def get_company_profile(self, symbol: str):
         """Lay thong tin doanh nghiep"""
+        industries = self.get_industry_map()
+        
+        if symbol in industries.index:
+            info = industries.loc[symbol]
+            
+            def value_or(key, default):
+                value = info.get(key)
+                return value if pd.notna(value) and value else default
+            
+            return {
+                'symbol': symbol,
+                'company_name': value_or('company_name', symbol),
+                'industry': value_or('industry', 'Unknown'),
+                'exchange': value_or('exchange', 'HOSE'),
+                'timestamp': datetime.now()
+            }
+        
         return {
             'symbol': symbol,
             'company_name': symbol,
@@ -111,6 +205,70 @@ class FundamentalDataCrawler:
             'timestamp': datetime.now()
         }
     
+    def get_ratios_table(self, symbols: list = None, use_cache: bool = True):
+        """
+        Bang chi so tai chinh cua ca universe (moi dong mot ma)
+        
+        Args:
+            symbols: Danh sach ma; None = doc bang da luu
+            use_cache: True = dung bang da luu neu co (khong goi API)
+            
+        Returns:
+            DataFrame index symbol, cac cot RATIO_COLUMNS + industry, exchange
+        """
+        if use_cache and self.ratios_table_file.exists():
+            table = pd.read_parquet(self.ratios_table_file)
+            if symbols is None:
+                return table
+            
+            missing = [s for s in symbols if s not in table.index]
+            if missing:
+                logger.info(f"Ratios table missing {len(missing)} symbols, fetching")
+                refreshed = self.refresh_ratios_table(missing)
+                if not refreshed.empty:
+                    table = refreshed
+        elif symbols is None:
+            return pd.DataFrame()
+        else:
+            table = self.refresh_ratios_table(symbols)
+            if table.empty:
+                return table
+        
+        return table.loc[[s for s in symbols if s in table.index]]
+    
+    def refresh_ratios_table(self, symbols: list):
+        """Lay lai chi so cho cac ma va ghi de bang da luu"""
+        rows = []
+        for symbol in symbols:
+            ratios = self.get_financial_ratios(symbol)
+            if ratios:
+                rows.append(ratios)
+        
+        return self.save_ratios_table(rows)
+    
+    def save_ratios_table(self, ratios_list: list):
+        """Ghi bang chi so tu list dict (gop voi bang cu, ban moi thay ban cu)"""
+        if not ratios_list:
+            return pd.DataFrame()
+        
+        table = pd.DataFrame(ratios_list).set_index('symbol')
+        for col in RATIO_COLUMNS:
+            table[col] = pd.to_numeric(table[col], errors='coerce') if col in table.columns else float('nan')
+        table = table[RATIO_COLUMNS]
+        
+        industries = self.get_industry_map()
+        table['industry'] = industries['industry'].reindex(table.index).fillna('Unknown')
+        table['exchange'] = industries['exchange'].reindex(table.index)
+        table['updated_at'] = datetime.now()
+        
+        if self.ratios_table_file.exists():
+            old = pd.read_parquet(self.ratios_table_file)
+            table = pd.concat([old[~old.index.isin(table.index)], table])
+        
+        table.to_parquet(self.ratios_table_file)
+        logger.info(f"Saved ratios table: {len(table)} symbols")
+        return table
+    
     def get_complete_fundamentals(self, symbol: str):
         """Lay toan bo du lieu co ban"""
         logger.info(f"Fetching complete fundamentals for {symbol}")
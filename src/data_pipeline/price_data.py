@@ -7,6 +7,7 @@ import numpy as np
 from datetime import datetime, timedelta
 from pathlib import Path
 import logging
+from concurrent.futures import ThreadPoolExecutor
 
 try:
     from vnstock import Vnstock
@@ -144,6 +145,21 @@ class PriceDataCrawler:
             logger.error(f"Error getting latest price for {symbol}: {str(e)}")
             return None
     
+    def get_latest_prices(self, symbols: list, max_workers: int = 8):
+        """
+        Lay gia moi nhat cho nhieu ma cung luc (mot dot I/O song song)
+        
+        Returns:
+            dict symbol -> ket qua get_latest_price (bo cac ma loi)
+        """
+        symbols = list(dict.fromkeys(symbols))
+        if not symbols:
+            return {}
+        
+        with ThreadPoolExecutor(max_workers=min(max_workers, len(symbols))) as executor:
+            latest = executor.map(self.get_latest_price, symbols)
+            return {symbol: result for symbol, result in zip(symbols, latest) if result}
+    
     def get_multiple_stocks(self, symbols: list, start_date: str = None, 
                            end_date: str = None):
         """Lay du lieu nhieu ma co phieu"""
@@ -0,0 +1,178 @@
+"""
+Danh muc ma toan thi truong (universe registry)
+
+WATCHLIST la danh sach go tay ~75 ma. Module nay giu danh muc tat ca co
+phieu niem yet tren HOSE, HNX va UPCoM (ma, ten, nganh, san), da chuan hoa
+va loai trung, luu ra file parquet de cac pipeline (update, scan, screen)
+chay tren toan thi truong hoac mot phan theo san/nganh.
+"""
+import logging
+from datetime import datetime
+from pathlib import Path
+
+import pandas as pd
+
+from config.settings import PROCESSED_DATA_DIR, WATCHLIST
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+EXCHANGES = ['HOSE', 'HNX', 'UPCOM']
+
+# Ten san theo cac nguon khac nhau -> ten chuan
+EXCHANGE_ALIASES = {
+    'HOSE': 'HOSE', 'HSX': 'HOSE',
+    'HNX': 'HNX', 'HASTC': 'HNX',
+    'UPCOM': 'UPCOM',
+}
+
+UNIVERSE_COLUMNS = ['company_name', 'industry', 'exchange']
+
+
+def normalize_universe(frame: pd.DataFrame):
+    """
+    Chuan hoa bang danh muc ma
+
+    - ma viet hoa, bo khoang trang, bo ma rong va ma trung (giu dong dau)
+    - ten san quy ve HOSE / HNX / UPCOM; ma thuoc san khac (OTC, DELISTED...) bi loai
+    - thieu nganh -> 'Unknown'
+
+    Args:
+        frame: DataFrame co cot 'symbol' (hoac index la ma) va cac cot UNIVERSE_COLUMNS
+
+    Returns:
+        DataFrame index symbol, cot company_name, industry, exchange
+    """
+    frame = frame.copy()
+    if 'symbol' not in frame.columns:
+        frame = frame.rename_axis('symbol').reset_index()
+
+    frame['symbol'] = frame['symbol'].astype(str).str.strip().str.upper()
+    frame = frame[frame['symbol'].str.len() > 0]
+
+    for col in UNIVERSE_COLUMNS:
+        if col not in frame.columns:
+            frame[col] = None
+
+    exchange = frame['exchange'].astype('string').str.strip().str.upper().replace('', pd.NA)
+    frame['exchange'] = exchange.map(EXCHANGE_ALIASES)
+    known_other = exchange.notna() & frame['exchange'].isna()
+    frame = frame[~known_other.to_numpy()]
+
+    frame['company_name'] = frame['company_name'].fillna(frame['symbol'])
+    frame['industry'] = frame['industry'].fillna('Unknown')
+
+    result = frame.drop_duplicates('symbol').set_index('symbol')[UNIVERSE_COLUMNS]
+    return result
+
+
+class UniverseRegistry:
+    """Danh muc ma toan thi truong co san va nganh"""
+
+    def __init__(self, universe_file=None):
+        """
+        Args:
+            universe_file: File luu danh muc (mac dinh data/processed/universe.parquet)
+        """
+        self.universe_file = Path(universe_file or PROCESSED_DATA_DIR / 'universe.parquet')
+        self._universe = None
+
+    # ==================== CAP NHAT ====================
+
+    def refresh(self, crawler=None):
+        """
+        Lay lai danh muc tu listing cua vnstock (qua bang nganh cua FundamentalDataCrawler)
+
+        Returns:
+            DataFrame danh muc da luu (rong neu khong lay duoc, file cu giu nguyen)
+        """
+        if crawler is None:
+            from src.data_pipeline.fundamental_data import FundamentalDataCrawler
+            crawler = FundamentalDataCrawler()
+
+        listing = crawler.get_industry_map(refresh=True)
+        if listing.empty:
+            logger.warning("Empty listing, keeping current universe")
+            return pd.DataFrame()
+
+        return self.save(listing)
+
+    def import_file(self, path):
+        """Nhap danh muc tu file cuc bo (.csv hoac .parquet) va luu lai"""
+        return self.save(self._read(Path(path)))
+
+    def save(self, frame: pd.DataFrame):
+        """Chuan hoa va ghi danh muc"""
+        universe = normalize_universe(frame)
+        universe['updated_at'] = datetime.now()
+        universe.to_parquet(self.universe_file)
+        logger.info(f"Saved universe: {len(universe)} symbols to {self.universe_file}")
+        self._universe = universe
+        return universe
+
+    # ==================== DOC ====================
+
+    def load(self, reload: bool = False):
+        """
+        Doc danh muc (cache trong bo nho)
+
+        Chua co file -> dung WATCHLIST (khong co nganh/san; loc theo san/nganh
+        se bao loi, xem symbols)
+        """
+        if self._universe is None or reload:
+            if self.universe_file.exists():
+                self._universe = normalize_universe(self._read(self.universe_file))
+            else:
+                logger.warning(f"{self.universe_file} not found, using WATCHLIST")
+                self._universe = normalize_universe(pd.DataFrame({'symbol': WATCHLIST}))
+        return self._universe
+
+    @staticmethod
+    def _read(path: Path):
+        if path.suffix == '.csv':
+            return pd.read_csv(path)
+        return pd.read_parquet(path)
+
+    def symbols(self, exchanges=None, industries=None, limit=None):
+        """
+        Danh sach ma theo san / nganh
+
+        Args:
+            exchanges: Chi lay cac san nay (vd. ['HOSE', 'HNX'])
+            industries: Chi lay cac nganh nay
+            limit: So ma toi da (theo thu tu trong danh muc)
+            
+        Raises:
+            FileNotFoundError: Loc theo san/nganh khi chua co file danh muc
+        """
+        if (exchanges or industries) and not self.universe_file.exists():
+            raise FileNotFoundError(
+                f"{self.universe_file} not found; run `python -m src.data_pipeline.universe` first"
+            )
+        universe = self.load()
+        mask = pd.Series(True, index=universe.index)
+
+        if exchanges:
+            wanted = {EXCHANGE_ALIASES.get(str(e).strip().upper(), str(e).strip().upper())
+                      for e in exchanges}
+            mask &= universe['exchange'].isin(wanted)
+        if industries:
+            mask &= universe['industry'].isin(industries)
+
+        result = list(universe.index[mask.to_numpy()])
+        return result[:limit] if limit else result
+
+    def summary(self):
+        """So ma theo san"""
+        universe = self.load()
+        return universe['exchange'].fillna('Unknown').value_counts()
+
+
+# Example usage
+if __name__ == "__main__":
+    registry = UniverseRegistry()
+    if not registry.universe_file.exists():
+        registry.refresh()
+
+    print(registry.summary().to_string())
+    print(f"\nHOSE: {len(registry.symbols(['HOSE']))} symbols")
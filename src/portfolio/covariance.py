@@ -0,0 +1,240 @@
+"""
+Ma tran hiep phuong sai / tuong quan cua universe, luu file va cap nhat tang dan
+
+Uoc luong tu bang gia dong cua (ClosePanel) tren cua so lookback_days:
+
+- sample: hiep phuong sai mau (theo tung cap phien cung co du lieu)
+- ewma: trung binh truot luy thua kieu RiskMetrics (lambda 0.94, trung binh 0)
+- ledoit_wolf: hiep phuong sai mau rut gon ve mu * I
+
+Ma tran (theo ngay, chua nhan 252) duoc luu <cache_dir>/<estimator>.npy
+(ma tran vuong 1.600 ma ghi/doc nhanh hon parquet rong nhieu lan) kem
+<estimator>.json (as_of = phien cuoi cung da dung, thu tu ma). Lan
+goi sau chi cat ma tran cho tap ma can dung; khi co phien moi, EWMA cap nhat
+S = lambda^m S + (1 - lambda) sum lambda^(m-1-j) r_j r_j' tren m phien moi
+thay vi tinh lai ca cua so. Sample / Ledoit-Wolf tinh lai toi da mot lan moi
+ngay giao dich.
+"""
+import json
+import logging
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+
+from config.settings import PROCESSED_DATA_DIR
+from src.data_pipeline.close_panel import ClosePanel, last_trading_day
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+TRADING_DAYS = 252
+ESTIMATORS = ['sample', 'ewma', 'ledoit_wolf']
+
+
+# ==================== UOC LUONG ====================
+
+def sample_covariance(returns):
+    """
+    Hiep phuong sai mau tu mang T x N (NaN: chi dung cac phien ca hai ma cung co)
+    """
+    x = np.asarray(returns, dtype=np.float64)
+    observed = (~np.isnan(x)).astype(np.float64)
+    x = np.nan_to_num(x - np.nanmean(x, axis=0))
+    pairs = observed.T @ observed
+    return x.T @ x / np.maximum(pairs - 1, 1)
+
+
+def ledoit_wolf(returns):
+    """
+    Hiep phuong sai co rut gon Ledoit-Wolf (dich ve mu * I)
+
+    Args:
+        returns: Mang T x N loi nhuan (NaN duoc coi la lech 0 so voi trung binh)
+
+    Returns:
+        (cov N x N, he so rut gon 0-1)
+    """
+    x = np.asarray(returns, dtype=np.float64)
+    x = x - np.nanmean(x, axis=0)
+    x = np.nan_to_num(x)
+    t, n = x.shape
+
+    sample = x.T @ x / t
+    mu = np.trace(sample) / n
+    delta = np.sum((sample - mu * np.eye(n)) ** 2) / n
+    # sum_t ||x_t x_t' - S||^2 = sum_t |x_t|^4 - T ||S||^2
+    beta = (np.sum(np.sum(x ** 2, axis=1) ** 2) - t * np.sum(sample ** 2)) / (n * t ** 2)
+    shrinkage = min(beta, delta) / delta if delta > 0 else 1.0
+
+    cov = (1 - shrinkage) * sample
+    cov[np.diag_indices(n)] += shrinkage * mu
+    return cov, shrinkage
+
+
+def ewma_update(cov, returns, decay):
+    """
+    Them cac phien moi vao EWMA: S = decay^m S + (1 - decay) sum decay^(m-1-j) r_j r_j'
+
+    Args:
+        cov: Ma tran N x N hien tai
+        returns: Mang m x N loi nhuan phien moi (NaN = 0)
+        decay: lambda
+    """
+    x = np.nan_to_num(np.asarray(returns, dtype=np.float64))
+    m = len(x)
+    if m == 0:
+        return cov
+    weights = (1 - decay) * decay ** np.arange(m - 1, -1, -1)
+    return decay ** m * cov + (x * weights[:, None]).T @ x
+
+
+def ewma_covariance(returns, decay, seed_days=20):
+    """EWMA tren ca cua so: khoi tao bang moment bac hai cua seed_days phien dau"""
+    x = np.nan_to_num(np.asarray(returns, dtype=np.float64))
+    k = min(seed_days, len(x))
+    seed = x[:k].T @ x[:k] / k
+    return ewma_update(seed, x[k:], decay)
+
+
+# ==================== DICH VU ====================
+
+class CovarianceService:
+    """Hiep phuong sai / tuong quan da luu cho universe"""
+
+    def __init__(self, panel=None, cache_dir=None, lookback_days=365, ewma_lambda=0.94,
+                 min_observations=60):
+        """
+        Args:
+            panel: ClosePanel (mac dinh tao moi)
+            cache_dir: Thu muc luu ma tran (mac dinh data/processed/covariance)
+            lookback_days: Cua so lich su cho sample / Ledoit-Wolf (va khi khoi tao EWMA)
+            ewma_lambda: He so suy giam EWMA theo ngay
+            min_observations: Ma co it phien hon bi loai khoi ma tran
+        """
+        self.panel = panel or ClosePanel()
+        self.cache_dir = Path(cache_dir or PROCESSED_DATA_DIR / 'covariance')
+        self.lookback_days = lookback_days
+        self.ewma_lambda = ewma_lambda
+        self.min_observations = min_observations
+        self._cache = {}
+
+    def matrix(self, symbols, estimator='ledoit_wolf', annualize=False, update=True):
+        """
+        Ma tran hiep phuong sai cho cac ma
+
+        Args:
+            symbols: Danh sach ma (thu tu hang/cot)
+            estimator: 'sample', 'ewma' hoac 'ledoit_wolf'
+            annualize: Nhan 252 (mac dinh theo ngay)
+            update: Dua ma tran len phien moi nhat neu can
+
+        Returns:
+            DataFrame ma x ma (ma thieu lich su bi bo)
+        """
+        if estimator not in ESTIMATORS:
+            raise ValueError(f"Unknown estimator: {estimator}. Use one of {ESTIMATORS}")
+
+        symbols = list(dict.fromkeys(symbols))
+        cov, meta = self._current(symbols, estimator, update)
+        columns = [s for s in symbols if s in cov.index]
+        result = cov.loc[columns, columns]
+        return result * TRADING_DAYS if annualize else result
+
+    def correlation(self, symbols, estimator='ledoit_wolf', update=True):
+        """Ma tran tuong quan tu hiep phuong sai"""
+        cov = self.matrix(symbols, estimator, update=update)
+        std = np.sqrt(np.diag(cov.to_numpy()))
+        corr = cov.to_numpy() / np.outer(std, std)
+        return pd.DataFrame(corr, index=cov.index, columns=cov.columns)
+
+    def info(self, estimator):
+        """Thong tin ma tran da luu (as_of, observations, symbols, ...) hoac None"""
+        loaded = self._load(estimator)
+        return loaded[1] if loaded else None
+
+    def _current(self, symbols, estimator, update):
+        loaded = self._load(estimator)
+        target = last_trading_day()
+
+        if loaded is not None:
+            cov, meta = loaded
+            covered = set(symbols) <= set(meta['requested'])
+            if covered and (not update or meta['checked'] == target.isoformat()):
+                return loaded
+            if covered and estimator == 'ewma' and meta['as_of']:
+                return self._extend_ewma(cov, meta, target)
+            symbols = list(dict.fromkeys(meta['requested'] + symbols))
+
+        return self._rebuild(symbols, estimator, target)
+
+    def _returns(self, symbols, start):
+        closes = self.panel.closes(symbols, start)
+        return closes.pct_change(fill_method=None).iloc[1:]
+
+    def _rebuild(self, symbols, estimator, target):
+        """Tinh lai tren ca cua so lookback_days"""
+        returns = self._returns(symbols, target - pd.Timedelta(days=self.lookback_days))
+        returns = returns.loc[:, returns.notna().sum() >= self.min_observations]
+        values = returns.to_numpy()
+
+        meta = {'estimator': estimator, 'observations': len(returns),
+                'lookback_days': self.lookback_days, 'ewma_lambda': self.ewma_lambda}
+        if values.shape[1] == 0:
+            cov = np.zeros((0, 0))
+        elif estimator == 'sample':
+            cov = sample_covariance(values)
+        elif estimator == 'ewma':
+            cov = ewma_covariance(values, self.ewma_lambda)
+        else:
+            cov, meta['shrinkage'] = ledoit_wolf(values)
+
+        meta.update({
+            'as_of': returns.index[-1].isoformat() if len(returns) else None,
+            'checked': target.isoformat(),
+            'requested': symbols
+        })
+        cov = pd.DataFrame(cov, index=returns.columns, columns=returns.columns)
+        logger.info(f"Covariance ({estimator}): {len(cov)} symbols, {len(returns)} days")
+        return self._save(estimator, cov, meta)
+
+    def _extend_ewma(self, cov, meta, target):
+        """Them cac phien sau as_of vao EWMA da luu"""
+        as_of = pd.Timestamp(meta['as_of'])
+        closes = self.panel.closes(list(cov.index), as_of)
+        new = closes.pct_change(fill_method=None)
+        new = new[new.index > as_of]
+
+        if not new.empty:
+            values = ewma_update(cov.to_numpy(), new[cov.index].to_numpy(), self.ewma_lambda)
+            cov = pd.DataFrame(values, index=cov.index, columns=cov.columns)
+            meta = {**meta, 'as_of': new.index[-1].isoformat(),
+                    'observations': meta['observations'] + len(new)}
+            logger.info(f"Covariance (ewma): +{len(new)} days for {len(cov)} symbols")
+        return self._save('ewma', cov, {**meta, 'checked': target.isoformat()})
+
+    def _paths(self, estimator):
+        return self.cache_dir / f'{estimator}.npy', self.cache_dir / f'{estimator}.json'
+
+    def _load(self, estimator):
+        if estimator in self._cache:
+            return self._cache[estimator]
+
+        matrix_file, meta_file = self._paths(estimator)
+        if not (matrix_file.exists() and meta_file.exists()):
+            return None
+        meta = json.loads(meta_file.read_text(encoding='utf-8'))
+        if meta.get('lookback_days') != self.lookback_days or meta.get('ewma_lambda') != self.ewma_lambda:
+            return None
+        cov = pd.DataFrame(np.load(matrix_file), index=meta['symbols'], columns=meta['symbols'])
+        self._cache[estimator] = (cov, meta)
+        return cov, meta
+
+    def _save(self, estimator, cov, meta):
+        matrix_file, meta_file = self._paths(estimator)
+        self.cache_dir.mkdir(parents=True, exist_ok=True)
+        meta = {**meta, 'symbols': list(cov.index)}
+        np.save(matrix_file, cov.to_numpy())
+        meta_file.write_text(json.dumps(meta, ensure_ascii=False), encoding='utf-8')
+        self._cache[estimator] = (cov, meta)
+        return cov, meta
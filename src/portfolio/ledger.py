@@ -0,0 +1,284 @@
+"""
+So cai danh muc (event-sourced): nhat ky JSONL chi ghi them + snapshot
+
+Moi giao dich (nap tien, mua, ban) la mot dong JSON ghi them vao cuoi
+nhat ky va fsync truoc khi tra ve, nen chi phi ghi la O(1) bat ke lich su
+dai bao nhieu. Trang thai (tien mat, vi the, tong nap, lai da chot) duoc
+tinh lai bang cach ap cac su kien tu snapshot gan nhat. Snapshot ghi ra
+file tam roi os.replace nen luon nguyen ven; dong cuoi nhat ky bi cat do
+crash giua chung duoc bo qua va cat khoi file khi mo lai.
+"""
+import json
+import logging
+import os
+from pathlib import Path
+
+from src.portfolio.position_book import PositionBook
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+EVENT_TYPES = ['open', 'deposit', 'buy', 'sell']
+
+# Gia von vi the = gia von cac lo (gom phi mua); snapshot khong co dau nay
+# (gia binh quan chua gom phi) bi bo qua va nhat ky duoc doc lai tu dau
+COST_BASIS = 'lots'
+
+
+def empty_state():
+    """Trang thai danh muc rong"""
+    return {
+        'cash': 0,
+        'positions': PositionBook(),
+        'total_deposits': 0,
+        'realized_pnl': 0,
+        'seq': 0,
+        'cost_basis': COST_BASIS
+    }
+
+
+def apply_event(state, event):
+    """
+    Ap mot su kien vao trang thai (tai cho)
+
+    - open: dat lai toan bo trang thai (dung khi chuyen tu portfolio.json)
+    - deposit: cong tien
+    - buy: tru 'total' (da gom phi), cong vi the voi gia von 'total' / 'shares'
+    - sell: cong 'total' (da tru phi/thue), giam vi the (tru 'cost' cua cac lo da
+      khop khoi gia von neu co), cong 'pnl' vao lai da chot
+
+    Su kien co 'migrated' chi la lich su cu, khong doi trang thai.
+    """
+    kind = event['type']
+    state['seq'] = event['seq']
+
+    if event.get('migrated'):
+        return state
+
+    if kind == 'open':
+        state['cash'] = event['cash']
+        state['positions'] = PositionBook.from_records(event['positions'])
+        state['total_deposits'] = event.get('total_deposits', 0)
+        state['realized_pnl'] = event.get('realized_pnl', 0)
+
+    elif kind == 'deposit':
+        state['cash'] += event['amount']
+        state['total_deposits'] += event['amount']
+
+    elif kind == 'buy':
+        state['cash'] -= event['total']
+        state['positions'].add(event['symbol'], event['shares'], event['total'] / event['shares'],
+                               event['date'])
+
+    elif kind == 'sell':
+        state['cash'] += event['total']
+        state['realized_pnl'] += event.get('pnl', 0)
+        state['positions'].reduce(event['symbol'], event['shares'], event.get('cost'))
+
+    else:
+        raise ValueError(f"Unknown event type: {kind}")
+
+    return state
+
+
+def find_position(state, symbol):
+    """Vi the cua mot ma (dict) hoac None"""
+    return state['positions'].get(symbol)
+
+
+def _fsync_dir(path: Path):
+    """fsync thu muc de os.replace ben vung (bo qua tren he khong ho tro)"""
+    try:
+        fd = os.open(path, os.O_RDONLY)
+    except OSError:
+        return
+    try:
+        os.fsync(fd)
+    except OSError:
+        pass
+    finally:
+        os.close(fd)
+
+
+class PortfolioLedger:
+    """Nhat ky giao dich chi ghi them voi snapshot dinh ky"""
+
+    def __init__(self, journal_file, snapshot_file=None, legacy_file=None,
+                 snapshot_every=500):
+        """
+        Args:
+            journal_file: File nhat ky JSONL
+            snapshot_file: File snapshot (mac dinh <journal>.snapshot.json)
+            legacy_file: portfolio.json cu; chuyen sang nhat ky neu chua co nhat ky
+            snapshot_every: Ghi snapshot sau moi N su kien
+        """
+        self.journal_file = Path(journal_file)
+        self.snapshot_file = Path(snapshot_file or self.journal_file.with_suffix('.snapshot.json'))
+        self.legacy_file = Path(legacy_file) if legacy_file else None
+        self.snapshot_every = snapshot_every
+        self._journal = None
+
+        self.state = self._recover()
+        self._since_snapshot = 0
+
+        if self.state['seq'] == 0 and self.legacy_file and self.legacy_file.exists():
+            self._migrate(self.legacy_file)
+
+    # ==================== GHI ====================
+
+    def record(self, event: dict):
+        """
+        Ghi mot su kien (fsync) roi ap vao trang thai
+
+        Args:
+            event: dict co 'type' (deposit / buy / sell / open) va cac truong cua loai do
+
+        Returns:
+            Su kien da ghi (co them 'seq')
+        """
+        if event.get('type') not in EVENT_TYPES:
+            raise ValueError(f"Unknown event type: {event.get('type')}")
+
+        event = {'seq': self.state['seq'] + 1, **event}
+        self._append([event])
+        apply_event(self.state, event)
+
+        self._since_snapshot += 1
+        if self._since_snapshot >= self.snapshot_every:
+            self.snapshot()
+        return event
+
+    def _append(self, events):
+        if self._journal is None:
+            self._journal = open(self.journal_file, 'a', encoding='utf-8')
+        lines = ''.join(json.dumps(e, ensure_ascii=False, default=str) + '\n' for e in events)
+        self._journal.write(lines)
+        self._journal.flush()
+        os.fsync(self._journal.fileno())
+
+    def snapshot(self):
+        """Ghi snapshot trang thai hien tai (ghi file tam + os.replace)"""
+        offset = self.journal_file.stat().st_size if self.journal_file.exists() else 0
+        state = {**self.state, 'positions': self.state['positions'].to_records()}
+        payload = {'state': state, 'journal_offset': offset}
+
+        tmp = self.snapshot_file.with_name(self.snapshot_file.name + '.tmp')
+        with open(tmp, 'w', encoding='utf-8') as f:
+            json.dump(payload, f, ensure_ascii=False, default=str)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp, self.snapshot_file)
+        _fsync_dir(self.snapshot_file.parent)
+
+        self._since_snapshot = 0
+        logger.info(f"Portfolio snapshot at seq {self.state['seq']}")
+
+    def close(self):
+        if self._journal is not None:
+            self._journal.close()
+            self._journal = None
+
+    # ==================== KHOI PHUC ====================
+
+    def _recover(self):
+        """Snapshot gan nhat + cac su kien sau no"""
+        state, offset = empty_state(), 0
+
+        if self.snapshot_file.exists():
+            try:
+                with open(self.snapshot_file, 'r', encoding='utf-8') as f:
+                    payload = json.load(f)
+                state, offset = payload['state'], payload['journal_offset']
+                state['positions'] = PositionBook.from_records(state['positions'])
+                if state.get('cost_basis') != COST_BASIS:
+                    logger.info("Snapshot uses an older cost basis, replaying journal")
+                    state, offset = empty_state(), 0
+            except (ValueError, KeyError) as e:
+                logger.error(f"Bad snapshot {self.snapshot_file}: {str(e)}, replaying journal")
+                state, offset = empty_state(), 0
+
+        if not self.journal_file.exists():
+            return state
+
+        # Nhat ky ngan hon snapshot (bi thay the) -> doc lai tu dau
+        if offset > self.journal_file.stat().st_size:
+            logger.warning("Journal shorter than snapshot offset, replaying from start")
+            state, offset = empty_state(), 0
+
+        for event in self._read_events(offset):
+            if event['seq'] > state['seq']:
+                apply_event(state, event)
+        return state
+
+    def _read_events(self, offset=0):
+        """
+        Doc su kien tu vi tri offset
+
+        Dong cuoi do dang (crash khi dang ghi) bi cat khoi file; dong hong
+        o giua nhat ky la loi that su va duoc bao ra.
+        """
+        events = []
+        with open(self.journal_file, 'rb') as f:
+            f.seek(offset)
+            position = offset
+            for raw in f:
+                try:
+                    if not raw.endswith(b'\n'):
+                        raise ValueError('incomplete line')
+                    events.append(json.loads(raw))
+                except ValueError:
+                    if f.read(1):
+                        raise ValueError(f"Corrupt journal line at byte {position} in {self.journal_file}")
+                    logger.warning(f"Truncating torn journal tail at byte {position}")
+                    self._truncate(position)
+                    break
+                position += len(raw)
+        return events
+
+    def _truncate(self, size):
+        with open(self.journal_file, 'r+b') as f:
+            f.truncate(size)
+            f.flush()
+            os.fsync(f.fileno())
+
+    def _migrate(self, legacy_file: Path):
+        """Chuyen portfolio.json cu: lich su cu (chi de xem) + mot su kien 'open'"""
+        with open(legacy_file, 'r', encoding='utf-8') as f:
+            legacy = json.load(f)
+
+        history = legacy.get('history', [])
+        events = [{'seq': i + 1, **item, 'migrated': True} for i, item in enumerate(history)]
+        events.append({
+            'seq': len(events) + 1,
+            'type': 'open',
+            'cash': legacy.get('cash', 0),
+            'positions': legacy.get('positions', []),
+            'total_deposits': sum(h.get('amount', 0) for h in history if h.get('type') == 'deposit'),
+            'realized_pnl': sum(h.get('pnl', 0) for h in history if h.get('type') == 'sell'),
+        })
+
+        self._append(events)
+        for event in events:
+            apply_event(self.state, event)
+        self.snapshot()
+        logger.info(f"Migrated {len(history)} history entries from {legacy_file}")
+
+    # ==================== DOC ====================
+
+    def history(self, types=None, include_open=False):
+        """
+        Lich su giao dich (doc tu nhat ky, khong giu trong bo nho)
+
+        Args:
+            types: Chi lay cac loai nay (vd. ['sell'])
+            include_open: Giu su kien 'open' (trang thai chuyen tu portfolio.json)
+
+        Returns:
+            List dict theo thu tu ghi
+        """
+        if not self.journal_file.exists():
+            return []
+        events = [e for e in self._read_events() if include_open or e['type'] != 'open']
+        if types is not None:
+            events = [e for e in events if e['type'] in types]
+        return events
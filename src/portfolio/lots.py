@@ -0,0 +1,316 @@
+"""
+Ke toan theo lo (lot) voi thanh toan T+2 va bieu phi/thue Viet Nam
+
+Moi lenh mua tao mot lo rieng (gia von gom ca phi mua). Lenh ban khop voi
+cac lo theo FIFO hoac theo lo chi dinh, chi tu so co phieu da ve tai
+khoan (T+2). Tien mua bi tru ngay, tien ban ve sau T+2. Lai/lo da chot
+cua tung lan khop duoc ghi vao cac mang theo thu tu ngay ban kem tong
+luy ke, nen truy van theo ma / khoang ngay la tim kiem nhi phan thay vi
+quet lai toan bo lich su.
+"""
+import bisect
+import logging
+from collections import defaultdict, deque
+
+import numpy as np
+import pandas as pd
+
+from config.settings import TRADING_FEES
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+
+# ==================== PHI / THUE ====================
+
+class FeeModel:
+    """Phi moi gioi theo bac va thue ban"""
+
+    def __init__(self, schedule=None):
+        """
+        Args:
+            schedule: dict nhu TRADING_FEES (thieu khoa nao lay mac dinh khoa do)
+        """
+        self.schedule = {**TRADING_FEES, **(schedule or {})}
+
+    @staticmethod
+    def _rate(tiers, value):
+        rate = 0.0
+        for threshold, tier_rate in sorted(tiers):
+            if value >= threshold:
+                rate = tier_rate
+        return rate
+
+    def _fee(self, tiers, value):
+        fee = value * self._rate(tiers, value)
+        return max(fee, self.schedule['min_fee']) if value > 0 else 0.0
+
+    def buy(self, shares, price):
+        """Returns: dict value, fee, total (tien phai tra)"""
+        value = shares * price
+        fee = self._fee(self.schedule['buy_fee'], value)
+        return {'value': value, 'fee': fee, 'total': value + fee}
+
+    def sell(self, shares, price):
+        """Returns: dict value, fee, tax, total (tien nhan ve)"""
+        value = shares * price
+        fee = self._fee(self.schedule['sell_fee'], value)
+        tax = value * self.schedule['sell_tax']
+        return {'value': value, 'fee': fee, 'tax': tax, 'total': value - fee - tax}
+
+    def cost_rate(self, side, value):
+        """Ty le phi (+ thue neu ban) tren gia tri lenh, dung cho uoc tinh hang loat"""
+        if side == 'buy':
+            return self._rate(self.schedule['buy_fee'], value)
+        return self._rate(self.schedule['sell_fee'], value) + self.schedule['sell_tax']
+
+    def costs(self, side, values):
+        """
+        Phi va thue cho mang gia tri lenh (moi hinh dang, 0 = khong dat lenh)
+
+        Returns:
+            (fee, tax) cung hinh dang voi values
+        """
+        values = np.asarray(values, dtype=np.float64)
+        tiers = sorted(self.schedule['buy_fee' if side == 'buy' else 'sell_fee'])
+        thresholds = np.array([threshold for threshold, _ in tiers], dtype=np.float64)
+        rates = np.array([0.0] + [rate for _, rate in tiers])
+        rate = rates[np.searchsorted(thresholds, values, side='right')]
+        fee = np.where(values > 0, np.maximum(values * rate, self.schedule['min_fee']), 0.0)
+        tax = values * self.schedule['sell_tax'] if side == 'sell' else np.zeros_like(values)
+        return fee, tax
+
+    def settle_date(self, trade_date):
+        """Ngay thanh toan: trade_date + settlement_days ngay lam viec"""
+        day = np.datetime64(pd.Timestamp(trade_date).normalize().date(), 'D')
+        return pd.Timestamp(np.busday_offset(day, self.schedule['settlement_days'], roll='forward'))
+
+
+# ==================== LO ====================
+
+class Lot:
+    """Mot lo mua"""
+
+    __slots__ = ('lot_id', 'symbol', 'trade_date', 'settle_date', 'shares', 'open_shares',
+                 'price', 'cost')
+
+    def __init__(self, lot_id, symbol, trade_date, settle_date, shares, price, cost):
+        self.lot_id = lot_id
+        self.symbol = symbol
+        self.trade_date = trade_date
+        self.settle_date = settle_date
+        self.shares = shares
+        self.open_shares = shares
+        self.price = price
+        self.cost = cost            # gia von ca lo (gom phi mua)
+
+    @property
+    def unit_cost(self):
+        return self.cost / self.shares
+
+    def to_dict(self):
+        return {slot: getattr(self, slot) for slot in self.__slots__}
+
+
+class LotLedger:
+    """Lo mo, tien mat theo ngay thanh toan va lai/lo da chot"""
+
+    def __init__(self, fees=None):
+        self.fees = fees or FeeModel()
+        self.lots = {}                          # lot_id -> Lot
+        self.open_lots = defaultdict(deque)     # symbol -> lot_id theo thu tu mua
+        self._cash = []                         # (settle_date, amount)
+
+        # Lai/lo da chot: mang theo ngay ban + tong luy ke (toan bo va tung ma)
+        self.realized = []                      # dict moi lan khop lo
+        self._dates = []
+        self._cum = [0.0]
+        self._by_symbol = defaultdict(lambda: ([], [0.0]))
+
+    @classmethod
+    def from_history(cls, events, fees=None):
+        """
+        Dung lai tu nhat ky (PortfolioLedger.history(include_open=True))
+
+        Co su kien 'open' (chuyen tu portfolio.json) thi bat dau tu trang thai
+        do, bo qua lich su cu truoc no.
+        """
+        ledger = cls(fees)
+        opened = [i for i, e in enumerate(events) if e['type'] == 'open']
+        start = opened[-1] if opened else 0
+        for event in events[start:]:
+            if not event.get('migrated'):
+                ledger.apply(event)
+        return ledger
+
+    # ==================== GHI ====================
+
+    def apply(self, event):
+        """Ap mot su kien nhat ky (open / deposit / buy / sell)"""
+        kind = event['type']
+        date = pd.Timestamp(event.get('date') or pd.Timestamp.now()).tz_localize(None).normalize()
+
+        if kind == 'open':
+            self.__init__(self.fees)
+            self._cash.append((date, event['cash']))
+            for pos in event['positions']:
+                trade_date = pd.Timestamp(pos.get('buy_date') or date).tz_localize(None).normalize()
+                self._add_lot(f"{event['seq']}:{pos['symbol']}", pos['symbol'], trade_date,
+                              trade_date, pos['shares'], pos['avg_price'],
+                              pos['shares'] * pos['avg_price'])
+
+        elif kind == 'deposit':
+            self._cash.append((date, event['amount']))
+
+        elif kind == 'buy':
+            self._cash.append((date, -event['total']))
+            self._add_lot(str(event['seq']), event['symbol'], date, self.fees.settle_date(date),
+                          event['shares'], event['price'], event['total'])
+
+        elif kind == 'sell':
+            self._cash.append((self.fees.settle_date(date), event['total']))
+            allocation = event.get('lots') or self.match(event['symbol'], event['shares'])
+            self._close(event['symbol'], allocation, date, event['shares'], event['price'], event['total'])
+
+    def _add_lot(self, lot_id, symbol, trade_date, settle_date, shares, price, cost):
+        self.lots[lot_id] = Lot(lot_id, symbol, trade_date, settle_date, shares, price, cost)
+        self.open_lots[symbol].append(lot_id)
+
+    def match(self, symbol, shares, method='FIFO', lot_ids=None, as_of=None):
+        """
+        Chon lo de ban (khong thay doi so)
+
+        Args:
+            method: 'FIFO' (lo mua truoc ban truoc), 'LIFO', hoac 'SPECIFIC' (theo lot_ids)
+            lot_ids: Thu tu lo khi method='SPECIFIC'
+            as_of: Chi dung lo da thanh toan den ngay nay (None = moi lo)
+
+        Returns:
+            List [lot_id, so co phieu]
+
+        Raises:
+            ValueError neu khong du co phieu
+        """
+        if method == 'SPECIFIC':
+            candidates = list(lot_ids or [])
+        elif method == 'LIFO':
+            candidates = list(reversed(self.open_lots[symbol]))
+        else:
+            candidates = list(self.open_lots[symbol])
+
+        as_of = pd.Timestamp(as_of).normalize() if as_of is not None else None
+        allocation, remaining = [], shares
+        for lot_id in candidates:
+            lot = self.lots.get(lot_id)
+            if lot is None or lot.symbol != symbol or lot.open_shares == 0:
+                continue
+            if as_of is not None and lot.settle_date > as_of:
+                continue
+            take = min(lot.open_shares, remaining)
+            allocation.append([lot_id, take])
+            remaining -= take
+            if remaining == 0:
+                return allocation
+
+        raise ValueError(f"Not enough settled shares of {symbol}: short {remaining}")
+
+    def _close(self, symbol, allocation, date, shares, price, proceeds):
+        for lot_id, take in allocation:
+            lot = self.lots[lot_id]
+            cost = lot.unit_cost * take
+            income = proceeds * take / shares
+            lot.open_shares -= take
+            if lot.open_shares == 0:
+                self.open_lots[symbol].remove(lot_id)
+
+            pnl = income - cost
+            self.realized.append({
+                'date': date, 'symbol': symbol, 'lot_id': lot_id, 'shares': take,
+                'buy_price': lot.price, 'sell_price': price, 'cost': cost,
+                'proceeds': income, 'pnl': pnl, 'holding_days': (date - lot.trade_date).days
+            })
+            self._index_realized(date, symbol, pnl)
+
+    def _index_realized(self, date, symbol, pnl):
+        key = date.value
+        if self._dates and key < self._dates[-1]:
+            # Ban ghi lui ngay (hiem): dung lai chi muc
+            self._dates.append(key)
+            self._rebuild_index()
+            return
+        self._dates.append(key)
+        self._cum.append(self._cum[-1] + pnl)
+        dates, cum = self._by_symbol[symbol]
+        dates.append(key)
+        cum.append(cum[-1] + pnl)
+
+    def _rebuild_index(self):
+        self.realized.sort(key=lambda r: r['date'])
+        self._dates, self._cum = [], [0.0]
+        self._by_symbol = defaultdict(lambda: ([], [0.0]))
+        for row in self.realized:
+            key = row['date'].value
+            self._dates.append(key)
+            self._cum.append(self._cum[-1] + row['pnl'])
+            dates, cum = self._by_symbol[row['symbol']]
+            dates.append(key)
+            cum.append(cum[-1] + row['pnl'])
+
+    # ==================== TRUY VAN ====================
+
+    def realized_pnl(self, symbol=None, start=None, end=None):
+        """
+        Lai/lo da chot trong [start, end] (bao gom hai dau), toan bo hoac mot ma
+
+        Tong luy ke + tim kiem nhi phan: O(log n) moi truy van.
+        """
+        dates, cum = (self._dates, self._cum) if symbol is None else self._by_symbol.get(symbol, ([], [0.0]))
+        lo = bisect.bisect_left(dates, pd.Timestamp(start).normalize().value) if start is not None else 0
+        hi = bisect.bisect_right(dates, pd.Timestamp(end).normalize().value) if end is not None else len(dates)
+        return cum[hi] - cum[lo] if hi > lo else 0.0
+
+    def realized_frame(self):
+        """Cac lan khop lo dang DataFrame"""
+        return pd.DataFrame(self.realized)
+
+    def open_lots_frame(self, symbol=None):
+        """Cac lo con mo (open_shares > 0)"""
+        symbols = [symbol] if symbol else list(self.open_lots)
+        rows = [self.lots[lot_id].to_dict() for s in symbols for lot_id in self.open_lots[s]]
+        return pd.DataFrame(rows)
+
+    def position(self, symbol, as_of=None):
+        """
+        So co phieu da ve / dang cho ve va gia von theo lo
+
+        Returns:
+            dict: settled, pending, shares, cost, unit_cost
+        """
+        as_of = pd.Timestamp(as_of or pd.Timestamp.now()).tz_localize(None).normalize()
+        lots = [self.lots[lot_id] for lot_id in self.open_lots.get(symbol, ())]
+        settled = sum(l.open_shares for l in lots if l.settle_date <= as_of)
+        shares = sum(l.open_shares for l in lots)
+        cost = sum(l.unit_cost * l.open_shares for l in lots)
+        return {
+            'settled': settled,
+            'pending': shares - settled,
+            'shares': shares,
+            'cost': cost,
+            'unit_cost': cost / shares if shares else 0.0
+        }
+
+    def cash(self, as_of=None):
+        """
+        Tien mat theo ngay thanh toan
+
+        Returns:
+            dict: settled (da ve), pending_in (tien ban chua ve), total
+        """
+        if not self._cash:
+            return {'settled': 0.0, 'pending_in': 0.0, 'total': 0.0}
+        as_of = pd.Timestamp(as_of or pd.Timestamp.now()).tz_localize(None).normalize()
+        dates = np.array([d.value for d, _ in self._cash])
+        amounts = np.array([a for _, a in self._cash], dtype=np.float64)
+        settled = float(amounts[dates <= as_of.value].sum())
+        total = float(amounts.sum())
+        return {'settled': settled, 'pending_in': total - settled, 'total': total}
@@ -0,0 +1,181 @@
+"""
+Dung lai NAV theo ngay tu lich su giao dich
+
+Cac su kien nap tien / mua / ban trong nhat ky duoc gan vao phien giao
+dich dau tien khong som hon ngay giao dich, cong don thanh ma tran so co
+phieu (ngay x ma) va chuoi tien mat, roi nhan voi ma tran gia dong cua
+cua ClosePanel trong mot luot vector. Ket qua (NAV, tien mat, ty le dau
+tu, dong gop loi nhuan cua tung ma) duoc cache ra file va chi tinh them
+cac phien moi khi khong co giao dich ghi lui ngay.
+"""
+import logging
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+
+from config.settings import PROCESSED_DATA_DIR
+from src.data_pipeline.close_panel import ClosePanel
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+NAV_COLUMNS = ['nav', 'cash', 'positions_value', 'exposure', 'flow', 'returns']
+
+
+def events_frame(history):
+    """
+    Lich su giao dich -> DataFrame (date, seq, type, symbol, shares, cash_delta, flow)
+
+    Su kien 'open' (chuyen tu portfolio.json) bi bo qua: NAV dung lai tu giao dich.
+    """
+    rows = []
+    for event in history:
+        kind = event.get('type')
+        if kind == 'deposit':
+            rows.append((event['date'], event.get('seq', 0), kind, None, 0, event['amount'], event['amount']))
+        elif kind == 'buy':
+            rows.append((event['date'], event.get('seq', 0), kind, event['symbol'],
+                         event['shares'], -event['total'], 0))
+        elif kind == 'sell':
+            rows.append((event['date'], event.get('seq', 0), kind, event['symbol'],
+                         -event['shares'], event['total'], 0))
+
+    frame = pd.DataFrame(rows, columns=['date', 'seq', 'type', 'symbol', 'shares', 'cash_delta', 'flow'])
+    frame['date'] = pd.to_datetime(frame['date'], format='ISO8601').dt.tz_localize(None).dt.normalize()
+    return frame
+
+
+class NavEngine:
+    """NAV, tien mat, ty le dau tu va dong gop theo ngay"""
+
+    def __init__(self, panel=None, cache_file=None):
+        """
+        Args:
+            panel: ClosePanel (mac dinh tao moi)
+            cache_file: File cache (mac dinh data/processed/portfolio_nav.parquet);
+                dong gop luu o <ten>_contrib.parquet
+        """
+        self.panel = panel or ClosePanel()
+        self.cache_file = Path(cache_file or PROCESSED_DATA_DIR / 'portfolio_nav.parquet')
+        self.contrib_file = self.cache_file.with_name(f"{self.cache_file.stem}_contrib.parquet")
+
+    def build(self, history, use_cache=True):
+        """
+        NAV theo ngay tu ngay giao dich dau tien den phien moi nhat
+
+        Args:
+            history: List su kien (PortfolioManager.get_history())
+            use_cache: Dung ket qua da luu, chi tinh them phien moi
+
+        Returns:
+            (nav, contributions):
+            nav - DataFrame index ngay: nav, cash, positions_value, exposure (0-1),
+                  flow (tien nap), returns (loi nhuan ngay, da loai tien nap)
+            contributions - DataFrame ngay x ma: lai/lo gia cua tung vi the (VND)
+        """
+        events = events_frame(history)
+        if events.empty:
+            return pd.DataFrame(columns=NAV_COLUMNS), pd.DataFrame()
+
+        symbols = list(events['symbol'].dropna().unique())
+        last_seq = int(events['seq'].max())
+        closes = self.panel.closes(symbols, events['date'].min()) if symbols else pd.DataFrame()
+        dates = self._calendar(events, closes)
+
+        cached = self._load() if use_cache else None
+        if cached is not None:
+            nav, contrib = cached
+            end = nav.index[-1]
+            new_events = events[events['seq'] > nav['seq'].iloc[-1]]
+            reusable = (nav.index[0] == dates[0] and end in dates
+                        and (new_events.empty or new_events['date'].min() > end))
+            if reusable:
+                if dates[-1] == end and new_events.empty:
+                    return nav[NAV_COLUMNS], contrib
+                # Tinh lai tu phien cuoi da luu (trang thai mo dau), noi cac phien sau no
+                block = dates[dates >= end]
+                previous_nav = nav['nav'].iloc[-2] if len(nav) > 1 else np.nan
+                ext_nav, ext_contrib = self._replay(events, closes, block, previous_nav)
+                nav = pd.concat([nav[NAV_COLUMNS].iloc[:-1], ext_nav])
+                contrib = pd.concat([contrib, ext_contrib.iloc[1:]]).fillna(0)
+                self._save(nav, contrib, last_seq)
+                return nav, contrib
+
+        nav, contrib = self._replay(events, closes, dates)
+        self._save(nav, contrib, last_seq)
+        return nav, contrib
+
+    @staticmethod
+    def _calendar(events, closes):
+        """Cac phien tu ngay giao dich dau tien (ngay co gia, them ngay su kien neu chua co gia)"""
+        dates = events['date'].drop_duplicates()
+        if not closes.empty:
+            dates = pd.concat([dates, closes.index.to_series()])
+        dates = pd.DatetimeIndex(dates.drop_duplicates()).sort_values()
+        return dates[dates >= events['date'].min()]
+
+    @staticmethod
+    def _replay(events, closes, dates, previous_nav=np.nan):
+        """
+        Mot luot vector tren cac ngay 'dates'
+
+        Su kien truoc ngay dau tien duoc don vao dong dau (trang thai mo dau).
+        previous_nav: NAV phien lien truoc dates[0] (de tinh loi nhuan dong dau)
+        """
+        row = np.searchsorted(dates.values, events['date'].values, side='left')
+        row = np.clip(row, 0, len(dates) - 1)
+        n = len(dates)
+
+        # Tien mat va tien nap theo ngay
+        cash = np.cumsum(np.bincount(row, weights=events['cash_delta'].astype(float), minlength=n))
+        flow_rows = row.copy()
+        flow_rows[events['date'].values < dates.values[0]] = -1  # nap truoc ky khong tinh la flow trong ky
+        valid = flow_rows >= 0
+        flow = np.bincount(flow_rows[valid], weights=events['flow'].astype(float)[valid], minlength=n)
+
+        # Ma khong co gia (khong co trong closes) khong duoc dinh gia
+        symbols = list(closes.columns) if not closes.empty else []
+        col = pd.Index(symbols).get_indexer(events['symbol'])
+        trades = col >= 0
+        if trades.any():
+            delta = np.zeros((n, len(symbols)))
+            np.add.at(delta, (row[trades], col[trades]), events['shares'].to_numpy(dtype=float)[trades])
+            shares = np.cumsum(delta, axis=0)
+
+            # Truoc phien co gia dau tien: NaN, vi the chua duoc dinh gia (khong lay gia tuong lai)
+            prices = closes.reindex(dates).ffill().to_numpy()
+            values = np.nan_to_num(shares * prices)
+            price_change = np.vstack([np.full((1, len(symbols)), np.nan), np.diff(prices, axis=0)])
+            held = np.vstack([np.zeros((1, len(symbols))), shares[:-1]])
+            contrib = np.nan_to_num(held * price_change)
+        else:
+            values = np.zeros((n, 0))
+            contrib = np.zeros((n, 0))
+
+        positions_value = values.sum(axis=1)
+        nav = cash + positions_value
+        previous = np.concatenate([[previous_nav], nav[:-1]])
+        with np.errstate(divide='ignore', invalid='ignore'):
+            returns = np.where(previous > 0, (nav - flow) / previous - 1, np.nan)
+            exposure = np.where(nav > 0, positions_value / nav, 0.0)
+
+        nav_frame = pd.DataFrame({
+            'nav': nav, 'cash': cash, 'positions_value': positions_value,
+            'exposure': exposure, 'flow': flow, 'returns': returns
+        }, index=dates)
+        nav_frame.index.name = 'date'
+        contrib_frame = pd.DataFrame(contrib, index=dates, columns=symbols)
+        return nav_frame, contrib_frame
+
+    def _load(self):
+        if not (self.cache_file.exists() and self.contrib_file.exists()):
+            return None
+        nav = pd.read_parquet(self.cache_file)
+        if nav.empty:
+            return None
+        return nav, pd.read_parquet(self.contrib_file)
+
+    def _save(self, nav, contrib, last_seq):
+        nav.assign(seq=last_seq).to_parquet(self.cache_file)
+        contrib.to_parquet(self.contrib_file)
@@ -0,0 +1,294 @@
+"""
+Toi uu ty trong danh muc theo rang buoc PORTFOLIO_CONFIG
+
+Ho tro mean-variance, minimum-variance, risk-parity va max-Sharpe tren
+ma tran loi nhuan lay tu gia dong cua da cache (ClosePanel). Hiep phuong
+sai lay tu CovarianceService (mac dinh Ledoit-Wolf, on dinh khi so ma lon
+gan bang so phien). Rang buoc:
+
+- 0 <= w_i <= max_position_size
+- tong ty trong co phieu = 1 - min_cash_reserve (phan con lai de tien mat)
+- toi da max_positions ma (giai lien tuc, giu cac ma ty trong lon nhat,
+  giai lai tren tap con)
+
+Chi dung NumPy: gradient chieu (FISTA) len tap {0 <= w <= cap, sum w = budget};
+phep chieu chinh xac O(n log n) nen 500 ma giai trong vai giay
+(xem benchmarks/bench_optimizer.py).
+"""
+import logging
+
+import numpy as np
+import pandas as pd
+
+from config.settings import PORTFOLIO_CONFIG
+from src.portfolio.covariance import CovarianceService
+from src.portfolio.returns import ReturnsEngine, TRADING_DAYS
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+METHODS = ['mean_variance', 'min_variance', 'risk_parity', 'max_sharpe']
+
+
+# ==================== GIAI ====================
+
+def project_capped_simplex(v, budget, cap):
+    """
+    Chieu v len {0 <= w <= cap, sum w = budget}
+
+    w = clip(v - tau, 0, cap); g(tau) = sum w tuyen tinh tung doan giua cac
+    diem gay v_i va v_i - cap, nen tinh g tai moi diem gay bang tong tich luy
+    roi noi suy tuyen tinh trong doan chua budget (chinh xac, O(n log n)).
+    """
+    order = np.sort(v)
+    prefix = np.concatenate([[0.0], np.cumsum(order)])
+    n = len(v)
+
+    def g(tau):
+        lo = np.searchsorted(order, tau, side='right')          # v_i <= tau: 0
+        hi = np.searchsorted(order, tau + cap, side='right')    # v_i > tau + cap: cap
+        return (prefix[hi] - prefix[lo]) - (hi - lo) * tau + (n - hi) * cap
+
+    points = np.unique(np.concatenate([order, order - cap]))
+    values = g(points)                                           # giam dan theo tau
+    k = np.searchsorted(-values, -budget)                        # values[k-1] > budget >= values[k]
+    if k == 0:
+        tau = points[0]
+    elif k == len(points):
+        tau = points[-1]
+    else:
+        t0, t1, g0, g1 = points[k - 1], points[k], values[k - 1], values[k]
+        tau = t0 + (g0 - budget) * (t1 - t0) / (g0 - g1)
+    return np.clip(v - tau, 0, cap)
+
+
+def _fista(grad, x0, lipschitz, project, max_iter=3000, tol=1e-9):
+    """Gradient chieu co gia toc Nesterov, khoi dong lai khi dong luong di nguoc gradient"""
+    step = 1.0 / lipschitz
+    x = y = project(x0)
+    t = 1.0
+    for _ in range(max_iter):
+        x_new = project(y - step * grad(y))
+        diff = x_new - x
+        if np.max(np.abs(diff)) < tol:
+            return x_new
+        if (y - x_new) @ diff > 0:
+            t = 1.0
+        t_new = (1 + np.sqrt(1 + 4 * t * t)) / 2
+        y = x_new + (t - 1) / t_new * diff
+        x, t = x_new, t_new
+    return x
+
+
+def solve_mean_variance(mu, cov, risk_aversion, budget, cap, x0=None, lipschitz=None):
+    """max mu'w - (risk_aversion / 2) w'Σw tren tap rang buoc (mu = 0: min variance)"""
+    n = len(cov)
+    lipschitz = lipschitz or np.linalg.eigvalsh(cov)[-1]
+    x0 = np.full(n, budget / n) if x0 is None else x0
+    return _fista(lambda w: risk_aversion * (cov @ w) - mu, x0, risk_aversion * lipschitz,
+                  lambda v: project_capped_simplex(v, budget, cap))
+
+
+def solve_risk_parity(cov, budget, cap, max_sweeps=200, tol=1e-8):
+    """
+    Dong gop rui ro bang nhau (w_i (Σw)_i nhu nhau)
+
+    Toa do luan phien tren bai toan loi min 0.5 w'Σw - sum log w_i, sau do
+    co ve budget; ma vuot cap bi cat va phan du chia theo ty le cho cac ma con lai.
+    """
+    n = len(cov)
+    diag = np.diag(cov).copy()
+    w = 1.0 / np.sqrt(diag)
+    s = cov @ w
+    for _ in range(max_sweeps):
+        change = 0.0
+        for i in range(n):
+            c = s[i] - diag[i] * w[i]
+            new = (-c + np.sqrt(c * c + 4 * diag[i])) / (2 * diag[i])
+            d = new - w[i]
+            if d:
+                s += d * cov[:, i]
+                w[i] = new
+                change = max(change, abs(d) / new)
+        if change < tol:
+            break
+    return _cap_proportional(w / w.sum() * budget, budget, cap)
+
+
+def _cap_proportional(w, budget, cap):
+    """Cat ty trong vuot cap, chia phan du theo ty le cho cac ma chua cham cap"""
+    w = w.copy()
+    for _ in range(len(w)):
+        over = w > cap
+        if not over.any():
+            break
+        excess = (w[over] - cap).sum()
+        w[over] = cap
+        free = w < cap
+        w[free] += excess * w[free] / w[free].sum()
+    return w
+
+
+# ==================== TOI UU DANH MUC ====================
+
+class PortfolioOptimizer:
+    """Ty trong muc tieu va danh sach lenh theo PORTFOLIO_CONFIG"""
+
+    def __init__(self, returns_engine=None, constraints=None, risk_free_rate=0.05,
+                 lookback_days=365, covariance=None, estimator='ledoit_wolf'):
+        """
+        Args:
+            returns_engine: ReturnsEngine (ma tran loi nhuan tu ClosePanel)
+            constraints: Ghi de PORTFOLIO_CONFIG (max_positions, max_position_size, min_cash_reserve)
+            risk_free_rate: Lai suat phi rui ro nam
+            lookback_days: So ngay lich su de uoc luong loi nhuan ky vong
+            covariance: CovarianceService (mac dinh tao tren cung ClosePanel)
+            estimator: 'sample', 'ewma' hoac 'ledoit_wolf'
+        """
+        self.returns_engine = returns_engine or ReturnsEngine()
+        self.covariance = covariance or CovarianceService(self.returns_engine.panel,
+                                                          lookback_days=lookback_days)
+        self.constraints = {**PORTFOLIO_CONFIG, **(constraints or {})}
+        self.risk_free_rate = risk_free_rate
+        self.lookback_days = lookback_days
+        self.estimator = estimator
+
+    def estimate(self, symbols, start=None, estimator=None):
+        """
+        Loi nhuan ky vong va hiep phuong sai (theo nam)
+
+        Returns:
+            (mu Series, cov DataFrame) chi gom ma du lich su (xem CovarianceService)
+        """
+        cov = self.covariance.matrix(symbols, estimator or self.estimator, annualize=True)
+        dropped = sorted(set(symbols) - set(cov.index))
+        if dropped:
+            logger.warning(f"Not enough history for {len(dropped)} symbols: {dropped[:10]}")
+
+        if start is None:
+            start = pd.Timestamp.now().normalize() - pd.Timedelta(days=self.lookback_days)
+        mu = self.returns_engine.return_matrix(list(cov.index), start).mean() * TRADING_DAYS
+        return mu.reindex(cov.index).fillna(0.0), cov
+
+    def optimize(self, symbols=None, method='max_sharpe', risk_aversion=3.0,
+                 expected_returns=None, cov=None):
+        """
+        Ty trong muc tieu
+
+        Args:
+            symbols: Danh sach ma (bo qua neu truyen cov)
+            method: 'mean_variance', 'min_variance', 'risk_parity', 'max_sharpe'
+            risk_aversion: He so e ngai rui ro cho mean_variance
+            expected_returns: Series loi nhuan ky vong nam (mac dinh trung binh lich su;
+                bang 0 neu truyen cov ma khong truyen expected_returns)
+            cov: DataFrame hiep phuong sai nam (mac dinh Ledoit-Wolf tu gia cache)
+
+        Returns:
+            dict: weights (Series, chi ma > 0, tong = ty trong co phieu), cash,
+            expected_return, volatility, sharpe_ratio, method
+        """
+        if method not in METHODS:
+            raise ValueError(f"Unknown method: {method}. Use one of {METHODS}")
+
+        if cov is None:
+            mu, cov = self.estimate(symbols)
+        else:
+            mu = pd.Series(0.0, index=cov.index)
+        if expected_returns is not None:
+            mu = expected_returns.reindex(cov.index).fillna(0.0)
+
+        names = cov.index
+        sigma = cov.to_numpy(dtype=np.float64)
+        mu_values = mu.to_numpy(dtype=np.float64)
+
+        cap = self.constraints['max_position_size']
+        max_positions = self.constraints['max_positions']
+        budget = 1 - self.constraints['min_cash_reserve']
+        if min(len(names), max_positions) * cap < budget:
+            budget = min(len(names), max_positions) * cap
+            logger.warning(f"Caps allow only {budget:.0%} invested; the rest stays in cash")
+
+        w = self._solve(method, mu_values, sigma, risk_aversion, budget, cap)
+
+        # Gioi han so ma: giu cac ma ty trong lon nhat, giai lai tren tap con
+        held = np.flatnonzero(w > 1e-6)
+        if len(held) > max_positions:
+            keep = np.sort(held[np.argsort(w[held])[::-1][:max_positions]])
+            w_sub = self._solve(method, mu_values[keep], sigma[np.ix_(keep, keep)],
+                                risk_aversion, budget, cap)
+            w = np.zeros(len(names))
+            w[keep] = w_sub
+
+        weights = pd.Series(w, index=names)
+        weights = weights[weights > 1e-6].sort_values(ascending=False)
+        return {'method': method, 'weights': weights, **self.stats(weights, mu, cov)}
+
+    def _solve(self, method, mu, sigma, risk_aversion, budget, cap):
+        if method == 'risk_parity':
+            return solve_risk_parity(sigma, budget, cap)
+
+        lipschitz = np.linalg.eigvalsh(sigma)[-1]
+        if method == 'min_variance':
+            return solve_mean_variance(np.zeros(len(mu)), sigma, 1.0, budget, cap, lipschitz=lipschitz)
+        if method == 'mean_variance':
+            return solve_mean_variance(mu, sigma, risk_aversion, budget, cap, lipschitz=lipschitz)
+        return self._max_sharpe(mu, sigma, budget, cap, lipschitz)
+
+    def _max_sharpe(self, mu, sigma, budget, cap, lipschitz):
+        """
+        Diem Sharpe cao nhat tren bien hieu qua
+
+        Moi risk_aversion cho mot diem tren bien; do luoi log roi thu hep
+        quanh diem tot nhat (golden section), moi lan giai khoi dong tu nghiem truoc.
+        """
+        def sharpe(w):
+            vol = np.sqrt(w @ sigma @ w)
+            return (mu @ w - self.risk_free_rate) / vol if vol > 0 else -np.inf
+
+        grid = np.logspace(-1, 3, 13)
+        solutions, w = [], None
+        for gamma in grid:
+            w = solve_mean_variance(mu, sigma, gamma, budget, cap, x0=w, lipschitz=lipschitz)
+            solutions.append(w)
+        scores = [sharpe(w) for w in solutions]
+        best = int(np.argmax(scores))
+
+        lo = np.log(grid[max(best - 1, 0)])
+        hi = np.log(grid[min(best + 1, len(grid) - 1)])
+        best_w, best_score = solutions[best], scores[best]
+        ratio = (np.sqrt(5) - 1) / 2
+        a, b = hi - ratio * (hi - lo), lo + ratio * (hi - lo)
+        cache = {}
+
+        def evaluate(log_gamma):
+            if log_gamma not in cache:
+                w = solve_mean_variance(mu, sigma, np.exp(log_gamma), budget, cap,
+                                        x0=best_w, lipschitz=lipschitz)
+                cache[log_gamma] = (sharpe(w), w)
+            return cache[log_gamma]
+
+        for _ in range(10):
+            if evaluate(a)[0] > evaluate(b)[0]:
+                hi, b = b, a
+                a = hi - ratio * (hi - lo)
+            else:
+                lo, a = a, b
+                b = lo + ratio * (hi - lo)
+
+        for score, w in cache.values():
+            if score > best_score:
+                best_score, best_w = score, w
+        return best_w
+
+    def stats(self, weights, mu, cov):
+        """Loi nhuan ky vong, bien dong, Sharpe (nam) cua bo ty trong; tien mat loi nhuan 0"""
+        names = weights.index
+        w = weights.to_numpy(dtype=np.float64)
+        expected = float(mu.reindex(names).fillna(0.0).to_numpy() @ w)
+        volatility = float(np.sqrt(w @ cov.loc[names, names].to_numpy() @ w))
+        return {
+            'cash': 1 - float(w.sum()),
+            'expected_return': expected,
+            'volatility': volatility,
+            'sharpe_ratio': (expected - self.risk_free_rate) / volatility if volatility > 0 else 0.0
+        }
@@ -3,12 +3,19 @@ Module quản lý danh mục đầu tư
 """
 import pandas as pd
 import numpy as np
-import json
 from datetime import datetime, timedelta
 from pathlib import Path
 import logging
 
 from src.data_pipeline.price_data import PriceDataCrawler
+from src.data_pipeline.close_panel import ClosePanel
+from src.portfolio.ledger import PortfolioLedger, find_position
+from src.portfolio.returns import ReturnsEngine
+from src.portfolio.nav import NavEngine
+from src.portfolio.lots import FeeModel, LotLedger
+from src.portfolio.optimizer import PortfolioOptimizer
+from src.portfolio.covariance import CovarianceService
+from src.portfolio.rebalance import RebalanceEngine
 from config.settings import PORTFOLIO_CONFIG, DATA_DIR
 
 logging.basicConfig(level=logging.INFO)
@@ -18,38 +25,73 @@ logger = logging.getLogger(__name__)
 class PortfolioManager:
     """Quản lý danh mục đầu tư cá nhân"""
     
-    def __init__(self, portfolio_file='portfolio.json'):
+    def __init__(self, portfolio_file='portfolio.json', price_ttl=60, fee_schedule=None):
+        """
+        Args:
+            portfolio_file: Tên file danh mục; giao dịch ghi vào nhật ký
+                <tên>_journal.jsonl (portfolio.json cũ được chuyển sang lần đầu)
+            price_ttl: Số giây dùng lại snapshot giá (một báo cáo / một lần render)
+            fee_schedule: Biểu phí/thuế ghi đè TRADING_FEES (xem config.settings)
+        """
         self.portfolio_file = DATA_DIR / portfolio_file
         self.price_crawler = PriceDataCrawler()
-        self.portfolio = self._load_portfolio()
+        panel = ClosePanel(self.price_crawler)
+        self.covariance = CovarianceService(panel)
+        self.returns_engine = ReturnsEngine(panel, covariance=self.covariance)
+        self.nav_engine = NavEngine(
+            self.returns_engine.panel,
+            cache_file=self.portfolio_file.with_name(f"{self.portfolio_file.stem}_nav.parquet")
+        )
+        self.price_ttl = timedelta(seconds=price_ttl)
+        self._prices = {}
+        self._prices_time = None
+        self.ledger = PortfolioLedger(
+            journal_file=self.portfolio_file.with_name(f"{self.portfolio_file.stem}_journal.jsonl"),
+            legacy_file=self.portfolio_file
+        )
+        self.portfolio = self.ledger.state
+        self.fees = FeeModel(fee_schedule)
+        self.optimizer = PortfolioOptimizer(self.returns_engine, covariance=self.covariance)
+        self.rebalancer = RebalanceEngine(self.fees)
+        self._lots = None
     
-    def _load_portfolio(self):
-        """Load danh mục từ file"""
-        if self.portfolio_file.exists():
-            with open(self.portfolio_file, 'r', encoding='utf-8') as f:
-                return json.load(f)
-        else:
-            return {
-                'cash': 0,
-                'positions': [],
-                'history': []
-            }
+    def get_history(self, types=None):
+        """Lịch sử giao dịch (đọc từ nhật ký)"""
+        return self.ledger.history(types)
+    
+    def get_nav(self):
+        """
+        NAV theo ngày dựng lại từ lịch sử giao dịch và giá đóng cửa
+        
+        Returns:
+            (nav, contributions) - xem NavEngine.build
+        """
+        return self.nav_engine.build(self.get_history())
+    
+    def get_lots(self):
+        """
+        Sổ lô (LotLedger) dựng lại từ nhật ký lần đầu gọi, sau đó cập nhật theo từng lệnh
+        
+        Dùng cho số cổ phiếu đã về (T+2), lô mở và lãi/lỗ đã chốt theo ngày / mã.
+        """
+        if self._lots is None:
+            self._lots = LotLedger.from_history(self.ledger.history(include_open=True), self.fees)
+        return self._lots
     
-    def _save_portfolio(self):
-        """Lưu danh mục vào file"""
-        with open(self.portfolio_file, 'w', encoding='utf-8') as f:
-            json.dump(self.portfolio, f, indent=2, ensure_ascii=False)
-        logger.info(f"Portfolio saved to {self.portfolio_file}")
+    def _record(self, event):
+        """Ghi nhật ký và cập nhật sổ lô nếu đã dựng"""
+        event = self.ledger.record(event)
+        if self._lots is not None:
+            self._lots.apply(event)
+        return event
     
     def add_cash(self, amount: float):
         """Nạp tiền vào tài khoản"""
-        self.portfolio['cash'] += amount
-        self.portfolio['history'].append({
+        self._record({
             'date': datetime.now().isoformat(),
             'type': 'deposit',
             'amount': amount
         })
-        self._save_portfolio()
         logger.info(f"Added {amount:,.0f} VND to portfolio")
     
     def buy_stock(self, symbol: str, shares: int, price: float, date=None):
@@ -65,55 +107,39 @@ class PortfolioManager:
         if date is None:
             date = datetime.now().isoformat()
         
-        total_cost = shares * price * 1.0015  # Phí 0.15%
+        order = self.fees.buy(shares, price)
+        total_cost = order['total']
         
         if total_cost > self.portfolio['cash']:
             logger.error(f"Insufficient cash. Need {total_cost:,.0f}, have {self.portfolio['cash']:,.0f}")
             return False
         
-        # Trừ tiền
-        self.portfolio['cash'] -= total_cost
-        
-        # Tìm position hiện có
-        existing_position = None
-        for pos in self.portfolio['positions']:
-            if pos['symbol'] == symbol:
-                existing_position = pos
-                break
-        
-        if existing_position:
-            # Cập nhật position hiện có
-            total_shares = existing_position['shares'] + shares
-            total_value = existing_position['shares'] * existing_position['avg_price'] + shares * price
-            existing_position['avg_price'] = total_value / total_shares
-            existing_position['shares'] = total_shares
-        else:
-            # Thêm position mới
-            self.portfolio['positions'].append({
-                'symbol': symbol,
-                'shares': shares,
-                'avg_price': price,
-                'buy_date': date
-            })
-        
-        # Lưu lịch sử
-        self.portfolio['history'].append({
+        # Ghi nhật ký (ledger cập nhật tiền và vị thế, mỗi lệnh mua là một lô)
+        self._record({
             'date': date,
             'type': 'buy',
             'symbol': symbol,
             'shares': shares,
             'price': price,
+            'fee': order['fee'],
             'total': total_cost
         })
         
-        self._save_portfolio()
         logger.info(f"Bought {shares} shares of {symbol} at {price:,.0f}")
         return True
     
-    def sell_stock(self, symbol: str, shares: int, price: float, date=None):
+    def sell_stock(self, symbol: str, shares: int, price: float, date=None,
+                   lot_method='FIFO', lot_ids=None):
         """
         Bán cổ phiếu
         
+        Chỉ bán được cổ phiếu đã về tài khoản (T+2). Giá vốn và P&L tính
+        theo các lô được khớp; tiền bán (đã trừ phí và thuế) về sau T+2.
+        
+        Args:
+            lot_method: 'FIFO', 'LIFO' hoặc 'SPECIFIC' (bán theo lot_ids)
+            lot_ids: Danh sách mã lô khi lot_method='SPECIFIC' (xem get_lots().open_lots_frame())
+        
         Returns:
             dict với thông tin P&L hoặc False nếu lỗi
         """
@@ -121,11 +147,7 @@ class PortfolioManager:
             date = datetime.now().isoformat()
         
         # Tìm position
-        position = None
-        for pos in self.portfolio['positions']:
-            if pos['symbol'] == symbol:
-                position = pos
-                break
+        position = find_position(self.portfolio, symbol)
         
         if not position:
             logger.error(f"No position found for {symbol}")
@@ -135,81 +157,110 @@ class PortfolioManager:
             logger.error(f"Cannot sell {shares} shares. Only have {position['shares']}")
             return False
         
-        # Tính toán P&L
-        buy_value = shares * position['avg_price']
-        sell_value = shares * price * 0.999  # Phí + thuế 0.1%
+        # Khớp lô trong số cổ phiếu đã về
+        lots = self.get_lots()
+        trade_day = pd.Timestamp(date).tz_localize(None).normalize()
+        try:
+            allocation = lots.match(symbol, shares, lot_method, lot_ids, as_of=trade_day)
+        except ValueError:
+            settled = lots.position(symbol, as_of=trade_day)['settled']
+            logger.error(f"Cannot sell {shares} shares of {symbol}. Only {settled} settled (T+{self.fees.schedule['settlement_days']})")
+            return False
+        
+        # Tính toán P&L theo giá vốn các lô (gồm phí mua)
+        buy_value = sum(lots.lots[lot_id].unit_cost * take for lot_id, take in allocation)
+        order = self.fees.sell(shares, price)
+        sell_value = order['total']
         pnl = sell_value - buy_value
         pnl_percent = (pnl / buy_value) * 100
         
-        # Cập nhật position
-        position['shares'] -= shares
-        
-        # Xóa position nếu bán hết
-        if position['shares'] == 0:
-            self.portfolio['positions'].remove(position)
+        avg_cost = buy_value / shares
         
-        # Cộng tiền
-        self.portfolio['cash'] += sell_value
-        
-        # Lưu lịch sử
-        self.portfolio['history'].append({
+        # Ghi nhật ký (ledger cập nhật tiền và giá vốn còn lại của vị thế, sổ lô đóng các lô đã khớp)
+        self._record({
             'date': date,
             'type': 'sell',
             'symbol': symbol,
             'shares': shares,
             'price': price,
+            'fee': order['fee'],
+            'tax': order['tax'],
             'total': sell_value,
+            'lots': allocation,
+            'cost': buy_value,
             'pnl': pnl,
             'pnl_percent': pnl_percent
         })
         
-        self._save_portfolio()
         logger.info(f"Sold {shares} shares of {symbol} at {price:,.0f}. P&L: {pnl:,.0f} ({pnl_percent:.2f}%)")
         
         return {
             'symbol': symbol,
             'shares': shares,
             'sell_price': price,
-            'avg_cost': position['avg_price'],
+            'avg_cost': avg_cost,
+            'lots': allocation,
             'pnl': pnl,
             'pnl_percent': pnl_percent
         }
     
-    def get_current_value(self):
-        """Tính giá trị danh mục hiện tại"""
-        total_value = self.portfolio['cash']
-        positions_value = 0
-        position_details = []
+    def get_price_snapshot(self, refresh=False):
+        """
+        Giá hiện tại của mọi vị thế, lấy song song một lượt
         
-        for pos in self.portfolio['positions']:
-            # Lấy giá hiện tại
-            latest = self.price_crawler.get_latest_price(pos['symbol'])
-            
-            if latest:
-                current_price = latest['close']
-                pos_value = pos['shares'] * current_price
-                pnl = (current_price - pos['avg_price']) * pos['shares']
-                pnl_percent = ((current_price - pos['avg_price']) / pos['avg_price']) * 100
-                
-                positions_value += pos_value
-                
-                position_details.append({
-                    'symbol': pos['symbol'],
-                    'shares': pos['shares'],
-                    'avg_price': pos['avg_price'],
-                    'current_price': current_price,
-                    'value': pos_value,
-                    'cost': pos['shares'] * pos['avg_price'],
-                    'pnl': pnl,
-                    'pnl_percent': pnl_percent,
-                    'weight': 0  # Will calculate later
-                })
+        Snapshot được dùng lại trong price_ttl giây để một báo cáo
+        (get_current_value, get_performance, suggest_rebalance) chỉ gọi API
+        một lần; mã mới mua chưa có trong snapshot được lấy bổ sung.
         
-        total_value += positions_value
+        Returns:
+            dict symbol -> giá đóng cửa mới nhất
+        """
+        symbols = self.portfolio['positions'].symbols
+        expired = (self._prices_time is None
+                   or datetime.now() - self._prices_time > self.price_ttl)
+        
+        if refresh or expired:
+            missing = symbols
+            self._prices = {}
+            self._prices_time = datetime.now()
+        else:
+            missing = [s for s in symbols if s not in self._prices]
         
-        # Tính weight
-        for pos in position_details:
-            pos['weight'] = (pos['value'] / total_value) * 100 if total_value > 0 else 0
+        if missing:
+            latest = self.price_crawler.get_latest_prices(missing)
+            self._prices.update({symbol: item['close'] for symbol, item in latest.items()})
+        
+        return {s: self._prices[s] for s in symbols if s in self._prices}
+    
+    def get_current_value(self, refresh_prices=False):
+        """Tính giá trị danh mục hiện tại"""
+        book = self.portfolio['positions']
+        
+        # Lấy giá hiện tại (snapshot dùng chung trong một báo cáo)
+        prices = self.get_price_snapshot(refresh=refresh_prices)
+        
+        # Định giá cả sổ bằng mảng (shares @ prices)
+        val = book.valuation(prices)
+        priced = ~np.isnan(val['price'])
+        positions_value = float(val['value'][priced].sum())
+        total_value = self.portfolio['cash'] + positions_value
+        weight = val['value'] / total_value * 100 if total_value > 0 else np.zeros(len(book))
+        
+        symbols = book.symbols
+        position_details = [
+            {
+                'symbol': symbols[i],
+                'shares': int(book.shares[i]),
+                'avg_price': float(book.avg_price[i]),
+                'current_price': float(val['price'][i]),
+                'value': float(val['value'][i]),
+                'cost': float(val['cost'][i]),
+                'pnl': float(val['pnl'][i]),
+                'pnl_percent': float(val['pnl_percent'][i]),
+                'weight': float(weight[i])
+            }
+            for i in np.flatnonzero(priced)
+        ]
         
         return {
             'total_value': total_value,
@@ -219,27 +270,26 @@ class PortfolioManager:
             'positions': position_details
         }
     
-    def get_performance(self):
-        """Tính toán hiệu suất đầu tư"""
-        # Tính tổng tiền nạp vào
-        total_deposits = sum(
-            h['amount'] for h in self.portfolio['history'] 
-            if h['type'] == 'deposit'
-        )
+    def get_performance(self, current=None):
+        """
+        Tính toán hiệu suất đầu tư
+        
+        Args:
+            current: Kết quả get_current_value đã có (tránh định giá lại)
+        """
+        # Tổng tiền nạp vào (ledger cộng dồn)
+        total_deposits = self.portfolio['total_deposits']
         
         # Giá trị hiện tại
-        current = self.get_current_value()
+        current = current or self.get_current_value()
         current_value = current['total_value']
         
         # P&L tổng
         total_pnl = current_value - total_deposits
         total_pnl_percent = (total_pnl / total_deposits * 100) if total_deposits > 0 else 0
         
-        # Tính realized P&L từ lịch sử bán
-        realized_pnl = sum(
-            h.get('pnl', 0) for h in self.portfolio['history']
-            if h['type'] == 'sell'
-        )
+        # Realized P&L (ledger cộng dồn từ các lệnh bán)
+        realized_pnl = self.portfolio['realized_pnl']
         
         # Unrealized P&L
         unrealized_pnl = sum(pos['pnl'] for pos in current['positions'])
@@ -254,49 +304,33 @@ class PortfolioManager:
         }
     
     def get_risk_metrics(self):
-        """Tính các chỉ số rủi ro"""
-        if not self.portfolio['positions']:
-            return {}
-        
-        returns = []
-        
-        for pos in self.portfolio['positions']:
-            # Lấy lịch sử giá
-            df = self.price_crawler.get_historical_data(
-                pos['symbol'],
-                start_date=(datetime.now() - timedelta(days=365)).strftime('%Y-%m-%d')
-            )
-            
-            if not df.empty:
-                daily_returns = df['close'].pct_change().dropna()
-                returns.extend(daily_returns.values)
+        """
+        Tính các chỉ số rủi ro từ chuỗi NAV của danh mục hiện tại
         
-        if not returns:
+        NAV theo ngày = số cổ phiếu đang giữ × giá đóng cửa (ma trận ngày × mã
+        từ bảng giá cục bộ), nên volatility, Sharpe và max drawdown là của
+        danh mục chứ không phải của các mã gộp lại. Rủi ro ex-ante (volatility,
+        VaR tham số, đóng góp rủi ro từng mã) tính từ ma trận hiệp phương sai
+        EWMA đã lưu của CovarianceService với tỷ trọng theo giá đóng cửa gần nhất.
+        """
+        book = self.portfolio['positions']
+        if not book:
             return {}
         
-        returns = np.array(returns)
-        
-        # Tính toán metrics
-        volatility = np.std(returns) * np.sqrt(252) * 100  # Annualized
-        
-        # Sharpe Ratio (giả sử risk-free rate = 5%)
-        risk_free_rate = 0.05
-        perf = self.get_performance()
-        annual_return = perf['total_pnl_percent'] / 100
-        sharpe_ratio = (annual_return - risk_free_rate) / (volatility / 100) if volatility > 0 else 0
-        
-        # Max Drawdown (simplified)
-        max_drawdown = np.min(returns) * 100
+        holdings = dict(zip(book.symbols, book.shares.tolist()))
+        series = self.returns_engine.portfolio_series(holdings)
+        if series.empty:
+            return {}
         
-        return {
-            'volatility': volatility,
-            'sharpe_ratio': sharpe_ratio,
-            'max_drawdown': max_drawdown
-        }
+        metrics = self.returns_engine.metrics(series)
+        weights = self.returns_engine.weights(holdings)
+        if not weights.empty:
+            metrics.update(self.returns_engine.risk.covariance_risk(weights.iloc[-1].dropna()))
+        return metrics
     
-    def suggest_rebalance(self):
+    def suggest_rebalance(self, current=None):
         """Đề xuất tái cân bằng danh mục"""
-        current = self.get_current_value()
+        current = current or self.get_current_value()
         suggestions = []
         
         max_weight = PORTFOLIO_CONFIG['max_position_size'] * 100
@@ -341,10 +375,83 @@ class PortfolioManager:
         
         return suggestions
     
+    def plan_rebalance(self, target_weights=None, threshold=None):
+        """
+        Lệnh tái cân bằng (lô 100 cổ phiếu, phí/thuế, tiền mặt, sổ sau giao dịch)
+        
+        Chỉ bán cổ phiếu đã về (T+2) tính đến hôm nay, nên lệnh mua không dựa
+        vào tiền từ lệnh bán sẽ bị từ chối.
+        
+        Args:
+            target_weights: Series mã -> tỷ trọng mục tiêu; None = giới hạn PORTFOLIO_CONFIG
+            threshold: Ngưỡng lệch để đặt lệnh (xem RebalanceEngine.plan)
+        
+        Returns:
+            dict: orders, book, summary (xem RebalanceEngine.plan)
+        """
+        prices = dict(self.get_price_snapshot())
+        if target_weights is not None:
+            missing = [s for s in target_weights.index if s not in prices]
+            if missing:
+                latest = self.price_crawler.get_latest_prices(missing)
+                prices.update({symbol: item['close'] for symbol, item in latest.items()})
+        
+        book = self.portfolio['positions']
+        lots = self.get_lots()
+        sellable = {symbol: lots.position(symbol)['settled'] for symbol in book.symbols}
+        return self.rebalancer.plan(book, self.portfolio['cash'], prices, target_weights, threshold, sellable)
+    
+    def execute_rebalance(self, plan, date=None):
+        """
+        Đặt các lệnh của plan_rebalance (bán trước, mua sau)
+        
+        Lệnh mua được tính với tiền từ các lệnh bán; nếu có lệnh bán bị từ chối
+        thì bỏ toàn bộ lệnh mua để không vượt trần tỷ trọng / dưới mức tiền mặt tối thiểu.
+        
+        Returns:
+            List dict: symbol, action, shares, ok (False nếu lệnh bị từ chối hoặc bị bỏ)
+        """
+        results = []
+        sell_failed = False
+        for order in plan['orders'].itertuples(index=False):
+            shares, price = int(order.shares), float(order.price)
+            if order.action == 'SELL':
+                ok = self.sell_stock(order.symbol, shares, price, date)
+                sell_failed = sell_failed or not ok
+            elif sell_failed:
+                logger.warning(f"Skipping BUY {shares} {order.symbol}: a rebalance sell was rejected")
+                ok = False
+            else:
+                ok = self.buy_stock(order.symbol, shares, price, date)
+            results.append({'symbol': order.symbol, 'action': order.action,
+                            'shares': shares, 'ok': bool(ok)})
+        return results
+    
+    def optimize(self, symbols=None, method='max_sharpe', **kwargs):
+        """
+        Tỷ trọng mục tiêu theo PORTFOLIO_CONFIG và lệnh để đạt tới
+        
+        Args:
+            symbols: Mã ứng viên (luôn gồm các mã đang nắm giữ)
+            method: 'mean_variance', 'min_variance', 'risk_parity', 'max_sharpe'
+            **kwargs: Truyền cho PortfolioOptimizer.optimize (risk_aversion, expected_returns)
+        
+        Returns:
+            dict của PortfolioOptimizer.optimize, thêm 'trades' (lệnh theo lô) và
+            'rebalance' (kết quả plan_rebalance đầy đủ)
+        """
+        held = self.portfolio['positions'].symbols
+        candidates = list(dict.fromkeys(held + list(symbols or [])))
+        
+        result = self.optimizer.optimize(candidates, method, **kwargs)
+        result['rebalance'] = self.plan_rebalance(result['weights'])
+        result['trades'] = result['rebalance']['orders']
+        return result
+    
     def print_summary(self):
         """In báo cáo tóm tắt"""
-        current = self.get_current_value()
-        perf = self.get_performance()
+        current = self.get_current_value(refresh_prices=True)
+        perf = self.get_performance(current)
         
         print("\n" + "="*80)
         print("PORTFOLIO SUMMARY")
@@ -369,7 +476,7 @@ class PortfolioManager:
                       f"P&L: {pos['pnl']:,.0f} ({pos['pnl_percent']:+.2f}%)")
         
         # Suggestions
-        suggestions = self.suggest_rebalance()
+        suggestions = self.suggest_rebalance(current)
         if suggestions:
             print(f"\n💡 Đề xuất:")
             for sug in suggestions:
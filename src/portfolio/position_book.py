@@ -0,0 +1,175 @@
+"""
+So vi the: tra cuu theo ma O(1), so luong/gia von luu bang mang song song
+
+Vi tri cua moi ma trong mang duoc giu trong dict symbol -> dong; them vi the
+ghi vao cuoi mang (tang gap doi khi day), xoa vi the doi cho dong cuoi vao
+dong bi xoa. Dinh gia ca so la mot phep nhan vo huong shares @ prices tren
+vector gia xep cung thu tu voi symbols.
+"""
+import numpy as np
+
+
+class PositionBook:
+    """Vi the theo ma voi mang shares / avg_price"""
+
+    def __init__(self, capacity=16):
+        self._index = {}
+        self._symbols = []
+        self._dates = []
+        self._shares = np.zeros(capacity, dtype=np.int64)
+        self._avg_price = np.zeros(capacity, dtype=np.float64)
+
+    @classmethod
+    def from_records(cls, records):
+        """Tao tu list dict (symbol, shares, avg_price, buy_date) nhu portfolio.json"""
+        book = cls(capacity=max(16, len(records)))
+        for rec in records:
+            book.add(rec['symbol'], rec['shares'], rec['avg_price'], rec.get('buy_date'))
+        return book
+
+    def to_records(self):
+        """List dict theo thu tu dong (dung khi ghi snapshot / hien thi)"""
+        return [self._record(row) for row in range(len(self._symbols))]
+
+    # ==================== CAP NHAT ====================
+
+    def add(self, symbol, shares, price, date=None):
+        """Mua them: cong so luong, gia von binh quan gia quyen"""
+        row = self._index.get(symbol)
+        if row is not None:
+            total = self._shares[row] + shares
+            self._avg_price[row] = (self._shares[row] * self._avg_price[row] + shares * price) / total
+            self._shares[row] = total
+            return
+
+        row = len(self._symbols)
+        if row == len(self._shares):
+            self._shares = np.concatenate([self._shares, np.zeros_like(self._shares)])
+            self._avg_price = np.concatenate([self._avg_price, np.zeros_like(self._avg_price)])
+
+        self._index[symbol] = row
+        self._symbols.append(symbol)
+        self._dates.append(date)
+        self._shares[row] = shares
+        self._avg_price[row] = price
+
+    def reduce(self, symbol, shares, cost=None):
+        """
+        Ban bot; ban het thi xoa vi the
+
+        cost: Gia von cua phan ban (theo lo da khop); phan con lai giu gia von
+            con lai. None = giu nguyen gia binh quan.
+        """
+        row = self._index[symbol]
+        if shares > self._shares[row]:
+            raise ValueError(f"Cannot reduce {symbol} by {shares}, only {self._shares[row]} held")
+        remaining = self._shares[row] - shares
+        if cost is not None and remaining > 0:
+            self._avg_price[row] = (self._shares[row] * self._avg_price[row] - cost) / remaining
+        self._shares[row] = remaining
+        if remaining == 0:
+            self.remove(symbol)
+
+    def remove(self, symbol):
+        """Xoa vi the (doi dong cuoi vao cho trong)"""
+        row = self._index.pop(symbol)
+        last = len(self._symbols) - 1
+        if row != last:
+            moved = self._symbols[last]
+            self._symbols[row] = moved
+            self._dates[row] = self._dates[last]
+            self._shares[row] = self._shares[last]
+            self._avg_price[row] = self._avg_price[last]
+            self._index[moved] = row
+        self._symbols.pop()
+        self._dates.pop()
+        self._shares[last] = 0
+        self._avg_price[last] = 0
+
+    # ==================== TRA CUU ====================
+
+    def get(self, symbol):
+        """Vi the cua mot ma (dict) hoac None"""
+        row = self._index.get(symbol)
+        return None if row is None else self._record(row)
+
+    def _record(self, row):
+        return {
+            'symbol': self._symbols[row],
+            'shares': int(self._shares[row]),
+            'avg_price': float(self._avg_price[row]),
+            'buy_date': self._dates[row]
+        }
+
+    def __contains__(self, symbol):
+        return symbol in self._index
+
+    def __len__(self):
+        return len(self._symbols)
+
+    def __iter__(self):
+        return iter(self.to_records())
+
+    def __bool__(self):
+        return bool(self._symbols)
+
+    def __eq__(self, other):
+        if isinstance(other, PositionBook):
+            return self.to_records() == other.to_records()
+        if isinstance(other, list):
+            return self.to_records() == other
+        return NotImplemented
+
+    @property
+    def symbols(self):
+        return list(self._symbols)
+
+    @property
+    def shares(self):
+        """Mang so luong (view, cung thu tu voi symbols)"""
+        return self._shares[:len(self._symbols)]
+
+    @property
+    def avg_price(self):
+        """Mang gia von binh quan (view, cung thu tu voi symbols)"""
+        return self._avg_price[:len(self._symbols)]
+
+    # ==================== DINH GIA ====================
+
+    def price_vector(self, prices):
+        """
+        Vector gia theo thu tu symbols
+
+        Args:
+            prices: Mang da xep theo symbols, hoac dict / Series ma -> gia (thieu -> NaN)
+        """
+        if isinstance(prices, np.ndarray):
+            return prices.astype(np.float64, copy=False)
+        return np.array([prices.get(symbol, np.nan) for symbol in self._symbols], dtype=np.float64)
+
+    def value(self, prices):
+        """Tong gia tri thi truong (bo qua ma khong co gia)"""
+        price = self.price_vector(prices)
+        priced = ~np.isnan(price)
+        return float(self.shares[priced] @ price[priced])
+
+    def cost_basis(self):
+        """Tong gia von"""
+        return float(self.shares @ self.avg_price)
+
+    def valuation(self, prices):
+        """
+        Dinh gia tung vi the bang mang
+
+        Returns:
+            dict cac mang cung thu tu voi symbols: price, value, cost, pnl, pnl_percent
+            (NaN voi ma khong co gia)
+        """
+        price = self.price_vector(prices)
+        shares = self.shares.astype(np.float64)
+        cost = shares * self.avg_price
+        value = shares * price
+        pnl = value - cost
+        with np.errstate(divide='ignore', invalid='ignore'):
+            pnl_percent = (price - self.avg_price) / self.avg_price * 100
+        return {'price': price, 'value': value, 'cost': cost, 'pnl': pnl, 'pnl_percent': pnl_percent}
@@ -0,0 +1,230 @@
+"""
+Lenh tai can bang: so co phieu chinh xac theo lo, phi, tien mat va so sau giao dich
+
+Tu so vi the hien tai, gia va ty trong muc tieu (hoac quy tac lech
+rebalance_threshold quanh gioi han PORTFOLIO_CONFIG), tinh lenh mua/ban
+lam tron theo lo HOSE (100 co phieu), phi/thue theo FeeModel, tien mat sau
+giao dich va so vi the sau khi khop. Moi phep tinh chay tren mang
+(phuong an x ma), nen quet hang nghin nguong / bo ty trong la mot luot vector.
+"""
+import logging
+
+import numpy as np
+import pandas as pd
+
+from config.settings import PORTFOLIO_CONFIG
+from src.portfolio.lots import FeeModel
+from src.portfolio.position_book import PositionBook
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+LOT_SIZE = 100  # Lo chan HOSE (HNX / UPCoM cung 100)
+
+ORDER_COLUMNS = ['symbol', 'action', 'shares', 'price', 'value', 'fee', 'tax', 'cash',
+                 'current_weight', 'target_weight']
+
+
+class RebalanceEngine:
+    """Ke hoach tai can bang va mo phong so sau giao dich"""
+
+    def __init__(self, fees=None, config=None, lot_size=LOT_SIZE):
+        """
+        Args:
+            fees: FeeModel (mac dinh theo TRADING_FEES)
+            config: Ghi de PORTFOLIO_CONFIG (max_position_size, min_cash_reserve, rebalance_threshold)
+            lot_size: So co phieu moi lo
+        """
+        self.fees = fees or FeeModel()
+        self.config = {**PORTFOLIO_CONFIG, **(config or {})}
+        self.lot_size = lot_size
+
+    # ==================== DAU VAO ====================
+
+    def _inputs(self, book, cash, prices, target_weights, sellable=None):
+        """Mang shares / prices / w hien tai / muc tieu / so ban duoc tren tap ma chung"""
+        symbols = book.symbols
+        if target_weights is not None:
+            symbols = symbols + [s for s in target_weights.index if s not in book]
+
+        price = np.array([prices.get(s, np.nan) for s in symbols], dtype=np.float64)
+        unpriced = [s for s, p in zip(symbols, price) if not p > 0]
+        if unpriced:
+            logger.warning(f"No price for {unpriced}, excluded from rebalance")
+
+        held = dict(zip(book.symbols, book.shares.tolist()))
+        keep = price > 0
+        symbols = [s for s, k in zip(symbols, keep) if k]
+        price = price[keep]
+        shares = np.array([held.get(s, 0) for s in symbols], dtype=np.float64)
+        if sellable is not None:
+            sellable = np.minimum([sellable.get(s, 0) for s in symbols], shares)
+
+        total = cash + shares @ price
+        current = shares * price / total if total > 0 else np.zeros(len(symbols))
+        if target_weights is not None:
+            target = target_weights.reindex(symbols).fillna(0.0).to_numpy(dtype=np.float64)
+        else:
+            target = self.policy_target(current)
+        return symbols, shares, price, current, target, sellable
+
+    def policy_target(self, weights):
+        """
+        Muc tieu theo PORTFOLIO_CONFIG: moi ma toi da max_position_size,
+        tong co phieu toi da 1 - min_cash_reserve (giam deu neu vuot)
+        """
+        target = np.minimum(weights, self.config['max_position_size'])
+        invested = target.sum()
+        limit = 1 - self.config['min_cash_reserve']
+        if invested > limit:
+            target = target * limit / invested
+        return target
+
+    # ==================== TINH HANG LOAT ====================
+
+    def evaluate(self, shares, price, cash, target, trade, sellable=None):
+        """
+        Tinh K phuong an cung luc
+
+        Args:
+            shares, price: Mang N (so luong, gia)
+            cash: Tien mat
+            target: Mang K x N ty trong muc tieu (tren tong tai san)
+            trade: Mang K x N bool, ma nao duoc dat lenh
+            sellable: Mang N so co phieu duoc ban (da ve T+2); None = ca vi the
+
+        Ban lam tron len theo lo (khong vuot so duoc ban), ve 0 thi ban het so
+        duoc ban ke ca lo le; mua lam tron xuong theo lo va co lai neu khong du tien (tien ban
+        duoc tinh vao suc mua, nhu ung truoc tien ban).
+
+        Returns:
+            dict mang K x N: buy, sell, buy_fee, sell_fee, sell_tax, shares_after;
+            mang K: cash_after, total_after
+        """
+        lot = self.lot_size
+        total = cash + shares @ price
+        delta = np.where(trade, target * total / price - shares, 0.0)
+
+        limit = shares if sellable is None else sellable
+        sell = np.where(delta < 0, np.minimum(np.ceil(-delta / lot) * lot, limit), 0.0)
+        sell = np.where(trade & (target <= 0), limit, sell)
+        sell_fee, sell_tax = self.fees.costs('sell', sell * price)
+        available = cash + (sell * price - sell_fee - sell_tax).sum(axis=1)
+
+        buy = np.where(delta > 0, np.floor(delta / lot) * lot, 0.0)
+        for attempt in range(6):
+            buy_fee, _ = self.fees.costs('buy', buy * price)
+            need = (buy * price + buy_fee).sum(axis=1)
+            short = need > available + 1e-6
+            if not short.any():
+                break
+            if attempt == 5:
+                # Phi toi thieu van lam thieu tien: bo lenh mua cua phuong an do
+                buy = np.where(short[:, None], 0.0, buy)
+                continue
+            scale = np.where(short, np.clip(available, 0, None) / np.where(short, need, 1.0), 1.0)
+            buy = np.where(short[:, None], np.floor(buy * scale[:, None] / lot) * lot, buy)
+        buy_fee, _ = self.fees.costs('buy', buy * price)
+        need = (buy * price + buy_fee).sum(axis=1)
+
+        cash_after = available - need
+        shares_after = shares + buy - sell
+        return {
+            'buy': buy, 'sell': sell, 'buy_fee': buy_fee, 'sell_fee': sell_fee, 'sell_tax': sell_tax,
+            'shares_after': shares_after, 'cash_after': cash_after,
+            'total_after': cash_after + shares_after @ price
+        }
+
+    # ==================== KE HOACH ====================
+
+    def plan(self, book, cash, prices, target_weights=None, threshold=None, sellable=None):
+        """
+        Lenh de dua so ve muc tieu
+
+        Args:
+            book: PositionBook hien tai
+            cash: Tien mat
+            prices: dict ma -> gia (gom ca ma moi trong target_weights)
+            target_weights: Series ma -> ty trong tren tong tai san; None = muc tieu
+                theo PORTFOLIO_CONFIG (policy_target)
+            threshold: Chi dat lenh cho ma lech muc tieu hon nguong (mac dinh 0 khi co
+                target_weights, rebalance_threshold khi khong co)
+            sellable: dict ma -> so co phieu duoc ban (vd. da ve T+2); None = ca vi the.
+                Lenh mua chi dung tien mat va tien tu cac lenh ban nay.
+
+        Returns:
+            dict: orders (DataFrame, ban truoc mua), book (PositionBook sau giao dich),
+            summary (tien mat truoc/sau, phi, thue, doanh so, do lech con lai)
+        """
+        if threshold is None:
+            threshold = 0.0 if target_weights is not None else self.config['rebalance_threshold']
+
+        symbols, shares, price, current, target, sellable = self._inputs(book, cash, prices, target_weights,
+                                                                         sellable)
+        trade = np.abs(current - target) > threshold
+        result = {k: v[0] for k, v in self.evaluate(shares, price, cash, target[None], trade[None],
+                                                    sellable).items()}
+
+        orders = []
+        for i in np.flatnonzero(result['sell'] > 0):
+            value = result['sell'][i] * price[i]
+            orders.append((symbols[i], 'SELL', int(result['sell'][i]), price[i], value,
+                           result['sell_fee'][i], result['sell_tax'][i],
+                           value - result['sell_fee'][i] - result['sell_tax'][i], current[i], target[i]))
+        for i in np.flatnonzero(result['buy'] > 0):
+            value = result['buy'][i] * price[i]
+            orders.append((symbols[i], 'BUY', int(result['buy'][i]), price[i], value,
+                           result['buy_fee'][i], 0.0, -(value + result['buy_fee'][i]), current[i], target[i]))
+        orders = pd.DataFrame(orders, columns=ORDER_COLUMNS)
+
+        after = self.simulate(book, orders)
+        weights_after = result['shares_after'] * price / result['total_after']
+        summary = {
+            'cash_before': cash,
+            'cash_after': float(result['cash_after']),
+            'fees': float(orders['fee'].sum()),
+            'taxes': float(orders['tax'].sum()),
+            'turnover': float(orders['value'].sum()),
+            'orders': len(orders),
+            'max_drift_before': float(np.abs(current - target).max()) if len(target) else 0.0,
+            'max_drift_after': float(np.abs(weights_after - target).max()) if len(target) else 0.0
+        }
+        return {'orders': orders, 'book': after, 'summary': summary}
+
+    @staticmethod
+    def simulate(book, orders):
+        """So vi the sau khi khop cac lenh (ban truoc, mua sau, gia von gom phi mua nhu nhat ky)"""
+        after = PositionBook.from_records(book.to_records())
+        for order in orders.itertuples(index=False):
+            if order.action == 'SELL':
+                after.reduce(order.symbol, order.shares)
+            else:
+                after.add(order.symbol, order.shares, (order.value + order.fee) / order.shares)
+        return after
+
+    def sweep(self, book, cash, prices, thresholds, target_weights=None, sellable=None):
+        """
+        Danh gia nhieu nguong lech cung luc (mot luot vector K x N)
+
+        Returns:
+            DataFrame index threshold: orders, turnover, fees (gom thue),
+            cash_after, max_drift_after, total_drift_after
+        """
+        thresholds = np.asarray(thresholds, dtype=np.float64)
+        symbols, shares, price, current, target, sellable = self._inputs(book, cash, prices, target_weights,
+                                                                         sellable)
+        targets = np.broadcast_to(target, (len(thresholds), len(target)))
+        trade = np.abs(current - target)[None, :] > thresholds[:, None]
+
+        result = self.evaluate(shares, price, cash, targets, trade, sellable)
+        traded = result['buy'] + result['sell']
+        weights_after = result['shares_after'] * price / result['total_after'][:, None]
+        drift = np.abs(weights_after - target)
+        return pd.DataFrame({
+            'orders': (traded > 0).sum(axis=1),
+            'turnover': (traded * price).sum(axis=1),
+            'fees': (result['buy_fee'] + result['sell_fee'] + result['sell_tax']).sum(axis=1),
+            'cash_after': result['cash_after'],
+            'max_drift_after': drift.max(axis=1) if len(target) else 0.0,
+            'total_drift_after': drift.sum(axis=1)
+        }, index=pd.Index(thresholds, name='threshold'))
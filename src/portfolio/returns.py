@@ -0,0 +1,157 @@
+"""
+Chuoi loi nhuan danh muc tu ma tran gia dong cua
+
+Thay vi noi loi nhuan ngay cua tung ma thanh mot list phang, module nay
+dung ma tran gia (ngay x ma) tu ClosePanel, nhan voi so co phieu dang giu
+de ra NAV cua danh muc moi ngay (ty trong troi theo gia), roi tinh loi
+nhuan danh muc tu NAV. Chuoi NAV/loi nhuan duoc cache ra file va chi tinh
+them cac phien moi khi danh muc khong doi.
+"""
+import hashlib
+import json
+import logging
+from datetime import datetime, timedelta
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+
+from config.settings import PROCESSED_DATA_DIR
+from src.data_pipeline.close_panel import ClosePanel
+from src.portfolio.risk_metrics import RiskMetrics
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+TRADING_DAYS = 252
+
+
+def holdings_key(holdings):
+    """Khoa cache cho mot bo (ma, so luong)"""
+    payload = json.dumps(sorted((s, float(q)) for s, q in holdings.items()))
+    return hashlib.sha1(payload.encode()).hexdigest()[:16]
+
+
+class ReturnsEngine:
+    """NAV va loi nhuan danh muc theo ngay"""
+
+    def __init__(self, panel=None, series_file=None, lookback_days=365, risk_free_rate=0.05,
+                 covariance=None):
+        """
+        Args:
+            panel: ClosePanel (mac dinh tao moi)
+            series_file: File cache NAV/loi nhuan (mac dinh data/processed/portfolio_returns.parquet)
+            lookback_days: So ngay lich su mac dinh
+            risk_free_rate: Lai suat phi rui ro cho Sharpe/Sortino
+            covariance: CovarianceService (RiskMetrics.covariance_risk)
+        """
+        self.panel = panel or ClosePanel()
+        self.series_file = Path(series_file or PROCESSED_DATA_DIR / 'portfolio_returns.parquet')
+        self.lookback_days = lookback_days
+        self.risk = RiskMetrics(risk_free_rate, covariance)
+
+    def _start(self, start):
+        if start is not None:
+            return pd.Timestamp(start).normalize()
+        return pd.Timestamp(datetime.now() - timedelta(days=self.lookback_days)).normalize()
+
+    def return_matrix(self, symbols, start=None):
+        """
+        Ma tran loi nhuan ngay (ngay x ma) tren truc ngay chung
+
+        Ma chua niem yet / chua co gia o dau ky la NaN.
+        """
+        closes = self.panel.closes(symbols, self._start(start))
+        return closes.pct_change(fill_method=None).iloc[1:]
+
+    def portfolio_series(self, holdings, start=None, use_cache=True):
+        """
+        NAV va loi nhuan ngay cua danh muc giu nguyen so luong hien tai
+
+        NAV_t = sum_i shares_i * close_i,t (ty trong troi theo gia), nen
+        loi nhuan danh muc = sum_i w_i,t-1 * r_i,t voi w tinh tu NAV ngay truoc.
+
+        Args:
+            holdings: dict ma -> so co phieu
+            start: Ngay bat dau (mac dinh lookback_days truoc)
+            use_cache: Dung chuoi da luu, chi tinh them phien moi
+
+        Returns:
+            DataFrame index ngay: nav, returns (phien dau NaN)
+        """
+        holdings = {s: q for s, q in holdings.items() if q}
+        if not holdings:
+            return pd.DataFrame(columns=['nav', 'returns'])
+
+        start = self._start(start)
+        key = holdings_key(holdings)
+
+        closes = self.panel.closes(list(holdings), start)
+        # Chi lay cac ngay moi ma trong danh muc deu co gia
+        closes = closes.dropna()
+        if closes.empty or len(closes.columns) < len(holdings):
+            missing = set(holdings) - set(closes.columns)
+            if missing:
+                logger.warning(f"No price history for {sorted(missing)}")
+            if closes.empty:
+                return pd.DataFrame(columns=['nav', 'returns'])
+
+        shares = np.array([holdings[s] for s in closes.columns], dtype=np.float64)
+
+        # Chuoi da luu dung duoc neu cung danh muc va bat dau khong muon hon cua so
+        cached = self._load_series(key) if use_cache else None
+        if cached is not None and not cached.empty and cached.index[0] <= closes.index[0]:
+            cached = cached[cached.index >= closes.index[0]]
+            new = closes[closes.index > cached.index[-1]]
+            if new.empty:
+                return cached
+            nav = pd.Series(new.to_numpy() @ shares, index=new.index)
+            previous = np.concatenate([[cached['nav'].iloc[-1]], nav.to_numpy()[:-1]])
+            extension = pd.DataFrame({'nav': nav, 'returns': nav.to_numpy() / previous - 1})
+            series = pd.concat([cached, extension])
+        else:
+            nav = pd.Series(closes.to_numpy() @ shares, index=closes.index)
+            series = pd.DataFrame({'nav': nav, 'returns': nav.pct_change()})
+
+        self._save_series(series, key)
+        return series
+
+    def weights(self, holdings, start=None):
+        """Ty trong tung ma theo ngay (ngay x ma, tong moi dong = 1)"""
+        closes = self.panel.closes(list(holdings), self._start(start)).dropna()
+        values = closes * pd.Series(holdings, dtype=np.float64)[closes.columns]
+        return values.div(values.sum(axis=1), axis=0)
+
+    def _load_series(self, key):
+        if not self.series_file.exists():
+            return None
+        cached = pd.read_parquet(self.series_file)
+        if cached.empty or cached['key'].iloc[0] != key:
+            return None
+        return cached[['nav', 'returns']]
+
+    def _save_series(self, series, key):
+        series.assign(key=key).to_parquet(self.series_file)
+
+    def metrics(self, series):
+        """
+        Chi so rui ro tu chuoi NAV / loi nhuan danh muc
+
+        Returns:
+            dict: volatility, annualized_return, sharpe_ratio, sortino_ratio,
+            max_drawdown, var_95 (%), observations
+        """
+        returns = series['returns'].dropna()
+        if len(returns) < 2:
+            return {}
+
+        values = returns.to_numpy()
+        return {
+            'volatility': self.risk.volatility(values) * 100,
+            'annualized_return': values.mean() * TRADING_DAYS * 100,
+            'sharpe_ratio': self.risk.sharpe_ratio(values),
+            'sortino_ratio': self.risk.sortino_ratio(values),
+            'max_drawdown': self.risk.max_drawdown(series['nav'])['max_drawdown'],
+            'var_95': self.risk.value_at_risk(values, 0.95),
+            'observations': len(values)
+        }
@@ -5,6 +5,7 @@ Copy vao: src/portfolio/risk_metrics.py
 import numpy as np
 import pandas as pd
 import logging
+from statistics import NormalDist
 
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
@@ -13,12 +14,14 @@ logger = logging.getLogger(__name__)
 class RiskMetrics:
     """Tinh toan cac chi so rui ro"""
     
-    def __init__(self, risk_free_rate=0.05):
+    def __init__(self, risk_free_rate=0.05, covariance=None):
         """
         Args:
             risk_free_rate: Lai suat phi rui ro (5% cho VN)
+            covariance: CovarianceService cho cac chi so tu ma tran hiep phuong sai
         """
         self.risk_free_rate = risk_free_rate
+        self.covariance = covariance
     
     def calculate_returns(self, prices):
         """Tinh daily returns tu gia"""
@@ -197,6 +200,44 @@ class RiskMetrics:
         calmar = (annual_return * 100) / max_dd
         return calmar
     
+    def covariance_risk(self, weights, estimator='ewma', confidence_level=0.95):
+        """
+        Rui ro ex-ante tu ma tran hiep phuong sai (CovarianceService)
+        
+        Args:
+            weights: dict/Series ma -> ty trong (tren tong gia tri dau tu)
+            estimator: 'sample', 'ewma' hoac 'ledoit_wolf'
+        
+        Returns:
+            dict: ex_ante_volatility (% nam), parametric_var (% ngay, am),
+            risk_contributions (ma -> % phuong sai), diversification_ratio
+        """
+        if self.covariance is None:
+            raise ValueError("RiskMetrics needs a CovarianceService for covariance_risk")
+        
+        weights = pd.Series(weights, dtype=np.float64)
+        cov = self.covariance.matrix(list(weights.index), estimator)
+        if cov.empty:
+            return {}
+        
+        w = weights[cov.index].to_numpy()
+        sigma = cov.to_numpy()
+        marginal = sigma @ w
+        variance = w @ marginal
+        if variance <= 0:
+            return {}
+        
+        daily_vol = np.sqrt(variance)
+        z = NormalDist().inv_cdf(1 - confidence_level)
+        stand_alone = np.sqrt(np.diag(sigma)) @ np.abs(w)
+        
+        return {
+            'ex_ante_volatility': daily_vol * np.sqrt(252) * 100,
+            'parametric_var': z * daily_vol * 100,
+            'risk_contributions': dict(zip(cov.index, w * marginal / variance * 100)),
+            'diversification_ratio': stand_alone / daily_vol
+        }
+    
     def portfolio_metrics(self, returns, prices, market_returns=None):
         """
         Tinh tat ca metrics cho portfolio
@@ -0,0 +1,216 @@
+"""
+Bo thuc thi ket hop: luong cho I/O, tien trinh cho tinh toan
+
+Lay du lieu (vnstock, doc parquet) chu yeu cho mang nen chay trong
+ThreadPoolExecutor; tinh chi bao/tin hieu ton CPU va bi GIL tuan tu hoa
+nen chay trong ProcessPoolExecutor. Du lieu gia OHLCV duoc chuyen sang
+tien trinh qua multiprocessing.shared_memory (mot khoi float64 + index
+int64) thay vi pickle ca DataFrame.
+"""
+import logging
+import multiprocessing
+import os
+from concurrent.futures import (ThreadPoolExecutor, ProcessPoolExecutor,
+                                as_completed, wait, FIRST_COMPLETED)
+from multiprocessing import shared_memory
+
+import numpy as np
+import pandas as pd
+
+from src.analysis.technical import TechnicalAnalyzer
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+OHLCV_COLUMNS = ['open', 'high', 'low', 'close', 'volume']
+
+
+# ==================== SHARED MEMORY ====================
+
+def pack_frame(df: pd.DataFrame, columns=None):
+    """
+    Ghi DataFrame gia vao mot khoi shared memory
+
+    Bo cuc: [index int64 (n)] [values float64 (n x so cot), C-order]
+
+    Returns:
+        (SharedMemory, meta) - meta la dict nho, pickle duoc, du de doc lai
+    """
+    columns = [c for c in (columns or OHLCV_COLUMNS) if c in df.columns]
+    values = df[columns].to_numpy(dtype=np.float64)
+    index = df.index
+
+    if isinstance(index, pd.DatetimeIndex):
+        index_kind = f"datetime64[{getattr(index, 'unit', 'ns')}]"
+        index_values = index.asi8
+    else:
+        index_kind = 'int'
+        index_values = np.asarray(index, dtype=np.int64)
+
+    n = len(df)
+    nbytes = max(n * 8 + values.nbytes, 1)
+    shm = shared_memory.SharedMemory(create=True, size=nbytes)
+
+    np.ndarray((n,), dtype=np.int64, buffer=shm.buf)[:] = index_values
+    np.ndarray(values.shape, dtype=np.float64, buffer=shm.buf, offset=n * 8)[:] = values
+
+    meta = {
+        'name': shm.name,
+        'rows': n,
+        'columns': columns,
+        'index_kind': index_kind,
+        'index_name': index.name
+    }
+    return shm, meta
+
+
+def unpack_frame(meta):
+    """Doc DataFrame tu khoi shared memory (ban sao, khoi duoc dong ngay)"""
+    shm = _attach(meta['name'])
+    try:
+        n = meta['rows']
+        index_values = np.ndarray((n,), dtype=np.int64, buffer=shm.buf).copy()
+        values = np.ndarray((n, len(meta['columns'])), dtype=np.float64,
+                            buffer=shm.buf, offset=n * 8).copy()
+    finally:
+        shm.close()
+
+    if meta['index_kind'].startswith('datetime64'):
+        index = pd.DatetimeIndex(index_values.view(meta['index_kind']), name=meta['index_name'])
+    else:
+        index = pd.Index(index_values, name=meta['index_name'])
+    return pd.DataFrame(values, index=index, columns=meta['columns'])
+
+
+def _attach(name):
+    """
+    Mo khoi co san. Worker cua pool dung chung resource tracker voi tien
+    trinh cha nen dang ky lai khong lam khoi bi xoa khi worker thoat.
+    """
+    try:
+        return shared_memory.SharedMemory(name=name, track=False)
+    except TypeError:  # Python < 3.13 khong co track
+        return shared_memory.SharedMemory(name=name)
+
+
+def _release(shm):
+    shm.close()
+    try:
+        shm.unlink()
+    except FileNotFoundError:
+        pass
+
+
+# ==================== WORKER (TOP-LEVEL, PICKLE DUOC) ====================
+
+_analyzers = {}
+
+
+def analyze_technical(symbol, df, params=None):
+    """
+    Phan tich ky thuat trong tien trinh con
+
+    Bo 'dataframe' khoi ket qua de khong pickle nguoc ca bang chi bao.
+    """
+    key = repr(params)
+    if key not in _analyzers:
+        _analyzers[key] = TechnicalAnalyzer(params)
+    result = _analyzers[key].analyze_stock(df, symbol)
+    result.pop('dataframe', None)
+    return result
+
+
+def _run_shared(analyze, symbol, meta, kwargs):
+    """Doc du lieu tu shared memory roi goi ham phan tich"""
+    return analyze(symbol, unpack_frame(meta), **kwargs)
+
+
+# ==================== EXECUTOR ====================
+
+def _default_context():
+    """forkserver tren POSIX (fork khi dang co luong I/O co the deadlock)"""
+    if 'forkserver' in multiprocessing.get_all_start_methods():
+        return multiprocessing.get_context('forkserver')
+    return None
+
+
+class HybridExecutor:
+    """Chong lap lay du lieu (luong) voi phan tich (tien trinh)"""
+
+    def __init__(self, io_workers=8, cpu_workers=None, mp_context=None):
+        """
+        Args:
+            io_workers: So luong lay du lieu
+            cpu_workers: So tien trinh phan tich (mac dinh = so core)
+            mp_context: multiprocessing context (mac dinh forkserver neu co)
+        """
+        self.io_workers = io_workers
+        self.cpu_workers = cpu_workers or os.cpu_count() or 1
+        self.mp_context = mp_context or _default_context()
+
+    def run(self, symbols, fetch, analyze=analyze_technical, **analyze_kwargs):
+        """
+        Lay du lieu va phan tich, tra ket qua ngay khi tung ma xong
+
+        Args:
+            symbols: Danh sach ma
+            fetch: fetch(symbol) -> (price_df, context); chay trong luong.
+                   context la du lieu tuy y tra kem ket qua (vd. phan tich co ban)
+            analyze: Ham top-level analyze(symbol, price_df, **kwargs); chay trong tien trinh
+            analyze_kwargs: Tham so them cho analyze (phai pickle duoc)
+
+        Yields:
+            (symbol, context, analysis) cho cac ma thanh cong
+        """
+        pending = {}
+
+        with ThreadPoolExecutor(max_workers=self.io_workers) as io_pool, \
+                ProcessPoolExecutor(max_workers=self.cpu_workers,
+                                    mp_context=self.mp_context) as cpu_pool:
+            try:
+                fetches = {io_pool.submit(fetch, symbol): symbol for symbol in symbols}
+
+                for future in as_completed(fetches):
+                    symbol = fetches[future]
+                    try:
+                        fetched = future.result()
+                    except Exception as e:
+                        logger.error(f"Fetch failed for {symbol}: {str(e)}")
+                        continue
+
+                    if fetched is None or fetched[0] is None or fetched[0].empty:
+                        continue
+
+                    price_df, context = fetched
+                    shm, meta = pack_frame(price_df)
+                    job = cpu_pool.submit(_run_shared, analyze, symbol, meta, analyze_kwargs)
+                    pending[job] = (symbol, context, shm)
+
+                    # Tra cac ket qua da xong de giai phong shared memory som
+                    yield from self._drain(pending, block=False)
+
+                yield from self._drain(pending, block=True)
+            finally:
+                for _, _, shm in pending.values():
+                    _release(shm)
+                pending.clear()
+
+    @staticmethod
+    def _drain(pending, block):
+        while pending:
+            if block:
+                done, _ = wait(pending, return_when=FIRST_COMPLETED)
+            else:
+                done = [job for job in pending if job.done()]
+                if not done:
+                    return
+
+            for job in done:
+                symbol, context, shm = pending.pop(job)
+                _release(shm)
+                try:
+                    analysis = job.result()
+                except Exception as e:
+                    logger.error(f"Analysis failed for {symbol}: {str(e)}")
+                    continue
+                yield symbol, context, analysis
@@ -1,30 +1,122 @@
 """
 Module sàng lọc cổ phiếu theo tiêu chí cơ bản và kỹ thuật
 """
+import heapq
+import queue
+import threading
+import time
+import numpy as np
 import pandas as pd
 import logging
 from datetime import datetime
-from concurrent.futures import ThreadPoolExecutor, as_completed
+from concurrent.futures import ThreadPoolExecutor, as_completed, wait, FIRST_COMPLETED
 
 from src.data_pipeline.price_data import PriceDataCrawler
 from src.data_pipeline.fundamental_data import FundamentalDataCrawler
 from src.analysis.fundamental import FundamentalAnalyzer
 from src.analysis.technical import TechnicalAnalyzer
-from config.settings import WATCHLIST, FUNDAMENTAL_CRITERIA
+from src.analysis.valuation import StockValuation
+from src.screener.executor import HybridExecutor, analyze_technical
+from src.screener.query import ScreenQuery
+from config.settings import WATCHLIST, FUNDAMENTAL_CRITERIA, CACHE_DIR, SCREENER_WEIGHTS
 
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
+# Chuyển rating / tín hiệu thành điểm 1-5 (không có trong bảng = 3)
+F_RATING_SCORES = {
+    'EXCELLENT': 5,
+    'GOOD': 4,
+    'AVERAGE': 3,
+    'BELOW AVERAGE': 2,
+    'POOR': 1
+}
+
+T_SIGNAL_SCORES = {
+    'STRONG BUY': 5,
+    'BUY': 4,
+    'HOLD': 3,
+    'SELL': 2,
+    'STRONG SELL': 1
+}
+
+# (ngưỡng điểm tổng hợp, rating, hành động) - xét từ trên xuống
+FINAL_RATINGS = [
+    (4.5, 'STRONG BUY', 'Mua mạnh - Cả cơ bản và kỹ thuật đều tốt'),
+    (3.8, 'BUY', 'Mua - Tổng thể khá tích cực'),
+    (3.2, 'HOLD', 'Giữ/Theo dõi - Chờ tín hiệu rõ ràng hơn'),
+    (2.5, 'AVOID', 'Tránh - Chưa hấp dẫn'),
+]
+FINAL_DEFAULT = ('SELL', 'Bán - Cả cơ bản và kỹ thuật đều yếu')
+
+NOTE_F_OVER_T = '⚠️  Cơ bản tốt nhưng kỹ thuật chưa đẹp - Chờ điểm vào tốt hơn'
+NOTE_T_OVER_F = '⚠️  Kỹ thuật tốt nhưng cơ bản yếu - Cẩn thận bẫy giá'
+NOTE_AGREE = '✓ Cơ bản và kỹ thuật đồng thuận'
+
+# Thứ tự cột của bảng tóm tắt
+SUMMARY_COLUMNS = ['Symbol', 'Rating', 'Score', 'F_Rating', 'F_Score', 'T_Signal', 'T_Score',
+                   'Price', 'RSI', 'ROE', 'PE', 'D/E', 'Trend', 'Sector', 'Sector_Pct', 'Note']
+
+
+def combine_scores(f_ratings, t_signals, weights=None):
+    """
+    Kết hợp rating cơ bản và tín hiệu kỹ thuật cho cả universe (vector hóa)
+    
+    Args:
+        f_ratings: Mảng rating cơ bản (EXCELLENT...POOR)
+        t_signals: Mảng tín hiệu kỹ thuật (STRONG BUY...STRONG SELL)
+        weights: dict fundamental/technical (mặc định SCREENER_WEIGHTS, tự chuẩn hóa tổng = 1)
+        
+    Returns:
+        DataFrame: fundamental_score, technical_score, combined_score,
+        final_rating, final_action, has_conflict, note
+    """
+    weights = weights or SCREENER_WEIGHTS
+    total = weights['fundamental'] + weights['technical']
+    w_f, w_t = weights['fundamental'] / total, weights['technical'] / total
+    
+    f_score = pd.Series(f_ratings, dtype=object).map(F_RATING_SCORES).fillna(3).to_numpy(dtype=np.int64)
+    t_score = pd.Series(t_signals, dtype=object).map(T_SIGNAL_SCORES).fillna(3).to_numpy(dtype=np.int64)
+    
+    combined = f_score * w_f + t_score * w_t
+    
+    conditions = [combined >= threshold for threshold, _, _ in FINAL_RATINGS]
+    final_rating = np.select(conditions, [r for _, r, _ in FINAL_RATINGS], default=FINAL_DEFAULT[0])
+    final_action = np.select(conditions, [a for _, _, a in FINAL_RATINGS], default=FINAL_DEFAULT[1])
+    
+    conflict = np.abs(f_score - t_score) >= 2
+    note = np.where(conflict, np.where(f_score > t_score, NOTE_F_OVER_T, NOTE_T_OVER_F), NOTE_AGREE)
+    
+    return pd.DataFrame({
+        'fundamental_score': f_score,
+        'technical_score': t_score,
+        'combined_score': combined,
+        'final_rating': final_rating,
+        'final_action': final_action,
+        'has_conflict': conflict,
+        'note': note
+    })
+
 
 class StockScreener:
     """Sàng lọc cổ phiếu kết hợp cơ bản và kỹ thuật"""
     
-    def __init__(self, watchlist=None):
+    def __init__(self, watchlist=None, weights=None):
+        """
+        Args:
+            watchlist: Danh sách mã (mặc định WATCHLIST)
+            weights: Trọng số fundamental/technical (mặc định SCREENER_WEIGHTS)
+        """
         self.watchlist = watchlist or WATCHLIST
+        self.weights = weights or SCREENER_WEIGHTS
         self.price_crawler = PriceDataCrawler()
         self.fundamental_crawler = FundamentalDataCrawler()
         self.fundamental_analyzer = FundamentalAnalyzer()
         self.technical_analyzer = TechnicalAnalyzer()
+        self.valuator = StockValuation()
+        self.stage_report = []
+        self.deadline_report = {}
+        self.last_results_file = CACHE_DIR / 'screen_last_results.parquet'
     
     def screen_single_stock(self, symbol: str):
         """
@@ -43,56 +135,99 @@ class StockScreener:
                 logger.warning(f"No fundamental data for {symbol}")
                 return None
             
-            # 2. Phan tich co ban
-            fundamental_analysis = self.fundamental_analyzer.analyze_stock(
+            return self._screen_with_fundamentals(
+                symbol,
                 ratios=fundamental_data['ratios'],
                 profile=fundamental_data.get('profile'),
                 growth=fundamental_data.get('growth')  # Use .get() de tranh loi
             )
             
-            # 3. Lay du lieu gia
-            price_df = self.price_crawler.get_historical_data(
-                symbol, 
-                start_date=(datetime.now().replace(year=datetime.now().year - 1)).strftime('%Y-%m-%d')
-            )
-            
-            if price_df.empty:
-                logger.warning(f"No price data for {symbol}")
-                return None
-            
-            # 4. Phan tich ky thuat
-            technical_analysis = self.technical_analyzer.analyze_stock(price_df, symbol)
-            
-            # 5. Ket hop danh gia
-            combined_score = self._combine_analysis(fundamental_analysis, technical_analysis)
-            
-            result = {
-                'symbol': symbol,
-                'timestamp': datetime.now(),
-                'fundamental': fundamental_analysis,
-                'technical': technical_analysis,
-                'combined': combined_score
-            }
-            
-            logger.info(f"[OK] {symbol}: F={fundamental_analysis['scoring']['rating']}, "
-                    f"T={technical_analysis['signals']['signal']}, "
-                    f"Combined={combined_score['final_rating']}")
-            
-            return result
-            
         except Exception as e:
             logger.error(f"Error screening {symbol}: {str(e)}")
             import traceback
             traceback.print_exc()  # In chi tiet loi de debug
             return None
     
-    def screen_multiple_stocks(self, symbols=None, max_workers=5):
+    def _screen_with_fundamentals(self, symbol: str, ratios: dict, profile=None, growth=None):
+        """Phan tich co ban tu chi so co san, roi lay gia va phan tich ky thuat"""
+        # 2. Phan tich co ban
+        fundamental_analysis = self.fundamental_analyzer.analyze_stock(
+            ratios=ratios,
+            profile=profile,
+            growth=growth
+        )
+        
+        # 3. Lay du lieu gia
+        price_df = self._load_prices(symbol)
+        
+        if price_df.empty:
+            logger.warning(f"No price data for {symbol}")
+            return None
+        
+        # 4. Phan tich ky thuat
+        technical_analysis = self.technical_analyzer.analyze_stock(price_df, symbol)
+        
+        # 5. Ket hop danh gia
+        return self._build_result(symbol, fundamental_analysis, technical_analysis)
+    
+    def _load_prices(self, symbol: str):
+        """Gia mot nam gan nhat"""
+        return self.price_crawler.get_historical_data(
+            symbol, 
+            start_date=(datetime.now().replace(year=datetime.now().year - 1)).strftime('%Y-%m-%d')
+        )
+    
+    def _build_result(self, symbol, fundamental_analysis, technical_analysis):
+        """Ket hop phan tich co ban va ky thuat thanh ket qua sang loc"""
+        combined_score = self._combine_analysis(fundamental_analysis, technical_analysis)
+        
+        result = {
+            'symbol': symbol,
+            'timestamp': datetime.now(),
+            'fundamental': fundamental_analysis,
+            'technical': technical_analysis,
+            'combined': combined_score
+        }
+        
+        logger.info(f"[OK] {symbol}: F={fundamental_analysis['scoring']['rating']}, "
+                f"T={technical_analysis['signals']['signal']}, "
+                f"Combined={combined_score['final_rating']}")
+        
+        return result
+    
+    def _fetch_for_hybrid(self, symbol: str):
+        """
+        Phan I/O cua mot ma cho che do hybrid (chay trong luong):
+        lay chi so + phan tich co ban (nhe) va gia; ky thuat de tien trinh lam
+        
+        Returns:
+            (price_df, fundamental_analysis) hoac None
+        """
+        fundamental_data = self.fundamental_crawler.get_complete_fundamentals(symbol)
+        
+        if not fundamental_data.get('ratios'):
+            logger.warning(f"No fundamental data for {symbol}")
+            return None
+        
+        fundamental_analysis = self.fundamental_analyzer.analyze_stock(
+            ratios=fundamental_data['ratios'],
+            profile=fundamental_data.get('profile'),
+            growth=fundamental_data.get('growth')
+        )
+        return self._load_prices(symbol), fundamental_analysis
+    
+    def screen_multiple_stocks(self, symbols=None, max_workers=5, mode='thread',
+                               cpu_workers=None):
         """
         Sàng lọc nhiều mã cổ phiếu song song
         
         Args:
             symbols: Danh sách mã (nếu None, dùng watchlist)
-            max_workers: Số luồng xử lý song song
+            max_workers: Số luồng xử lý song song (luồng I/O khi mode='hybrid')
+            mode: 'thread' = mọi bước trong ThreadPoolExecutor;
+                  'hybrid' = lấy dữ liệu bằng luồng, phân tích kỹ thuật bằng
+                  tiến trình (HybridExecutor, giá chuyển qua shared memory)
+            cpu_workers: Số tiến trình phân tích khi mode='hybrid' (mặc định = số core)
             
         Returns:
             DataFrame với kết quả sàng lọc
@@ -100,6 +235,17 @@ class StockScreener:
         symbols = symbols or self.watchlist
         results = []
         
+        if mode == 'hybrid':
+            executor = HybridExecutor(io_workers=max_workers, cpu_workers=cpu_workers)
+            for symbol, fundamental, technical in executor.run(
+                    symbols, self._fetch_for_hybrid, analyze_technical,
+                    params=self.technical_analyzer.params):
+                results.append(self._build_result(symbol, fundamental, technical))
+            
+            if results:
+                return self._create_summary_dataframe(results)
+            return pd.DataFrame()
+        
         with ThreadPoolExecutor(max_workers=max_workers) as executor:
             # Submit tất cả tasks
             future_to_symbol = {
@@ -124,51 +270,354 @@ class StockScreener:
         else:
             return pd.DataFrame()
     
-    def _combine_analysis(self, fundamental, technical):
+    def iter_screen(self, symbols=None, max_workers=5, top_n=10,
+                    stop_after=None, is_candidate=None):
         """
-        Kết hợp đánh giá cơ bản và kỹ thuật
+        Sàng lọc và trả từng kết quả ngay khi mỗi mã xong (generator)
+        
+        Mỗi sự kiện là dict:
+            symbol, row (dòng tóm tắt như _create_summary_dataframe, None nếu lỗi),
+            result (kết quả đầy đủ), completed, total, succeeded, failed,
+            candidates, elapsed (giây), top (list dòng tốt nhất theo Score)
+        
+        Dừng sớm: đặt stop_after = số ứng viên cần có, hoặc break khỏi vòng
+        lặp - các mã chưa chạy sẽ bị hủy.
         
-        Trọng số: Fundamental 60%, Technical 40%
+        Args:
+            symbols: Danh sách mã (nếu None, dùng watchlist)
+            max_workers: Số luồng
+            top_n: Kích thước bảng top giữ trong heap
+            stop_after: Dừng khi đủ số ứng viên này
+            is_candidate: Hàm row -> bool (mặc định Rating BUY/STRONG BUY)
+        """
+        symbols = symbols or self.watchlist
+        is_candidate = is_candidate or (lambda row: row['Rating'] in ('STRONG BUY', 'BUY'))
+        
+        started = time.perf_counter()
+        heap = []  # min-heap (Score, thứ tự, row) giữ top_n dòng
+        counters = {'completed': 0, 'succeeded': 0, 'failed': 0, 'candidates': 0}
+        
+        executor = ThreadPoolExecutor(max_workers=max_workers)
+        try:
+            pending = {executor.submit(self.screen_single_stock, symbol): symbol
+                       for symbol in symbols}
+            
+            while pending:
+                done, _ = wait(pending, return_when=FIRST_COMPLETED)
+                
+                for future in done:
+                    symbol = pending.pop(future)
+                    try:
+                        result = future.result()
+                    except Exception as e:
+                        logger.error(f"Exception for {symbol}: {str(e)}")
+                        result = None
+                    
+                    counters['completed'] += 1
+                    row = None
+                    if result:
+                        counters['succeeded'] += 1
+                        row = self._summary_row(result)
+                        if is_candidate(row):
+                            counters['candidates'] += 1
+                        
+                        entry = (row['Score'], counters['completed'], row)
+                        if len(heap) < top_n:
+                            heapq.heappush(heap, entry)
+                        elif entry > heap[0]:
+                            heapq.heapreplace(heap, entry)
+                    else:
+                        counters['failed'] += 1
+                    
+                    yield {
+                        'symbol': symbol,
+                        'row': row,
+                        'result': result,
+                        'total': len(symbols),
+                        **counters,
+                        'elapsed': time.perf_counter() - started,
+                        'top': [item[2] for item in sorted(heap, reverse=True)]
+                    }
+                
+                if stop_after is not None and counters['candidates'] >= stop_after:
+                    logger.info(f"Found {counters['candidates']} candidates, stopping early")
+                    break
+        finally:
+            # Hủy các mã chưa chạy (kể cả khi caller break khỏi vòng lặp)
+            executor.shutdown(wait=False, cancel_futures=True)
+    
+    def screen_with_deadline(self, symbols=None, deadline=120, symbol_timeout=30,
+                             max_workers=5, use_last_results=True):
         """
-        # Chuyển rating thành điểm
-        f_rating_map = {
-            'EXCELLENT': 5,
-            'GOOD': 4,
-            'AVERAGE': 3,
-            'BELOW AVERAGE': 2,
-            'POOR': 1
+        Sàng lọc với giới hạn thời gian: trả về những mã đã xong trước hạn
+        
+        Mã chạy quá symbol_timeout giây, hoặc chưa xong khi hết deadline, bị
+        coi là trễ và không chờ nữa. Nếu cache có kết quả lần trước của mã trễ
+        thì dùng lại, đánh dấu Stale=True kèm As_Of và Age_Hours.
+        
+        Luồng của mã trễ không bị dừng cưỡng bức (Python không hủy được
+        luồng đang chạy) nhưng hàm trả về đúng hạn. Các luồng là daemon
+        (không dùng ThreadPoolExecutor, vốn được join khi thoát) nên lệnh
+        gọi treo cũng không giữ tiến trình lại khi thoát.
+        
+        Args:
+            symbols: Danh sách mã (nếu None, dùng watchlist)
+            deadline: Tổng thời gian tối đa (giây)
+            symbol_timeout: Thời gian tối đa cho mỗi mã kể từ khi bắt đầu chạy
+            max_workers: Số luồng
+            use_last_results: Điền mã trễ từ kết quả lần trước
+            
+        Returns:
+            DataFrame như screen_multiple_stocks + cột Stale, As_Of, Age_Hours.
+            Chi tiết trong self.deadline_report.
+        """
+        symbols = symbols or self.watchlist
+        started = time.monotonic()
+        run_started = {}
+        results = []
+        late = []
+        
+        tasks = queue.SimpleQueue()
+        for symbol in symbols:
+            tasks.put(symbol)
+        finished = queue.SimpleQueue()
+        stop = threading.Event()
+        
+        def worker():
+            # Hết hạn thì không nhận mã mới (như cancel_futures)
+            while not stop.is_set():
+                try:
+                    symbol = tasks.get_nowait()
+                except queue.Empty:
+                    return
+                run_started[symbol] = time.monotonic()
+                try:
+                    finished.put((symbol, self.screen_single_stock(symbol), None))
+                except Exception as e:
+                    finished.put((symbol, None, e))
+        
+        for _ in range(min(max_workers, len(symbols))):
+            threading.Thread(target=worker, name='screen-deadline', daemon=True).start()
+        
+        pending = dict.fromkeys(symbols)  # giữ thứ tự mã
+        
+        def receive(item):
+            symbol, result, error = item
+            if symbol not in pending:
+                return  # Xong sau khi đã bị coi là trễ
+            del pending[symbol]
+            if error is not None:
+                logger.error(f"Exception for {symbol}: {str(error)}")
+            elif result:
+                results.append(result)
+        
+        try:
+            while pending:
+                # Nhận các mã đã xong trước khi xét quá hạn
+                while True:
+                    try:
+                        receive(finished.get_nowait())
+                    except queue.Empty:
+                        break
+                if not pending:
+                    break
+                
+                now = time.monotonic()
+                remaining = deadline - (now - started)
+                
+                # Bỏ các mã đã chạy quá symbol_timeout
+                for symbol in list(pending):
+                    began = run_started.get(symbol)
+                    if began is not None and now - began >= symbol_timeout:
+                        logger.warning(f"{symbol} timed out after {symbol_timeout}s")
+                        late.append(symbol)
+                        del pending[symbol]
+                
+                if remaining <= 0:
+                    late.extend(pending)
+                    logger.warning(f"Deadline reached, {len(pending)} symbols unfinished")
+                    break
+                if not pending:
+                    break
+                
+                # Chờ đến khi có mã xong, hết deadline hoặc mã sớm nhất hết hạn
+                expiries = [run_started[s] + symbol_timeout - now
+                            for s in pending if s in run_started]
+                timeout = min([remaining] + expiries)
+                try:
+                    receive(finished.get(timeout=max(timeout, 0.01)))
+                except queue.Empty:
+                    pass
+        finally:
+            stop.set()
+        
+        now = datetime.now()
+        fresh = self._create_summary_dataframe(results)
+        if not fresh.empty:
+            fresh['Stale'] = False
+            fresh['As_Of'] = now
+            fresh['Age_Hours'] = 0.0
+            self._save_last_results(fresh)
+        
+        filled = pd.DataFrame()
+        if late and use_last_results:
+            previous = self._load_last_results()
+            if not previous.empty:
+                filled = previous[previous['Symbol'].isin(late)].copy()
+                filled['Stale'] = True
+                filled['Age_Hours'] = ((now - pd.to_datetime(filled['As_Of']))
+                                       .dt.total_seconds() / 3600).round(1)
+        
+        self.deadline_report = {
+            'elapsed': round(time.monotonic() - started, 3),
+            'completed': len(results),
+            'late': late,
+            'filled_from_cache': list(filled['Symbol']) if not filled.empty else []
         }
+        logger.info(f"Deadline screen: {len(results)} fresh, {len(late)} late, "
+                    f"{len(filled)} filled from cache in {self.deadline_report['elapsed']}s")
+        
+        frames = [df for df in (fresh, filled) if not df.empty]
+        if not frames:
+            return pd.DataFrame()
+        return pd.concat(frames, ignore_index=True).sort_values('Score', ascending=False)
+    
+    def _load_last_results(self):
+        """Kết quả sàng lọc gần nhất của từng mã (cache)"""
+        if self.last_results_file.exists():
+            try:
+                return pd.read_parquet(self.last_results_file)
+            except Exception as e:
+                logger.error(f"Error reading last results: {str(e)}")
+        return pd.DataFrame()
+    
+    def _save_last_results(self, fresh: pd.DataFrame):
+        """Ghi đè kết quả mới vào cache, giữ kết quả cũ của các mã khác"""
+        previous = self._load_last_results()
+        if not previous.empty:
+            fresh = pd.concat([previous[~previous['Symbol'].isin(fresh['Symbol'])], fresh],
+                              ignore_index=True)
+        try:
+            fresh.to_parquet(self.last_results_file, index=False)
+        except Exception as e:
+            logger.error(f"Error saving last results: {str(e)}")
+    
+    def screen_staged(self, symbols=None, max_workers=5, min_fundamental_pct=None,
+                      use_cache=True):
+        """
+        Sàng lọc 2 giai đoạn: lọc cơ bản trước, chỉ mã đạt mới lấy giá
+        
+        Giai đoạn 1 (fundamental): đọc bảng chỉ số đã lưu cho cả universe,
+        chấm điểm và kiểm tra tiêu chí bằng vector (score_universe, check_universe).
+        Giai đoạn 2 (technical): chỉ các mã qua giai đoạn 1 mới tải giá một năm
+        và phân tích kỹ thuật.
+        
+        Số mã vào/đạt và thời gian từng giai đoạn được ghi vào self.stage_report.
+        
+        Args:
+            symbols: Danh sách mã (nếu None, dùng watchlist)
+            max_workers: Số luồng cho giai đoạn 2
+            min_fundamental_pct: Điểm cơ bản tối thiểu (%) ngoài check_criteria
+            use_cache: Dùng bảng chỉ số đã lưu (chỉ gọi API cho mã còn thiếu)
+            
+        Returns:
+            DataFrame kết quả như screen_multiple_stocks (chỉ các mã qua giai đoạn 1),
+            thêm cột Fair_Value và Upside (%) từ batch_valuation
+        """
+        symbols = symbols or self.watchlist
+        self.stage_report = []
+        
+        # Giai đoạn 1: lọc cơ bản trên bảng chỉ số
+        started = time.perf_counter()
+        table = self.fundamental_crawler.get_ratios_table(symbols, use_cache=use_cache)
+        
+        if table.empty:
+            self._record_stage('fundamental', len(symbols), 0, started)
+            return pd.DataFrame()
+        
+        scores = self.fundamental_analyzer.score_universe(table)
+        criteria = self.fundamental_analyzer.check_universe(table)
+        
+        mask = criteria['meets_criteria']
+        if min_fundamental_pct is not None:
+            mask &= scores['percentage'] >= min_fundamental_pct
+        survivors = list(table.index[mask.to_numpy()])
+        self._record_stage('fundamental', len(symbols), len(survivors), started)
+        
+        # Giai đoạn 2: giá + kỹ thuật cho các mã còn lại
+        started = time.perf_counter()
+        results = []
+        
+        with ThreadPoolExecutor(max_workers=max_workers) as executor:
+            future_to_symbol = {
+                executor.submit(
+                    self._screen_with_fundamentals,
+                    symbol,
+                    self._ratios_from_row(symbol, table.loc[symbol]),
+                    self.fundamental_crawler.get_company_profile(symbol)
+                ): symbol
+                for symbol in survivors
+            }
+            
+            for future in as_completed(future_to_symbol):
+                symbol = future_to_symbol[future]
+                try:
+                    result = future.result()
+                    if result:
+                        results.append(result)
+                except Exception as e:
+                    logger.error(f"Exception for {symbol}: {str(e)}")
+        
+        self._record_stage('technical', len(survivors), len(results), started)
         
-        t_signal_map = {
-            'STRONG BUY': 5,
-            'BUY': 4,
-            'HOLD': 3,
-            'SELL': 2,
-            'STRONG SELL': 1
+        if results:
+            return self._add_valuation(self._create_summary_dataframe(results), table)
+        return pd.DataFrame()
+    
+    def _add_valuation(self, summary, table):
+        """
+        Thêm cột Fair_Value, Upside (%) từ batch_valuation trên bảng chỉ số
+        
+        Giá hiện tại lấy từ cột Price của giai đoạn 2, không gọi thêm API.
+        """
+        ratios = table.loc[summary['Symbol']].assign(current_price=summary['Price'].to_numpy())
+        valuation = self.valuator.batch_valuation(ratios)
+        
+        summary = summary.copy()
+        summary['Fair_Value'] = valuation['average_fair_value'].round(0).to_numpy()
+        summary['Upside'] = valuation['upside_downside'].round(1).to_numpy()
+        return summary
+    
+    def _record_stage(self, stage, n_in, n_passed, started):
+        """Ghi số mã vào/đạt và thời gian của một giai đoạn"""
+        entry = {
+            'stage': stage,
+            'input': n_in,
+            'passed': n_passed,
+            'seconds': round(time.perf_counter() - started, 3)
         }
+        self.stage_report.append(entry)
+        logger.info(f"Stage {stage}: {n_passed}/{n_in} passed in {entry['seconds']}s")
+    
+    @staticmethod
+    def _ratios_from_row(symbol, row):
+        """Dòng bảng chỉ số -> dict như get_financial_ratios (NaN -> None)"""
+        ratios = {key: (None if pd.isna(value) else value) for key, value in row.items()}
+        ratios['symbol'] = symbol
+        return ratios
+    
+    def _combine_analysis(self, fundamental, technical):
+        """
+        Kết hợp đánh giá cơ bản và kỹ thuật cho một mã
         
-        f_score = f_rating_map.get(fundamental['scoring']['rating'], 3)
-        t_score = t_signal_map.get(technical['signals']['signal'], 3)
-        
-        # Điểm tổng hợp (60-40)
-        combined_score = (f_score * 0.6 + t_score * 0.4)
-        
-        # Quyết định cuối cùng
-        if combined_score >= 4.5:
-            final_rating = 'STRONG BUY'
-            final_action = 'Mua mạnh - Cả cơ bản và kỹ thuật đều tốt'
-        elif combined_score >= 3.8:
-            final_rating = 'BUY'
-            final_action = 'Mua - Tổng thể khá tích cực'
-        elif combined_score >= 3.2:
-            final_rating = 'HOLD'
-            final_action = 'Giữ/Theo dõi - Chờ tín hiệu rõ ràng hơn'
-        elif combined_score >= 2.5:
-            final_rating = 'AVOID'
-            final_action = 'Tránh - Chưa hấp dẫn'
-        else:
-            final_rating = 'SELL'
-            final_action = 'Bán - Cả cơ bản và kỹ thuật đều yếu'
+        Cùng quy tắc với combine_scores (trọng số self.weights, mặc định 60/40)
+        """
+        combined = combine_scores([fundamental['scoring']['rating']],
+                                  [technical['signals']['signal']],
+                                  self.weights).iloc[0]
+        
+        f_score = int(combined['fundamental_score'])
+        t_score = int(combined['technical_score'])
         
         # Phân tích điểm mạnh/yếu
         strengths = []
@@ -184,63 +633,78 @@ class StockScreener:
         elif t_score <= 2:
             weaknesses.append('Kỹ thuật tiêu cực')
         
-        # Kiểm tra xung đột
-        conflict = abs(f_score - t_score) >= 2
-        if conflict:
-            if f_score > t_score:
-                note = '⚠️  Cơ bản tốt nhưng kỹ thuật chưa đẹp - Chờ điểm vào tốt hơn'
-            else:
-                note = '⚠️  Kỹ thuật tốt nhưng cơ bản yếu - Cẩn thận bẫy giá'
-        else:
-            note = '✓ Cơ bản và kỹ thuật đồng thuận'
-        
         return {
             'fundamental_score': f_score,
             'technical_score': t_score,
-            'combined_score': combined_score,
-            'final_rating': final_rating,
-            'final_action': final_action,
+            'combined_score': float(combined['combined_score']),
+            'final_rating': combined['final_rating'],
+            'final_action': combined['final_action'],
             'strengths': strengths,
             'weaknesses': weaknesses,
-            'has_conflict': conflict,
-            'note': note
+            'has_conflict': bool(combined['has_conflict']),
+            'note': combined['note']
         }
     
     def _create_summary_dataframe(self, results):
-        """Tạo DataFrame tóm tắt kết quả"""
-        data = []
-        
-        for result in results:
-            symbol = result['symbol']
-            f = result['fundamental']
-            t = result['technical']
-            c = result['combined']
-            
-            row = {
-                'Symbol': symbol,
-                'Rating': c['final_rating'],
-                'Score': round(c['combined_score'], 2),
-                'F_Rating': f['scoring']['rating'],
-                'F_Score': f['scoring']['percentage'],
-                'T_Signal': t['signals']['signal'],
-                'T_Score': t['signals']['score'],
-                'Price': t['close'],
-                'RSI': round(t['rsi'], 1),
-                'ROE': f['ratios'].get('roe'),
-                'PE': f['ratios'].get('pe'),
-                'D/E': f['ratios'].get('debt_to_equity'),
-                'Trend': t['trend']['medium_term'],
-                'Note': c['note']
-            }
-            
-            data.append(row)
+        """
+        Tạo DataFrame tóm tắt kết quả
         
-        df = pd.DataFrame(data)
+        Lấy từng cột từ kết quả phân tích rồi kết hợp điểm một lần cho cả
+        bảng bằng combine_frame (không dựng từng dòng dict).
+        """
+        if not results:
+            return pd.DataFrame(columns=SUMMARY_COLUMNS)
         
-        # Sort theo Score giảm dần
-        df = df.sort_values('Score', ascending=False)
+        fundamentals = [r['fundamental'] for r in results]
+        technicals = [r['technical'] for r in results]
+        ratios = [f['ratios'] for f in fundamentals]
+        
+        frame = pd.DataFrame({
+            'Symbol': [r['symbol'] for r in results],
+            'F_Rating': [f['scoring']['rating'] for f in fundamentals],
+            'F_Score': [f['scoring']['percentage'] for f in fundamentals],
+            'T_Signal': [t['signals']['signal'] for t in technicals],
+            'T_Score': [t['signals']['score'] for t in technicals],
+            'Price': [t['close'] for t in technicals],
+            'RSI': np.round(np.array([t['rsi'] for t in technicals], dtype=float), 1),
+            'ROE': [r.get('roe') for r in ratios],
+            'PE': [r.get('pe') for r in ratios],
+            'D/E': [r.get('debt_to_equity') for r in ratios],
+            'Trend': [t['trend']['medium_term'] for t in technicals],
+            'Sector': [f['profile'].get('industry', 'Unknown') for f in fundamentals],
+            'Sector_Pct': [(f.get('sector_relative') or {}).get('sector_score') for f in fundamentals]
+        })
+        
+        return self.combine_frame(frame)
+    
+    def combine_frame(self, frame: pd.DataFrame):
+        """
+        Thêm Rating, Score, Note cho bảng đã có cột F_Rating, T_Signal và xếp hạng
+        
+        Dùng được trực tiếp với kết quả vector hóa (vd. rating từ score_universe),
+        trọng số theo self.weights.
+        
+        Returns:
+            DataFrame theo thứ tự SUMMARY_COLUMNS (giữ thêm các cột khác), sort Score giảm dần
+        """
+        combined = combine_scores(frame['F_Rating'].to_numpy(), frame['T_Signal'].to_numpy(),
+                                  self.weights)
+        
+        frame = frame.copy()
+        frame['Rating'] = combined['final_rating'].to_numpy()
+        frame['Score'] = combined['combined_score'].round(2).to_numpy()
+        frame['Note'] = combined['note'].to_numpy()
         
-        return df
+        ordered = [c for c in SUMMARY_COLUMNS if c in frame.columns]
+        extra = [c for c in frame.columns if c not in SUMMARY_COLUMNS]
+        frame = frame[ordered + extra]
+        
+        # Sort theo Score giảm dần
+        return frame.sort_values('Score', ascending=False, kind='stable')
+    
+    def _summary_row(self, result):
+        """Một dòng tóm tắt từ kết quả screen_single_stock (cùng cột với _create_summary_dataframe)"""
+        return self._create_summary_dataframe([result]).iloc[0].to_dict()
     
     def get_top_picks(self, n=10):
         """Lấy top N cổ phiếu tốt nhất"""
@@ -269,6 +733,21 @@ class StockScreener:
         ]
         
         return filtered
+    
+    def filter_by_query(self, df: pd.DataFrame, query):
+        """
+        Lọc bằng truy vấn (xem src/screener/query.py), ví dụ:
+        "ROE > 15 and PE < sector_median(PE) and RSI between 30 and 70"
+        
+        Args:
+            df: Kết quả screen_multiple_stocks / screen_staged
+            query: Chuỗi truy vấn hoặc ScreenQuery
+        """
+        if df.empty:
+            return df
+        if not isinstance(query, ScreenQuery):
+            query = ScreenQuery(query)
+        return query.filter(df)
 
 
 # Example usage
@@ -0,0 +1,255 @@
+"""
+Lich su cac lan sang loc (columnar store)
+
+Moi lan chay screen duoc ghi vao mot file parquet duy nhat, moi dong mot
+(run_ts, Symbol). Cac truy van lich su (doi rating, chuoi rating lien tiep,
+so sanh 2 lan chay) la phep toan groupby/shift tren bang nay thay vi doc
+lai tung file screening_results_*.csv.
+"""
+import logging
+import re
+from datetime import datetime
+from pathlib import Path
+
+import pandas as pd
+
+from config.settings import PROCESSED_DATA_DIR
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+CSV_TIMESTAMP = re.compile(r'screening_results_(\d{8}_\d{6})\.csv$')
+
+
+class ScreenHistory:
+    """Luu va truy van lich su sang loc"""
+
+    def __init__(self, history_file=None):
+        """
+        Args:
+            history_file: File parquet (mac dinh data/processed/screen_history.parquet)
+        """
+        self.history_file = Path(history_file or PROCESSED_DATA_DIR / 'screen_history.parquet')
+        self._table = None
+
+    # ==================== GHI ====================
+
+    def append_run(self, results: pd.DataFrame, run_ts=None):
+        """
+        Ghi ket qua mot lan sang loc
+
+        Args:
+            results: DataFrame nhu screen_multiple_stocks (cot Symbol, Rating, Score...)
+            run_ts: Thoi diem chay (mac dinh bay gio); ghi lai cung run_ts se thay the
+
+        Returns:
+            run_ts da ghi
+        """
+        if results is None or results.empty:
+            return None
+
+        run_ts = pd.Timestamp(run_ts or datetime.now()).floor('s')
+        run = results.copy()
+        run.insert(0, 'run_ts', run_ts)
+
+        table = self.load()
+        if not table.empty:
+            table = table[table['run_ts'] != run_ts]
+            run = pd.concat([table, run], ignore_index=True)
+
+        self._write(run)
+        logger.info(f"Saved screen run {run_ts} ({len(results)} symbols)")
+        return run_ts
+
+    def import_csv(self, paths):
+        """
+        Nhap cac file screening_results_YYYYMMDD_HHMMSS.csv cu
+
+        Args:
+            paths: List duong dan hoac thu muc (tim screening_results_*.csv)
+
+        Returns:
+            So lan chay da nhap
+        """
+        if isinstance(paths, (str, Path)) and Path(paths).is_dir():
+            paths = sorted(Path(paths).glob('screening_results_*.csv'))
+
+        frames = []
+        for path in map(Path, paths):
+            match = CSV_TIMESTAMP.search(path.name)
+            if not match:
+                logger.warning(f"Skip {path.name}: no timestamp in file name")
+                continue
+            run = pd.read_csv(path)
+            run.insert(0, 'run_ts', pd.Timestamp(datetime.strptime(match.group(1), '%Y%m%d_%H%M%S')))
+            frames.append(run)
+
+        if not frames:
+            return 0
+
+        imported = pd.concat(frames, ignore_index=True)
+        table = self.load()
+        if not table.empty:
+            table = table[~table['run_ts'].isin(imported['run_ts'])]
+            imported = pd.concat([table, imported], ignore_index=True)
+
+        self._write(imported)
+        logger.info(f"Imported {len(frames)} screen runs from CSV")
+        return len(frames)
+
+    def _write(self, table):
+        table = table.sort_values(['run_ts', 'Symbol'], ignore_index=True)
+        table.to_parquet(self.history_file, index=False)
+        self._table = table
+
+    # ==================== DOC ====================
+
+    def load(self, symbols=None, since=None, until=None):
+        """
+        Doc lich su (cache trong bo nho)
+
+        Args:
+            symbols: Chi lay cac ma nay
+            since, until: Khoang run_ts (bao gom ca hai dau)
+        """
+        if self._table is None:
+            if self.history_file.exists():
+                self._table = pd.read_parquet(self.history_file)
+            else:
+                self._table = pd.DataFrame()
+
+        table = self._table
+        if table.empty:
+            return table
+
+        mask = pd.Series(True, index=table.index)
+        if symbols is not None:
+            mask &= table['Symbol'].isin(symbols)
+        if since is not None:
+            mask &= table['run_ts'] >= pd.Timestamp(since)
+        if until is not None:
+            mask &= table['run_ts'] <= pd.Timestamp(until)
+        return table[mask]
+
+    def runs(self):
+        """Danh sach run_ts da luu (tang dan)"""
+        table = self.load()
+        if table.empty:
+            return []
+        return list(table['run_ts'].drop_duplicates().sort_values())
+
+    def get_run(self, run_ts=None):
+        """Ket qua mot lan chay (mac dinh lan gan nhat)"""
+        runs = self.runs()
+        if not runs:
+            return pd.DataFrame()
+        run_ts = pd.Timestamp(run_ts) if run_ts is not None else runs[-1]
+        table = self.load()
+        return table[table['run_ts'] == run_ts].reset_index(drop=True)
+
+    # ==================== TRUY VAN ====================
+
+    def diff(self, old_run=None, new_run=None, column='Rating'):
+        """
+        So sanh 2 lan chay (mac dinh 2 lan gan nhat)
+
+        Returns:
+            DataFrame index Symbol: <column>_old, <column>_new, Score_old,
+            Score_new, Score_change, status (changed / new / dropped);
+            chi gom cac ma co thay doi
+        """
+        runs = self.runs()
+        if len(runs) < 2 and (old_run is None or new_run is None):
+            return pd.DataFrame()
+
+        old_run = pd.Timestamp(old_run) if old_run is not None else runs[-2]
+        new_run = pd.Timestamp(new_run) if new_run is not None else runs[-1]
+
+        fields = [column] if column == 'Score' else [column, 'Score']
+        old = self.get_run(old_run).set_index('Symbol')[fields]
+        new = self.get_run(new_run).set_index('Symbol')[fields]
+
+        merged = old.join(new, how='outer', lsuffix='_old', rsuffix='_new')
+        in_old = merged.index.isin(old.index)
+        in_new = merged.index.isin(new.index)
+
+        merged['status'] = 'changed'
+        merged.loc[~in_old, 'status'] = 'new'
+        merged.loc[~in_new, 'status'] = 'dropped'
+        merged['Score_change'] = merged['Score_new'] - merged['Score_old']
+
+        changed = merged[f'{column}_old'].ne(merged[f'{column}_new']) | ~(in_old & in_new)
+        return merged[changed]
+
+    def rating_changes(self, since=None, column='Rating'):
+        """
+        Cac lan doi rating so voi lan chay truoc cua cung ma
+
+        Args:
+            since: Chi lay thay doi tu thoi diem nay (mac dinh dau ngay hom nay)
+
+        Returns:
+            DataFrame: run_ts, Symbol, previous, current, Score
+        """
+        table = self.load()
+        if table.empty:
+            return pd.DataFrame()
+
+        since = pd.Timestamp(since) if since is not None else pd.Timestamp(datetime.now().date())
+
+        ordered = table.sort_values(['Symbol', 'run_ts'])
+        previous = ordered.groupby('Symbol')[column].shift()
+        changed = previous.notna() & previous.ne(ordered[column]) & (ordered['run_ts'] >= since)
+
+        result = ordered.loc[changed, ['run_ts', 'Symbol', column, 'Score']].copy()
+        result.insert(2, 'previous', previous[changed])
+        result = result.rename(columns={column: 'current'})
+        return result.sort_values(['run_ts', 'Symbol']).reset_index(drop=True)
+
+    def streaks(self, column='Rating', value=None, min_length=1):
+        """
+        Chuoi gia tri lien tiep hien tai cua moi ma (tinh tu lan chay moi nhat lui ve)
+
+        Args:
+            value: Chi lay ma dang co gia tri nay (vd. 'BUY')
+            min_length: Do dai chuoi toi thieu
+
+        Returns:
+            DataFrame index Symbol: <column>, streak (so lan chay), since (run_ts dau chuoi)
+        """
+        table = self.load()
+        if table.empty:
+            return pd.DataFrame()
+
+        ordered = table.sort_values(['Symbol', 'run_ts'])
+        new_block = ordered[column].ne(ordered.groupby('Symbol')[column].shift())
+        block = new_block.cumsum()
+
+        # Block cuoi cua moi ma la chuoi hien tai
+        last_block = block.groupby(ordered['Symbol']).transform('max')
+        current = ordered[block == last_block]
+
+        result = current.groupby('Symbol').agg(
+            value=(column, 'last'),
+            streak=('run_ts', 'size'),
+            since=('run_ts', 'min')
+        ).rename(columns={'value': column})
+
+        if value is not None:
+            result = result[result[column] == value]
+        return result[result['streak'] >= min_length].sort_values('streak', ascending=False)
+
+
+# Example usage
+if __name__ == "__main__":
+    from config.settings import BASE_DIR
+
+    history = ScreenHistory()
+    if not history.runs():
+        history.import_csv(BASE_DIR)
+
+    print(f"Runs: {len(history.runs())}")
+    print("\nDiff (2 lan gan nhat):")
+    print(history.diff().to_string())
+    print("\nRating streaks:")
+    print(history.streaks().head(10).to_string())
@@ -0,0 +1,524 @@
+"""
+Ngon ngu truy van sang loc bien dich thanh mask NumPy
+
+Vi du:
+    ROE > 15 and PE < sector_median(PE) and RSI between 30 and 70
+    Rating in ('BUY', 'STRONG BUY') and not `D/E` > 2
+
+Cu phap:
+    expr       := or_expr
+    or_expr    := and_expr ('or' and_expr)*
+    and_expr   := not_expr ('and' not_expr)*
+    not_expr   := 'not' not_expr | comparison
+    comparison := arith [ CMP arith | 'between' arith 'and' arith | 'in' '(' list ')' ]
+    arith      := term (('+' | '-') term)*
+    term       := unary (('*' | '/') unary)*
+    unary      := '-' unary | atom
+    atom       := NUMBER | STRING | COLUMN | FUNC '(' args ')' | '(' expr ')'
+
+Ten cot khong phan biet hoa thuong; cot co ky tu dac biet dat trong dau
+backtick (`D/E`). So sanh voi NaN luon la False, ke ca sau 'not'
+(logic ba gia tri: not `D/E` > 2 khong chon dong D/E NaN).
+
+Truy van duoc phan tich mot lan thanh cay (tuple, hash duoc). Khi chay
+nhieu truy van tren cung mot bang (evaluate_many), cac bieu thuc con giong
+nhau chi tinh mot lan nho cache theo nut cay.
+"""
+import json
+import logging
+import re
+from functools import lru_cache
+
+import numpy as np
+import pandas as pd
+
+from config.settings import DATA_DIR
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+SCREENS_FILE = DATA_DIR / 'screens.json'
+
+# Cac bo loc co san (ten cot theo _create_summary_dataframe)
+DEFAULT_SCREENS = {
+    'value_quality': 'ROE >= 15 and PE > 0 and PE <= 20 and `D/E` <= 2',
+    'cheap_vs_sector': 'PE > 0 and PE < sector_median(PE) and ROE > sector_median(ROE)',
+    'oversold_quality': 'RSI < 35 and F_Score >= 60',
+    'momentum': "Rating in ('BUY', 'STRONG BUY') and RSI between 50 and 70",
+}
+
+KEYWORDS = {'and', 'or', 'not', 'between', 'in', 'true', 'false'}
+COMPARISONS = {'>', '>=', '<', '<=', '==', '=', '!=', '<>'}
+
+TOKEN_RE = re.compile(r"""
+    \s*(?:
+        (?P<number>\d+(?:\.\d*)?(?:[eE][+-]?\d+)?|\.\d+(?:[eE][+-]?\d+)?)
+      | (?P<string>'[^']*'|"[^"]*")
+      | (?P<quoted>`[^`]+`)
+      | (?P<name>[A-Za-z_][A-Za-z0-9_]*)
+      | (?P<op>>=|<=|==|!=|<>|[<>=+\-*/(),])
+    )""", re.VERBOSE)
+
+
+class QueryError(ValueError):
+    """Loi cu phap hoac loi khi danh gia truy van"""
+
+
+# ==================== TOKENIZER + PARSER ====================
+
+def tokenize(text):
+    """Tach truy van thanh list (loai, gia tri, vi tri)"""
+    tokens = []
+    pos = 0
+    text = text.rstrip()
+
+    while pos < len(text):
+        match = TOKEN_RE.match(text, pos)
+        if not match or match.end() == pos:
+            raise QueryError(f"Unexpected character at {pos}: {text[pos:pos + 10]!r}")
+
+        kind = match.lastgroup
+        value = match.group(kind)
+        start = match.start(kind)
+
+        if kind == 'number':
+            tokens.append(('number', float(value), start))
+        elif kind == 'string':
+            tokens.append(('string', value[1:-1], start))
+        elif kind == 'quoted':
+            tokens.append(('name', value[1:-1], start))
+        elif kind == 'name' and value.lower() in KEYWORDS:
+            tokens.append(('keyword', value.lower(), start))
+        else:
+            tokens.append((kind, value, start))
+
+        pos = match.end()
+
+    tokens.append(('end', None, len(text)))
+    return tokens
+
+
+class _Parser:
+    """Recursive-descent parser tao cay tuple"""
+
+    def __init__(self, text):
+        self.text = text
+        self.tokens = tokenize(text)
+        self.pos = 0
+
+    def parse(self):
+        node = self.or_expr()
+        if self.peek()[0] != 'end':
+            self.error('Unexpected token')
+        return node
+
+    # --- tien ich ---
+    def peek(self):
+        return self.tokens[self.pos]
+
+    def advance(self):
+        token = self.tokens[self.pos]
+        self.pos += 1
+        return token
+
+    def accept(self, kind, value=None):
+        token = self.peek()
+        if token[0] == kind and (value is None or token[1] == value):
+            self.pos += 1
+            return token
+        return None
+
+    def expect(self, kind, value=None):
+        token = self.accept(kind, value)
+        if token is None:
+            self.error(f"Expected {value or kind}")
+        return token
+
+    def error(self, message):
+        _, value, position = self.peek()
+        raise QueryError(f"{message} at {position} (got {value!r}) in: {self.text}")
+
+    # --- ngu phap ---
+    def or_expr(self):
+        node = self.and_expr()
+        while self.accept('keyword', 'or'):
+            node = ('or', node, self.and_expr())
+        return node
+
+    def and_expr(self):
+        node = self.not_expr()
+        while self.accept('keyword', 'and'):
+            node = ('and', node, self.not_expr())
+        return node
+
+    def not_expr(self):
+        if self.accept('keyword', 'not'):
+            return ('not', self.not_expr())
+        return self.comparison()
+
+    def comparison(self):
+        left = self.arith()
+        kind, value, _ = self.peek()
+
+        if kind == 'op' and value in COMPARISONS:
+            self.advance()
+            op = {'=': '==', '<>': '!='}.get(value, value)
+            return ('cmp', op, left, self.arith())
+
+        if self.accept('keyword', 'between'):
+            low = self.arith()
+            self.expect('keyword', 'and')
+            return ('between', left, low, self.arith())
+
+        if self.accept('keyword', 'in'):
+            self.expect('op', '(')
+            values = [self.literal()]
+            while self.accept('op', ','):
+                values.append(self.literal())
+            self.expect('op', ')')
+            return ('in', left, tuple(values))
+
+        return left
+
+    def literal(self):
+        kind, value, _ = self.peek()
+        if kind in ('number', 'string'):
+            self.advance()
+            return value
+        if self.accept('op', '-'):
+            return -self.expect('number')[1]
+        self.error('Expected literal')
+
+    def arith(self):
+        node = self.term()
+        while True:
+            token = self.accept('op', '+') or self.accept('op', '-')
+            if not token:
+                return node
+            node = ('bin', token[1], node, self.term())
+
+    def term(self):
+        node = self.unary()
+        while True:
+            token = self.accept('op', '*') or self.accept('op', '/')
+            if not token:
+                return node
+            node = ('bin', token[1], node, self.unary())
+
+    def unary(self):
+        if self.accept('op', '-'):
+            return ('neg', self.unary())
+        return self.atom()
+
+    def atom(self):
+        kind, value, _ = self.peek()
+
+        if kind == 'number':
+            self.advance()
+            return ('num', value)
+        if kind == 'string':
+            self.advance()
+            return ('str', value)
+        if kind == 'keyword' and value in ('true', 'false'):
+            self.advance()
+            return ('bool', value == 'true')
+        if self.accept('op', '('):
+            node = self.or_expr()
+            self.expect('op', ')')
+            return node
+        if kind == 'name':
+            self.advance()
+            if self.accept('op', '('):
+                name = value.lower()
+                if name not in FUNCTIONS:
+                    raise QueryError(f"Unknown function: {value}")
+                args = []
+                if not self.accept('op', ')'):
+                    args.append(self.arith())
+                    while self.accept('op', ','):
+                        args.append(self.arith())
+                    self.expect('op', ')')
+                if len(args) != 1:
+                    raise QueryError(f"{value}() takes exactly one argument")
+                return ('call', name, tuple(args))
+            return ('col', value.lower())
+
+        self.error('Unexpected token')
+
+
+@lru_cache(maxsize=256)
+def parse(text):
+    """Phan tich truy van thanh cay (co cache theo chuoi)"""
+    return _Parser(text).parse()
+
+
+# ==================== HAM THONG KE ====================
+
+def _group_transform(values, groups, how):
+    if groups is None:
+        raise QueryError("Sector functions need a sector column in the table")
+    grouped = pd.Series(values).groupby(groups)
+    if how == 'rank':
+        return grouped.rank(pct=True).to_numpy(dtype=float)
+    return grouped.transform(how).to_numpy(dtype=float)
+
+
+def _pct_rank(values):
+    return pd.Series(values).rank(pct=True).to_numpy(dtype=float) * 100
+
+
+FUNCTIONS = {
+    'abs': lambda ctx, x: np.abs(x),
+    'median': lambda ctx, x: np.full(ctx.n, np.nanmedian(x) if np.isfinite(x).any() else np.nan),
+    'mean': lambda ctx, x: np.full(ctx.n, np.nanmean(x) if np.isfinite(x).any() else np.nan),
+    'pct_rank': lambda ctx, x: _pct_rank(x),
+    'sector_median': lambda ctx, x: _group_transform(x, ctx.sectors, 'median'),
+    'sector_mean': lambda ctx, x: _group_transform(x, ctx.sectors, 'mean'),
+    'sector_pct_rank': lambda ctx, x: _group_transform(x, ctx.sectors, 'rank') * 100,
+}
+
+
+# ==================== DANH GIA ====================
+
+class _Context:
+    """Bang dang danh gia + cache ket qua theo nut cay"""
+
+    def __init__(self, table, sector_column):
+        self.table = table
+        self.n = len(table)
+        self.columns = {str(c).lower(): c for c in table.columns}
+        self.cache = {}
+
+        sector = self.columns.get(sector_column.lower()) if sector_column else None
+        self.sectors = table[sector].fillna('Unknown').to_numpy() if sector is not None else None
+
+    def column(self, name):
+        if name not in self.columns:
+            raise QueryError(f"Unknown column: {name}")
+        series = self.table[self.columns[name]]
+        if pd.api.types.is_bool_dtype(series) or pd.api.types.is_numeric_dtype(series):
+            return series.to_numpy(dtype=float, na_value=np.nan)
+        return series.to_numpy(dtype=object)
+
+    def evaluate(self, node):
+        if node in self.cache:
+            return self.cache[node]
+        value = self._evaluate(node)
+        self.cache[node] = value
+        return value
+
+    def _evaluate(self, node):
+        kind = node[0]
+
+        if kind in ('num', 'str'):
+            return node[1]
+        if kind == 'bool':
+            return np.full(self.n, node[1])
+        if kind == 'col':
+            return self.column(node[1])
+        if kind == 'neg':
+            return -self._numeric(node[1])
+        if kind == 'bin':
+            left, right = self._numeric(node[2]), self._numeric(node[3])
+            with np.errstate(divide='ignore', invalid='ignore'):
+                if node[1] == '+':
+                    return left + right
+                if node[1] == '-':
+                    return left - right
+                if node[1] == '*':
+                    return left * right
+                return left / right
+        if kind == 'call':
+            args = [self._numeric(arg) for arg in node[2]]
+            return FUNCTIONS[node[1]](self, *args)
+        if kind == 'cmp':
+            try:
+                return self._compare(node[1], self.evaluate(node[2]), self.evaluate(node[3]))
+            except TypeError as e:
+                raise QueryError(f"Cannot compare {node[2]} {node[1]} {node[3]}: {e}")
+        if kind == 'between':
+            value = self.evaluate(node[1])
+            return (self._compare('>=', value, self.evaluate(node[2]))
+                    & self._compare('<=', value, self.evaluate(node[3])))
+        if kind == 'in':
+            value = self.evaluate(node[1])
+            return np.isin(np.broadcast_to(value, self.n), list(node[2]))
+        if kind in ('and', 'or', 'not'):
+            return self.condition(node)
+
+        raise QueryError(f"Unknown node: {kind}")
+
+    def _numeric(self, node):
+        value = self.evaluate(node)
+        if isinstance(value, str):
+            raise QueryError(f"String used in arithmetic: {value!r}")
+        if isinstance(value, np.ndarray) and value.dtype == object:
+            return pd.to_numeric(pd.Series(value), errors='coerce').to_numpy(dtype=float)
+        return value
+
+    def condition(self, node):
+        """Mask bool cua nut (so sanh, phep logic hoac cot bool); nut khac la loi"""
+        return self._truth(node)[0]
+
+    def _truth(self, node):
+        """
+        (dung, biet) theo logic ba gia tri: 'biet' = False khi ket qua phu
+        thuoc vao NaN. Dong chua biet la False va 'not' giu nguyen False
+        (not PE > 20 khong chon dong PE NaN).
+        """
+        key = ('truth', node)
+        if key not in self.cache:
+            self.cache[key] = self._evaluate_truth(node)
+        return self.cache[key]
+
+    def _evaluate_truth(self, node):
+        kind = node[0]
+
+        if kind == 'not':
+            value, known = self._truth(node[1])
+            return ~value & known, known
+        if kind == 'and':
+            (left, left_known), (right, right_known) = self._truth(node[1]), self._truth(node[2])
+            # False neu mot ve chac chan False, du ve kia chua biet
+            known = (left_known & right_known) | (left_known & ~left) | (right_known & ~right)
+            return left & right, known
+        if kind == 'or':
+            (left, left_known), (right, right_known) = self._truth(node[1]), self._truth(node[2])
+            return left | right, (left_known & right_known) | left | right
+
+        value = self.evaluate(node)
+        if node[0] == 'col' and pd.api.types.is_bool_dtype(self.table[self.columns[node[1]]]):
+            return value == 1, self._known_mask(value)  # Cot bool doc thanh 0/1/NaN; NaN -> False
+        if not isinstance(value, np.ndarray) or value.dtype != bool:
+            raise QueryError(f"Expected a condition (comparison or boolean column), got {node}")
+
+        operands = {'cmp': node[2:4], 'between': node[1:4], 'in': node[1:2]}.get(kind, ())
+        known = np.ones(self.n, dtype=bool)
+        for operand in operands:
+            known &= self._known_mask(self.evaluate(operand))
+        return value, known
+
+    def _compare(self, op, left, right):
+        with np.errstate(invalid='ignore'):
+            if op == '==':
+                result = left == right
+            elif op == '!=':
+                # NaN != x la True trong numpy; giu quy uoc "so sanh voi NaN = False"
+                result = (left != right) & self._known(left) & self._known(right)
+            elif op == '>':
+                result = left > right
+            elif op == '>=':
+                result = left >= right
+            elif op == '<':
+                result = left < right
+            else:
+                result = left <= right
+        return np.broadcast_to(np.asarray(result, dtype=bool), (self.n,)).copy()
+
+    def _known(self, value):
+        if isinstance(value, np.ndarray):
+            return ~pd.isna(value)
+        return not pd.isna(value)
+
+    def _known_mask(self, value):
+        return np.broadcast_to(np.asarray(self._known(value), dtype=bool), (self.n,))
+
+
+class ScreenQuery:
+    """Mot truy van da phan tich, danh gia duoc tren nhieu bang"""
+
+    def __init__(self, text, sector_column='Sector'):
+        self.text = text
+        self.sector_column = sector_column
+        self.tree = parse(text)
+
+    def mask(self, table: pd.DataFrame):
+        """Mask bool (numpy) tren cac dong cua bang"""
+        return _Context(table, self.sector_column).condition(self.tree)
+
+    def filter(self, table: pd.DataFrame):
+        """Cac dong thoa truy van"""
+        return table[self.mask(table)]
+
+    def __repr__(self):
+        return f"ScreenQuery({self.text!r})"
+
+
+def evaluate_many(table: pd.DataFrame, screens: dict, sector_column='Sector'):
+    """
+    Danh gia nhieu truy van tren cung mot bang trong mot luot
+
+    Bieu thuc con trung nhau (vd. sector_median(PE)) chi tinh mot lan.
+
+    Args:
+        table: Bang ket qua sang loc
+        screens: dict ten -> chuoi truy van hoac ScreenQuery
+
+    Returns:
+        DataFrame bool, cung index voi table, moi cot mot truy van
+    """
+    context = _Context(table, sector_column)
+    masks = {}
+    for name, query in screens.items():
+        tree = query.tree if isinstance(query, ScreenQuery) else parse(query)
+        masks[name] = context.condition(tree)
+    return pd.DataFrame(masks, index=table.index, dtype=bool)
+
+
+# ==================== BO LOC DA LUU ====================
+
+class ScreenLibrary:
+    """Bo loc dat ten, luu trong file JSON"""
+
+    def __init__(self, screens_file=None):
+        self.screens_file = screens_file or SCREENS_FILE
+        self.screens = dict(DEFAULT_SCREENS)
+        self._load()
+
+    def _load(self):
+        if self.screens_file.exists():
+            try:
+                with open(self.screens_file, 'r', encoding='utf-8') as f:
+                    saved = json.load(f)
+                for name, text in saved.items():
+                    if text is None:
+                        self.screens.pop(name, None)  # Bo loc co san da bi xoa
+                    else:
+                        self.screens[name] = text
+            except Exception as e:
+                logger.error(f"Error loading screens: {str(e)}")
+
+    def _save(self):
+        custom = {name: text for name, text in self.screens.items()
+                  if DEFAULT_SCREENS.get(name) != text}
+        custom.update({name: None for name in DEFAULT_SCREENS if name not in self.screens})
+        with open(self.screens_file, 'w', encoding='utf-8') as f:
+            json.dump(custom, f, indent=2, ensure_ascii=False)
+
+    def save(self, name: str, text: str):
+        """Luu bo loc (kiem tra cu phap truoc khi ghi)"""
+        parse(text)
+        self.screens[name] = text
+        self._save()
+        logger.info(f"Saved screen '{name}'")
+
+    def delete(self, name: str):
+        """Xoa bo loc da luu"""
+        if name in self.screens:
+            del self.screens[name]
+            self._save()
+
+    def get(self, name: str):
+        """ScreenQuery theo ten"""
+        if name not in self.screens:
+            raise KeyError(f"Unknown screen: {name}")
+        return ScreenQuery(self.screens[name])
+
+    def names(self):
+        return sorted(self.screens)
+
+    def evaluate(self, table: pd.DataFrame, names=None, sector_column='Sector'):
+        """Danh gia cac bo loc da luu (mac dinh tat ca) tren mot bang"""
+        names = names or self.names()
+        return evaluate_many(table, {name: self.screens[name] for name in names},
+                             sector_column=sector_column)
@@ -2,12 +2,15 @@
 Module scan tin hieu ky thuat nhanh
 Copy vao: src/screener/technical_scanner.py
 """
+import os
 import pandas as pd
 import logging
+from datetime import datetime
 from concurrent.futures import ThreadPoolExecutor, as_completed
 
 from src.data_pipeline.price_data import PriceDataCrawler
 from src.analysis.technical import TechnicalAnalyzer
+from src.screener.executor import HybridExecutor, analyze_technical
 from config.settings import WATCHLIST
 
 logging.basicConfig(level=logging.INFO)
@@ -21,6 +24,11 @@ class TechnicalScanner:
         self.watchlist = watchlist or WATCHLIST
         self.price_crawler = PriceDataCrawler()
         self.technical_analyzer = TechnicalAnalyzer()
+        
+        # Ket qua scan_all gan nhat, dung chung cho cac ham find_*
+        self.snapshot_time = None
+        self._snapshot = None
+        self._snapshot_key = None
     
     def scan_single_stock(self, symbol: str):
         """Scan mot ma co phieu"""
@@ -34,28 +42,60 @@ class TechnicalScanner:
             # Phan tich
             result = self.technical_analyzer.analyze_stock(df, symbol)
             
-            # Tom tat quan trong
-            summary = {
-                'symbol': symbol,
-                'close': result['close'],
-                'signal': result['signals']['signal'],
-                'signal_score': result['signals']['score'],
-                'rsi': result['rsi'],
-                'macd': result['macd'],
-                'trend': result['trend']['medium_term'],
-                'patterns': result['patterns'],
-                'support': result['support_resistance']['supports'][-1] if result['support_resistance']['supports'] else None,
-                'resistance': result['support_resistance']['resistances'][-1] if result['support_resistance']['resistances'] else None
-            }
-            
-            return summary
+            return self._summarize(symbol, result)
             
         except Exception as e:
             logger.error(f"Error scanning {symbol}: {str(e)}")
             return None
     
-    def scan_all(self, max_workers=5):
-        """Scan tat ca ma trong watchlist"""
+    @staticmethod
+    def _summarize(symbol, result):
+        """Tom tat quan trong tu ket qua analyze_stock"""
+        return {
+            'symbol': symbol,
+            'close': result['close'],
+            'signal': result['signals']['signal'],
+            'signal_score': result['signals']['score'],
+            'rsi': result['rsi'],
+            'macd': result['macd'],
+            'trend': result['trend']['medium_term'],
+            'patterns': result['patterns'],
+            'support': result['support_resistance']['supports'][-1] if result['support_resistance']['supports'] else None,
+            'resistance': result['support_resistance']['resistances'][-1] if result['support_resistance']['resistances'] else None
+        }
+    
+    def scan_all(self, max_workers=5, mode='thread', cpu_workers=None):
+        """
+        Scan tat ca ma trong watchlist
+        
+        Args:
+            max_workers: So luong (luong I/O khi mode='hybrid')
+            mode: 'thread' hoac 'hybrid' (tai gia bang luong, phan tich bang tien trinh)
+            cpu_workers: So tien trinh khi mode='hybrid' (mac dinh = so core)
+        """
+        results = []
+        
+        if mode == 'hybrid':
+            executor = HybridExecutor(io_workers=max_workers, cpu_workers=cpu_workers)
+            
+            def fetch(symbol):
+                return self.price_crawler.get_historical_data(symbol), None
+            
+            for symbol, _, result in executor.run(self.watchlist, fetch, analyze_technical,
+                                                  params=self.technical_analyzer.params):
+                results.append(self._summarize(symbol, result))
+        else:
+            results = self._scan_threaded(max_workers)
+        
+        if results:
+            df = pd.DataFrame(results)
+            df = df.sort_values('signal_score', ascending=False)
+            return df
+        
+        return pd.DataFrame()
+    
+    def _scan_threaded(self, max_workers):
+        """Scan bang ThreadPoolExecutor (moi luong vua tai gia vua phan tich)"""
         results = []
         
         with ThreadPoolExecutor(max_workers=max_workers) as executor:
@@ -69,16 +109,53 @@ class TechnicalScanner:
                 if result:
                     results.append(result)
         
-        if results:
-            df = pd.DataFrame(results)
-            df = df.sort_values('signal_score', ascending=False)
-            return df
+        return results
+    
+    def get_snapshot(self, refresh=False, max_workers=5, mode='thread'):
+        """
+        Ket qua scan_all da ghi nho; chi scan lai khi du lieu thay doi
+        
+        Snapshot het han khi watchlist, ngay hien tai hoac file cache gia
+        cua cac ma trong watchlist (so file, mtime moi nhat) thay doi.
+        
+        Args:
+            refresh: True = bat buoc scan lai
+            max_workers, mode: Truyen cho scan_all khi can scan
+        """
+        if refresh or self._snapshot is None or self._data_fingerprint() != self._snapshot_key:
+            self._snapshot = self.scan_all(max_workers=max_workers, mode=mode)
+            self.snapshot_time = datetime.now()
+            # Lay dau van tay sau khi scan vi scan co the ghi them file cache
+            self._snapshot_key = self._data_fingerprint()
+        
+        return self._snapshot
+    
+    def invalidate(self):
+        """Bo snapshot, lan truy van sau se scan lai"""
+        self._snapshot = None
+        self._snapshot_key = None
+        self.snapshot_time = None
+    
+    def _data_fingerprint(self):
+        """(watchlist, ngay, so file cache, mtime moi nhat) cua du lieu gia"""
+        symbols = set(self.watchlist)
+        count = 0
+        latest = 0.0
         
-        return pd.DataFrame()
+        try:
+            with os.scandir(self.price_crawler.cache_dir) as entries:
+                for entry in entries:
+                    if entry.name.split('_', 1)[0] in symbols and entry.name.endswith('.parquet'):
+                        count += 1
+                        latest = max(latest, entry.stat().st_mtime)
+        except FileNotFoundError:
+            pass
+        
+        return tuple(self.watchlist), datetime.now().date(), count, latest
     
     def find_buy_signals(self):
         """Tim cac ma co tin hieu mua"""
-        df = self.scan_all()
+        df = self.get_snapshot()
         
         if df.empty:
             return pd.DataFrame()
@@ -90,7 +167,7 @@ class TechnicalScanner:
     
     def find_oversold(self, rsi_threshold=30):
         """Tim cac ma oversold (RSI thap)"""
-        df = self.scan_all()
+        df = self.get_snapshot()
         
         if df.empty:
             return pd.DataFrame()
@@ -100,7 +177,7 @@ class TechnicalScanner:
     
     def find_overbought(self, rsi_threshold=70):
         """Tim cac ma overbought (RSI cao)"""
-        df = self.scan_all()
+        df = self.get_snapshot()
         
         if df.empty:
             return pd.DataFrame()
@@ -110,41 +187,30 @@ class TechnicalScanner:
     
     def find_near_support(self, threshold=0.02):
         """Tim cac ma gan vung ho tro"""
-        df = self.scan_all()
+        df = self.get_snapshot()
         
         if df.empty:
             return pd.DataFrame()
         
-        near_support = []
+        support = pd.to_numeric(df['support'], errors='coerce')
+        close = pd.to_numeric(df['close'], errors='coerce')
         
-        for _, row in df.iterrows():
-            if row['support'] and row['close']:
-                distance = abs(row['close'] - row['support']) / row['close']
-                if distance < threshold:
-                    near_support.append(row)
+        distance = (close - support).abs() / close
+        mask = support.fillna(0).ne(0) & close.fillna(0).ne(0) & (distance < threshold)
         
-        if near_support:
-            return pd.DataFrame(near_support)
-        
-        return pd.DataFrame()
+        return df[mask]
     
     def find_breakout(self):
         """Tim cac ma breakout khoi resistance"""
-        df = self.scan_all()
+        df = self.get_snapshot()
         
         if df.empty:
             return pd.DataFrame()
         
-        breakouts = []
+        resistance = pd.to_numeric(df['resistance'], errors='coerce')
+        mask = resistance.fillna(0).ne(0) & (df['close'] > resistance)
         
-        for _, row in df.iterrows():
-            if row['resistance'] and row['close'] > row['resistance']:
-                breakouts.append(row)
-        
-        if breakouts:
-            return pd.DataFrame(breakouts)
-        
-        return pd.DataFrame()
+        return df[mask]
 
 
 # Example usage
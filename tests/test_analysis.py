@@ -13,6 +13,9 @@ sys.path.append(str(Path(__file__).parent.parent))
 
 from src.analysis.technical import TechnicalAnalyzer
 from src.analysis.fundamental import FundamentalAnalyzer
+from src.analysis.sector_ranks import SectorRanker
+from src.analysis.param_sweep import ParameterSweep, _SharedSeries, signal_scores
+from src.analysis.valuation import StockValuation
 from src.portfolio.risk_metrics import RiskMetrics
 
 
@@ -108,6 +111,71 @@ class TestFundamentalAnalyzer(unittest.TestCase):
         
         self.assertIsInstance(result['meets_criteria'], bool)
     
+    def test_score_universe_matches_score_stock(self):
+        """Chấm điểm vector hóa phải khớp tuyệt đối với score_stock"""
+        rng = np.random.default_rng(0)
+        candidates = [None, np.nan, 0, 0.5, 1, 1.5, 2, 2.5, 3, 4, 5, 8, 10, 15, 20, 25, 30, -2]
+        fields = ['roe', 'pe', 'pb', 'debt_to_equity', 'roa', 'net_margin', 'current_ratio']
+        
+        ratios_list = [self.test_ratios]
+        for i in range(500):
+            ratios = {'symbol': f'S{i}'}
+            for field in fields:
+                if rng.random() < 0.1:
+                    continue  # thiếu key
+                ratios[field] = (candidates[rng.integers(len(candidates))]
+                                 if rng.random() < 0.7 else float(rng.uniform(-5, 40)))
+            ratios_list.append(ratios)
+        
+        universe = self.analyzer.score_universe(
+            self.analyzer.ratios_frame(ratios_list), with_reasons=True
+        )
+        
+        for ratios in ratios_list:
+            expected = self.analyzer.score_stock(ratios)
+            row = universe.loc[ratios['symbol']]
+            
+            self.assertEqual(row['score'], expected['score'])
+            self.assertEqual(row['max_score'], expected['max_score'])
+            self.assertEqual(row['percentage'], expected['percentage'])
+            self.assertEqual(row['rating'], expected['rating'])
+            self.assertEqual(row['reasons'], expected['reasons'])
+    
+    def test_nan_ratios_are_missing(self):
+        """NaN bị coi như thiếu dữ liệu ở cả đường vô hướng và vector hóa"""
+        ratios = {'symbol': 'NAN', 'roe': 18, 'pe': np.nan, 'pb': 1.2, 'debt_to_equity': np.nan,
+                  'roa': np.nan, 'net_margin': 12, 'current_ratio': 2}
+        expected = self.analyzer.score_stock(ratios)
+        row = self.analyzer.score_universe(self.analyzer.ratios_frame([ratios])).loc['NAN']
+        
+        self.assertEqual(expected['score'], 27)
+        self.assertEqual(row['score'], expected['score'])
+        self.assertFalse(any('nan' in reason for reason in expected['reasons']))
+        self.assertEqual(self.analyzer.check_criteria(ratios)['failed'], [])
+    
+    def test_check_universe_matches_check_criteria(self):
+        """Kiểm tra tiêu chí vector hóa khớp với check_criteria"""
+        rng = np.random.default_rng(1)
+        candidates = [None, np.nan, 0, 0.5, 1, 1.5, 5, 10, 15, 20, 25, -3]
+        
+        ratios_list = [self.test_ratios]
+        for i in range(300):
+            ratios = {'symbol': f'S{i}'}
+            for field in ['roe', 'pe', 'debt_to_equity']:
+                if rng.random() < 0.8:
+                    ratios[field] = candidates[rng.integers(len(candidates))]
+            ratios_list.append(ratios)
+        
+        universe = self.analyzer.check_universe(self.analyzer.ratios_frame(ratios_list))
+        
+        for ratios in ratios_list:
+            expected = self.analyzer.check_criteria(ratios)
+            row = universe.loc[ratios['symbol']]
+            
+            self.assertEqual(row['meets_criteria'], expected['meets_criteria'])
+            self.assertEqual(row['passed_count'], len(expected['passed']))
+            self.assertEqual(row['failed_count'], len(expected['failed']))
+    
     def test_analyze_stock(self):
         """Test phân tích tổng hợp"""
         result = self.analyzer.analyze_stock(self.test_ratios)
@@ -120,6 +188,150 @@ class TestFundamentalAnalyzer(unittest.TestCase):
         self.assertIn('action', result['recommendation'])
 
 
+class TestSectorRanker(unittest.TestCase):
+    """Test xếp hạng phân vị theo ngành"""
+    
+    def test_compute_ranks_within_sector(self):
+        table = pd.DataFrame({
+            'industry': ['Bank'] * 5 + ['Retail'] * 5 + ['Tiny'],
+            'roe': [22, 18, 15, 12, 9, 14, 10, 8, 6, 3, 30],
+            'pe': [8, 9, 10, 12, 15, 12, 20, -5, 30, 45, 10],
+        }, index=['B1', 'B2', 'B3', 'B4', 'B5', 'R1', 'R2', 'R3', 'R4', 'R5', 'T1'])
+        
+        ranker = SectorRanker(min_sector_size=5)
+        ranks = ranker.compute(table, save=False)
+        
+        # ROE cao nhất ngành = 100, P/E thấp nhất ngành = 100
+        self.assertEqual(ranks.loc['B1', 'roe_pct'], 100)
+        self.assertEqual(ranks.loc['R1', 'roe_pct'], 100)
+        self.assertEqual(ranks.loc['B1', 'pe_pct'], 100)
+        
+        # P/E âm không được xếp hạng
+        self.assertTrue(np.isnan(ranks.loc['R3', 'pe_pct']))
+        
+        # Ngành quá nhỏ xếp hạng trên toàn thị trường
+        self.assertEqual(ranks.loc['T1', 'roe_pct'], 100)
+        self.assertAlmostEqual(ranks.loc['T1', 'pe_pct'], 75)
+        self.assertEqual(ranker.get('B1')['industry'], 'Bank')
+
+
+class TestStockValuation(unittest.TestCase):
+    """Test định giá"""
+    
+    def setUp(self):
+        self.valuator = StockValuation()
+    
+    def test_dcf_grid_matches_dcf_valuation(self):
+        """Lưới DCF khớp với dcf_valuation từng điểm"""
+        cash_flows = {'AAA': [1000, 1100, 1210], 'BBB': [500, 600, 700, 800, 900]}
+        rates = [0.08, 0.10, 0.12]
+        growth = [0.02, 0.03]
+        
+        grid = self.valuator.dcf_grid(cash_flows, rates, growth)
+        self.assertEqual(len(grid), 2 * 3 * 2)
+        
+        for (symbol, rate, g), row in grid.iterrows():
+            expected = self.valuator.dcf_valuation(cash_flows[symbol], rate, g)
+            self.assertAlmostEqual(row['enterprise_value'], expected['enterprise_value'], places=6)
+            self.assertAlmostEqual(row['pv_terminal'], expected['pv_terminal'], places=6)
+    
+    def test_dcf_grid_dataframe_skips_missing_years(self):
+        """Đầu vào DataFrame: NaN (kể cả ở giữa) bị bỏ như dropna()"""
+        frame = pd.DataFrame([[1000, np.nan, 1210, np.nan], [500, 600, 700, 800]],
+                             index=['AAA', 'BBB'])
+        grid = self.valuator.dcf_grid(frame, [0.10], [0.03])
+        
+        for (symbol, rate, g), row in grid.iterrows():
+            expected = self.valuator.dcf_valuation(frame.loc[symbol].dropna().tolist(), rate, g)
+            self.assertAlmostEqual(row['enterprise_value'], expected['enterprise_value'], places=6)
+    
+    def test_dcf_grid_masks_invalid_spread(self):
+        """WACC <= g không có terminal value"""
+        grid = self.valuator.dcf_grid({'AAA': [100, 110]}, [0.03], [0.03, 0.05])
+        self.assertTrue(grid['enterprise_value'].isna().all())
+    
+    def test_batch_valuation_matches_scalar_methods(self):
+        """Định giá hàng loạt khớp với từng phương pháp đơn lẻ và loại đầu vào không hợp lệ"""
+        universe = pd.DataFrame({
+            'eps': [5000, -200, 0],
+            'bvps': [20000, 8000, np.nan],
+            'roe': [25, -3, 10],
+            'dps': [2000, np.nan, np.nan],
+            'current_price': [60000, 7000, 9000]
+        }, index=pd.Index(['AAA', 'BBB', 'CCC'], name='symbol'))
+        
+        table = self.valuator.batch_valuation(universe, growth_rate=0.10, terminal_growth=0.03)
+        aaa = table.loc['AAA']
+        point = self.valuator.comprehensive_valuation(universe.loc['AAA'].to_dict())
+        
+        self.assertAlmostEqual(aaa['pe_value'], point['methods']['pe_method']['fair_value'])
+        self.assertAlmostEqual(aaa['pb_value'], point['methods']['pb_method']['fair_value'])
+        self.assertAlmostEqual(aaa['ddm_value'],
+                               self.valuator.ddm_valuation(2000, 0.03, self.valuator.market_return))
+        
+        fcf = [5000 * 1.1 ** t for t in range(1, 6)]
+        dcf = self.valuator.dcf_valuation(fcf, self.valuator.market_return, 0.03)
+        self.assertAlmostEqual(aaa['dcf_value'], dcf['enterprise_value'], places=6)
+        self.assertEqual(aaa['n_methods'], 4)
+        
+        # P/E, P/B cùng điều kiện với định giá điểm (eligible_methods): EPS/ROE âm vẫn được tính
+        bbb = table.loc['BBB']
+        point = self.valuator.comprehensive_valuation(universe.loc['BBB'].to_dict())
+        self.assertAlmostEqual(bbb['pe_value'], point['methods']['pe_method']['fair_value'])
+        self.assertAlmostEqual(bbb['pb_value'], point['methods']['pb_method']['fair_value'])
+        self.assertTrue(bbb[['ddm_value', 'dcf_value']].isna().all())
+        self.assertEqual(bbb['n_methods'], 2)
+        
+        self.assertIsNone(self.valuator.comprehensive_valuation(universe.loc['CCC'].to_dict()))
+        self.assertTrue(np.isnan(table.loc['CCC', 'average_fair_value']))
+        self.assertEqual(table.loc['CCC', 'n_methods'], 0)
+    
+    def test_monte_carlo_reproducible_across_batches(self):
+        """Cùng seed cho cùng kết quả, không phụ thuộc kích thước batch"""
+        universe = pd.DataFrame({
+            'eps': [5000, 3000, 0],
+            'bvps': [20000, 25000, 10000],
+            'roe': [25, 12, 0],
+            'current_price': [60000, 30000, 5000]
+        }, index=pd.Index(['AAA', 'BBB', 'CCC'], name='symbol'))
+        
+        whole = self.valuator.monte_carlo_valuation(universe, n_draws=2000, seed=7)
+        batched = self.valuator.monte_carlo_valuation(universe, n_draws=2000, seed=7,
+                                                      max_cells=2000)
+        pd.testing.assert_frame_equal(whole, batched)
+        
+        self.assertTrue(whole.loc['CCC', ['mean', 'prob_upside']].isna().all())
+        self.assertTrue((whole.loc[['AAA', 'BBB'], 'p5'] < whole.loc[['AAA', 'BBB'], 'p95']).all())
+        self.assertTrue(whole['prob_upside'].dropna().between(0, 1).all())
+    
+    def test_monte_carlo_fixed_matches_point_estimate(self):
+        """Phân phối cố định cho lại đúng giá trị của comprehensive_valuation"""
+        ratios = {'symbol': 'AAA', 'eps': 5000, 'bvps': 20000, 'roe': 25, 'pe': 12}
+        fixed = {
+            'growth': {'dist': 'fixed', 'value': 0.10},
+            'required_return': {'dist': 'fixed', 'value': self.valuator.market_return},
+            'peg': {'dist': 'fixed', 'value': 1.0},
+            'pb_multiple': {'dist': 'fixed', 'value': 1.0}
+        }
+        point = self.valuator.comprehensive_valuation(ratios, growth_rate=0.10)
+        mc = self.valuator.monte_carlo_valuation(pd.DataFrame([ratios]).set_index('symbol'),
+                                                 n_draws=10, distributions=fixed)
+        
+        self.assertAlmostEqual(mc.loc['AAA', 'p50'], point['average_fair_value'], places=6)
+        self.assertEqual(mc.loc['AAA', 'current_price'], 60000)
+        
+        # Cùng điều kiện áp dụng phương pháp như định giá điểm (roe = 0 / thiếu -> bỏ P/B)
+        cases = [{'symbol': 'NOPB', 'eps': 5000, 'bvps': 20000, 'roe': 0, 'pe': 12},
+                 {'symbol': 'NAN', 'eps': 5000, 'bvps': 20000, 'roe': np.nan, 'pe': 12},
+                 {'symbol': 'LOSS', 'eps': -500, 'bvps': 20000, 'roe': 8, 'pe': 12}]
+        mc = self.valuator.monte_carlo_valuation(pd.DataFrame(cases).set_index('symbol'),
+                                                 n_draws=10, distributions=fixed)
+        for ratios in cases:
+            point = self.valuator.comprehensive_valuation(ratios, growth_rate=0.10)
+            self.assertEqual(mc.loc[ratios['symbol'], 'n_methods'], len(point['methods']))
+            self.assertAlmostEqual(mc.loc[ratios['symbol'], 'p50'], point['average_fair_value'], places=6)
+
+
 class TestRiskMetrics(unittest.TestCase):
     """Test risk metrics"""
     
@@ -173,6 +385,58 @@ class TestRiskMetrics(unittest.TestCase):
             self.assertIn(key, metrics)
 
 
+class TestParameterSweep(unittest.TestCase):
+    """Test parameter sweep"""
+    
+    def setUp(self):
+        """Tạo dữ liệu test"""
+        dates = pd.date_range(start='2023-01-01', periods=400, freq='D')
+        np.random.seed(7)
+        close = 75000 * np.cumprod(1 + np.random.normal(0, 0.015, len(dates)))
+        
+        self.df = pd.DataFrame({
+            'open': close,
+            'high': close * 1.01,
+            'low': close * 0.99,
+            'close': close,
+            'volume': np.random.uniform(1000000, 5000000, len(dates))
+        }, index=dates)
+    
+    def test_scores_match_generate_signals(self):
+        """Điểm vector hóa khớp với generate_signals ở phiên cuối"""
+        analyzer = TechnicalAnalyzer()
+        
+        for end in [250, 320, 400]:
+            sub = self.df.iloc[:end]
+            expected = analyzer.generate_signals(analyzer.add_all_indicators(sub))['score']
+            shared = _SharedSeries(sub['close'], sub['high'], sub['low'], horizon=20)
+            score, valid = signal_scores(shared, analyzer.params)
+            
+            self.assertTrue(valid[-1])
+            self.assertEqual(score[-1], expected)
+    
+    def test_run_grid(self):
+        """Test bảng kết quả theo tổ hợp tham số"""
+        sweep = ParameterSweep(max_workers=1)
+        results = sweep.run(
+            {'AAA': self.df, 'BBB': self.df * 1.1},
+            grid={'rsi_period': [9, 14], 'macd_fast': [12, 30]}
+        )
+        
+        # macd_fast=30 >= macd_slow=26 bị loại
+        self.assertEqual(len(results), 2)
+        self.assertIn('buy_fwd_return', results.columns)
+        self.assertTrue((results['n_symbols'] == 2).all())
+    
+    def test_run_without_prices(self):
+        """Mọi khung giá rỗng -> bảng rỗng thay vì lỗi"""
+        sweep = ParameterSweep(max_workers=1)
+        for by_symbol in [False, True]:
+            results = sweep.run({'AAA': self.df.iloc[:0], 'BBB': None}, grid={'rsi_period': [9, 14]},
+                                by_symbol=by_symbol)
+            self.assertTrue(results.empty)
+
+
 class TestDataIntegration(unittest.TestCase):
     """Test integration giữa các modules"""
     
@@ -221,7 +485,10 @@ def run_tests():
     # Thêm tests
     suite.addTests(unittest.TestLoader().loadTestsFromTestCase(TestTechnicalAnalyzer))
     suite.addTests(unittest.TestLoader().loadTestsFromTestCase(TestFundamentalAnalyzer))
+    suite.addTests(unittest.TestLoader().loadTestsFromTestCase(TestSectorRanker))
+    suite.addTests(unittest.TestLoader().loadTestsFromTestCase(TestStockValuation))
     suite.addTests(unittest.TestLoader().loadTestsFromTestCase(TestRiskMetrics))
+    suite.addTests(unittest.TestLoader().loadTestsFromTestCase(TestParameterSweep))
     suite.addTests(unittest.TestLoader().loadTestsFromTestCase(TestDataIntegration))
     
     # Chạy tests
@@ -0,0 +1,87 @@
+"""
+Unit tests cho data pipeline
+"""
+import tempfile
+import unittest
+import pandas as pd
+import sys
+from pathlib import Path
+
+# Add parent directory to path
+sys.path.append(str(Path(__file__).parent.parent))
+
+from src.data_pipeline.universe import UniverseRegistry, normalize_universe
+from config.settings import WATCHLIST
+
+
+class FakeIndustryCrawler:
+    """Thay FundamentalDataCrawler: bảng ngành như get_industry_map"""
+
+    def get_industry_map(self, refresh=False):
+        return pd.DataFrame({
+            'company_name': ['Vinamilk', 'Vietcombank', 'Hòa Phát', 'Vinamilk (trùng)', 'ABC'],
+            'industry': ['Thực phẩm', 'Ngân hàng', None, 'Thực phẩm', 'Khác'],
+            'exchange': ['HSX', 'HOSE', 'HOSE', 'HSX', 'OTC']
+        }, index=pd.Index(['VNM', 'VCB', 'hpg ', 'VNM', 'ABC'], name='symbol'))
+
+
+class TestUniverseRegistry(unittest.TestCase):
+    """Test danh mục mã toàn thị trường"""
+
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.registry = UniverseRegistry(Path(self.tmp.name) / 'universe.parquet')
+
+    def tearDown(self):
+        self.tmp.cleanup()
+
+    def test_watchlist_has_no_duplicates(self):
+        """WATCHLIST đã loại mã trùng"""
+        self.assertEqual(len(WATCHLIST), len(set(WATCHLIST)))
+
+    def test_missing_file_falls_back_to_watchlist(self):
+        """Chưa có file -> danh mục là WATCHLIST"""
+        self.assertEqual(self.registry.symbols(), WATCHLIST)
+        
+        # Lọc theo sàn/ngành cần danh mục thật, không lùi về WATCHLIST (không có sàn)
+        with self.assertRaises(FileNotFoundError):
+            self.registry.symbols(exchanges=['HOSE'])
+        with self.assertRaises(FileNotFoundError):
+            self.registry.symbols(industries=['Ngân hàng'])
+
+    def test_refresh_normalizes_and_persists(self):
+        """Chuẩn hóa mã/sàn, loại trùng và sàn lạ, đọc lại từ file"""
+        universe = self.registry.refresh(FakeIndustryCrawler())
+
+        self.assertEqual(list(universe.index), ['VNM', 'VCB', 'HPG'])
+        self.assertEqual(set(universe['exchange']), {'HOSE'})
+        self.assertEqual(universe.loc['HPG', 'industry'], 'Unknown')
+
+        reloaded = UniverseRegistry(self.registry.universe_file)
+        self.assertEqual(reloaded.symbols(exchanges=['hsx']), ['VNM', 'VCB', 'HPG'])
+        self.assertEqual(reloaded.symbols(industries=['Ngân hàng']), ['VCB'])
+        self.assertEqual(reloaded.symbols(exchanges=['HNX']), [])
+
+    def test_import_csv(self):
+        """Nhập danh mục từ file CSV cục bộ"""
+        path = Path(self.tmp.name) / 'listing.csv'
+        pd.DataFrame({
+            'symbol': ['SHS', 'BSR', 'FPT', 'SHS'],
+            'exchange': ['HNX', 'UPCoM', 'HOSE', 'HNX'],
+            'industry': ['Chứng khoán', 'Dầu khí', 'Phần mềm', 'Chứng khoán']
+        }).to_csv(path, index=False)
+
+        self.registry.import_file(path)
+        self.assertEqual(self.registry.summary().to_dict(), {'HNX': 1, 'UPCOM': 1, 'HOSE': 1})
+        self.assertEqual(self.registry.symbols(exchanges=['HNX', 'UPCOM']), ['SHS', 'BSR'])
+        self.assertEqual(self.registry.symbols(limit=2), ['SHS', 'BSR'])
+
+    def test_normalize_keeps_unknown_exchange(self):
+        """Thiếu sàn vẫn giữ mã (không phải sàn lạ)"""
+        universe = normalize_universe(pd.DataFrame({'symbol': ['VNM'], 'exchange': [None]}))
+        self.assertEqual(list(universe.index), ['VNM'])
+        self.assertTrue(pd.isna(universe.loc['VNM', 'exchange']))
+
+
+if __name__ == '__main__':
+    unittest.main()
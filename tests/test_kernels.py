@@ -0,0 +1,159 @@
+"""
+Unit tests cho kernel chỉ báo kỹ thuật (so khớp với thư viện ta)
+"""
+import unittest
+from unittest.mock import patch
+import pandas as pd
+import numpy as np
+import sys
+from pathlib import Path
+
+from ta.trend import MACD, SMAIndicator, EMAIndicator
+from ta.momentum import RSIIndicator, StochasticOscillator
+from ta.volatility import BollingerBands, AverageTrueRange
+from ta.volume import OnBalanceVolumeIndicator
+
+# Add parent directory to path
+sys.path.append(str(Path(__file__).parent.parent))
+
+from src.analysis import kernels
+from src.analysis.technical import TechnicalAnalyzer
+
+
+def make_prices(n=600, seed=42):
+    """Tạo chuỗi giá OHLCV giả lập"""
+    rng = np.random.default_rng(seed)
+    close = 50000 * np.cumprod(1 + rng.normal(0, 0.02, n))
+    spread = np.abs(rng.normal(0, 0.01, n)) * close
+    dates = pd.date_range(start='2020-01-01', periods=n, freq='D')
+    return pd.DataFrame({
+        'open': close,
+        'high': close + spread,
+        'low': close - spread,
+        'close': close,
+        'volume': rng.uniform(1e5, 5e6, n).round()
+    }, index=dates)
+
+
+class TestKernelParity(unittest.TestCase):
+    """Kernel phải khớp với ta cho cả backend numba và numpy"""
+
+    def setUp(self):
+        self.df = make_prices()
+        self.close = self.df['close']
+        self.high = self.df['high']
+        self.low = self.df['low']
+
+    def assertSeriesClose(self, actual, expected):
+        np.testing.assert_allclose(actual, np.asarray(expected, dtype=float),
+                                   rtol=1e-9, atol=1e-9, equal_nan=True)
+
+    def test_ema_sma(self):
+        for window in [5, 20, 50, 200]:
+            self.assertSeriesClose(kernels.ema(self.close, window),
+                                   EMAIndicator(self.close, window).ema_indicator())
+            self.assertSeriesClose(kernels.sma(self.close, window),
+                                   SMAIndicator(self.close, window).sma_indicator())
+
+    def test_rsi(self):
+        for window in [6, 14, 21]:
+            self.assertSeriesClose(kernels.rsi(self.close, window),
+                                   RSIIndicator(self.close, window).rsi())
+
+    def test_macd(self):
+        expected = MACD(self.close, window_fast=12, window_slow=26, window_sign=9)
+        line, signal, diff = kernels.macd(self.close, 12, 26, 9)
+
+        self.assertSeriesClose(line, expected.macd())
+        self.assertSeriesClose(signal, expected.macd_signal())
+        self.assertSeriesClose(diff, expected.macd_diff())
+
+    def test_atr(self):
+        expected = AverageTrueRange(self.high, self.low, self.close, window=14)
+        self.assertSeriesClose(kernels.atr(self.high, self.low, self.close, 14),
+                               expected.average_true_range())
+
+    def test_stochastic(self):
+        expected = StochasticOscillator(self.high, self.low, self.close, window=14, smooth_window=3)
+        k, d = kernels.stochastic(self.high, self.low, self.close, 14, 3)
+
+        self.assertSeriesClose(k, expected.stoch())
+        self.assertSeriesClose(d, expected.stoch_signal())
+
+    def test_bollinger_obv(self):
+        bb = BollingerBands(self.close, window=20, window_dev=2)
+        self.assertSeriesClose(kernels.rolling_std(self.close, 20) * 2 + kernels.sma(self.close, 20),
+                               bb.bollinger_hband())
+        self.assertSeriesClose(kernels.obv(self.close, self.df['volume']),
+                               OnBalanceVolumeIndicator(self.close, self.df['volume']).on_balance_volume())
+
+    def test_add_all_indicators(self):
+        """add_all_indicators vẫn cho kết quả như bản dùng ta"""
+        result = TechnicalAnalyzer().add_all_indicators(self.df)
+
+        self.assertSeriesClose(result['RSI'], RSIIndicator(self.close, 14).rsi())
+        self.assertSeriesClose(result['BB_width'],
+                               BollingerBands(self.close, 20, 2).bollinger_wband())
+        self.assertSeriesClose(result['EMA_200'], EMAIndicator(self.close, 200).ema_indicator())
+
+
+class TestKernelParityNumpy(TestKernelParity):
+    """Chạy lại toàn bộ so khớp với backend NumPy (HAS_NUMBA=False) kể cả khi có numba"""
+
+    def setUp(self):
+        super().setUp()
+        patcher = patch.object(kernels, 'HAS_NUMBA', False)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    @unittest.skipUnless(kernels.HAS_NUMBA, "numba không được cài")
+    def test_backends_agree(self):
+        """Backend NumPy khớp với backend numba, kể cả khi high/low có NaN"""
+        high, low = self.high.copy(), self.low.copy()
+        high.iloc[[3, 40, 41]] = np.nan
+        low.iloc[100] = np.nan
+
+        def run():
+            return (kernels.atr(self.high, self.low, self.close, 14), kernels.rsi(self.close, 14),
+                    kernels.rolling_max(high, 14), kernels.rolling_min(low, 14),
+                    *kernels.stochastic(high, low, self.close, 14, 3))
+
+        fallback = run()
+        with patch.object(kernels, 'HAS_NUMBA', True):
+            jit = run()
+
+        for actual, expected in zip(fallback, jit):
+            self.assertSeriesClose(actual, expected)
+
+
+class TestKernelLoops(unittest.TestCase):
+    """Vòng lặp JIT chạy được cả khi không có numba (Python thuần)"""
+
+    def test_ewm_loop_with_nan(self):
+        x = make_prices(200)['close'].to_numpy().copy()
+        x[:7] = np.nan
+        x[50] = np.nan
+        expected = pd.Series(x).ewm(alpha=0.1, min_periods=10, adjust=False).mean()
+
+        np.testing.assert_allclose(kernels._ewm_mean_loop(x, 0.1, 10), expected,
+                                   rtol=1e-12, equal_nan=True)
+
+    def test_atr_loop(self):
+        df = make_prices(200)
+        tr = kernels.true_range(df['high'], df['low'], df['close'])
+        expected = AverageTrueRange(df['high'], df['low'], df['close'], window=14).average_true_range()
+
+        np.testing.assert_allclose(kernels._wilder_atr_loop(tr, 14), expected, rtol=1e-12)
+
+    def test_rolling_extreme_loop(self):
+        x = make_prices(300)['low'].to_numpy().copy()
+        x[[5, 60, 61, 200]] = np.nan
+
+        np.testing.assert_allclose(kernels._rolling_extreme_loop(x, 14, False),
+                                   pd.Series(x).rolling(14).min(), equal_nan=True)
+        np.testing.assert_allclose(kernels._rolling_extreme_loop(x, 14, True),
+                                   pd.Series(x).rolling(14).max(), equal_nan=True)
+
+
+if __name__ == '__main__':
+    unittest.main()
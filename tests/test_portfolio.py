@@ -0,0 +1,814 @@
+"""
+Unit tests cho portfolio
+"""
+import io
+import json
+import shutil
+import tempfile
+import time
+import unittest
+from contextlib import redirect_stdout
+import numpy as np
+import pandas as pd
+import sys
+from pathlib import Path
+
+# Add parent directory to path
+sys.path.append(str(Path(__file__).parent.parent))
+
+from src.portfolio.ledger import PortfolioLedger
+from src.portfolio.position_book import PositionBook
+from src.portfolio.portfolio_manager import PortfolioManager
+from src.data_pipeline.price_data import PriceDataCrawler
+from src.data_pipeline.close_panel import ClosePanel
+from src.portfolio.returns import ReturnsEngine
+from src.portfolio.risk_metrics import RiskMetrics
+from src.portfolio.nav import NavEngine
+from src.portfolio.lots import FeeModel, LotLedger
+from src.portfolio.optimizer import PortfolioOptimizer, METHODS
+from src.portfolio.covariance import CovarianceService, ledoit_wolf, sample_covariance
+from src.portfolio.rebalance import RebalanceEngine
+
+
+class TestPortfolioLedger(unittest.TestCase):
+    """Test sổ cái nhật ký giao dịch"""
+
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.dir = Path(self.tmp.name)
+        self.journal = self.dir / 'portfolio_journal.jsonl'
+
+    def tearDown(self):
+        self.tmp.cleanup()
+
+    def open_ledger(self, **kwargs):
+        ledger = PortfolioLedger(self.journal, **kwargs)
+        self.addCleanup(ledger.close)
+        return ledger
+
+    def trade(self, ledger):
+        ledger.record({'type': 'deposit', 'date': '2024-01-02', 'amount': 100_000_000})
+        ledger.record({'type': 'buy', 'date': '2024-01-03', 'symbol': 'VNM',
+                       'shares': 1000, 'price': 70000, 'total': 70_105_000})
+        ledger.record({'type': 'buy', 'date': '2024-01-04', 'symbol': 'VNM',
+                       'shares': 200, 'price': 76000, 'total': 15_222_800})
+        ledger.record({'type': 'sell', 'date': '2024-02-01', 'symbol': 'VNM',
+                       'shares': 600, 'price': 80000, 'total': 47_952_000, 'pnl': 5_352_000})
+
+    def test_replay_matches_live_state(self):
+        """Mở lại từ nhật ký (có và không có snapshot) ra cùng trạng thái"""
+        ledger = self.open_ledger(snapshot_every=3)
+        self.trade(ledger)
+        ledger.close()
+
+        position = ledger.state['positions'].get('VNM')
+        self.assertEqual(position['shares'], 600)
+        self.assertAlmostEqual(position['avg_price'], (70_105_000 + 15_222_800) / 1200)  # gồm phí mua
+        self.assertAlmostEqual(ledger.state['realized_pnl'], 5_352_000)
+        self.assertTrue(ledger.snapshot_file.exists())
+
+        reopened = self.open_ledger()
+        self.assertEqual(reopened.state, ledger.state)
+
+        ledger.snapshot_file.unlink()
+        self.assertEqual(self.open_ledger().state, ledger.state)
+        self.assertEqual([e['type'] for e in reopened.history()], ['deposit', 'buy', 'buy', 'sell'])
+
+    def test_torn_tail_is_truncated(self):
+        """Crash giữa lúc ghi: dòng cuối dở dang bị bỏ, ghi tiếp bình thường"""
+        ledger = self.open_ledger()
+        self.trade(ledger)
+        ledger.close()
+        expected = dict(ledger.state)
+
+        with open(self.journal, 'a', encoding='utf-8') as f:
+            f.write('{"seq": 5, "type": "deposit", "amo')
+
+        recovered = self.open_ledger()
+        self.assertEqual(recovered.state, expected)
+
+        recovered.record({'type': 'deposit', 'date': '2024-03-01', 'amount': 1_000_000})
+        recovered.close()
+        self.assertEqual(self.open_ledger().state['seq'], 5)
+
+    def test_corrupt_middle_line_raises(self):
+        """Dòng hỏng giữa nhật ký không được bỏ qua âm thầm"""
+        self.journal.write_text('{"seq": 1, "type": "deposit", "amount": 5}\nxx\n'
+                                '{"seq": 2, "type": "deposit", "amount": 5}\n')
+        with self.assertRaises(ValueError):
+            PortfolioLedger(self.journal)
+
+    def test_migrates_legacy_json(self):
+        """portfolio.json cũ chuyển thành sự kiện 'open' + lịch sử"""
+        legacy = self.dir / 'portfolio.json'
+        legacy.write_text(json.dumps({
+            'cash': 20_000_000,
+            'positions': [{'symbol': 'FPT', 'shares': 500, 'avg_price': 120000, 'buy_date': '2024-01-05'}],
+            'history': [
+                {'date': '2024-01-02', 'type': 'deposit', 'amount': 80_000_000},
+                {'date': '2024-01-05', 'type': 'buy', 'symbol': 'FPT', 'shares': 500,
+                 'price': 120000, 'total': 60_090_000},
+            ]
+        }))
+
+        ledger = self.open_ledger(legacy_file=legacy)
+        self.assertEqual(ledger.state['cash'], 20_000_000)
+        self.assertEqual(ledger.state['total_deposits'], 80_000_000)
+        self.assertEqual(len(ledger.history()), 2)
+
+        # Lần sau đọc từ nhật ký, không chuyển lại
+        ledger.record({'type': 'deposit', 'date': '2024-02-01', 'amount': 1})
+        ledger.close()
+        reopened = self.open_ledger(legacy_file=legacy)
+        self.assertEqual(reopened.state['cash'], 20_000_001)
+        self.assertEqual(len(reopened.history()), 3)
+
+
+class TestPositionBook(unittest.TestCase):
+    """Test sổ vị thế dạng mảng"""
+
+    def setUp(self):
+        self.book = PositionBook(capacity=2)
+        self.book.add('VNM', 1000, 70000)
+        self.book.add('FPT', 500, 120000)
+        self.book.add('HPG', 2000, 25000)   # vượt capacity -> mảng tăng gấp đôi
+        self.book.add('VNM', 1000, 80000)
+
+    def test_add_and_lookup(self):
+        """Mua thêm tính giá vốn bình quân, tra cứu theo mã"""
+        self.assertEqual(self.book.symbols, ['VNM', 'FPT', 'HPG'])
+        self.assertEqual(self.book.get('VNM')['shares'], 2000)
+        self.assertAlmostEqual(self.book.get('VNM')['avg_price'], 75000)
+        self.assertIsNone(self.book.get('MWG'))
+        self.assertIn('HPG', self.book)
+
+    def test_remove_keeps_index_consistent(self):
+        """Bán hết một mã: dòng cuối dời vào chỗ trống, index vẫn đúng"""
+        self.book.reduce('VNM', 2000)
+        self.assertEqual(self.book.symbols, ['HPG', 'FPT'])
+        self.assertEqual(self.book.get('HPG')['shares'], 2000)
+        self.book.reduce('HPG', 500)
+        self.assertEqual(self.book.get('HPG')['shares'], 1500)
+        with self.assertRaises(ValueError):
+            self.book.reduce('FPT', 600)
+
+    def test_valuation_matches_loop(self):
+        """Định giá bằng dot product khớp với cộng từng vị thế, bỏ mã thiếu giá"""
+        prices = {'VNM': 78000, 'FPT': 130000}
+        expected = 2000 * 78000 + 500 * 130000
+        self.assertAlmostEqual(self.book.value(prices), expected)
+        self.assertAlmostEqual(self.book.value(np.array([78000, 130000, np.nan])), expected)
+
+        val = self.book.valuation(prices)
+        self.assertAlmostEqual(val['pnl'][0], 2000 * (78000 - 75000))
+        self.assertTrue(np.isnan(val['value'][2]))
+
+        rebuilt = PositionBook.from_records(self.book.to_records())
+        self.assertEqual(rebuilt, self.book)
+
+
+class FakePriceCrawler:
+    """Giá cố định, ghi lại mỗi lượt get_latest_prices"""
+
+    def __init__(self, prices):
+        self.prices = prices
+        self.batches = []
+
+    def get_latest_prices(self, symbols, max_workers=8):
+        self.batches.append(list(symbols))
+        return {s: {'symbol': s, 'close': self.prices[s]} for s in symbols if s in self.prices}
+
+
+class TestPriceSnapshot(unittest.TestCase):
+    """Test lấy giá theo lô cho portfolio"""
+
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.pm = PortfolioManager(Path(self.tmp.name) / 'portfolio.json')
+        self.addCleanup(self.pm.ledger.close)
+        self.pm.add_cash(1_000_000_000)
+        symbols = [f'S{i:02d}' for i in range(20)]
+        for symbol in symbols:
+            self.pm.buy_stock(symbol, 100, 10000)
+        self.crawler = FakePriceCrawler({s: 11000 for s in symbols})
+        self.pm.price_crawler = self.crawler
+
+    def tearDown(self):
+        self.tmp.cleanup()
+
+    def test_summary_fetches_prices_once(self):
+        """print_summary: một lượt lấy giá cho cả 20 vị thế"""
+        with redirect_stdout(io.StringIO()):
+            self.pm.print_summary()
+        self.assertEqual(len(self.crawler.batches), 1)
+        self.assertEqual(len(self.crawler.batches[0]), 20)
+
+        current = self.pm.get_current_value()
+        self.assertAlmostEqual(current['positions_value'], 20 * 100 * 11000)
+        self.assertEqual(len(self.crawler.batches), 1)
+
+    def test_new_position_fetches_only_missing(self):
+        """Mã mới mua được lấy bổ sung, không lấy lại cả snapshot"""
+        self.pm.get_current_value()
+        self.crawler.prices['NEW'] = 5000
+        self.pm.buy_stock('NEW', 100, 5000)
+        self.pm.get_current_value()
+        self.assertEqual(self.crawler.batches[-1], ['NEW'])
+
+        self.pm.get_current_value(refresh_prices=True)
+        self.assertEqual(len(self.crawler.batches[-1]), 21)
+
+    def test_latest_prices_run_concurrently(self):
+        """get_latest_prices gọi song song (20 mã x 50ms < 0.5s với 8 luồng)"""
+        crawler = PriceDataCrawler()
+
+        def slow_latest(symbol):
+            time.sleep(0.05)
+            return None if symbol == 'BAD' else {'symbol': symbol, 'close': 1.0}
+
+        crawler.get_latest_price = slow_latest
+        started = time.perf_counter()
+        prices = crawler.get_latest_prices([f'S{i}' for i in range(20)] + ['BAD'])
+        self.assertLess(time.perf_counter() - started, 0.5)
+        self.assertEqual(len(prices), 20)
+
+
+class FakeHistoryCrawler:
+    """get_historical_data trên chuỗi giá giả lập cố định, đếm số lần gọi"""
+
+    def __init__(self, symbols, cache_dir, days=400):
+        dates = pd.bdate_range(end=pd.Timestamp.now().normalize(), periods=days)
+        rng = np.random.default_rng(7)
+        self.closes = pd.DataFrame(
+            {s: 10000 * np.cumprod(1 + rng.normal(0.0005, 0.02, days)) for s in symbols},
+            index=dates)
+        self.cache_dir = Path(cache_dir)
+        self.calls = []
+
+    def get_historical_data(self, symbol, start_date=None, end_date=None, use_cache=True):
+        self.calls.append(symbol)
+        closes = self.closes.loc[start_date:end_date, symbol]
+        return pd.DataFrame({'close': closes})
+
+
+class TestReturnsEngine(unittest.TestCase):
+    """Test chuỗi lợi nhuận danh mục"""
+
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.dir = Path(self.tmp.name)
+        self.holdings = {'VNM': 1000, 'FPT': 300, 'HPG': 2500}
+        self.crawler = FakeHistoryCrawler(list(self.holdings), self.dir)
+
+    def tearDown(self):
+        self.tmp.cleanup()
+
+    def engine(self):
+        panel = ClosePanel(self.crawler, panel_file=self.dir / 'panel.parquet')
+        return ReturnsEngine(panel, series_file=self.dir / 'returns.parquet', lookback_days=200)
+
+    def test_series_matches_drifting_weights(self):
+        """NAV = shares @ closes; lợi nhuận = tổng w(t-1) × r(t)"""
+        engine = self.engine()
+        series = engine.portfolio_series(self.holdings)
+
+        closes = self.crawler.closes.loc[series.index, list(self.holdings)]
+        expected_nav = (closes * pd.Series(self.holdings)).sum(axis=1)
+        np.testing.assert_allclose(series['nav'], expected_nav)
+
+        weights = engine.weights(self.holdings).shift()
+        returns = engine.return_matrix(list(self.holdings))
+        weighted = (weights * returns).sum(axis=1, min_count=1).reindex(series.index)
+        np.testing.assert_allclose(series['returns'].iloc[1:], weighted.iloc[1:])
+
+        metrics = engine.metrics(series)
+        drawdown = (expected_nav / expected_nav.cummax() - 1).min() * 100
+        self.assertAlmostEqual(metrics['max_drawdown'], drawdown)
+        self.assertEqual(metrics['observations'], len(series) - 1)
+
+    def test_incremental_update(self):
+        """Mở lại: không gọi API; chuỗi cache thiếu phiên cuối được nối thêm đúng"""
+        full = self.engine().portfolio_series(self.holdings)
+        calls = len(self.crawler.calls)
+
+        again = self.engine().portfolio_series(self.holdings)
+        self.assertEqual(len(self.crawler.calls), calls)
+        pd.testing.assert_frame_equal(again, full, check_freq=False)
+
+        # Cắt 5 phiên cuối của cache -> chỉ tính lại 5 phiên đó
+        cached = pd.read_parquet(self.dir / 'returns.parquet')
+        cached.iloc[:-5].to_parquet(self.dir / 'returns.parquet')
+        extended = self.engine().portfolio_series(self.holdings)
+        np.testing.assert_allclose(extended['nav'], full['nav'])
+        np.testing.assert_allclose(extended['returns'].iloc[1:], full['returns'].iloc[1:])
+
+
+class TestNavEngine(unittest.TestCase):
+    """Test dựng NAV từ lịch sử giao dịch"""
+
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.dir = Path(self.tmp.name)
+        self.crawler = FakeHistoryCrawler(['VNM', 'FPT'], self.dir, days=120)
+        closes = self.crawler.closes
+        self.days = closes.index
+
+        def trade(seq, day, kind, symbol, shares):
+            price = closes[symbol].iloc[day]
+            total = shares * price * (1.0015 if kind == 'buy' else 0.999)
+            return {'seq': seq, 'date': self.days[day].isoformat(), 'type': kind,
+                    'symbol': symbol, 'shares': shares, 'price': price, 'total': total}
+
+        self.history = [
+            {'seq': 1, 'date': self.days[50].isoformat(), 'type': 'deposit', 'amount': 50_000_000},
+            trade(2, 52, 'buy', 'VNM', 2000),
+            trade(3, 60, 'buy', 'FPT', 1000),
+            {'seq': 4, 'date': self.days[70].isoformat(), 'type': 'deposit', 'amount': 20_000_000},
+            trade(5, 80, 'sell', 'VNM', 500),
+        ]
+
+    def tearDown(self):
+        self.tmp.cleanup()
+
+    def engine(self):
+        panel = ClosePanel(self.crawler, panel_file=self.dir / 'panel.parquet')
+        return NavEngine(panel, cache_file=self.dir / 'nav.parquet')
+
+    def expected_nav(self, history):
+        """Tính NAV từng ngày bằng vòng lặp"""
+        closes = self.crawler.closes
+        cash, shares, rows = 0.0, {'VNM': 0, 'FPT': 0}, []
+        for day in closes.index[50:]:
+            for e in history:
+                if pd.Timestamp(e['date']) == day:
+                    if e['type'] == 'deposit':
+                        cash += e['amount']
+                    elif e['type'] == 'buy':
+                        cash -= e['total']
+                        shares[e['symbol']] += e['shares']
+                    else:
+                        cash += e['total']
+                        shares[e['symbol']] -= e['shares']
+            rows.append(cash + sum(q * closes.loc[day, s] for s, q in shares.items()))
+        return pd.Series(rows, index=closes.index[50:])
+
+    def test_nav_matches_loop(self):
+        """NAV, tiền nạp không tính là lợi nhuận, đóng góp cộng lại bằng lãi giá"""
+        nav, contrib = self.engine().build(self.history)
+        expected = self.expected_nav(self.history)
+        np.testing.assert_allclose(nav['nav'], expected)
+
+        day70 = self.days[70]
+        self.assertEqual(nav.loc[day70, 'flow'], 20_000_000)
+        self.assertLess(abs(nav.loc[day70, 'returns']), 0.1)
+        self.assertTrue(((nav['exposure'] >= 0) & (nav['exposure'] <= 1)).all())
+
+        # Đóng góp = số cổ phiếu giữ phiên trước × thay đổi giá
+        self.assertEqual(list(contrib.columns), ['VNM', 'FPT'])
+        self.assertAlmostEqual(contrib.loc[self.days[53], 'VNM'],
+                               2000 * (self.crawler.closes['VNM'].iloc[53] - self.crawler.closes['VNM'].iloc[52]))
+
+    def test_incremental_extend(self):
+        """Cache thiếu phiên cuối / có giao dịch mới sau cache: nối thêm khớp với dựng lại"""
+        full, full_contrib = self.engine().build(self.history)
+
+        nav = pd.read_parquet(self.dir / 'nav.parquet')
+        contrib = pd.read_parquet(self.dir / 'nav_contrib.parquet')
+        nav.iloc[:-10].to_parquet(self.dir / 'nav.parquet')
+        contrib.iloc[:-10].to_parquet(self.dir / 'nav_contrib.parquet')
+
+        extended, extended_contrib = self.engine().build(self.history)
+        np.testing.assert_allclose(extended['nav'], full['nav'])
+        np.testing.assert_allclose(extended['returns'].iloc[1:], full['returns'].iloc[1:])
+        np.testing.assert_allclose(extended_contrib, full_contrib)
+
+        # Giao dịch mới sau phiên cuối đã cache
+        history = self.history + [{'seq': 6, 'date': self.days[-1].isoformat(), 'type': 'deposit',
+                                   'amount': 1_000_000}]
+        nav, _ = self.engine().build(history)
+        np.testing.assert_allclose(nav['nav'], self.expected_nav(history))
+
+    def test_trade_before_panel_is_backfilled(self):
+        """Bảng giá đã có cửa sổ 365 ngày: giao dịch cũ hơn được lấy bù giá, không dùng giá tương lai"""
+        crawler = FakeHistoryCrawler(['VNM'], self.dir, days=400)
+        closes = crawler.closes['VNM']
+        panel = ClosePanel(crawler, panel_file=self.dir / 'panel.parquet')
+        self.assertGreater(panel.closes(['VNM']).index[0], closes.index[10])
+
+        day = closes.index[10]
+        history = [
+            {'seq': 1, 'date': (day - pd.Timedelta(days=30)).isoformat(), 'type': 'deposit',
+             'amount': 100_000_000},
+            {'seq': 2, 'date': (day - pd.Timedelta(days=20)).isoformat(), 'type': 'buy', 'symbol': 'VNM',
+             'shares': 1000, 'price': 10000, 'total': 10_000_000},
+        ]
+        nav, _ = NavEngine(panel, cache_file=self.dir / 'nav.parquet').build(history)
+
+        # Mọi phiên từ ngày có giá đầu tiên đều có mặt và định giá theo giá ngày đó
+        priced = nav.loc[closes.index[0]:]
+        self.assertEqual(len(priced), len(closes))
+        np.testing.assert_allclose(priced['positions_value'], 1000 * closes.to_numpy())
+        self.assertEqual(nav.loc[day, 'positions_value'], 1000 * closes.loc[day])
+
+        # Trước phiên có giá đầu tiên: chưa định giá
+        self.assertTrue((nav.loc[:closes.index[0] - pd.Timedelta(days=1), 'positions_value'] == 0).all())
+
+
+class TestFeeModel(unittest.TestCase):
+    """Test biểu phí / thuế"""
+
+    def test_default_matches_previous_multipliers(self):
+        """Mặc định: mua x1.0015, bán x0.999"""
+        fees = FeeModel()
+        self.assertAlmostEqual(fees.buy(1000, 70000)['total'], 1000 * 70000 * 1.0015)
+        self.assertAlmostEqual(fees.sell(1000, 80000)['total'], 1000 * 80000 * 0.999)
+
+    def test_tiers_and_min_fee(self):
+        fees = FeeModel({'buy_fee': [(0, 0.003), (100_000_000, 0.002)], 'min_fee': 20000})
+        self.assertAlmostEqual(fees.buy(100, 10000)['fee'], 20000)
+        self.assertAlmostEqual(fees.buy(1000, 50000)['fee'], 50_000_000 * 0.003)
+        self.assertAlmostEqual(fees.buy(3000, 50000)['fee'], 150_000_000 * 0.002)
+
+    def test_settlement_skips_weekend(self):
+        """Mua thứ 5 -> về thứ 2"""
+        self.assertEqual(FeeModel().settle_date('2024-03-07'), pd.Timestamp('2024-03-11'))
+
+
+class TestLotLedger(unittest.TestCase):
+    """Test sổ lô: FIFO / lô chỉ định, T+2, truy vấn lãi/lỗ đã chốt"""
+
+    def setUp(self):
+        self.lots = LotLedger()
+        self.seq = 0
+        self.event('deposit', '2024-03-01', amount=500_000_000)
+        self.event('buy', '2024-03-04', symbol='VNM', shares=1000, price=70000, total=70_000_000)
+        self.event('buy', '2024-03-05', symbol='VNM', shares=1000, price=80000, total=80_000_000)
+
+    def event(self, kind, date, **fields):
+        self.seq += 1
+        event = {'seq': self.seq, 'type': kind, 'date': date, **fields}
+        self.lots.apply(event)
+        return event
+
+    def test_fifo_and_specific_lot(self):
+        self.assertEqual(self.lots.match('VNM', 1500), [['2', 1000], ['3', 500]])
+        self.assertEqual(self.lots.match('VNM', 500, 'SPECIFIC', ['3']), [['3', 500]])
+
+        self.event('sell', '2024-03-11', symbol='VNM', shares=500, price=90000,
+                   total=45_000_000, lots=[['3', 500]])
+        self.assertAlmostEqual(self.lots.realized_pnl('VNM'), 5_000_000)
+        self.assertEqual(self.lots.position('VNM', '2024-03-11')['shares'], 1500)
+        self.assertAlmostEqual(self.lots.position('VNM', '2024-03-11')['unit_cost'], 220_000_000 / 3 / 1000)
+
+    def test_settlement(self):
+        """Cổ phiếu mua về sau T+2; tiền bán về sau T+2"""
+        self.assertEqual(self.lots.position('VNM', '2024-03-05')['settled'], 0)
+        self.assertEqual(self.lots.position('VNM', '2024-03-06')['settled'], 1000)
+        self.assertEqual(self.lots.position('VNM', '2024-03-06')['pending'], 1000)
+        with self.assertRaises(ValueError):
+            self.lots.match('VNM', 1500, as_of='2024-03-06')
+
+        self.event('sell', '2024-03-06', symbol='VNM', shares=1000, price=75000, total=75_000_000)
+        cash = self.lots.cash('2024-03-07')
+        self.assertAlmostEqual(cash['settled'], 350_000_000)
+        self.assertAlmostEqual(cash['pending_in'], 75_000_000)
+        self.assertAlmostEqual(self.lots.cash('2024-03-08')['settled'], 425_000_000)
+
+    def test_realized_queries_match_scan(self):
+        """Truy vấn theo khoảng ngày / mã khớp với quét toàn bộ"""
+        rng = np.random.default_rng(3)
+        days = pd.bdate_range('2024-04-01', periods=200)
+        for day in days:
+            for symbol in ('VNM', 'FPT'):
+                self.event('buy', day.isoformat(), symbol=symbol, shares=100, price=50000, total=5_000_000)
+                if day > days[3] and rng.random() < 0.6:
+                    self.event('sell', day.isoformat(), symbol=symbol, shares=100,
+                               price=float(rng.integers(40000, 60000)), total=float(rng.integers(4, 6)) * 1e6)
+
+        frame = self.lots.realized_frame()
+        for start, end, symbol in [(days[10], days[50], None), (days[0], days[-1], 'FPT'),
+                                   (days[120], days[121], 'VNM'), (None, days[30], None)]:
+            mask = frame['date'] <= end
+            if start is not None:
+                mask &= frame['date'] >= start
+            if symbol:
+                mask &= frame['symbol'] == symbol
+            self.assertAlmostEqual(self.lots.realized_pnl(symbol, start, end), frame.loc[mask, 'pnl'].sum(),
+                                   places=4)
+
+    def test_manager_blocks_unsettled_sell(self):
+        """PortfolioManager chỉ bán cổ phiếu đã về và ghi lô vào nhật ký"""
+        tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(tmp.cleanup)
+        pm = PortfolioManager(Path(tmp.name) / 'portfolio.json')
+        self.addCleanup(pm.ledger.close)
+        pm.add_cash(200_000_000)
+        pm.buy_stock('VNM', 1000, 70000, date='2024-03-04')
+        pm.buy_stock('VNM', 1000, 80000, date='2024-03-05')
+
+        self.assertFalse(pm.sell_stock('VNM', 1500, 90000, date='2024-03-06'))
+        result = pm.sell_stock('VNM', 500, 90000, date='2024-03-07', lot_method='LIFO')
+        self.assertEqual(result['lots'], [['3', 500]])
+        self.assertAlmostEqual(result['pnl'], 500 * 90000 * 0.999 - 500 * 80000 * 1.0015)
+
+        # Sổ lô dựng lại từ nhật ký khớp với sổ cập nhật trực tiếp
+        rebuilt = LotLedger.from_history(pm.ledger.history(include_open=True))
+        self.assertAlmostEqual(rebuilt.realized_pnl(), pm.get_lots().realized_pnl())
+        self.assertAlmostEqual(pm.portfolio['realized_pnl'], pm.get_lots().realized_pnl())
+
+    def test_book_cost_matches_lots(self):
+        """Giá vốn trong sổ vị thế = giá vốn các lô còn mở (gồm phí mua), kể cả sau khi bán LIFO"""
+        tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(tmp.cleanup)
+        pm = PortfolioManager(Path(tmp.name) / 'portfolio.json')
+        self.addCleanup(pm.ledger.close)
+        pm.price_crawler = FakePriceCrawler({'VNM': 90000})
+        pm.add_cash(200_000_000)
+        pm.buy_stock('VNM', 1000, 70000, date='2024-03-04')
+        pm.buy_stock('VNM', 1000, 80000, date='2024-03-05')
+
+        # Ngày có múi giờ: chưa về T+2 thì từ chối, không lỗi
+        self.assertFalse(pm.sell_stock('VNM', 1500, 90000, date='2024-03-06T10:00:00+07:00'))
+        pm.sell_stock('VNM', 500, 90000, date='2024-03-07', lot_method='LIFO')
+
+        lots = pm.get_lots().position('VNM')
+        position = pm.get_current_value()['positions'][0]
+        self.assertAlmostEqual(position['avg_price'], lots['unit_cost'])
+        self.assertAlmostEqual(position['cost'], 1000 * 70000 * 1.0015 + 500 * 80000 * 1.0015)
+        self.assertAlmostEqual(position['pnl'], 1500 * 90000 - lots['cost'])
+
+        # Dựng lại từ nhật ký cho cùng giá vốn
+        pm.ledger.close()
+        reopened = PortfolioLedger(pm.ledger.journal_file)
+        self.addCleanup(reopened.close)
+        self.assertAlmostEqual(reopened.state['positions'].get('VNM')['avg_price'], lots['unit_cost'])
+
+
+class TestPortfolioOptimizer(unittest.TestCase):
+    """Test tối ưu tỷ trọng theo PORTFOLIO_CONFIG"""
+
+    def setUp(self):
+        rng = np.random.default_rng(11)
+        self.returns = rng.normal(0.0004, 0.01, (250, 1)) + rng.normal(0.0003, 0.02, (250, 40))
+        names = [f'S{i:02d}' for i in range(40)]
+        cov, _ = ledoit_wolf(self.returns)
+        self.cov = pd.DataFrame(cov * 252, index=names, columns=names)
+        self.mu = pd.Series(self.returns.mean(axis=0) * 252, index=names)
+        self.optimizer = PortfolioOptimizer(ReturnsEngine(ClosePanel(FakeHistoryCrawler([], '.'))))
+
+    def test_ledoit_wolf_matches_reference(self):
+        """Hệ số rút gọn khớp công thức gốc (vòng lặp theo phiên)"""
+        x = self.returns - self.returns.mean(axis=0)
+        t, n = x.shape
+        sample = x.T @ x / t
+        mu = np.trace(sample) / n
+        delta = np.sum((sample - mu * np.eye(n)) ** 2) / n
+        beta = sum(np.sum((np.outer(row, row) - sample) ** 2) for row in x) / n / t ** 2
+        expected = min(beta, delta) / delta
+
+        cov, shrinkage = ledoit_wolf(self.returns)
+        self.assertAlmostEqual(shrinkage, expected)
+        np.testing.assert_allclose(cov, expected * mu * np.eye(n) + (1 - expected) * sample)
+
+    def test_constraints_hold_for_all_methods(self):
+        for method in METHODS:
+            result = self.optimizer.optimize(method=method, cov=self.cov, expected_returns=self.mu)
+            weights = result['weights']
+            self.assertLessEqual(len(weights), 8, method)
+            self.assertLessEqual(weights.max(), 0.20 + 1e-9, method)
+            self.assertAlmostEqual(weights.sum(), 0.90, places=6, msg=method)
+            self.assertAlmostEqual(result['cash'], 0.10, places=6, msg=method)
+
+    def test_min_variance_kkt(self):
+        """Không giới hạn số mã: gradient bằng nhau trên các mã nằm trong (0, cap)"""
+        self.optimizer.constraints['max_positions'] = 40
+        weights = self.optimizer.optimize(method='min_variance', cov=self.cov)['weights']
+        w = weights.reindex(self.cov.index).fillna(0).to_numpy()
+        grad = self.cov.to_numpy() @ w
+        inner = (w > 1e-6) & (w < 0.20 - 1e-6)
+        self.assertTrue(inner.any())
+        level = grad[inner].mean()
+        np.testing.assert_allclose(grad[inner], level, rtol=1e-4)
+        self.assertTrue(np.all(grad[w <= 1e-6] >= level * (1 - 1e-4)))
+
+    def test_max_sharpe_beats_other_methods(self):
+        results = {m: self.optimizer.optimize(method=m, cov=self.cov, expected_returns=self.mu)
+                   for m in METHODS}
+        best = results['max_sharpe']['sharpe_ratio']
+        for method, result in results.items():
+            self.assertLessEqual(result['sharpe_ratio'], best + 1e-6, method)
+
+    def test_risk_parity_equal_contributions(self):
+        self.optimizer.constraints.update({'max_positions': 40, 'max_position_size': 1.0})
+        weights = self.optimizer.optimize(method='risk_parity', cov=self.cov)['weights']
+        w = weights.reindex(self.cov.index).to_numpy()
+        contributions = w * (self.cov.to_numpy() @ w)
+        np.testing.assert_allclose(contributions, contributions.mean(), rtol=1e-5)
+
+    def test_manager_trade_list(self):
+        """PortfolioManager.optimize: ước lượng từ giá cache, lệnh theo lô đưa danh mục về mục tiêu"""
+        tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(tmp.cleanup)
+        pm = PortfolioManager(Path(tmp.name) / 'portfolio.json')
+        self.addCleanup(pm.ledger.close)
+        symbols = ['VNM', 'FPT', 'HPG', 'MWG', 'VCB', 'TCB']
+        history = FakeHistoryCrawler(symbols, tmp.name)
+        panel = ClosePanel(history, panel_file=Path(tmp.name) / 'panel.parquet')
+        pm.returns_engine.panel = pm.covariance.panel = panel
+        pm.covariance.cache_dir = Path(tmp.name) / 'covariance'
+        pm.price_crawler = FakePriceCrawler(history.closes.iloc[-1].to_dict())
+
+        pm.add_cash(1_000_000_000)
+        pm.buy_stock('VNM', 40000, float(history.closes['VNM'].iloc[-1]), date='2024-01-02')
+        result = pm.optimize(symbols, method='min_variance')
+
+        trades = result['trades']
+        self.assertTrue((trades['shares'] % 100 == 0).all())
+        book = result['rebalance']['book']
+        prices = history.closes.iloc[-1]
+        total = pm.get_current_value()['total_value']
+        for symbol in set(book.symbols) | set(result['weights'].index):
+            shares = book.get(symbol)['shares'] if symbol in book else 0
+            self.assertAlmostEqual(shares * prices[symbol] / total, result['weights'].get(symbol, 0.0),
+                                   delta=100 * prices[symbol] / total + 1e-3)
+
+        executed = pm.execute_rebalance(result['rebalance'])
+        self.assertTrue(all(r['ok'] for r in executed))
+        held = pm.portfolio['positions']
+        self.assertEqual(dict(zip(held.symbols, held.shares)), dict(zip(book.symbols, book.shares)))
+        self.assertAlmostEqual(pm.portfolio['cash'], result['rebalance']['summary']['cash_after'], places=2)
+
+    def test_manager_rebalance_with_unsettled_lot(self):
+        """Lô chưa về T+2 không được đưa vào lệnh bán; lệnh bán bị từ chối thì bỏ lệnh mua"""
+        tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(tmp.cleanup)
+        pm = PortfolioManager(Path(tmp.name) / 'portfolio.json')
+        self.addCleanup(pm.ledger.close)
+        pm.price_crawler = FakePriceCrawler({'VNM': 70000, 'FPT': 100000})
+        pm.add_cash(100_000_000)
+        pm.buy_stock('VNM', 1000, 70000)   # hôm nay: chưa về
+        target = pd.Series({'FPT': 0.8})
+
+        plan = pm.plan_rebalance(target)
+        self.assertNotIn('SELL', plan['orders']['action'].tolist())
+        self.assertEqual(plan['book'].get('VNM')['shares'], 1000)
+        self.assertGreaterEqual(plan['summary']['cash_after'], 0)
+        self.assertTrue(all(r['ok'] for r in pm.execute_rebalance(plan)))
+
+        # Kế hoạch giả định bán được VNM: lệnh bán bị từ chối, lệnh mua bị bỏ
+        cash = pm.portfolio['cash']
+        naive = pm.rebalancer.plan(pm.portfolio['positions'], cash, {'VNM': 70000, 'FPT': 100000}, target)
+        self.assertIn('SELL', naive['orders']['action'].tolist())
+        self.assertIn('BUY', naive['orders']['action'].tolist())
+        executed = pm.execute_rebalance(naive)
+        self.assertFalse(any(r['ok'] for r in executed))
+        self.assertEqual(pm.portfolio['cash'], cash)
+
+
+class TestRebalanceEngine(unittest.TestCase):
+    """Test lệnh tái cân bằng theo lô, phí và quét ngưỡng"""
+
+    def setUp(self):
+        self.book = PositionBook.from_records([
+            {'symbol': 'VNM', 'shares': 5000, 'avg_price': 60000},
+            {'symbol': 'FPT', 'shares': 1050, 'avg_price': 90000},
+            {'symbol': 'HPG', 'shares': 3000, 'avg_price': 25000}
+        ])
+        self.prices = {'VNM': 70000, 'FPT': 100000, 'HPG': 20000, 'MWG': 50000}
+        self.cash = 50_000_000
+        self.engine = RebalanceEngine()
+        self.total = self.cash + self.book.value(self.prices)
+
+    def test_policy_rule_trims_to_caps(self):
+        """VNM 69% > 20%: bán theo lô về dưới trần; tiền mặt đạt tối thiểu 10%"""
+        plan = self.engine.plan(self.book, self.cash, self.prices)
+        orders = plan['orders'].set_index('symbol')
+        self.assertEqual(list(orders['action']), ['SELL'] * len(orders))
+        self.assertTrue((orders['shares'] % 100 == 0).all())
+
+        after = plan['book']
+        weights = {s: after.get(s)['shares'] * self.prices[s] / self.total for s in after.symbols}
+        self.assertLessEqual(weights['VNM'], 0.20)
+        self.assertGreater(weights['VNM'], 0.20 - 100 * 70000 / self.total)
+
+        summary = plan['summary']
+        fees = FeeModel().sell(orders['shares'].values, orders['price'].values)
+        self.assertAlmostEqual(summary['cash_after'], self.cash + fees['total'].sum())
+        self.assertGreaterEqual(summary['cash_after'] / self.total, 0.10 - 1e-3)
+
+    def test_target_weights_with_new_symbol(self):
+        """Mục tiêu có mã mới: bán mã không còn trong mục tiêu (kể cả lô lẻ), mua mã mới theo lô"""
+        target = pd.Series({'VNM': 0.3, 'HPG': 0.1, 'MWG': 0.4})
+        plan = self.engine.plan(self.book, self.cash, self.prices, target)
+        orders = plan['orders'].set_index('symbol')
+        self.assertEqual(orders.loc['FPT', 'shares'], 1050)
+        self.assertEqual(orders.loc['MWG', 'action'], 'BUY')
+        self.assertEqual(orders.loc['MWG', 'shares'] % 100, 0)
+        self.assertNotIn('FPT', plan['book'])
+        self.assertGreaterEqual(plan['summary']['cash_after'], 0)
+
+    def test_sells_limited_to_sellable(self):
+        """Chỉ 1.000 VNM đã về: bán tối đa 1.000, mua mới chỉ bằng tiền mặt + tiền bán đó"""
+        plan = self.engine.plan(self.book, self.cash, self.prices, pd.Series({'MWG': 0.5}),
+                                sellable={'VNM': 1000, 'HPG': 3000})
+        orders = plan['orders'].set_index('symbol')
+        self.assertEqual(orders.loc['VNM', 'shares'], 1000)
+        self.assertNotIn('FPT', orders.index)
+        self.assertEqual(plan['book'].get('FPT')['shares'], 1050)
+        self.assertGreaterEqual(plan['summary']['cash_after'], 0)
+
+    def test_buys_scaled_to_cash(self):
+        """100% vào MWG: 2 lô cần 10.015 triệu > 10 triệu tiền mặt -> chỉ mua 1 lô"""
+        plan = self.engine.plan(PositionBook(), 10_000_000, self.prices, pd.Series({'MWG': 1.0}))
+        self.assertEqual(plan['orders']['shares'].tolist(), [100])
+        self.assertAlmostEqual(plan['summary']['cash_after'], 10_000_000 - 100 * 50000 * 1.0015)
+
+    def test_sweep_matches_single_plans(self):
+        """Quét 2.000 ngưỡng một lượt = gọi plan từng ngưỡng"""
+        thresholds = np.linspace(0, 0.6, 2000)
+        table = self.engine.sweep(self.book, self.cash, self.prices, thresholds)
+        self.assertEqual(len(table), 2000)
+        for threshold in thresholds[::250]:
+            summary = self.engine.plan(self.book, self.cash, self.prices, threshold=threshold)['summary']
+            row = table.loc[threshold]
+            self.assertEqual(row['orders'], summary['orders'])
+            self.assertAlmostEqual(row['cash_after'], summary['cash_after'])
+            self.assertAlmostEqual(row['fees'], summary['fees'] + summary['taxes'])
+            self.assertAlmostEqual(row['max_drift_after'], summary['max_drift_after'])
+        self.assertTrue(table['turnover'].is_monotonic_decreasing)
+
+class TestCovarianceService(unittest.TestCase):
+    """Test ma trận hiệp phương sai lưu file và cập nhật EWMA tăng dần"""
+
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.dir = Path(self.tmp.name)
+        self.symbols = ['VNM', 'FPT', 'HPG', 'MWG']
+        self.crawler = FakeHistoryCrawler(self.symbols, self.dir)
+
+    def tearDown(self):
+        self.tmp.cleanup()
+
+    def service(self):
+        panel = ClosePanel(self.crawler, panel_file=self.dir / 'panel.parquet')
+        return CovarianceService(panel, cache_dir=self.dir / 'covariance', lookback_days=200)
+
+    def test_sample_matches_numpy(self):
+        returns = self.crawler.closes.pct_change().iloc[1:].to_numpy()
+        np.testing.assert_allclose(sample_covariance(returns), np.cov(returns, rowvar=False))
+
+    def test_persisted_and_sliced(self):
+        """Lần sau đọc từ file; tập con cắt từ ma trận đã có, mã mới thì tính lại cả universe"""
+        full = self.service().matrix(self.symbols)
+        calls = len(self.crawler.calls)
+
+        service = self.service()
+        sub = service.matrix(['HPG', 'VNM'])
+        self.assertEqual(len(self.crawler.calls), calls)
+        pd.testing.assert_frame_equal(sub, full.loc[['HPG', 'VNM'], ['HPG', 'VNM']])
+        self.assertEqual(service.info('ledoit_wolf')['as_of'], self.crawler.closes.index[-1].isoformat())
+
+        self.crawler.closes['VCB'] = self.crawler.closes['VNM'] * 1.5
+        service.matrix(['VCB'])
+        self.assertEqual(service.info('ledoit_wolf')['requested'], self.symbols + ['VCB'])
+
+        corr = service.correlation(self.symbols + ['VCB'])
+        np.testing.assert_allclose(np.diag(corr), 1)
+        self.assertEqual(corr['VCB'].drop('VCB').idxmax(), 'VNM')
+
+    def test_ewma_incremental_matches_full(self):
+        """Thêm 5 phiên mới vào EWMA đã lưu = tính lại cả cửa sổ"""
+        closes = self.crawler.closes
+        self.crawler.closes = closes.iloc[:-5]
+        self.service().matrix(self.symbols, 'ewma')
+
+        # Giả lập lần chạy hôm trước, hôm nay có thêm 5 phiên
+        meta_file = self.dir / 'covariance' / 'ewma.json'
+        meta = json.loads(meta_file.read_text())
+        meta['checked'] = '2000-01-03T00:00:00'
+        meta_file.write_text(json.dumps(meta))
+        self.crawler.closes = closes
+
+        service = self.service()
+        incremental = service.matrix(self.symbols, 'ewma')
+        self.assertEqual(service.info('ewma')['as_of'], closes.index[-1].isoformat())
+        self.assertEqual(service.info('ewma')['observations'], meta['observations'] + 5)
+
+        shutil.rmtree(self.dir / 'covariance')
+        full = self.service().matrix(self.symbols, 'ewma')
+        np.testing.assert_allclose(incremental, full, rtol=1e-10)
+
+    def test_risk_metrics_from_service(self):
+        risk = RiskMetrics(covariance=self.service())
+        weights = {'VNM': 0.4, 'FPT': 0.3, 'HPG': 0.3}
+        result = risk.covariance_risk(weights, 'sample')
+
+        cov = risk.covariance.matrix(list(weights), 'sample').to_numpy()
+        w = np.array(list(weights.values()))
+        self.assertAlmostEqual(result['ex_ante_volatility'], np.sqrt(w @ cov @ w * 252) * 100)
+        self.assertAlmostEqual(sum(result['risk_contributions'].values()), 100)
+        self.assertGreater(result['diversification_ratio'], 1)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,476 @@
+"""
+Unit tests cho screener
+"""
+import subprocess
+import tempfile
+import textwrap
+import time
+import unittest
+import pandas as pd
+import numpy as np
+import sys
+from datetime import datetime, timedelta
+from pathlib import Path
+
+# Add parent directory to path
+sys.path.append(str(Path(__file__).parent.parent))
+
+from src.analysis.technical import TechnicalAnalyzer
+from src.screener.technical_scanner import TechnicalScanner
+from src.screener.fundamental_screener import StockScreener
+from src.screener.history import ScreenHistory
+from src.screener.query import ScreenQuery, ScreenLibrary, QueryError, evaluate_many
+from src.screener.executor import HybridExecutor, pack_frame, unpack_frame, _release
+
+
+def make_prices(n=300, seed=0):
+    """Tạo dữ liệu giá giả lập"""
+    rng = np.random.default_rng(seed)
+    close = 50000 * np.cumprod(1 + rng.normal(0, 0.02, n))
+    return pd.DataFrame({
+        'open': close,
+        'high': close * 1.01,
+        'low': close * 0.99,
+        'close': close,
+        'volume': rng.uniform(1e5, 5e6, n).round()
+    }, index=pd.date_range(start='2023-01-01', periods=n, freq='D', name='time'))
+
+
+def fetch_prices(symbol):
+    """fetch giả lập: seed theo mã, context = độ dài tên mã"""
+    if symbol == 'BAD':
+        raise ValueError('network error')
+    return make_prices(seed=sum(map(ord, symbol))), len(symbol)
+
+
+class TestHybridExecutor(unittest.TestCase):
+    """Test bộ thực thi luồng + tiến trình"""
+    
+    def test_shared_memory_roundtrip(self):
+        """Dữ liệu đọc lại từ shared memory giống hệt bản gốc"""
+        df = make_prices(50)
+        shm, meta = pack_frame(df)
+        try:
+            pd.testing.assert_frame_equal(unpack_frame(meta), df, check_freq=False)
+        finally:
+            _release(shm)
+    
+    def test_run_matches_in_process_analysis(self):
+        """Kết quả từ tiến trình con khớp phân tích trực tiếp, lỗi fetch bị bỏ qua"""
+        symbols = ['AAA', 'BBBB', 'BAD']
+        executor = HybridExecutor(io_workers=2, cpu_workers=2)
+        results = {symbol: (context, analysis)
+                   for symbol, context, analysis in executor.run(symbols, fetch_prices)}
+        
+        self.assertEqual(sorted(results), ['AAA', 'BBBB'])
+        for symbol, (context, analysis) in results.items():
+            expected = TechnicalAnalyzer().analyze_stock(fetch_prices(symbol)[0], symbol)
+            self.assertEqual(context, len(symbol))
+            self.assertNotIn('dataframe', analysis)
+            self.assertAlmostEqual(analysis['rsi'], expected['rsi'])
+            self.assertEqual(analysis['signals'], expected['signals'])
+
+
+class TestTechnicalScannerSnapshot(unittest.TestCase):
+    """Test snapshot dùng chung cho các hàm find_*"""
+    
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.scanner = TechnicalScanner(watchlist=['AAA', 'BBB', 'CCC'])
+        self.scanner.price_crawler.cache_dir = Path(self.tmp.name)
+        self.scans = 0
+        
+        def fake_scan_all(max_workers=5, mode='thread'):
+            self.scans += 1
+            return pd.DataFrame({
+                'symbol': ['AAA', 'BBB', 'CCC'],
+                'close': [100.0, 50.0, 20.0],
+                'signal': ['BUY', 'HOLD', 'SELL'],
+                'signal_score': [3, 0, -3],
+                'rsi': [25.0, 50.0, 75.0],
+                'support': [99.0, None, 10.0],
+                'resistance': [120.0, 45.0, None]
+            })
+        
+        self.scanner.scan_all = fake_scan_all
+    
+    def tearDown(self):
+        self.tmp.cleanup()
+    
+    def test_queries_share_one_scan(self):
+        """Nhiều truy vấn liên tiếp chỉ scan một lần"""
+        self.assertEqual(list(self.scanner.find_oversold()['symbol']), ['AAA'])
+        self.assertEqual(list(self.scanner.find_overbought()['symbol']), ['CCC'])
+        self.assertEqual(list(self.scanner.find_buy_signals()['symbol']), ['AAA'])
+        self.assertEqual(list(self.scanner.find_near_support()['symbol']), ['AAA'])
+        self.assertEqual(list(self.scanner.find_breakout()['symbol']), ['BBB'])
+        self.assertEqual(self.scans, 1)
+        self.assertIsNotNone(self.scanner.snapshot_time)
+    
+    def test_refresh_on_data_change(self):
+        """Snapshot làm mới khi file cache giá thay đổi hoặc bị invalidate"""
+        self.scanner.get_snapshot()
+        
+        cache_file = Path(self.tmp.name) / 'AAA_2024-01-01_2024-12-31.parquet'
+        make_prices(10).to_parquet(cache_file)
+        self.scanner.get_snapshot()
+        self.assertEqual(self.scans, 2)
+        
+        # File của mã ngoài watchlist không ảnh hưởng
+        make_prices(10).to_parquet(Path(self.tmp.name) / 'ZZZ_2024-01-01_2024-12-31.parquet')
+        self.scanner.get_snapshot()
+        self.assertEqual(self.scans, 2)
+        
+        self.scanner.invalidate()
+        self.scanner.get_snapshot()
+        self.assertEqual(self.scans, 3)
+
+
+class TestScreenQuery(unittest.TestCase):
+    """Test ngôn ngữ truy vấn sàng lọc"""
+    
+    def setUp(self):
+        self.table = pd.DataFrame({
+            'Symbol': ['VCB', 'TCB', 'MBB', 'VHM', 'NVL', 'KDH'],
+            'Sector': ['Bank', 'Bank', 'Bank', 'RE', 'RE', 'RE'],
+            'Rating': ['BUY', 'HOLD', 'STRONG BUY', 'BUY', 'SELL', 'HOLD'],
+            'ROE': [22.0, 18.0, 12.0, 14.0, np.nan, 9.0],
+            'PE': [15.0, 8.0, 6.0, 10.0, -5.0, 20.0],
+            'RSI': [45.0, 72.0, 30.0, 55.0, 25.0, 68.0],
+            'D/E': [9.0, 6.0, 8.0, 1.2, 2.5, 0.8]
+        })
+    
+    def symbols(self, query):
+        return list(ScreenQuery(query).filter(self.table)['Symbol'])
+    
+    def test_operators(self):
+        """So sánh, between, in, not, số học và cột trong backtick"""
+        self.assertEqual(self.symbols('ROE > 15 and RSI between 30 and 70'), ['VCB'])
+        self.assertEqual(self.symbols("Rating in ('BUY', 'STRONG BUY') and `D/E` < 5"), ['VHM'])
+        self.assertEqual(self.symbols('not ROE >= 10'), ['KDH'])
+        self.assertEqual(self.symbols('roe / pe > 2 or pe < 0'), ['TCB', 'NVL'])
+    
+    def test_sector_functions(self):
+        """sector_median tính theo ngành trên toàn bảng"""
+        self.assertEqual(self.symbols('PE > 0 and PE < sector_median(PE)'), ['MBB'])
+        self.assertEqual(self.symbols('ROE > median(ROE)'), ['VCB', 'TCB'])
+    
+    def test_evaluate_many_matches_single(self):
+        """Đánh giá nhiều truy vấn một lượt cho cùng kết quả như từng truy vấn"""
+        screens = {
+            'a': 'PE < sector_median(PE) and ROE > 10',
+            'b': 'PE < sector_median(PE) or RSI > 70',
+            'c': ScreenQuery('Rating = "HOLD"')
+        }
+        masks = evaluate_many(self.table, screens)
+        
+        for name, query in screens.items():
+            query = query if isinstance(query, ScreenQuery) else ScreenQuery(query)
+            np.testing.assert_array_equal(masks[name].to_numpy(), query.mask(self.table))
+    
+    def test_errors(self):
+        """Lỗi cú pháp, cột và hàm không tồn tại"""
+        for bad in ['ROE >', 'ROE > 15 15', 'unknown_fn(ROE) > 1', 'median(ROE, PE) > 1']:
+            with self.assertRaises(QueryError):
+                ScreenQuery(bad)
+        with self.assertRaises(QueryError):
+            ScreenQuery('XYZ > 1').mask(self.table)
+        for not_condition in ['ROE', 'ROE + 1', 'ROE and RSI > 50']:
+            with self.assertRaises(QueryError):
+                ScreenQuery(not_condition).mask(self.table)
+            with self.assertRaises(QueryError):
+                evaluate_many(self.table, {'x': not_condition})
+
+    def test_not_with_nan(self):
+        """'not' không chọn dòng NaN; and/or theo logic ba giá trị"""
+        table = pd.DataFrame({'Symbol': ['A', 'B', 'C'], 'PE': [np.nan, 10.0, 30.0],
+                              'ROE': [20.0, np.nan, 5.0]})
+        masks = evaluate_many(table, {
+            'not_gt': 'not PE > 20',
+            'not_between': 'not PE between 5 and 15',
+            'not_and': 'not (PE > 20 and ROE > 10)',
+            'not_or': 'not (PE > 20 or ROE > 10)',
+            'double': 'not not PE > 20',
+        })
+        self.assertEqual(masks['not_gt'].tolist(), [False, True, False])
+        self.assertEqual(masks['not_between'].tolist(), [False, False, True])
+        # A: PE NaN nhưng ROE > 10 -> vế and chưa biết; C: PE > 20 và ROE <= 10 -> False
+        self.assertEqual(masks['not_and'].tolist(), [False, True, True])
+        # A: ROE > 10 chắc chắn True -> or True; B: PE <= 20, ROE NaN -> chưa biết
+        self.assertEqual(masks['not_or'].tolist(), [False, False, False])
+        self.assertEqual(masks['double'].tolist(), [False, False, True])
+
+    def test_boolean_column(self):
+        """Cột bool dùng trực tiếp làm điều kiện (NaN = False); kết quả luôn là bool"""
+        table = self.table.assign(Stale=[True, False, False, True, False, False])
+        self.assertEqual(list(ScreenQuery('Stale').filter(table)['Symbol']), ['VCB', 'VHM'])
+        self.assertEqual(list(ScreenQuery('not Stale and ROE > 10').filter(table)['Symbol']), ['TCB', 'MBB'])
+
+        table['Stale'] = table['Stale'].astype('boolean')
+        table.loc[0, 'Stale'] = pd.NA
+        masks = evaluate_many(table, {'stale': 'Stale', 'cheap': 'PE < 10'})
+        self.assertTrue((masks.dtypes == bool).all())
+        self.assertEqual(list(table['Symbol'][masks['stale']]), ['VHM'])
+
+    def test_library_roundtrip(self):
+        """Bộ lọc đã lưu đọc lại được; xóa bộ lọc có sẵn được ghi nhớ"""
+        with tempfile.TemporaryDirectory() as tmp:
+            path = Path(tmp) / 'screens.json'
+            library = ScreenLibrary(path)
+            library.save('quality_bank', "Sector = 'Bank' and ROE > 15")
+            library.delete('momentum')
+            
+            with self.assertRaises(QueryError):
+                library.save('broken', 'ROE >')
+            
+            reloaded = ScreenLibrary(path)
+            self.assertIn('quality_bank', reloaded.names())
+            self.assertNotIn('momentum', reloaded.names())
+            self.assertNotIn('broken', reloaded.names())
+            
+            masks = reloaded.evaluate(self.table, ['quality_bank'])
+            self.assertEqual(list(self.table['Symbol'][masks['quality_bank']]), ['VCB', 'TCB'])
+
+
+def fake_result(symbol, f_rating='GOOD', t_signal='BUY'):
+    """Kết quả screen_single_stock tối thiểu cho _create_summary_dataframe"""
+    return {
+        'symbol': symbol,
+        'fundamental': {
+            'scoring': {'rating': f_rating, 'percentage': 70.0},
+            'ratios': {'roe': 18.0, 'pe': 12.0, 'debt_to_equity': 0.5},
+            'profile': {'industry': 'Bank'},
+            'sector_relative': None
+        },
+        'technical': {
+            'signals': {'signal': t_signal, 'score': 3},
+            'close': 50000.0,
+            'rsi': 55.0,
+            'trend': {'medium_term': 'UPTREND'}
+        }
+    }
+
+
+class TestStreamingScreen(unittest.TestCase):
+    """Test iter_screen"""
+    
+    def setUp(self):
+        f_ratings = ['EXCELLENT', 'GOOD', 'AVERAGE', 'POOR']
+        t_signals = ['STRONG BUY', 'BUY', 'HOLD', 'SELL', 'STRONG SELL']
+        self.results = {f'S{i:02d}': fake_result(f'S{i:02d}', f_ratings[i % 4], t_signals[i % 5])
+                        for i in range(20)}
+        self.screener = StockScreener(watchlist=list(self.results))
+        self.calls = []
+        
+        def fake_screen(symbol):
+            self.calls.append(symbol)
+            time.sleep(0.01)
+            if symbol == 'S03':
+                return None
+            return self.results[symbol]
+        
+        self.screener.screen_single_stock = fake_screen
+    
+    def test_progress_and_top_heap(self):
+        """Đếm tiến độ và top-N khớp với sắp xếp toàn bộ"""
+        events = list(self.screener.iter_screen(max_workers=4, top_n=5))
+        last = events[-1]
+        
+        self.assertEqual(len(events), 20)
+        self.assertEqual([e['completed'] for e in events], list(range(1, 21)))
+        self.assertEqual((last['succeeded'], last['failed']), (19, 1))
+        
+        table = self.screener._create_summary_dataframe(
+            [r for symbol, r in self.results.items() if symbol != 'S03'])
+        self.assertEqual([row['Score'] for row in last['top']], list(table['Score'][:5]))
+        
+        # Dòng stream cùng cột và giá trị với bảng tóm tắt
+        row = next(e['row'] for e in events if e['symbol'] == 'S07')
+        self.assertEqual(row, table.set_index('Symbol').loc['S07'].to_dict() | {'Symbol': 'S07'})
+    
+    def test_stop_after_candidates(self):
+        """Dừng sớm khi đủ ứng viên, các mã còn lại không chạy"""
+        events = list(self.screener.iter_screen(max_workers=1, stop_after=2))
+        
+        self.assertEqual(events[-1]['candidates'], 2)
+        self.assertLess(len(self.calls), 20)
+
+
+class TestCombineScores(unittest.TestCase):
+    """Test kết hợp điểm vector hóa"""
+    
+    def setUp(self):
+        self.screener = StockScreener(watchlist=['AAA'])
+    
+    def make_result(self, symbol, f_rating, t_signal):
+        result = fake_result(symbol, f_rating, t_signal)
+        return self.screener._build_result(symbol, result['fundamental'], result['technical'])
+    
+    def test_summary_matches_per_symbol_combine(self):
+        """Bảng cột khớp với _combine_analysis từng mã cho mọi tổ hợp"""
+        f_ratings = ['EXCELLENT', 'GOOD', 'AVERAGE', 'BELOW AVERAGE', 'POOR', 'N/A']
+        t_signals = ['STRONG BUY', 'BUY', 'HOLD', 'SELL', 'STRONG SELL']
+        results = [self.make_result(f'S{i}{j}', f, t)
+                   for i, f in enumerate(f_ratings) for j, t in enumerate(t_signals)]
+        
+        table = self.screener._create_summary_dataframe(results).set_index('Symbol')
+        expected = pd.DataFrame({
+            'Rating': [r['combined']['final_rating'] for r in results],
+            'Score': [round(r['combined']['combined_score'], 2) for r in results],
+            'Note': [r['combined']['note'] for r in results]
+        }, index=pd.Index([r['symbol'] for r in results], name='Symbol'))
+        
+        pd.testing.assert_frame_equal(table[['Rating', 'Score', 'Note']].sort_index(), expected.sort_index(),
+                                      check_dtype=False)
+        rows = pd.DataFrame([self.screener._summary_row(r) for r in results]).set_index('Symbol')
+        pd.testing.assert_frame_equal(rows.sort_index(), table.sort_index(), check_dtype=False)
+        self.assertEqual(table.loc['S00', 'Rating'], 'STRONG BUY')
+        self.assertEqual(table.loc['S44', 'Rating'], 'SELL')
+    
+    def test_configurable_weights(self):
+        """Trọng số 100% cơ bản cho điểm bằng điểm rating cơ bản"""
+        screener = StockScreener(watchlist=['AAA'], weights={'fundamental': 1, 'technical': 0})
+        frame = pd.DataFrame({'Symbol': ['A', 'B'], 'F_Rating': ['GOOD', 'POOR'],
+                              'T_Signal': ['STRONG SELL', 'STRONG BUY']})
+        
+        ranked = screener.combine_frame(frame)
+        self.assertEqual(list(ranked['Symbol']), ['A', 'B'])
+        self.assertEqual(list(ranked['Score']), [4.0, 1.0])
+
+
+class TestStagedScreen(unittest.TestCase):
+    """Test sàng lọc 2 giai đoạn"""
+    
+    def test_staged_adds_valuation(self):
+        """Mã qua giai đoạn 1 có Fair_Value, Upside từ batch_valuation với giá giai đoạn 2"""
+        table = pd.DataFrame({
+            'roe': [20.0, 5.0, 18.0],
+            'pe': [10.0, 40.0, 12.0],
+            'debt_to_equity': [0.5, 3.0, 0.8],
+            'eps': [5000.0, 500.0, np.nan],
+            'bvps': [20000.0, 9000.0, 15000.0]
+        }, index=pd.Index(['AAA', 'BBB', 'CCC'], name='symbol'))
+        
+        screener = StockScreener(watchlist=list(table.index))
+        screener.fundamental_crawler.get_ratios_table = lambda symbols, use_cache=True: table
+        screener.fundamental_crawler.get_company_profile = lambda symbol: {}
+        screener._screen_with_fundamentals = lambda symbol, ratios, profile: fake_result(symbol)
+        
+        result = screener.screen_staged(max_workers=2).set_index('Symbol')
+        expected = screener.valuator.batch_valuation(
+            table.loc[['AAA', 'CCC']].assign(current_price=50000.0))
+        
+        self.assertEqual(sorted(result.index), ['AAA', 'CCC'])
+        for symbol in ['AAA', 'CCC']:
+            self.assertEqual(result.loc[symbol, 'Fair_Value'],
+                             round(expected.loc[symbol, 'average_fair_value']))
+            self.assertEqual(result.loc[symbol, 'Upside'],
+                             round(expected.loc[symbol, 'upside_downside'], 1))
+
+
+class TestDeadlineScreen(unittest.TestCase):
+    """Test sàng lọc có giới hạn thời gian"""
+    
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.screener = StockScreener(watchlist=['AAA', 'BBB', 'SLOW'])
+        self.screener.last_results_file = Path(self.tmp.name) / 'last.parquet'
+        
+        def fake_screen(symbol):
+            time.sleep(1.5 if symbol == 'SLOW' else 0.01)
+            return fake_result(symbol)
+        
+        self.screener.screen_single_stock = fake_screen
+    
+    def tearDown(self):
+        self.tmp.cleanup()
+    
+    def test_late_symbol_filled_from_cache(self):
+        """Mã trễ bị bỏ qua đúng hạn và được điền từ kết quả lần trước"""
+        as_of = datetime.now() - timedelta(hours=6)
+        self.screener._save_last_results(pd.DataFrame([{
+            **self.screener._summary_row(fake_result('SLOW', 'AVERAGE', 'HOLD')),
+            'Stale': False, 'As_Of': as_of, 'Age_Hours': 0.0
+        }]))
+        
+        started = time.monotonic()
+        df = self.screener.screen_with_deadline(deadline=1.0, symbol_timeout=0.3, max_workers=3)
+        
+        self.assertLess(time.monotonic() - started, 1.0)
+        self.assertEqual(self.screener.deadline_report['late'], ['SLOW'])
+        
+        slow = df.set_index('Symbol').loc['SLOW']
+        self.assertTrue(slow['Stale'])
+        self.assertAlmostEqual(slow['Age_Hours'], 6.0, places=1)
+        self.assertFalse(df.set_index('Symbol').loc['AAA', 'Stale'])
+        
+        # Kết quả mới được lưu lại, kết quả cũ của SLOW vẫn giữ
+        cached = self.screener._load_last_results().set_index('Symbol')
+        self.assertEqual(sorted(cached.index), ['AAA', 'BBB', 'SLOW'])
+    
+    def test_hung_call_does_not_block_exit(self):
+        """Lệnh gọi treo không giữ tiến trình khi thoát (luồng daemon)"""
+        script = textwrap.dedent(f"""
+            import sys, tempfile, time
+            from pathlib import Path
+            sys.path.insert(0, {str(Path(__file__).parent.parent)!r})
+            from src.screener.fundamental_screener import StockScreener
+            screener = StockScreener(watchlist=['HANG'])
+            screener.last_results_file = Path(tempfile.mkdtemp()) / 'last.parquet'
+            screener.screen_single_stock = lambda symbol: time.sleep(60)
+            screener.screen_with_deadline(deadline=0.2, symbol_timeout=0.1)
+            print('done', flush=True)
+        """)
+        
+        started = time.monotonic()
+        proc = subprocess.run([sys.executable, '-c', script], capture_output=True, text=True, timeout=30)
+        self.assertIn('done', proc.stdout)
+        self.assertLess(time.monotonic() - started, 20)
+
+
+class TestScreenHistory(unittest.TestCase):
+    """Test lịch sử sàng lọc"""
+    
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.history = ScreenHistory(Path(self.tmp.name) / 'history.parquet')
+        
+        runs = [
+            ('2024-05-01 15:30', {'VCB': ('BUY', 4.0), 'HPG': ('HOLD', 3.2), 'FPT': ('BUY', 4.1)}),
+            ('2024-05-02 15:30', {'VCB': ('BUY', 4.2), 'HPG': ('BUY', 3.9), 'FPT': ('BUY', 4.0)}),
+            ('2024-05-03 15:30', {'VCB': ('BUY', 4.1), 'HPG': ('AVOID', 2.6), 'MWG': ('HOLD', 3.3)}),
+        ]
+        for run_ts, rows in runs:
+            df = pd.DataFrame([{'Symbol': k, 'Rating': r, 'Score': sc} for k, (r, sc) in rows.items()])
+            self.history.append_run(df, run_ts=run_ts)
+    
+    def tearDown(self):
+        self.tmp.cleanup()
+    
+    def test_diff_latest_runs(self):
+        """Diff 2 lần gần nhất: đổi rating, mã mới, mã bị loại"""
+        diff = self.history.diff()
+        
+        self.assertEqual(diff.loc['HPG', 'Rating_old'], 'BUY')
+        self.assertEqual(diff.loc['HPG', 'Rating_new'], 'AVOID')
+        self.assertEqual(diff.loc['MWG', 'status'], 'new')
+        self.assertEqual(diff.loc['FPT', 'status'], 'dropped')
+        self.assertNotIn('VCB', diff.index)
+    
+    def test_rating_changes_and_streaks(self):
+        """Đổi rating từ một ngày và chuỗi rating hiện tại"""
+        changes = self.history.rating_changes(since='2024-05-02')
+        self.assertEqual(list(zip(changes['Symbol'], changes['previous'], changes['current'])),
+                         [('HPG', 'HOLD', 'BUY'), ('HPG', 'BUY', 'AVOID')])
+        
+        streaks = self.history.streaks(value='BUY')
+        self.assertEqual(list(streaks.index), ['VCB', 'FPT'])
+        self.assertEqual(list(streaks['streak']), [3, 2])
+        
+        # Đọc lại từ file
+        reloaded = ScreenHistory(self.history.history_file)
+        self.assertEqual(len(reloaded.runs()), 3)
+
+
+if __name__ == '__main__':
+    unittest.main()